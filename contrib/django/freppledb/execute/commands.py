@@ -76,7 +76,13 @@ def logMessage(msg, database=DEFAULT_DB_ALIAS):
       transaction.leave_transaction_management(using=database)
 
 
-def createPlan(database=DEFAULT_DB_ALIAS):
+def createPlan(database=DEFAULT_DB_ALIAS, incremental=False, clusters=None):
+  '''
+  Generates the plan.
+  With the incremental flag, only the clusters with changes since the
+  previous plan are replanned. A list of clusters restricts the plan to
+  these clusters.
+  '''
   # Auxiliary functions for debugging
   def debugResource(res, mode):
     # if res.name != 'my favorite resource': return
@@ -115,10 +121,23 @@ def createPlan(database=DEFAULT_DB_ALIAS):
     )
   print("Plan type: ", plantype)
   print("Constraints: ", constraint)
-  solver.solve()
-
-
-def exportPlan(database=DEFAULT_DB_ALIAS):
+  if incremental or clusters is not None:
+    skipped = solver.solve(clusters=clusters, changed_only=incremental)
+    print("Skipped %d clusters" % len(skipped))
+  else:
+    solver.solve()
+
+
+def exportPlan(database=DEFAULT_DB_ALIAS, differential=False):
+  '''
+  Exports the plan to the database.
+  With the differential flag, only the changes since the previous export
+  from this process are written.
+  '''
+  if differential:
+    from freppledb.execute.export_database_plan_differential import exportDifferential
+    exportDifferential(database).run()
+    return
   if settings.DATABASES[database]['ENGINE'] == 'django.db.backends.postgresql_psycopg2':
     from freppledb.execute.export_database_plan_postgresql import exportfrepple as export_plan_to_database
   else:
@@ -126,42 +145,31 @@ def exportPlan(database=DEFAULT_DB_ALIAS):
   export_plan_to_database()
 
 
-if __name__ == "__main__":
-  # Select database
-  try:
-    db = os.environ['FREPPLE_DATABASE'] or DEFAULT_DB_ALIAS
-  except:
-    db = DEFAULT_DB_ALIAS
-
-  # Use the test database if we are running the test suite
-  if 'FREPPLE_TEST' in os.environ:
-    settings.DATABASES[db]['NAME'] = settings.DATABASES[db]['TEST_NAME']
-    if 'TEST_CHARSET' in os.environ:
-      settings.DATABASES[db]['CHARSET'] = settings.DATABASES[db]['TEST_CHARSET']
-    if 'TEST_COLLATION' in os.environ:
-      settings.DATABASES[db]['COLLATION'] = settings.DATABASES[db]['TEST_COLLATION']
-    if 'TEST_USER' in os.environ:
-      settings.DATABASES[db]['USER'] = settings.DATABASES[db]['TEST_USER']
-
-  printWelcome(database=db)
-  logProgress(1, db)
+def runPlan(database=DEFAULT_DB_ALIAS, incremental=False):
+  '''
+  Loads the data, generates the plan and exports it to the database.
+  With the incremental flag, only the changes since the previous run are
+  loaded in the model kept in memory, and only the changes in the plan are
+  exported.
+  '''
+  logProgress(1, database)
   frepple.printsize()
   print("\nStart loading data from the database at", datetime.now().strftime("%H:%M:%S"))
   from freppledb.execute.load import loadData
-  loadData(database=db, filter=None).run()
+  loadData(database=database, filter=None, incremental=incremental).run()
   frepple.printsize()
-  logProgress(33, db)
+  logProgress(33, database)
   print("\nStart plan generation at", datetime.now().strftime("%H:%M:%S"))
-  createPlan(db)
+  createPlan(database, incremental=incremental)
   frepple.printsize()
-  logProgress(66, db)
+  logProgress(66, database)
 
   #print("\nStart exporting static model to the database at", datetime.now().strftime("%H:%M:%S"))
   #from freppledb.execute.export_database_static import exportStaticModel
-  #exportStaticModel(database=db, source=None).run()
+  #exportStaticModel(database=database, source=None).run()
 
   print("\nStart exporting plan to the database at", datetime.now().strftime("%H:%M:%S"))
-  exportPlan(db)
+  exportPlan(database, differential=incremental)
 
   #print("\nStart saving the plan to flat files at", datetime.now().strftime("%H:%M:%S"))
   #from freppledb.execute.export_file_plan import exportfrepple as export_plan_to_file
@@ -177,4 +185,25 @@ if __name__ == "__main__":
   #frepple.printsize()
 
   print("\nFinished planning at", datetime.now().strftime("%H:%M:%S"))
-  logProgress(100, db)
+  logProgress(100, database)
+
+
+if __name__ == "__main__":
+  # Select database
+  try:
+    db = os.environ['FREPPLE_DATABASE'] or DEFAULT_DB_ALIAS
+  except:
+    db = DEFAULT_DB_ALIAS
+
+  # Use the test database if we are running the test suite
+  if 'FREPPLE_TEST' in os.environ:
+    settings.DATABASES[db]['NAME'] = settings.DATABASES[db]['TEST_NAME']
+    if 'TEST_CHARSET' in os.environ:
+      settings.DATABASES[db]['CHARSET'] = settings.DATABASES[db]['TEST_CHARSET']
+    if 'TEST_COLLATION' in os.environ:
+      settings.DATABASES[db]['COLLATION'] = settings.DATABASES[db]['TEST_COLLATION']
+    if 'TEST_USER' in os.environ:
+      settings.DATABASES[db]['USER'] = settings.DATABASES[db]['TEST_USER']
+
+  printWelcome(database=db)
+  runPlan(db)
@@ -26,7 +26,7 @@ database records with the information. The Django database wrappers are used
 to keep the code portable between different databases.
 '''
 from __future__ import print_function
-from datetime import timedelta, datetime, date
+from itertools import chain
 from time import time
 from threading import Thread
 import os
@@ -37,6 +37,8 @@ from django.core.management.color import no_style
 
 import frepple
 
+from freppledb.common.models import Parameter
+
 if 'FREPPLE_DATABASE' in os.environ:
   database = os.environ['FREPPLE_DATABASE']
 else:
@@ -58,167 +60,136 @@ def truncate(cursor):
   print("Emptied plan tables in %.2f seconds" % (time() - starttime))
 
 
-def exportProblems(cursor):
-  print("Exporting problems...")
-  starttime = time()
+def clusterMembers(clusters, index, function):
+  # Returns the entities of the selected clusters from the cluster index, or
+  # all entities when no clusters are selected
+  if clusters is None:
+    return function()
+  return frepple.clustermembers(clusters)[index]
+
+
+def problemCluster(i):
+  # Problems are owned by a demand, buffer, resource, operation or operationplan
+  owner = i.owner
+  if isinstance(owner, frepple.operationplan):
+    owner = owner.operation
+  return getattr(owner, 'cluster', 0)
+
+
+def exportProblems(cursor, problems=None):
+  if problems is None:
+    problems = frepple.problems()
+  rows = [(
+     i.entity, i.name,
+     isinstance(i.owner, frepple.operationplan) and unicode(i.owner.operation) or unicode(i.owner),
+     i.description[0:settings.NAMESIZE + 20], str(i.start), str(i.end),
+     round(i.weight, settings.DECIMAL_PLACES)
+   ) for i in problems]
   cursor.executemany(
     "insert into out_problem \
     (entity,name,owner,description,startdate,enddate,weight) \
     values(%s,%s,%s,%s,%s,%s,%s)",
-    [(
-       i.entity, i.name,
-       isinstance(i.owner, frepple.operationplan) and unicode(i.owner.operation) or unicode(i.owner),
-       i.description[0:settings.NAMESIZE + 20], str(i.start), str(i.end),
-       round(i.weight, settings.DECIMAL_PLACES)
-     ) for i in frepple.problems()]
+    rows
     )
-  cursor.execute("select count(*) from out_problem")
-  print('Exported %d problems in %.2f seconds' % (cursor.fetchone()[0], time() - starttime))
+  return len(rows)
 
 
-def exportConstraints(cursor):
-  print("Exporting constraints...")
-  starttime = time()
+def exportConstraints(cursor, clusters=None):
   cnt = 0
-  for d in frepple.demands():
+  for d in clusterMembers(clusters, 3, frepple.demands):
+    rows = [(
+       d.name, i.entity, i.name,
+       isinstance(i.owner, frepple.operationplan) and unicode(i.owner.operation) or unicode(i.owner),
+       i.description[0:settings.NAMESIZE + 20], str(i.start), str(i.end),
+       round(i.weight, settings.DECIMAL_PLACES)
+     ) for i in d.constraints]
     cursor.executemany(
       "insert into out_constraint \
       (demand,entity,name,owner,description,startdate,enddate,weight) \
       values(%s,%s,%s,%s,%s,%s,%s,%s)",
-      [(
-         d.name, i.entity, i.name,
-         isinstance(i.owner, frepple.operationplan) and unicode(i.owner.operation) or unicode(i.owner),
-         i.description[0:settings.NAMESIZE + 20], str(i.start), str(i.end),
-         round(i.weight, settings.DECIMAL_PLACES)
-       ) for i in d.constraints]
+      rows
       )
-    cnt += 1
-  cursor.execute("select count(*) from out_constraint")
-  print('Exported %d constraints in %.2f seconds' % (cursor.fetchone()[0], time() - starttime))
+    cnt += len(rows)
+  return cnt
 
 
-def exportOperationplans(cursor):
-  print("Exporting operationplans...")
-  starttime = time()
+def exportOperationplans(cursor, clusters=None):
   cnt = 0
-  for i in frepple.operations():
+  for i in clusterMembers(clusters, 2, frepple.operations):
+    rows = [(
+      j.id, i.name.replace("'", "''"),
+      round(j.quantity, settings.DECIMAL_PLACES), str(j.start), str(j.end),
+      round(j.criticality, settings.DECIMAL_PLACES), j.locked, j.unavailable,
+      j.owner and j.owner.id or None
+     ) for j in i.operationplans ]
     cursor.executemany(
       "insert into out_operationplan \
        (id,operation,quantity,startdate,enddate,criticality,locked,unavailable,owner) \
        values (%s,%s,%s,%s,%s,%s,%s,%s,%s)",
-      [(
-        j.id, i.name.replace("'", "''"),
-        round(j.quantity, settings.DECIMAL_PLACES), str(j.start), str(j.end),
-        round(j.criticality, settings.DECIMAL_PLACES), j.locked, j.unavailable,
-        j.owner and j.owner.id or None
-       ) for j in i.operationplans ])
-    cnt += 1
-  cursor.execute("select count(*) from out_operationplan")
-  print('Exported %d operationplans in %.2f seconds' % (cursor.fetchone()[0], time() - starttime))
-
-
-def exportFlowplans(cursor):
-  print("Exporting flowplans...")
-  starttime = time()
+      rows
+      )
+    cnt += len(rows)
+  return cnt
+
+
+def exportFlowplans(cursor, clusters=None):
   cnt = 0
-  for i in frepple.buffers():
+  for i in clusterMembers(clusters, 0, frepple.buffers):
+    rows = [(
+       j.operationplan.id, j.buffer.name,
+       round(j.quantity, settings.DECIMAL_PLACES),
+       str(j.date), round(j.onhand, settings.DECIMAL_PLACES)
+     ) for j in i.flowplans]
     cursor.executemany(
       "insert into out_flowplan \
       (operationplan_id, thebuffer, quantity, flowdate, onhand) \
       values (%s,%s,%s,%s,%s)",
-      [(
-         j.operationplan.id, j.buffer.name,
-         round(j.quantity, settings.DECIMAL_PLACES),
-         str(j.date), round(j.onhand, settings.DECIMAL_PLACES)
-       ) for j in i.flowplans]
+      rows
       )
-    cnt += 1
-  cursor.execute("select count(*) from out_flowplan")
-  print('Exported %d flowplans in %.2f seconds' % (cursor.fetchone()[0], time() - starttime))
+    cnt += len(rows)
+  return cnt
 
 
-def exportLoadplans(cursor):
-  print("Exporting loadplans...")
-  starttime = time()
+def exportLoadplans(cursor, clusters=None):
   cnt = 0
-  for i in frepple.resources():
+  for i in clusterMembers(clusters, 1, frepple.resources):
+    rows = [(
+       j.operationplan.id, j.resource.name,
+       round(-j.quantity, settings.DECIMAL_PLACES),
+       str(j.startdate), str(j.enddate), j.setup
+     ) for j in i.loadplans if j.quantity < 0]
     cursor.executemany(
       "insert into out_loadplan \
       (operationplan_id, theresource, quantity, startdate, enddate, setup) \
       values (%s,%s,%s,%s,%s,%s)",
-      [(
-         j.operationplan.id, j.resource.name,
-         round(-j.quantity, settings.DECIMAL_PLACES),
-         str(j.startdate), str(j.enddate), j.setup
-       ) for j in i.loadplans if j.quantity < 0]
-      )
-    cnt += 1
-  cursor.execute("select count(*) from out_loadplan")
-  print('Exported %d loadplans in %.2f seconds' % (cursor.fetchone()[0], time() - starttime))
-
-
-def exportResourceplans(cursor):
-  print("Exporting resourceplans...")
-  starttime = time()
-
-  # Determine start and end date of the reporting horizon
-  # The start date is computed as 5 weeks before the start of the earliest loadplan in
-  # the entire plan.
-  # The end date is computed as 5 weeks after the end of the latest loadplan in
-  # the entire plan.
-  # If no loadplans exist at all we use the current date +- 1 month.
-  startdate = datetime.max
-  enddate = datetime.min
-  for i in frepple.resources():
-    for j in i.loadplans:
-      if j.startdate < startdate:
-        startdate = j.startdate
-      if j.enddate > enddate:
-        enddate = j.enddate
-  if startdate == datetime.max:
-    startdate = frepple.settings.current
-  if enddate == datetime.min:
-    enddate = frepple.settings.current
-  startdate = startdate - timedelta(days=30)
-  enddate = enddate + timedelta(days=30)
-  startdate = datetime(startdate.year, startdate.month, startdate.day)
-  if enddate > datetime(2030, 12, 30):  # This is the max frePPLe can represent.
-    enddate = datetime(2030, 12, 30)
-  else:
-    enddate = datetime(enddate.year, enddate.month, enddate.day)
-
-  # Build a list of horizon buckets
-  buckets = []
-  while startdate < enddate:
-    buckets.append(startdate)
-    startdate += timedelta(days=1)
-
-  # Loop over all reporting buckets of all resources
-  cnt = 0
-  for i in frepple.resources():
-    for j in i.plan(buckets):
-      print(j['start'], str(j['start']))
-    cursor.executemany(
-      "insert into out_resourceplan \
-      (theresource,startdate,available,unavailable,setup,%s,free) \
-      values (%%s,%%s,%%s,%%s,%%s,%%s,%%s)" % connections[database].ops.quote_name('load'),
-      [(
-         i.name, str(j['start']),
-         round(j['available'], settings.DECIMAL_PLACES),
-         round(j['unavailable'], settings.DECIMAL_PLACES),
-         round(j['setup'], settings.DECIMAL_PLACES),
-         round(j['load'], settings.DECIMAL_PLACES),
-         round(j['free'], settings.DECIMAL_PLACES)
-       ) for j in i.plan(buckets)]
+      rows
       )
-    cnt += 1
-
-  # Finalize
-  cursor.execute("select count(*) from out_resourceplan")
-  print('Exported %d resourceplans in %.2f seconds' % (cursor.fetchone()[0], time() - starttime))
+    cnt += len(rows)
+  return cnt
+
+
+def exportResourceplans(cursor, clusters=None):
+  # The plan of all resources in daily buckets is computed in a single call.
+  # The reporting horizon starts 30 days before the earliest loadplan and ends
+  # 30 days after the latest loadplan.
+  rows = [(
+     j[0], str(j[1]),
+     round(j[2], settings.DECIMAL_PLACES),
+     round(j[3], settings.DECIMAL_PLACES),
+     round(j[4], settings.DECIMAL_PLACES),
+     round(j[5], settings.DECIMAL_PLACES),
+     round(j[6], settings.DECIMAL_PLACES)
+   ) for j in frepple.resourceplans(None, None, clusters)]
+  cursor.executemany(
+    "insert into out_resourceplan \
+    (theresource,startdate,available,unavailable,setup,%s,free) \
+    values (%%s,%%s,%%s,%%s,%%s,%%s,%%s)" % connections[database].ops.quote_name('load'),
+    rows
+    )
+  return len(rows)
 
 
-def exportDemand(cursor):
+def exportDemand(cursor, clusters=None):
 
   def deliveries(d):
     cumplanned = 0
@@ -243,56 +214,99 @@ def exportDemand(cursor):
         None, None
         )
 
-  print("Exporting demand plans...")
-  starttime = time()
   cnt = 0
-  for i in frepple.demands():
+  for i in clusterMembers(clusters, 3, frepple.demands):
     if i.quantity == 0:
       continue
+    rows = [ j for j in deliveries(i) ]
     cursor.executemany(
       "insert into out_demand \
       (demand,item,customer,due,quantity,plandate,planquantity,operationplan) \
       values (%s,%s,%s,%s,%s,%s,%s,%s)",
-      [ j for j in deliveries(i) ] )
-    cnt += 1
-  cursor.execute("select count(*) from out_demand")
-  print('Exported %d demand plans in %.2f seconds' % (cursor.fetchone()[0], time() - starttime))
+      rows
+      )
+    cnt += len(rows)
+  return cnt
+
+
+def exportPegging(cursor, pegging=None):
+  # The pegging of all demands of the clusters is computed in a single call.
+  # The pegging of hidden demands is reported on their non-hidden owner.
+  if pegging is None:
+    pegging = frepple.pegging()
+  rows = [
+    (j[0], j[1], j[2], round(j[3], settings.DECIMAL_PLACES))
+    for j in pegging
+    ]
+  cursor.executemany(
+    "insert into out_demandpegging \
+    (demand,level,operationplan,quantity) values (%s,%s,%s,%s)",
+    rows
+    )
+  return len(rows)
 
 
-def exportPegging(cursor):
-  print("Exporting pegging...")
-  starttime = time()
-  cnt = 0
-  for i in frepple.demands():
-    # Find non-hidden demand owner
-    n = i
-    while n.hidden and n.owner:
-      n = n.owner
-    n = n and n.name or 'unspecified'
-    # Export pegging
-    cursor.executemany(
-      "insert into out_demandpegging \
-      (demand,level,operationplan,quantity) values (%s,%s,%s,%s)",
-      [(
-         n, j.level, j.operationplan.id,
-         round(j.quantity, settings.DECIMAL_PLACES)
-       ) for j in i.pegging]
-      )
-    cnt += 1
-  cursor.execute("select count(*) from out_demandpegging")
-  print('Exported %d pegging in %.2f seconds' % (cursor.fetchone()[0], time() - starttime))
+def partitionClusters(workers):
+  '''
+  Splits the planning clusters in groups of about the same size, one for each
+  worker. The size of a cluster is measured by the number of operations,
+  buffers, resources and demands in it.
+  '''
+  size = {}
+  for i in chain(frepple.operations(), frepple.buffers(), frepple.resources(), frepple.demands()):
+    size[i.cluster] = size.get(i.cluster, 0) + 1
+  # Assign the biggest clusters first, each time to the smallest group
+  groups = [ [0, set()] for i in range(workers) ]
+  for c in sorted(size, key=lambda c: size[c], reverse=True):
+    g = min(groups, key=lambda g: g[0])
+    g[0] += size[c]
+    g[1].add(c)
+  return [ g[1] for g in groups if g[1] ]
+
+
+def partitionProblems(groups):
+  '''
+  Splits the problems over the groups of clusters. The problems are detected
+  and walked only once for all groups.
+  '''
+  index = {}
+  for n, clusters in enumerate(groups):
+    for c in clusters:
+      index[c] = n
+  result = [ [] for g in groups ]
+  for i in frepple.problems():
+    n = index.get(problemCluster(i))
+    if n is not None:
+      result[n].append(i)
+  return result
 
 
 class DatabaseTask(Thread):
   '''
-  An auxiliary class that allows us to run a function with its own
-  database connection in its own thread.
+  An auxiliary class that allows us to export the plan of a set of clusters
+  with its own database connection in its own thread.
+  When no clusters are specified, the complete plan is exported.
+  The problems and the pegging of the clusters are computed before the
+  thread is started, and are passed as lists.
   '''
-  def __init__(self, *f):
-    super(DatabaseTask, self).__init__()
-    self.functions = f
+  functions = (
+    ('constraints', exportConstraints),
+    ('operationplans', exportOperationplans),
+    ('flowplans', exportFlowplans),
+    ('loadplans', exportLoadplans),
+    ('resourceplans', exportResourceplans),
+    ('demand plans', exportDemand),
+    )
+
+  def __init__(self, clusters=None, name='Export', problems=None, pegging=None):
+    super(DatabaseTask, self).__init__(name=name)
+    self.clusters = clusters
+    self.problems = problems
+    self.pegging = pegging
 
   def run(self):
+    starttime = time()
+
     # Create a database connection
     cursor = connections[database].cursor()
     if settings.DATABASES[database]['ENGINE'] == 'django.db.backends.sqlite3':
@@ -303,12 +317,18 @@ class DatabaseTask(Thread):
       cursor.execute("ALTER SESSION SET COMMIT_WRITE='BATCH,NOWAIT'")
 
     # Run the functions sequentially
-    for f in self.functions:
+    counts = []
+    with transaction.atomic(using=database):
+      counts.append("%d problems" % exportProblems(cursor, self.problems))
+    for label, f in self.functions:
       with transaction.atomic(using=database):
-        f(cursor)
+        counts.append("%d %s" % (f(cursor, self.clusters), label))
+    with transaction.atomic(using=database):
+      counts.append("%d pegging" % exportPegging(cursor, self.pegging))
 
     # Close the connection
     cursor.close()
+    print('%s: exported %s in %.2f seconds' % (self.name, ', '.join(counts), time() - starttime))
 
 
 def exportfrepple():
@@ -337,31 +357,30 @@ def exportfrepple():
     # performance, but you could still choose a sequential export.
     with transaction.atomic(using=database):
       truncate(cursor)  # Erase previous output
-      exportProblems(cursor)
-      exportConstraints(cursor)
-      exportOperationplans(cursor)
-      exportFlowplans(cursor)
-      exportLoadplans(cursor)
-      exportResourceplans(cursor)
-      exportDemand(cursor)
-      exportPegging(cursor)
+      DatabaseTask().run()
 
   else:
-    # OPTION 2: Parallel export of entities in groups.
-    # The groups are running in separate threads, and all functions in a group
-    # are run in sequence.
+    # OPTION 2: Parallel export of groups of clusters.
+    # Each group is exported in a separate thread, which exports all entities
+    # of the clusters in the group.
 
     # Erase previous output
     with transaction.atomic(using=database):
       truncate(cursor)
 
-    tasks = (
-      DatabaseTask(exportProblems, exportConstraints),
-      DatabaseTask(exportOperationplans, exportFlowplans, exportLoadplans),
-      DatabaseTask(exportResourceplans),
-      DatabaseTask(exportDemand),
-      DatabaseTask(exportPegging),
-      )
+    # The problem detection and the pegging run in the engine without the
+    # Python lock. They are completed before the workers start exporting the
+    # inventory profiles of the buffers.
+    workers = int(Parameter.getValue('plan.exportWorkers', database, '4'))
+    groups = partitionClusters(max(workers, 1))
+    problems = partitionProblems(groups)
+    tasks = [
+      DatabaseTask(
+        clusters, "Export worker %d" % (i + 1),
+        problems[i], frepple.pegging(clusters)
+        )
+      for i, clusters in enumerate(groups)
+      ]
     # Start all threads
     for i in tasks:
       i.start()
@@ -0,0 +1,284 @@
+#
+# Copyright (C) 2007-2013 by Johan De Taeye, frePPLe bvba
+#
+# This library is free software; you can redistribute it and/or modify it
+# under the terms of the GNU Affero General Public License as published
+# by the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU Affero
+# General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public
+# License along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+r'''
+Exports the changes in the frePPLe plan into a database.
+
+The code in this file is executed NOT by Django, but by the embedded Python
+interpreter from the frePPLe engine.
+
+The rows of every output table are split in groups with the same key, eg all
+flowplans of a buffer or all pegging records of a demand. A hash of the
+content of every group is remembered after each export. The next export only
+deletes the groups that disappeared, replaces the groups whose hash changed,
+and inserts the new groups. Operationplans are a group by themselves and are
+updated in place, since other tables refer to them.
+
+The hashes are kept in the memory of the process. This export is thus only
+useful in an engine that stays resident between runs. The first export of a
+process empties the output tables and writes all rows.
+'''
+from __future__ import print_function
+from itertools import groupby
+from time import time
+import os
+
+from django.db import connections, transaction, DEFAULT_DB_ALIAS
+from django.conf import settings
+
+import frepple
+
+from freppledb.execute.export_database_plan import truncate
+
+if 'FREPPLE_DATABASE' in os.environ:
+  database = os.environ['FREPPLE_DATABASE']
+else:
+  database = DEFAULT_DB_ALIAS
+
+
+def ownerName(i):
+  return isinstance(i.owner, frepple.operationplan) and i.owner.operation.name or i.owner.name
+
+
+def groupOperationplans():
+  for i in frepple.operations():
+    for j in i.operationplans:
+      yield (j.id,), [(
+        j.id, i.name,
+        round(j.quantity, settings.DECIMAL_PLACES), str(j.start), str(j.end),
+        round(j.criticality, settings.DECIMAL_PLACES), j.locked, j.unavailable,
+        j.owner and j.owner.id or None
+        )]
+
+
+def groupFlowplans():
+  # The onhand of all flowplans of a buffer changes together
+  for i in frepple.buffers():
+    yield (i.name,), [(
+       j.operationplan.id, j.buffer.name,
+       round(j.quantity, settings.DECIMAL_PLACES),
+       str(j.date), round(j.onhand, settings.DECIMAL_PLACES)
+       ) for j in i.flowplans]
+
+
+def groupLoadplans():
+  for i in frepple.resources():
+    yield (i.name,), [(
+       j.operationplan.id, j.resource.name,
+       round(-j.quantity, settings.DECIMAL_PLACES),
+       str(j.startdate), str(j.enddate), j.setup
+       ) for j in i.loadplans if j.quantity < 0]
+
+
+def groupResourceplans():
+  # The rows of a resource are returned consecutively
+  for name, rows in groupby(frepple.resourceplans(), lambda j: j[0]):
+    yield (name,), [(
+       j[0], str(j[1]),
+       round(j[2], settings.DECIMAL_PLACES),
+       round(j[3], settings.DECIMAL_PLACES),
+       round(j[4], settings.DECIMAL_PLACES),
+       round(j[5], settings.DECIMAL_PLACES),
+       round(j[6], settings.DECIMAL_PLACES)
+       ) for j in rows]
+
+
+def groupProblems():
+  # Problems of the same owner aren't returned consecutively
+  groups = {}
+  for i in frepple.problems():
+    owner = ownerName(i)
+    groups.setdefault((i.entity, owner), []).append((
+      i.entity, i.name, owner,
+      i.description[0:settings.NAMESIZE + 20], str(i.start), str(i.end),
+      round(i.weight, settings.DECIMAL_PLACES)
+      ))
+  return groups.items()
+
+
+def groupConstraints():
+  for d in frepple.demands():
+    yield (d.name,), [(
+       d.name, i.entity, i.name, ownerName(i),
+       i.description[0:settings.NAMESIZE + 20], str(i.start), str(i.end),
+       round(i.weight, settings.DECIMAL_PLACES)
+       ) for i in d.constraints]
+
+
+def groupDemand():
+
+  def deliveries(d):
+    cumplanned = 0
+    # Loop over all delivery operationplans
+    for i in d.operationplans:
+      cumplanned += i.quantity
+      cur = i.quantity
+      if cumplanned > d.quantity:
+        cur -= cumplanned - d.quantity
+        if cur < 0:
+          cur = 0
+      yield (
+        d.name, d.item.name, d.customer and d.customer.name or None, str(d.due),
+        round(cur, settings.DECIMAL_PLACES), str(i.end),
+        round(i.quantity, settings.DECIMAL_PLACES), i.id
+        )
+    # Extra record if planned short
+    if cumplanned < d.quantity:
+      yield (
+        d.name, d.item.name, d.customer and d.customer.name or None, str(d.due),
+        round(d.quantity - cumplanned, settings.DECIMAL_PLACES), None,
+        None, None
+        )
+
+  for i in frepple.demands():
+    if i.quantity == 0:
+      continue
+    yield (i.name,), [ j for j in deliveries(i) ]
+
+
+def groupPegging():
+  # The pegging of hidden demands is reported on their non-hidden owner, and
+  # isn't returned consecutively with the pegging of the owner
+  groups = {}
+  for j in frepple.pegging():
+    groups.setdefault((j[0],), []).append((
+      j[0], j[1], j[2], round(j[3], settings.DECIMAL_PLACES)
+      ))
+  return groups.items()
+
+
+class exportDifferential(object):
+  '''
+  Exports the differences between the plan and the previous export.
+  '''
+
+  # Output tables with their columns, the key columns of a group and the
+  # function returning the groups.
+  # The tables are listed in the order of inserts. Deletes are processed in
+  # the reverse order.
+  tables = (
+    ('out_operationplan',
+     ('id', 'operation', 'quantity', 'startdate', 'enddate', 'criticality', 'locked', 'unavailable', 'owner'),
+     ('id',), groupOperationplans),
+    ('out_flowplan',
+     ('operationplan_id', 'thebuffer', 'quantity', 'flowdate', 'onhand'),
+     ('thebuffer',), groupFlowplans),
+    ('out_loadplan',
+     ('operationplan_id', 'theresource', 'quantity', 'startdate', 'enddate', 'setup'),
+     ('theresource',), groupLoadplans),
+    ('out_resourceplan',
+     ('theresource', 'startdate', 'available', 'unavailable', 'setup', 'load', 'free'),
+     ('theresource',), groupResourceplans),
+    ('out_problem',
+     ('entity', 'name', 'owner', 'description', 'startdate', 'enddate', 'weight'),
+     ('entity', 'owner'), groupProblems),
+    ('out_constraint',
+     ('demand', 'entity', 'name', 'owner', 'description', 'startdate', 'enddate', 'weight'),
+     ('demand',), groupConstraints),
+    ('out_demand',
+     ('demand', 'item', 'customer', 'due', 'quantity', 'plandate', 'planquantity', 'operationplan'),
+     ('demand',), groupDemand),
+    ('out_demandpegging',
+     ('demand', 'level', 'operationplan', 'quantity'),
+     ('demand',), groupPegging),
+    )
+
+  # Tables whose rows are updated in place rather than deleted and inserted
+  # again. The first column is the key of the row.
+  updatetables = ('out_operationplan',)
+
+  # Hashes of the groups of the previous export, per database and per table
+  history = {}
+
+  def __init__(self, database=database):
+    self.database = database
+
+  def compare(self, function, previous):
+    '''
+    Compares the groups of a table with the previous export.
+    Returns the new hashes, the keys of the removed groups, the changed groups
+    and the new groups.
+    '''
+    hashes = {}
+    changed = []
+    new = []
+    for key, rows in function():
+      h = hash(tuple(rows))
+      hashes[key] = h
+      old = previous.get(key, None)
+      if old is None:
+        new.append(rows)
+      elif old != h:
+        changed.append((key, rows))
+    removed = [ key for key in previous if key not in hashes ]
+    return hashes, removed, changed, new
+
+  def run(self):
+    starttime = time()
+    settings.DEBUG = False
+    cursor = connections[self.database].cursor()
+    quote = connections[self.database].ops.quote_name
+    previous = exportDifferential.history.pop(self.database, None)
+
+    # Compare the plan with the previous export
+    result = [
+      self.compare(function, previous and previous[table] or {})
+      for table, columns, keys, function in self.tables
+      ]
+
+    with transaction.atomic(using=self.database):
+      if previous is None:
+        # First export of this process
+        truncate(cursor)
+
+      # Delete removed and changed groups, starting with the tables that
+      # refer to the others
+      for (table, columns, keys, function), (hashes, removed, changed, new) in reversed(list(zip(self.tables, result))):
+        if table not in self.updatetables:
+          removed = removed + [ key for key, rows in changed ]
+        cursor.executemany(
+          "delete from %s where %s" % (table, ' and '.join([ "%s=%%s" % quote(k) for k in keys ])),
+          removed
+          )
+
+      # Update and insert rows
+      for (table, columns, keys, function), (hashes, removed, changed, new) in zip(self.tables, result):
+        if table in self.updatetables:
+          cursor.executemany(
+            "update %s set %s where %s=%%s" % (
+              table, ','.join([ "%s=%%s" % quote(c) for c in columns[1:] ]), quote(columns[0])
+              ),
+            [ j[1:] + j[:1] for key, rows in changed for j in rows ]
+            )
+        else:
+          new.extend([ rows for key, rows in changed ])
+        rows = [ j for rows in new for j in rows ]
+        cursor.executemany(
+          "insert into %s (%s) values (%s)" % (
+            table, ','.join([ quote(c) for c in columns ]), ','.join(['%s'] * len(columns))
+            ),
+          rows
+          )
+        print("Table %s: %d groups removed, %d changed, %d records written" % (
+          table, len(removed), len(changed), len(rows)
+          ))
+
+    # Remember the hashes for the next export, only when the export succeeded
+    exportDifferential.history[self.database] = dict([
+      (t[0], r[0]) for t, r in zip(self.tables, result)
+      ])
+    print('Exported plan differences in %.2f seconds' % (time() - starttime))
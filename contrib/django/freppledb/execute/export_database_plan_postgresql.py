@@ -21,14 +21,19 @@ PostgreSQL database.
 
 The code in this file is executed NOT by the Django web application, but by the
 embedded Python interpreter from the frePPLe engine.
+
+Each output table is loaded with a COPY statement over its own database
+connection, and all tables are loaded in parallel threads. The rows are
+formatted and encoded in chunks, which are streamed to the database by the
+driver.
 '''
 from __future__ import print_function
-from datetime import timedelta, datetime, date
+from itertools import islice
+from threading import Thread
 from time import time
 import os
-from subprocess import Popen, PIPE
 
-from django.db import connections, DEFAULT_DB_ALIAS
+from django.db import connections, transaction, DEFAULT_DB_ALIAS
 from django.conf import settings
 
 import frepple
@@ -41,145 +46,81 @@ else:
 encoding = 'UTF8'
 
 
-def truncate(process):
+def truncate(cursor):
   print("Emptying database plan tables...")
   starttime = time()
-  process.stdin.write('truncate table out_demandpegging;\n')
-  process.stdin.write('truncate table out_problem, out_resourceplan, out_constraint;\n')
-  process.stdin.write('truncate table out_loadplan, out_flowplan, out_operationplan;\n')
-  process.stdin.write('truncate table out_demand;\n')
+  cursor.execute('truncate table out_demandpegging')
+  cursor.execute('truncate table out_problem, out_resourceplan, out_constraint')
+  cursor.execute('truncate table out_loadplan, out_flowplan, out_operationplan')
+  cursor.execute('truncate table out_demand')
   print("Emptied plan tables in %.2f seconds" % (time() - starttime))
 
 
-def exportProblems(process):
-  print("Exporting problems...")
-  starttime = time()
-  process.stdin.write('COPY out_problem (entity, name, owner, description, startdate, enddate, weight) FROM STDIN;\n')
-  for i in frepple.problems():
-    process.stdin.write("%s\t%s\t%s\t%s\t%s\t%s\t%s\n" % (
-       i.entity.encode(encoding), i.name.encode(encoding),
-       isinstance(i.owner, frepple.operationplan) and i.owner.operation.name.encode(encoding) or i.owner.name.encode(encoding),
-       i.description.encode(encoding)[0:settings.NAMESIZE + 20], str(i.start), str(i.end),
+def exportProblems(problems):
+  for i in problems:
+    yield "%s\t%s\t%s\t%s\t%s\t%s\t%s\n" % (
+       i.entity, i.name,
+       isinstance(i.owner, frepple.operationplan) and i.owner.operation.name or i.owner.name,
+       i.description[0:settings.NAMESIZE + 20], str(i.start), str(i.end),
        round(i.weight, settings.DECIMAL_PLACES)
-    ))
-  process.stdin.write('\\.\n')
-  print('Exported problems in %.2f seconds' % (time() - starttime))
+       )
 
 
-def exportConstraints(process):
-  print("Exporting constraints...")
-  starttime = time()
-  process.stdin.write('COPY out_constraint (demand,entity,name,owner,description,startdate,enddate,weight) FROM STDIN;\n')
+def exportConstraints():
   for d in frepple.demands():
     for i in d.constraints:
-      process.stdin.write("%s\t%s\t%s\t%s\t%s\t%s\t%s\t%s\n" % (
-         d.name.encode(encoding), i.entity.encode(encoding), i.name.encode(encoding),
-         isinstance(i.owner, frepple.operationplan) and i.owner.operation.name.encode(encoding) or i.owner.name.encode(encoding),
-         i.description.encode(encoding)[0:settings.NAMESIZE + 20], str(i.start), str(i.end),
+      yield "%s\t%s\t%s\t%s\t%s\t%s\t%s\t%s\n" % (
+         d.name, i.entity, i.name,
+         isinstance(i.owner, frepple.operationplan) and i.owner.operation.name or i.owner.name,
+         i.description[0:settings.NAMESIZE + 20], str(i.start), str(i.end),
          round(i.weight, settings.DECIMAL_PLACES)
-       ))
-  process.stdin.write('\\.\n')
-  print('Exported constraints in %.2f seconds' % (time() - starttime))
-
-
-def exportOperationplans(process):
-  print("Exporting operationplans...")
-  starttime = time()
-  process.stdin.write('COPY out_operationplan (id,operation,quantity,startdate,enddate,criticality,locked,unavailable,owner) FROM STDIN;\n')
-  for i in frepple.operations():
-    for j in i.operationplans:
-      process.stdin.write("%s\t%s\t%s\t%s\t%s\t%s\t%s\t%s\t%s\n" % (
-        j.id, i.name[0:settings.NAMESIZE].encode(encoding),
-        round(j.quantity, settings.DECIMAL_PLACES), str(j.start), str(j.end),
-        round(j.criticality, settings.DECIMAL_PLACES), j.locked, j.unavailable,
-        j.owner and j.owner.id or "\\N"
-        ))
-  process.stdin.write('\\.\n')
-  print('Exported operationplans in %.2f seconds' % (time() - starttime))
-
-
-def exportFlowplans(process):
-  print("Exporting flowplans...")
-  starttime = time()
-  process.stdin.write('COPY out_flowplan (operationplan_id, thebuffer, quantity, flowdate, onhand) FROM STDIN;\n')
-  for i in frepple.buffers():
-    for j in i.flowplans:
-      process.stdin.write("%s\t%s\t%s\t%s\t%s\n" % (
-         j.operationplan.id, j.buffer.name.encode(encoding),
-         round(j.quantity, settings.DECIMAL_PLACES),
-         str(j.date), round(j.onhand, settings.DECIMAL_PLACES)
-         ))
-  process.stdin.write('\\.\n')
-  print('Exported flowplans in %.2f seconds' % (time() - starttime))
-
-
-def exportLoadplans(process):
-  print("Exporting loadplans...")
-  starttime = time()
-  process.stdin.write('COPY out_loadplan (operationplan_id, theresource, quantity, startdate, enddate, setup) FROM STDIN;\n')
-  for i in frepple.resources():
-    for j in i.loadplans:
-      if j.quantity < 0:
-        process.stdin.write("%s\t%s\t%s\t%s\t%s\t%s\n" % (
-          j.operationplan.id, j.resource.name.encode(encoding),
-          round(-j.quantity, settings.DECIMAL_PLACES),
-          str(j.startdate), str(j.enddate),
-          j.setup and j.setup.encode(encoding) or "\\N"
-          ))
-  process.stdin.write('\\.\n')
-  print('Exported loadplans in %.2f seconds' % (time() - starttime))
-
-
-def exportResourceplans(process):
-  print("Exporting resourceplans...")
-  starttime = time()
-
-  # Determine start and end date of the reporting horizon
-  # The start date is computed as 5 weeks before the start of the earliest loadplan in
-  # the entire plan.
-  # The end date is computed as 5 weeks after the end of the latest loadplan in
-  # the entire plan.
-  # If no loadplans exist at all we use the current date +- 1 month.
-  startdate = datetime.max
-  enddate = datetime.min
-  for i in frepple.resources():
-    for j in i.loadplans:
-      if j.startdate < startdate:
-        startdate = j.startdate
-      if j.enddate > enddate:
-        enddate = j.enddate
-  if startdate == datetime.max:
-    startdate = frepple.settings.current
-  if enddate == datetime.min:
-    enddate = frepple.settings.current
-  startdate = (startdate - timedelta(days=30)).date()
-  enddate = (enddate + timedelta(days=30)).date()
-  if enddate > date(2030, 12, 30):  # This is the max frePPLe can represent.
-    enddate = date(2030, 12, 30)
-
-  # Build a list of horizon buckets
-  buckets = []
-  while startdate < enddate:
-    buckets.append(startdate)
-    startdate += timedelta(days=1)
-
-  # Loop over all reporting buckets of all resources
-  process.stdin.write('COPY out_resourceplan (theresource,startdate,available,unavailable,setup,load,free) FROM STDIN;\n')
-  for i in frepple.resources():
-    for j in i.plan(buckets):
-      process.stdin.write("%s\t%s\t%s\t%s\t%s\t%s\t%s\n" % (
-       i.name.encode(encoding), str(j['start']),
-       round(j['available'], settings.DECIMAL_PLACES),
-       round(j['unavailable'], settings.DECIMAL_PLACES),
-       round(j['setup'], settings.DECIMAL_PLACES),
-       round(j['load'], settings.DECIMAL_PLACES),
-       round(j['free'], settings.DECIMAL_PLACES)
-       ))
-  process.stdin.write('\\.\n')
-  print('Exported resourceplans in %.2f seconds' % (time() - starttime))
-
-
-def exportDemand(process):
+         )
+
+
+def exportOperationplans():
+  # The rows are built in chunks by the engine
+  fmt = "%%s\t%%.%ds\t%%.%df\t%%s\t%%s\t%%.%df\t%%s\t%%s\t%%s\n" % (
+    settings.NAMESIZE, settings.DECIMAL_PLACES, settings.DECIMAL_PLACES
+    )
+  for rows in frepple.operationplans(
+      fields=('id', 'operation', 'quantity', 'start', 'end', 'criticality', 'locked', 'unavailable', 'owner'),
+      chunk=2000, null="\\N"
+      ):
+    for j in rows:
+      yield fmt % j
+
+
+def exportFlowplans():
+  fmt = "%%s\t%%s\t%%.%df\t%%s\t%%.%df\n" % ((settings.DECIMAL_PLACES,) * 2)
+  for rows in frepple.flowplans(
+      fields=('operationplan', 'buffer', 'quantity', 'date', 'onhand'),
+      chunk=2000
+      ):
+    for j in rows:
+      yield fmt % j
+
+
+def exportLoadplans():
+  # Only the loadplans consuming capacity are returned, with a positive quantity
+  fmt = "%%s\t%%s\t%%.%df\t%%s\t%%s\t%%s\n" % settings.DECIMAL_PLACES
+  for rows in frepple.loadplans(
+      fields=('operationplan', 'resource', 'quantity', 'startdate', 'enddate', 'setup'),
+      chunk=2000, null="\\N"
+      ):
+    for j in rows:
+      yield fmt % j
+
+
+def exportResourceplans():
+  # The plan of all resources in daily buckets is computed in a single call.
+  # The reporting horizon starts 30 days before the earliest loadplan and ends
+  # 30 days after the latest loadplan.
+  fmt = "%%s\t%%s\t%%.%df\t%%.%df\t%%.%df\t%%.%df\t%%.%df\n" % ((settings.DECIMAL_PLACES,) * 5)
+  for j in frepple.resourceplans():
+    yield fmt % j
+
+
+def exportDemand():
 
   def deliveries(d):
     cumplanned = 0
@@ -192,101 +133,142 @@ def exportDemand(process):
         if cur < 0:
           cur = 0
       yield (
-        d.name.encode(encoding), d.item.name.encode(encoding), d.customer and d.customer.name.encode(encoding) or "\\N", str(d.due),
+        d.name, d.item.name, d.customer and d.customer.name or "\\N", str(d.due),
         round(cur, settings.DECIMAL_PLACES), str(i.end),
         round(i.quantity, settings.DECIMAL_PLACES), i.id
         )
     # Extra record if planned short
     if cumplanned < d.quantity:
       yield (
-        d.name.encode(encoding), d.item.name.encode(encoding), d.customer and d.customer.name.encode(encoding) or "\\N", str(d.due),
+        d.name, d.item.name, d.customer and d.customer.name or "\\N", str(d.due),
         round(d.quantity - cumplanned, settings.DECIMAL_PLACES), "\\N",
         "\\N", "\\N"
         )
 
-  print("Exporting demand plans...")
-  starttime = time()
-  process.stdin.write('COPY out_demand (demand,item,customer,due,quantity,plandate,planquantity,operationplan) FROM STDIN;\n')
   for i in frepple.demands():
     if i.quantity == 0:
       continue
     for j in deliveries(i):
-      process.stdin.write("%s\t%s\t%s\t%s\t%s\t%s\t%s\t%s\n" % j)
-  process.stdin.write('\\.\n')
-  print('Exported demand plans in %.2f seconds' % (time() - starttime))
+      yield "%s\t%s\t%s\t%s\t%s\t%s\t%s\t%s\n" % j
 
 
-def exportPegging(process):
-  print("Exporting pegging...")
-  starttime = time()
-  process.stdin.write('COPY out_demandpegging (demand,level,operationplan,quantity) FROM STDIN;\n')
-  for i in frepple.demands():
-    # Find non-hidden demand owner
-    n = i
-    while n.hidden and n.owner:
-      n = n.owner
-    n = n and n.name or 'unspecified'
-    # Export pegging
-    for j in i.pegging:
-      process.stdin.write("%s\t%s\t%s\t%s\n" % (
-        n.encode(encoding), str(j.level),
-        j.operationplan.id, round(j.quantity, settings.DECIMAL_PLACES)
+def exportPegging(pegging):
+  # The pegging of all demands is computed in a single call. The pegging of
+  # hidden demands is reported on their non-hidden owner.
+  fmt = "%%s\t%%s\t%%s\t%%.%df\n" % settings.DECIMAL_PLACES
+  for j in pegging:
+    yield fmt % j
+
+
+class CopyFile(object):
+  '''
+  A file-like object that feeds the rows of a generator to a COPY statement.
+  Rows are joined and encoded in chunks, rather than one at a time.
+  '''
+  def __init__(self, rows, chunksize=2000):
+    self.rows = rows
+    self.chunksize = chunksize
+    self.count = 0
+
+  def read(self, size=-1):
+    # The driver sends every chunk we return as a single message, regardless
+    # of the size it asked for.
+    chunk = list(islice(self.rows, self.chunksize))
+    self.count += len(chunk)
+    return ''.join(chunk).encode(encoding)
+
+  readline = read
+
+
+class CopyTask(Thread):
+  '''
+  An auxiliary class that loads a table with a COPY statement, using its own
+  database connection in its own thread.
+  '''
+  def __init__(self, table, columns, function):
+    super(CopyTask, self).__init__()
+    self.table = table
+    self.columns = columns
+    self.function = function
+    self.error = None
+
+  def run(self):
+    starttime = time()
+    try:
+      cursor = connections[database].cursor()
+      cursor.execute("SET statement_timeout = 0")
+      with transaction.atomic(using=database):
+        data = CopyFile(self.function())
+        cursor.copy_expert(
+          "COPY %s (%s) FROM STDIN" % (self.table, ','.join(self.columns)),
+          data
+          )
+      cursor.close()
+      duration = time() - starttime
+      print("Exported %d records into %s in %.2f seconds (%.0f records per second)" % (
+        data.count, self.table, duration, duration and data.count / duration or data.count
         ))
-  process.stdin.write('\\.\n')
-  print('Exported pegging in %.2f seconds' % (time() - starttime))
+    except Exception as e:
+      self.error = e
+      print("Error: Export of %s failed: %s" % (self.table, e))
+    finally:
+      connections[database].close()
 
 
 def exportfrepple():
   '''
   This function exports the data from the frePPLe memory into the database.
   '''
-  test = 'FREPPLE_TEST' in os.environ
-
-  # Start a PSQL process
-  # Commenting the next line is a little more secure, but requires you to create a .pgpass file.
-  os.environ['PGPASSWORD'] = settings.DATABASES[database]['PASSWORD']
-  process = Popen("psql -q -w -U%s %s%s%s" % (
-      settings.DATABASES[database]['USER'],
-     settings.DATABASES[database]['HOST'] and ("-h %s " % settings.DATABASES[database]['HOST']) or '',
-     settings.DATABASES[database]['PORT'] and ("-p %s " % settings.DATABASES[database]['PORT']) or '',
-     test and settings.DATABASES[database]['TEST_NAME'] or settings.DATABASES[database]['NAME'],
-   ), stdin=PIPE, stderr=PIPE, bufsize=0, shell=True, universal_newlines=True)
-  if process.returncode is None:
-    # PSQL session is still running
-    process.stdin.write("SET statement_timeout = 0;\n")
-    process.stdin.write("SET client_encoding = 'UTF8';\n")
-
-  # Send all output to the PSQL process through a pipe
-  try:
-    truncate(process)
-    exportProblems(process)
-    exportConstraints(process)
-    exportOperationplans(process)
-    exportFlowplans(process)
-    exportLoadplans(process)
-    exportResourceplans(process)
-    exportDemand(process)
-    exportPegging(process)
-  finally:
-    # Print any error messages
-    print(process.communicate()[1])
-    # Close the pipe and PSQL process
-    if process.returncode is None:
-      # PSQL session is still running.
-      process.stdin.write('\\q\n')
-    process.stdin.close()
+  # Make sure the debug flag is not set!
+  # When it is set, the django database wrapper collects a list of all sql
+  # statements executed and their timings. This consumes plenty of memory
+  # and cpu time.
+  settings.DEBUG = False
+  starttime = time()
 
+  # Erase previous output
   cursor = connections[database].cursor()
-  cursor.execute('''
-    select 'out_problem', count(*) from out_problem
-    union select 'out_constraint', count(*) from out_constraint
-    union select 'out_operationplan', count(*) from out_operationplan
-    union select 'out_flowplan', count(*) from out_flowplan
-    union select 'out_loadplan', count(*) from out_loadplan
-    union select 'out_resourceplan', count(*) from out_resourceplan
-    union select 'out_demandpegging', count(*) from out_demandpegging
-    union select 'out_demand', count(*) from out_demand
-    order by 1
-    ''')
-  for table, recs in cursor.fetchall():
-    print("Table %s: %d records" % (table, recs))
+  with transaction.atomic(using=database):
+    truncate(cursor)
+
+  # Problem detection and pegging run in the engine without the Python lock.
+  # They read the inventory profile of the buffers, which isn't safe while
+  # other threads export the flowplans. Both are completed up front.
+  problems = list(frepple.problems())
+  pegging = frepple.pegging()
+
+  # Load all tables in parallel, each with its own connection.
+  # The flowplans and loadplans refer to the operationplans. They are only
+  # started once the operationplans are committed.
+  print("Exporting plan tables...")
+  operationplans = CopyTask('out_operationplan', ('id', 'operation', 'quantity', 'startdate', 'enddate', 'criticality', 'locked', 'unavailable', 'owner'), exportOperationplans)
+  tasks = [
+    operationplans,
+    CopyTask('out_problem', ('entity', 'name', 'owner', 'description', 'startdate', 'enddate', 'weight'), lambda: exportProblems(problems)),
+    CopyTask('out_constraint', ('demand', 'entity', 'name', 'owner', 'description', 'startdate', 'enddate', 'weight'), exportConstraints),
+    CopyTask('out_resourceplan', ('theresource', 'startdate', 'available', 'unavailable', 'setup', 'load', 'free'), exportResourceplans),
+    CopyTask('out_demand', ('demand', 'item', 'customer', 'due', 'quantity', 'plandate', 'planquantity', 'operationplan'), exportDemand),
+    CopyTask('out_demandpegging', ('demand', 'level', 'operationplan', 'quantity'), lambda: exportPegging(pegging)),
+    ]
+  dependent = [
+    CopyTask('out_flowplan', ('operationplan_id', 'thebuffer', 'quantity', 'flowdate', 'onhand'), exportFlowplans),
+    CopyTask('out_loadplan', ('operationplan_id', 'theresource', 'quantity', 'startdate', 'enddate', 'setup'), exportLoadplans),
+    ]
+  # Start all independent threads
+  for i in tasks:
+    i.start()
+  # Start the dependent threads when the operationplans are exported
+  operationplans.join()
+  if not operationplans.error:
+    for i in dependent:
+      i.start()
+    tasks.extend(dependent)
+  # Wait for all threads to finish
+  for i in tasks:
+    i.join()
+
+  # Report errors
+  failed = [ i.table for i in tasks if i.error ]
+  if failed:
+    raise Exception("Export failed for tables: %s" % ', '.join(failed))
+  print("Exported plan in %.2f seconds" % (time() - starttime))
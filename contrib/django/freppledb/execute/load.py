@@ -27,6 +27,7 @@ API of frePPLe to bring the data into the frePPLe C++ core engine.
 from __future__ import print_function
 from datetime import datetime
 import os
+from threading import Event, Lock, Semaphore, Thread, local
 from time import time
 
 from django.db import connections, DEFAULT_DB_ALIAS
@@ -37,25 +38,437 @@ from freppledb.input.models import Resource
 import frepple
 
 
+# Marker for the columns that don't reset a field when they are empty
+noreset = object()
+
+
 class loadData(object):
 
-  def __init__(self, database=None, filter=None):
+  # The steps of the load, and the steps they depend on.
+  # A step only starts creating objects in frePPLe when the steps it depends
+  # on are finished. It can already read its data from the database before.
+  steps = (
+    ('parameter', 'loadParameter', ()),
+    ('calendars', 'loadCalendars', ()),
+    ('calendar buckets', 'loadCalendarBuckets', ('calendars',)),
+    ('locations', 'loadLocations', ('calendars',)),
+    ('customers', 'loadCustomers', ()),
+    ('operations', 'loadOperations', ('locations',)),
+    ('suboperations', 'loadSuboperations', ('operations',)),
+    ('items', 'loadItems', ('operations',)),
+    ('buffers', 'loadBuffers', ('calendars', 'locations', 'operations', 'items')),
+    ('setup matrices', 'loadSetupMatrices', ()),
+    ('resources', 'loadResources', ('calendars', 'locations', 'setup matrices')),
+    ('resource skills', 'loadResourceSkills', ('resources',)),
+    ('flows', 'loadFlows', ('operations', 'buffers')),
+    ('loads', 'loadLoads', ('operations', 'resources', 'resource skills')),
+    ('operationplans', 'loadOperationPlans', ('parameter', 'suboperations', 'flows', 'loads')),
+    ('demands', 'loadDemand', ('customers', 'items', 'operations')),
+    )
+
+  # Tables that can be loaded incrementally.
+  # The objects of these tables are updated in place: only the rows modified
+  # since the previous load are read again, and the objects of the rows that
+  # disappeared are deleted. The empty columns of a modified row reset their
+  # field to its default value. Each entry has the load step, the table, the
+  # frePPLe type, the primary key, and the condition on the rows loaded.
+  # The solver deletes the unlocked operationplans when it replans, so these
+  # are always read again.
+  deltatables = (
+    ('calendars', 'calendar', 'calendar', 'name', None),
+    ('locations', 'location', 'location', 'name', None),
+    ('customers', 'customer', 'customer', 'name', None),
+    ('operations', 'operation', 'operation', 'name', None),
+    ('items', 'item', 'item', 'name', None),
+    ('buffers', 'buffer', 'buffer', 'name', None),
+    ('resources', 'resource', 'resource', 'name', None),
+    ('operationplans', 'operationplan', 'operationplan', 'id', None),
+    ('demands', 'demand', 'demand', 'name',
+      "(status IS NULL OR status ='open' OR status = 'quote')"),
+    )
+
+  # Tables of which the rows are mapped on a frePPLe type. The type of an
+  # object can't be updated in place, and a changed type requires a full
+  # reload. Each entry has the table, the frePPLe type, and the expression
+  # of the type of a row.
+  typedtables = (
+    ('operation', 'operation', "'operation_' || coalesce(nullif(type,''), 'fixed_time')"),
+    ('buffer', 'buffer', "'buffer_' || coalesce(nullif(type,''), 'default')"),
+    ('resource', 'resource', "'resource_' || coalesce(nullif(type,''), 'default')"),
+    )
+
+  # The objects of these tables can't be updated in place. Any change in
+  # them requires a full reload.
+  fulltables = (
+    'calendarbucket', 'suboperation', 'setupmatrix', 'setuprule', 'skill',
+    'resourceskill', 'flow', 'resourceload'
+    )
+
+  # Status of the previous load, per database: the number of rows and the
+  # most recent modification of each table, and the primary keys of the
+  # tables loaded incrementally.
+  # The frePPLe engine holds the model of a single database, and only the
+  # status of that database is kept.
+  history = {}
+
+
+  def __init__(self, database=None, filter=None, batchsize=None, threads=None, prefetch=5, incremental=False):
     if database:
       self.database = database
     elif 'FREPPLE_DATABASE' in os.environ:
       self.database = os.environ['FREPPLE_DATABASE']
     else:
       self.database = DEFAULT_DB_ALIAS
-    if filter:
-      self.filter_and = "and %s " % filter
-      self.filter_where = "where %s " % filter
+    self.filter = filter
+    if batchsize is not None:
+      self.batchsize = batchsize
+    elif 'FREPPLE_LOADBATCHSIZE' in os.environ:
+      self.batchsize = int(os.environ['FREPPLE_LOADBATCHSIZE'])
     else:
-      self.filter_and = ""
-      self.filter_where = ""
+      self.batchsize = 10000
+    if threads is not None:
+      self.threads = threads
+    elif 'FREPPLE_LOADTHREADS' in os.environ:
+      self.threads = int(os.environ['FREPPLE_LOADTHREADS'])
+    else:
+      self.threads = 4
+    self.prefetch = prefetch
+    self.incremental = incremental
+    self.cursorcounter = 0
+    self.local = local()
+    self.enginelock = Lock()
+
+
+  @property
+  def cursor(self):
+    '''
+    Database cursor of the current thread.
+    '''
+    return self.local.cursor
+
+
+  @property
+  def filter_and(self):
+    '''
+    Filter of the current step, to append to a where clause.
+    '''
+    if self.local.filter:
+      return "and %s " % self.local.filter
+    else:
+      return ""
+
+
+  @property
+  def filter_where(self):
+    '''
+    Filter of the current step, as a where clause.
+    '''
+    if self.local.filter:
+      return "where %s " % self.local.filter
+    else:
+      return ""
+
+
+  def query(self, sql):
+    '''
+    Executes a query and returns an iterator over its result, in batches of
+    rows.
+
+    The rows are streamed from the database, so only a single batch is kept
+    in memory, regardless of the size of the table.
+    On PostgreSQL a named, server-side cursor is used. On the other databases
+    the rows are retrieved with fetchmany from a regular cursor.
+    A batch size of 0 retrieves the complete result at once.
+    '''
+    if not self.batchsize:
+      self.cursor.execute(sql)
+      yield self.cursor.fetchall()
+    elif settings.DATABASES[self.database]['ENGINE'] == 'django.db.backends.postgresql_psycopg2':
+      # Server-side cursors need to be created on the database connection
+      # of the psycopg2 driver. The cursor is declared "with hold" to make it
+      # independent of the transaction status.
+      self.cursorcounter += 1
+      cursor = connections[self.database].connection.cursor(
+        'frepple_load_%d' % self.cursorcounter, withhold=True
+        )
+      try:
+        cursor.execute(sql)
+        while True:
+          rows = cursor.fetchmany(self.batchsize)
+          if not rows:
+            break
+          yield rows
+      finally:
+        cursor.close()
+    else:
+      self.cursor.execute(sql)
+      while True:
+        rows = self.cursor.fetchmany(self.batchsize)
+        if not rows:
+          break
+        yield rows
+
+
+  def fetch(self, sql):
+    '''
+    Executes a query for the current step, and returns an iterator over its
+    result in batches of rows.
+
+    While the steps we depend on are still running, up to "prefetch"
+    batches are read ahead from the database. The frePPLe engine is locked
+    while the caller processes a batch, since only one step at a time can
+    create objects.
+    '''
+    stats = self.stats[self.local.step]
+    batches = self.query(sql)
+    readahead = []
+    while len(readahead) < self.prefetch and not self.isReady():
+      start = time()
+      rows = next(batches, None)
+      stats[0] += time() - start
+      if rows is None:
+        break
+      readahead.append(rows)
+    start = time()
+    self.waitReady()
+    stats[3] += time() - start
+    while True:
+      if readahead:
+        rows = readahead.pop(0)
+      else:
+        start = time()
+        rows = next(batches, None)
+        stats[0] += time() - start
+        if rows is None:
+          break
+      start = time()
+      self.enginelock.acquire()
+      stats[3] += time() - start
+      start = time()
+      try:
+        yield rows
+      finally:
+        self.enginelock.release()
+        stats[1] += time() - start
+
+
+  def rows(self, sql):
+    '''
+    Executes a query and returns an iterator over the rows of its result.
+    '''
+    for rows in self.fetch(sql):
+      for i in rows:
+        yield i
+
+
+  def bulkload(self, cls, fields, sql):
+    '''
+    Creates or updates frePPLe objects from the result of a query, one
+    batch of rows at a time.
+    Returns the number of rows processed.
+    '''
+    stats = self.stats[self.local.step]
+    reset = self.local.step in self.since
+    cnt = 0
+    for rows in self.fetch(sql):
+      start = time()
+      if reset:
+        cnt += self.resetload(cls, fields, rows)
+      else:
+        cnt += frepple.bulkload(cls, fields, rows)
+      # Time spent in the engine is not Python time
+      stats[1] -= time() - start
+      stats[2] += time() - start
+    return cnt
+
+
+  def resetload(self, cls, fields, rows):
+    '''
+    Updates frePPLe objects from rows modified since the previous load.
+    The empty columns reset their field to the value it has on a new object
+    of the same type. A value cleared in the database is thus also cleared
+    in frePPLe.
+    Returns the number of rows processed.
+    '''
+    # The fields differ between the types, and the rows are loaded per type
+    t = fields.index('type') if 'type' in fields else None
+    groups = {}
+    for r in rows:
+      groups.setdefault(r[t] if t is not None else None, []).append(r)
+    cnt = 0
+    for typename, grouprows in groups.items():
+      resets = self.resetValues(cls, typename, fields)
+      cnt += frepple.bulkload(
+        cls,
+        [ f for f, d in resets ],
+        [
+          [ d if v is None and d is not noreset else v for v, (f, d) in zip(r, resets) ]
+          for r in grouprows
+        ],
+        True
+        )
+    return cnt
+
+
+  def resetValues(self, cls, typename, fields):
+    '''
+    Returns for each field a tuple with the field specification and the
+    value of the field on a new object of the type.
+    The fields that can't be set on the type are replaced by None, to skip
+    the column.
+    '''
+    key = (cls.__name__, typename)
+    if key in self.resets:
+      return self.resets[key]
+    args = {'name': 'frepple reset values', 'action': 'A'}
+    if typename:
+      args['type'] = typename
+    obj = cls(**args)
+    resets = []
+    try:
+      for f in fields:
+        name = isinstance(f, tuple) and f[0] or f
+        if name in (None, 'name', 'type'):
+          resets.append( (f, noreset) )
+          continue
+        try:
+          value = getattr(obj, name)
+          setattr(obj, name, value)
+          resets.append( (f, value) )
+        except Exception:
+          # The field doesn't exist on this type
+          resets.append( (None, noreset) )
+    finally:
+      cls(name='frepple reset values', action='R')
+    self.resets[key] = resets
+    return resets
+
+
+  def isReady(self):
+    '''
+    Returns true when all steps the current step depends on are finished.
+    '''
+    for i in self.local.depends:
+      if not self.done[i].is_set():
+        return False
+    return True
+
+
+  def waitReady(self):
+    '''
+    Waits till all steps the current step depends on are finished.
+    '''
+    for i in self.local.depends:
+      self.done[i].wait()
+
+
+  def runStep(self, name, method, depends, slots=None):
+    '''
+    Runs a step of the load, with a database connection of its own.
+    '''
+    try:
+      self.local.step = name
+      self.local.depends = depends
+      if name in self.since:
+        filters = [ i for i in (self.filter, "lastmodified >= '%s'" % self.since[name]) if i ]
+        self.local.filter = " and ".join([ "(%s)" % i for i in filters ])
+      else:
+        self.local.filter = self.filter
+      self.local.cursor = connections[self.database].cursor()
+      try:
+        getattr(self, method)()
+      finally:
+        self.local.cursor.close()
+        if slots:
+          connections[self.database].close()
+    except Exception as e:
+      print("Error: Failed loading %s: %s" % (name, e))
+      if not self.error:
+        self.error = e
+    finally:
+      self.done[name].set()
+      if slots:
+        slots.release()
+
+
+  def readHistory(self):
+    '''
+    Reads the status of the tables in the database: the number of rows
+    and the most recent modification of each table, and the primary keys
+    of the tables loaded incrementally.
+    '''
+    history = {}
+    self.local.cursor = connections[self.database].cursor()
+    try:
+      quote_name = connections[self.database].ops.quote_name
+      for step, table, cls, key, condition in self.deltatables:
+        filters = [ i for i in (condition, self.filter) if i ]
+        where = filters and "WHERE %s" % " and ".join([ "(%s)" % i for i in filters ]) or ""
+        self.cursor.execute("SELECT max(lastmodified) FROM %s %s" % (quote_name(table), where))
+        lastmodified = self.cursor.fetchone()[0]
+        keys = set()
+        for rows in self.query("SELECT %s FROM %s %s" % (key, quote_name(table), where)):
+          keys.update([ i[0] for i in rows ])
+        history[table] = (lastmodified, keys)
+      for table in self.fulltables:
+        self.cursor.execute("SELECT count(*), max(lastmodified) FROM %s %s" % (
+          quote_name(table), self.filter and "WHERE %s" % self.filter or ""
+          ))
+        history[table] = tuple(self.cursor.fetchone())
+    finally:
+      self.cursor.close()
+    return history
+
+
+  def typeChanged(self, previous):
+    '''
+    Returns true when a row modified since the previous load maps to another
+    type than its existing frePPLe object.
+    '''
+    self.local.cursor = connections[self.database].cursor()
+    try:
+      quote_name = connections[self.database].ops.quote_name
+      for table, cls, expr in self.typedtables:
+        if not previous[table][0]:
+          continue
+        filters = [ i for i in (self.filter, "lastmodified >= '%s'" % previous[table][0]) if i ]
+        for rows in self.query("SELECT name, %s FROM %s WHERE %s" % (
+          expr, quote_name(table), " and ".join([ "(%s)" % i for i in filters ])
+          )):
+          for name, typename in rows:
+            try:
+              obj = getattr(frepple, cls)(name=name, action='C')
+            except Exception:
+              # A new object
+              continue
+            if obj.__class__.__name__ != typename:
+              print("Type of %s %s has changed: a full reload is required" % (cls, name))
+              return True
+    finally:
+      self.cursor.close()
+    return False
+
+
+  def deleteObjects(self, previous, history):
+    '''
+    Deletes the objects of the rows that were deleted from the database
+    since the previous load.
+    The objects are deleted in the reverse order of the load.
+    '''
+    for step, table, cls, key, condition in reversed(self.deltatables):
+      deleted = previous[table][1] - history[table][1]
+      for i in deleted:
+        try:
+          getattr(frepple, cls)(**{key: i, 'action': 'R'})
+        except Exception as e:
+          print("Error:", e)
+      if deleted:
+        print('Deleted %d %s objects' % (len(deleted), cls))
 
 
   def loadParameter(self):
     print('Importing parameters...')
+    self.enginelock.acquire()
     try:
       self.cursor.execute("SELECT value FROM common_parameter where name='currentdate'")
       d = self.cursor.fetchone()
@@ -63,45 +476,38 @@ class loadData(object):
     except:
       frepple.settings.current = datetime.now().replace(microsecond=0)
       print('Using system clock as current date: %s' % frepple.settings.current)
+    finally:
+      self.enginelock.release()
 
 
   def loadLocations(self):
     print('Importing locations...')
-    cnt = 0
     starttime = time()
-    self.cursor.execute('''
+    cnt = self.bulkload(
+      frepple.location,
+      ("name", "description", ("owner", frepple.location),
+       ("available", frepple.calendar), "category", "subcategory", "source"),
+      '''
       SELECT
         name, description, owner_id, available_id, category, subcategory, source
       FROM location %s
-      ''' % self.filter_where)
-    for i in self.cursor.fetchall():
-      cnt += 1
-      try:
-        x = frepple.location(name=i[0], description=i[1], category=i[4], subcategory=i[5], source=i[6])
-        if i[2]:
-          x.owner = frepple.location(name=i[2])
-        if i[3]:
-          x.available = frepple.calendar(name=i[3])
-      except Exception as e:
-        print("Error:", e)
+      ''' % self.filter_where
+      )
     print('Loaded %d locations in %.2f seconds' % (cnt, time() - starttime))
 
 
   def loadCalendars(self):
     print('Importing calendars...')
-    cnt = 0
     starttime = time()
-    self.cursor.execute('''
+    cnt = self.bulkload(
+      frepple.calendar,
+      ("name", "default", "source"),
+      '''
       SELECT
         name, defaultvalue, source
       FROM calendar %s
-      ''' % self.filter_where)
-    for i in self.cursor.fetchall():
-      cnt += 1
-      try:
-        frepple.calendar(name=i[0], default=i[1], source=i[2])
-      except Exception as e:
-        print("Error:", e)
+      ''' % self.filter_where
+      )
     print('Loaded %d calendars in %.2f seconds' % (cnt, time() - starttime))
 
 
@@ -109,15 +515,14 @@ class loadData(object):
     print('Importing calendar buckets...')
     cnt = 0
     starttime = time()
-    self.cursor.execute('''
+    for i in self.rows('''
        SELECT
          calendar_id, startdate, enddate, id, priority, value,
          sunday, monday, tuesday, wednesday, thursday, friday, saturday,
          starttime, endtime
       FROM calendarbucket %s
       ORDER BY calendar_id, startdate desc
-      ''' % self.filter_where)
-    for i in self.cursor.fetchall():
+      ''' % self.filter_where):
       cnt += 1
       try:
         days = 0
@@ -155,84 +560,44 @@ class loadData(object):
 
   def loadCustomers(self):
     print('Importing customers...')
-    cnt = 0
     starttime = time()
-    self.cursor.execute('''
+    cnt = self.bulkload(
+      frepple.customer,
+      ("name", "description", ("owner", frepple.customer),
+       "category", "subcategory", "source"),
+      '''
       SELECT
         name, description, owner_id, category, subcategory, source
       FROM customer %s
-      ''' % self.filter_where)
-    for i in self.cursor.fetchall():
-      cnt += 1
-      try:
-        x = frepple.customer(name=i[0], description=i[1], category=i[3], subcategory=i[4], source=i[5])
-        if i[2]:
-          x.owner = frepple.customer(name=i[2])
-      except Exception as e:
-        print("Error:", e)
+      ''' % self.filter_where
+      )
     print('Loaded %d customers in %.2f seconds' % (cnt, time() - starttime))
 
 
   def loadOperations(self):
     print('Importing operations...')
-    cnt = 0
     starttime = time()
-    self.cursor.execute('''
+    # The type column is mapped to the name of the frePPLe operation type.
+    # Unknown types are reported as an error on the row.
+    # The duration fields are only passed to the types that support them.
+    cnt = self.bulkload(
+      frepple.operation,
+      ("name", "type", "fence", "posttime", "size_minimum", "size_multiple",
+       "size_maximum", "duration", "duration_per", ("location", frepple.location),
+       "cost", "search", "description", "category", "subcategory", "source"),
+      '''
       SELECT
-        name, fence, posttime, sizeminimum, sizemultiple, sizemaximum,
-        type, duration, duration_per, location_id, cost, search, description,
+        name, 'operation_' || coalesce(nullif(type,''), 'fixed_time'),
+        nullif(fence,0), nullif(posttime,0), nullif(sizeminimum,0),
+        nullif(sizemultiple,0), nullif(sizemaximum,0),
+        case when type is null or type in ('', 'fixed_time', 'time_per')
+          then nullif(duration,0) end,
+        case when type = 'time_per' then nullif(duration_per,0) end,
+        location_id, nullif(cost,0), nullif(search,''), description,
         category, subcategory, source
       FROM operation %s
-      ''' % self.filter_where)
-    for i in self.cursor.fetchall():
-      cnt += 1
-      try:
-        if not i[6] or i[6] == "fixed_time":
-          x = frepple.operation_fixed_time(
-            name=i[0], description=i[12], category=i[13], subcategory=i[14], source=i[15]
-            )
-          if i[7]:
-            x.duration = i[7]
-        elif i[6] == "time_per":
-          x = frepple.operation_time_per(
-            name=i[0], description=i[12], category=i[13], subcategory=i[14], source=i[15]
-            )
-          if i[7]:
-            x.duration = i[7]
-          if i[8]:
-            x.duration_per = i[8]
-        elif i[6] == "alternate":
-          x = frepple.operation_alternate(
-            name=i[0], description=i[12], category=i[13], subcategory=i[14], source=i[15]
-            )
-        elif i[6] == "split":
-          x = frepple.operation_split(
-            name=i[0], description=i[12], category=i[13], subcategory=i[14], source=i[15]
-            )
-        elif i[6] == "routing":
-          x = frepple.operation_routing(
-            name=i[0], description=i[12], category=i[13], subcategory=i[14], source=i[15]
-            )
-        else:
-          raise ValueError("Operation type '%s' not recognized" % i[6])
-        if i[1]:
-          x.fence = i[1]
-        if i[2]:
-          x.posttime = i[2]
-        if i[3]:
-          x.size_minimum = i[3]
-        if i[4]:
-          x.size_multiple = i[4]
-        if i[5]:
-          x.size_maximum = i[5]
-        if i[9]:
-          x.location = frepple.location(name=i[9])
-        if i[10]:
-          x.cost = i[10]
-        if i[11]:
-          x.search = i[11]
-      except Exception as e:
-        print("Error:", e)
+      ''' % self.filter_where
+      )
     print('Loaded %d operations in %.2f seconds' % (cnt, time() - starttime))
 
 
@@ -240,7 +605,8 @@ class loadData(object):
     print('Importing suboperations...')
     cnt = 0
     starttime = time()
-    self.cursor.execute('''
+    curopername = None
+    for i in self.rows('''
       SELECT operation_id, suboperation_id, priority, effective_start, effective_end,
         (select type
          from operation
@@ -248,9 +614,7 @@ class loadData(object):
       FROM suboperation
       WHERE priority >= 0 %s
       ORDER BY operation_id, priority
-      ''' % self.filter_and)
-    curopername = None
-    for i in self.cursor.fetchall():
+      ''' % self.filter_and):
       cnt += 1
       try:
         if i[0] != curopername:
@@ -287,90 +651,52 @@ class loadData(object):
 
   def loadItems(self):
     print('Importing items...')
-    cnt = 0
     starttime = time()
-    self.cursor.execute('''
+    cnt = self.bulkload(
+      frepple.item,
+      ("name", "description", ("operation", frepple.operation),
+       ("owner", frepple.item), "price", "category", "subcategory", "source"),
+      '''
       SELECT
         name, description, operation_id, owner_id,
-        price, category, subcategory, source
+        nullif(price,0), category, subcategory, source
       FROM item %s
-      ''' % self.filter_where)
-    for i in self.cursor.fetchall():
-      cnt += 1
-      try:
-        x = frepple.item(name=i[0], description=i[1], category=i[5], subcategory=i[6], source=i[7])
-        if i[2]:
-          x.operation = frepple.operation(name=i[2])
-        if i[3]:
-          x.owner = frepple.item(name=i[3])
-        if i[4]:
-          x.price = i[4]
-      except Exception as e:
-        print("Error:", e)
+      ''' % self.filter_where
+      )
     print('Loaded %d items in %.2f seconds' % (cnt, time() - starttime))
 
 
   def loadBuffers(self):
     print('Importing buffers...')
-    cnt = 0
     starttime = time()
-    self.cursor.execute('''
-      SELECT name, description, location_id, item_id, onhand,
-        minimum, minimum_calendar_id, producing_id, type, leadtime, min_inventory,
-        max_inventory, min_interval, max_interval, size_minimum,
-        size_multiple, size_maximum, fence, carrying_cost,
+    # The type column is mapped to the name of the frePPLe buffer type.
+    # The replenishment fields are only passed to procurement buffers.
+    cnt = self.bulkload(
+      frepple.buffer,
+      ("name", "type", "description", ("location", frepple.location),
+       ("item", frepple.item), "onhand", "minimum",
+       ("minimum_calendar", frepple.calendar), ("producing", frepple.operation),
+       "leadtime", "mininventory", "maxinventory", "mininterval", "maxinterval",
+       "size_minimum", "size_multiple", "size_maximum", "fence",
+       "carrying_cost", "tool", "category", "subcategory", "source"),
+      '''
+      SELECT name, 'buffer_' || coalesce(nullif(type,''), 'default'),
+        description, location_id, item_id, onhand,
+        nullif(minimum,0), minimum_calendar_id, producing_id,
+        case when type = 'procure' then nullif(leadtime,0) end,
+        case when type = 'procure' then nullif(min_inventory,0) end,
+        case when type = 'procure' then nullif(max_inventory,0) end,
+        nullif(min_interval,0), nullif(max_interval,0),
+        case when type = 'procure' then nullif(size_minimum,0) end,
+        case when type = 'procure' then nullif(size_multiple,0) end,
+        case when type = 'procure' then nullif(size_maximum,0) end,
+        case when type = 'procure' then nullif(fence,0) end,
+        nullif(carrying_cost,0),
+        case when subcategory = 'tool' then 1 end,
         category, subcategory, source
       FROM buffer %s
-      ''' % self.filter_where)
-    for i in self.cursor.fetchall():
-      cnt += 1
-      if i[8] == "procure":
-        b = frepple.buffer_procure(
-          name=i[0], description=i[1], item=frepple.item(name=i[3]), onhand=i[4],
-          category=i[19], subcategory=i[20], source=i[21]
-          )
-        if i[9]:
-          b.leadtime = i[9]
-        if i[10]:
-          b.mininventory = i[10]
-        if i[11]:
-          b.maxinventory = i[11]
-        if i[14]:
-          b.size_minimum = i[14]
-        if i[15]:
-          b.size_multiple = i[15]
-        if i[16]:
-          b.size_maximum = i[16]
-        if i[17]:
-          b.fence = i[17]
-      elif i[8] == "infinite":
-        b = frepple.buffer_infinite(
-          name=i[0], description=i[1], item=frepple.item(name=i[3]), onhand=i[4],
-          category=i[19], subcategory=i[20], source=i[21]
-          )
-      elif not i[8] or i[8] == "default":
-        b = frepple.buffer(
-          name=i[0], description=i[1], item=frepple.item(name=i[3]), onhand=i[4],
-          category=i[19], subcategory=i[20], source=i[21]
-          )
-      else:
-        raise ValueError("Buffer type '%s' not recognized" % i[8])
-      if i[20] == 'tool':
-        b.tool = True
-      if i[2]:
-        b.location = frepple.location(name=i[2])
-      if i[5]:
-        b.minimum = i[5]
-      if i[6]:
-        b.minimum_calendar = frepple.calendar(name=i[6])
-      if i[7]:
-        b.producing = frepple.operation(name=i[7])
-      if i[18]:
-        b.carrying_cost = i[18]
-      if i[12]:
-        b.mininterval = i[12]
-      if i[13]:
-        b.maxinterval = i[13]
+      ''' % self.filter_where
+      )
     print('Loaded %d buffers in %.2f seconds' % (cnt, time() - starttime))
 
 
@@ -378,13 +704,12 @@ class loadData(object):
     print('Importing setup matrix rules...')
     cnt = 0
     starttime = time()
-    self.cursor.execute('''
+    for i in self.rows('''
       SELECT
         setupmatrix_id, priority, fromsetup, tosetup, duration, cost, source
       FROM setuprule %s
       ORDER BY setupmatrix_id, priority DESC
-      ''' % self.filter_where)
-    for i in self.cursor.fetchall():
+      ''' % self.filter_where):
       cnt += 1
       try:
         r = frepple.setupmatrix(name=i[0], source=i[6]).addRule(priority=i[1])
@@ -403,291 +728,175 @@ class loadData(object):
 
   def loadResources(self):
     print('Importing resources...')
-    cnt = 0
     starttime = time()
     Resource.rebuildHierarchy(database=self.database)
-    self.cursor.execute('''
+    # The type column is mapped to the name of the frePPLe resource type.
+    # The capacity fields are only passed to the types that support them.
+    cnt = self.bulkload(
+      frepple.resource,
+      ("name", "type", "description", "maximum",
+       ("maximum_calendar", frepple.calendar), "maxearly",
+       ("location", frepple.location), "cost", "setup",
+       ("setupmatrix", frepple.setupmatrix), "category", "subcategory",
+       ("owner", frepple.resource), "source"),
+      '''
       SELECT
-        name, description, maximum, maximum_calendar_id, location_id, type, cost,
-        maxearly, setup, setupmatrix_id, category, subcategory, owner_id, source
+        name, 'resource_' || coalesce(nullif(type,''), 'default'), description,
+        case when type is null or type in ('', 'default')
+          then nullif(maximum,0) end,
+        case when type is null or type in ('', 'default', 'buckets')
+          then maximum_calendar_id end,
+        case when type is null or type in ('', 'default', 'buckets')
+          then nullif(maxearly,0) end,
+        location_id, nullif(cost,0), nullif(setup,''), setupmatrix_id,
+        category, subcategory, owner_id, source
       FROM %s %s
       ORDER BY lvl ASC, name
-      ''' % (connections[self.cursor.db.alias].ops.quote_name('resource'), self.filter_where) )
-    for i in self.cursor.fetchall():
-      cnt += 1
-      try:
-        if i[5] == "infinite":
-          x = frepple.resource_infinite(
-            name=i[0], description=i[1], category=i[10], subcategory=i[11], source=i[13]
-            )
-        elif i[5] == "buckets":
-          x = frepple.resource_buckets(
-            name=i[0], description=i[1], category=i[10], subcategory=i[11], source=i[13]
-            )
-          if i[3]:
-            x.maximum_calendar = frepple.calendar(name=i[3])
-          if i[7]:
-            x.maxearly = i[7]
-        elif not i[5] or i[5] == "default":
-          x = frepple.resource_default(
-            name=i[0], description=i[1], category=i[10], subcategory=i[11], source=i[13]
-            )
-          if i[3]:
-            x.maximum_calendar = frepple.calendar(name=i[3])
-          if i[7]:
-            x.maxearly = i[7]
-          if i[2]:
-            x.maximum = i[2]
-        else:
-          raise ValueError("Resource type '%s' not recognized" % i[5])
-        if i[4]:
-          x.location = frepple.location(name=i[4])
-        if i[6]:
-          x.cost = i[6]
-        if i[8]:
-          x.setup = i[8]
-        if i[9]:
-          x.setupmatrix = frepple.setupmatrix(name=i[9])
-        if i[12]:
-          x.owner = frepple.resource(name=i[12])
-      except Exception as e:
-        print("Error:", e)
+      ''' % (connections[self.cursor.db.alias].ops.quote_name('resource'), self.filter_where)
+      )
     print('Loaded %d resources in %.2f seconds' % (cnt, time() - starttime))
 
 
   def loadResourceSkills(self):
     print('Importing resource skills...')
-    cnt = 0
     starttime = time()
-    self.cursor.execute('''
+    cnt = self.bulkload(
+      frepple.resourceskill,
+      (("resource", frepple.resource), ("skill", frepple.skill),
+       "effective_start", "effective_end", "priority", "source"),
+      '''
       SELECT
-        resource_id, skill_id, effective_start, effective_end, priority, source
+        resource_id, skill_id, effective_start, effective_end,
+        coalesce(nullif(priority,0),1), source
       FROM resourceskill %s
       ORDER BY skill_id, priority, resource_id
-      ''' % self.filter_where)
-    for i in self.cursor.fetchall():
-      cnt += 1
-      try:
-        cur = frepple.resourceskill(
-          resource=frepple.resource(name=i[0]), skill=frepple.skill(name=i[1]),
-          priority=i[4] or 1, source=i[5]
-          )
-        if i[2]:
-          cur.effective_start = i[2]
-        if i[3]:
-          cur.effective_end = i[3]
-      except Exception as e:
-        print("Error:", e)
+      ''' % self.filter_where
+      )
     print('Loaded %d resource skills in %.2f seconds' % (cnt, time() - starttime))
 
 
   def loadFlows(self):
     print('Importing flows...')
-    cnt = 0
     starttime = time()
     # Note: The sorting of the flows is not really necessary, but helps to make
     # the planning progress consistent across runs and database engines.
-    self.cursor.execute('''
+    cnt = self.bulkload(
+      frepple.flow,
+      (("operation", frepple.operation), ("buffer", frepple.buffer), "quantity",
+       "type", "effective_start", "effective_end", "name", "priority",
+       "search", "source"),
+      '''
       SELECT
-        operation_id, thebuffer_id, quantity, type, effective_start,
-        effective_end, name, priority, search, source
+        operation_id, thebuffer_id, quantity, 'flow_' || type, effective_start,
+        effective_end, nullif(name,''), nullif(priority,0), nullif(search,''), source
       FROM flow
       WHERE (alternate IS NULL OR alternate = '') %s
       ORDER BY operation_id, thebuffer_id
-      ''' % self.filter_and)
-    curbufname = None
-    for i in self.cursor.fetchall():
-      cnt += 1
-      try:
-        if i[1] != curbufname:
-          curbufname = i[1]
-          curbuf = frepple.buffer(name=curbufname)
-        curflow = frepple.flow(operation=frepple.operation(name=i[0]), type="flow_%s" % i[3], buffer=curbuf, quantity=i[2], source=i[9])
-        if i[4]:
-          curflow.effective_start = i[4]
-        if i[5]:
-          curflow.effective_end = i[5]
-        if i[6]:
-          curflow.name = i[6]
-        if i[7]:
-          curflow.priority = i[7]
-        if i[8]:
-          curflow.search = i[8]
-      except Exception as e:
-        print("Error:", e)
-    self.cursor.execute('''
+      ''' % self.filter_and
+      )
+    cnt += self.bulkload(
+      frepple.flow,
+      (("operation", frepple.operation), ("buffer", frepple.buffer), "quantity",
+       "type", "effective_start", "effective_end", "name", "alternate",
+       "priority", "search", "source"),
+      '''
       SELECT
         operation_id, thebuffer_id, quantity, type, effective_start,
-        effective_end, name, alternate, priority, search, source
+        effective_end, nullif(name,''), alternate, nullif(priority,0),
+        nullif(search,''), source
       FROM flow
       WHERE (alternate IS NOT NULL AND alternate <> '') %s
       ORDER BY operation_id, thebuffer_id
-      ''' % self.filter_and)
-    curbufname = None
-    for i in self.cursor.fetchall():
-      cnt += 1
-      try:
-        if i[1] != curbufname:
-          curbufname = i[1]
-          curbuf = frepple.buffer(name=curbufname)
-        curflow = frepple.flow(operation=frepple.operation(name=i[0]), type=i[3], buffer=curbuf, quantity=i[2], source=i[10])
-        if i[4]:
-          curflow.effective_start = i[4]
-        if i[5]:
-          curflow.effective_end = i[5]
-        if i[6]:
-          curflow.name = i[6]
-        if i[7]:
-          curflow.alternate = i[7]
-        if i[8]:
-          curflow.priority = i[8]
-        if i[9]:
-          curflow.search = i[9]
-      except Exception as e:
-        print("Error:", e)
+      ''' % self.filter_and
+      )
     print('Loaded %d flows in %.2f seconds' % (cnt, time() - starttime))
 
 
   def loadLoads(self):
     print('Importing loads...')
-    cnt = 0
     starttime = time()
     # Note: The sorting of the loads is not really necessary, but helps to make
     # the planning progress consistent across runs and database engines.
-    self.cursor.execute('''
+    cnt = self.bulkload(
+      frepple.load,
+      (("operation", frepple.operation), ("resource", frepple.resource),
+       "quantity", "effective_start", "effective_end", "name", "priority",
+       "setup", "search", ("skill", frepple.skill), "source"),
+      '''
       SELECT
-        operation_id, resource_id, quantity, effective_start, effective_end, name,
-        priority, setup, search, skill_id, source
+        operation_id, resource_id, quantity, effective_start, effective_end,
+        nullif(name,''), nullif(priority,0), nullif(setup,''), nullif(search,''),
+        skill_id, source
       FROM resourceload
       WHERE (alternate IS NULL OR alternate = '') %s
       ORDER BY operation_id, resource_id
-      ''' % self.filter_and)
-    curresname = None
-    for i in self.cursor.fetchall():
-      cnt += 1
-      try:
-        if i[1] != curresname:
-          curresname = i[1]
-          curres = frepple.resource(name=curresname)
-        curload = frepple.load(operation=frepple.operation(name=i[0]), resource=curres, quantity=i[2], source=i[10])
-        if i[3]:
-          curload.effective_start = i[3]
-        if i[4]:
-          curload.effective_end = i[4]
-        if i[5]:
-          curload.name = i[5]
-        if i[6]:
-          curload.priority = i[6]
-        if i[7]:
-          curload.setup = i[7]
-        if i[8]:
-          curload.search = i[8]
-        if i[9]:
-          curload.skill = frepple.skill(name=i[9])
-      except Exception as e:
-        print("Error:", e)
-    self.cursor.execute('''
+      ''' % self.filter_and
+      )
+    cnt += self.bulkload(
+      frepple.load,
+      (("operation", frepple.operation), ("resource", frepple.resource),
+       "quantity", "effective_start", "effective_end", "name", "alternate",
+       "priority", "setup", "search", ("skill", frepple.skill), "source"),
+      '''
       SELECT
         operation_id, resource_id, quantity, effective_start, effective_end,
-        name, alternate, priority, setup, search, skill_id, source
+        nullif(name,''), alternate, nullif(priority,0), nullif(setup,''),
+        nullif(search,''), skill_id, source
       FROM resourceload
       WHERE (alternate IS NOT NULL AND alternate <> '') %s
       ORDER BY operation_id, resource_id
-      ''' % self.filter_and)
-    curresname = None
-    for i in self.cursor.fetchall():
-      cnt += 1
-      try:
-        if i[1] != curresname:
-          curresname = i[1]
-          curres = frepple.resource(name=curresname)
-        curload = frepple.load(operation=frepple.operation(name=i[0]), resource=curres, quantity=i[2], source=i[11])
-        if i[3]:
-          curload.effective_start = i[3]
-        if i[4]:
-          curload.effective_end = i[4]
-        if i[5]:
-          curload.name = i[5]
-        if i[6]:
-          curload.alternate = i[6]
-        if i[7]:
-          curload.priority = i[7]
-        if i[8]:
-          curload.setup = i[8]
-        if i[9]:
-          curload.search = i[9]
-        if i[10]:
-          curload.skill = frepple.skill(name=i[10])
-      except Exception as e:
-        print("Error:", e)
+      ''' % self.filter_and
+      )
     print('Loaded %d loads in %.2f seconds' % (cnt, time() - starttime))
 
 
   def loadOperationPlans(self):
     print('Importing operationplans...')
-    cnt = 0
     starttime = time()
-    self.cursor.execute('''
+    cnt = self.bulkload(
+      frepple.operationplan,
+      ("operation", "id", "quantity", "start", "end", "locked", "source"),
+      '''
       SELECT
         operation_id, id, quantity, startdate, enddate, locked, source
       FROM operationplan
       WHERE owner_id IS NULL %s
       ORDER BY id ASC
-      ''' % self.filter_and)
-    for i in self.cursor.fetchall():
-      cnt += 1
-      frepple.operationplan(
-        operation=frepple.operation(name=i[0]),
-        id=i[1], quantity=i[2], start=i[3], end=i[4], source=i[6]
-        ).locked = i[5]
-    self.cursor.execute('''
+      ''' % self.filter_and
+      )
+    cnt += self.bulkload(
+      frepple.operationplan,
+      ("operation", "id", "quantity", "start", "end", "locked",
+       ("owner", frepple.operationplan, "id"), "source"),
+      '''
       SELECT
         operation_id, id, quantity, startdate, enddate, locked, owner_id, source
       FROM operationplan
       WHERE owner_id IS NOT NULL %s
       ORDER BY id ASC
-      ''' % self.filter_and)
-    for i in self.cursor.fetchall():
-      cnt += 1
-      frepple.operationplan(
-        operation=frepple.operation(name=i[0]),
-        id=i[1], quantity=i[2], start=i[3], end=i[4],
-        owner=frepple.operationplan(id=i[6]), source=i[7]
-        ).locked = i[5]
+      ''' % self.filter_and
+      )
     print('Loaded %d operationplans in %.2f seconds' % (cnt, time() - starttime))
 
 
   def loadDemand(self):
     print('Importing demands...')
-    cnt = 0
     starttime = time()
-    self.cursor.execute('''
+    cnt = self.bulkload(
+      frepple.demand,
+      ("name", "due", "quantity", "priority", ("item", frepple.item),
+       ("operation", frepple.operation), ("customer", frepple.customer),
+       ("owner", frepple.demand), "minshipment", "maxlateness",
+       "category", "subcategory", "source"),
+      '''
       SELECT
         name, due, quantity, priority, item_id,
-        operation_id, customer_id, owner_id, minshipment, maxlateness,
+        operation_id, customer_id, owner_id, nullif(minshipment,0), maxlateness,
         category, subcategory, source
       FROM demand
       WHERE (status IS NULL OR status ='open' OR status = 'quote') %s
-      ''' % self.filter_and)
-    for i in self.cursor.fetchall():
-      cnt += 1
-      try:
-        x = frepple.demand(
-          name=i[0], due=i[1], quantity=i[2], priority=i[3],
-          item=frepple.item(name=i[4]), category=i[10], subcategory=i[11], source=i[12]
-          )
-        if i[5]:
-          x.operation = frepple.operation(name=i[5])
-        if i[6]:
-          x.customer = frepple.customer(name=i[6])
-        if i[7]:
-          x.owner = frepple.demand(name=i[7])
-        if i[8]:
-          x.minshipment = i[8]
-        if i[9] is not None:
-          x.maxlateness = i[9]
-      except Exception as e:
-        print("Error:", e)
+      ''' % self.filter_and
+      )
     print('Loaded %d demands in %.2f seconds' % (cnt, time() - starttime))
 
 
@@ -703,32 +912,74 @@ class loadData(object):
     # and cpu time.
     settings.DEBUG = False
 
-    # Create a database connection
-    self.cursor = connections[self.database].cursor()
-
-    # Sequential load of all entities
-    # Some entities could be loaded in parallel threads, but in preliminary tests
-    # we haven't seen a clear performance gain. It is unclear what the limiting
-    # bottleneck is: python or frepple, definitely not the database...
-    self.loadParameter()
-    self.loadCalendars()
-    self.loadCalendarBuckets()
-    self.loadLocations()
-    self.loadCustomers()
-    self.loadOperations()
-    self.loadSuboperations()
-    self.loadItems()
-    self.loadBuffers()
-    self.loadSetupMatrices()
-    self.loadResources()
-    self.loadResourceSkills()
-    self.loadFlows()
-    self.loadLoads()
-    self.loadOperationPlans()
-    self.loadDemand()
-
-    # Close the database connection
-    self.cursor.close()
+    self.stats = dict([ (i[0], [0.0, 0.0, 0.0, 0.0]) for i in self.steps ])
+    self.done = dict([ (i[0], Event()) for i in self.steps ])
+    self.error = None
+    self.since = {}
+    self.resets = {}
+    steps = self.steps
+
+    # An incremental load only updates the objects modified since the
+    # previous load of the database.
+    # The status of the previous load is only kept again when this load
+    # succeeds.
+    previous = self.history.get(self.database)
+    loadData.history = {}
+    if self.incremental:
+      history = self.readHistory()
+      if previous:
+        for table in self.fulltables:
+          if history[table] != previous[table]:
+            print("Table %s has changed: a full reload is required" % table)
+            previous = None
+            break
+      if previous and self.typeChanged(previous):
+        previous = None
+      if not previous:
+        # Start from an empty model
+        frepple.erase(True)
+      else:
+        self.deleteObjects(previous, history)
+        # Objects are updated in place. Some rows are read again if they are
+        # modified at the same time as the previous load.
+        for step, table, cls, key, condition in self.deltatables:
+          if table != 'operationplan' and previous[table][0]:
+            self.since[step] = previous[table][0]
+        deltasteps = ['parameter'] + [ i[0] for i in self.deltatables ]
+        steps = [ i for i in self.steps if i[0] in deltasteps ]
+        for name, method, depends in self.steps:
+          if name not in deltasteps:
+            self.done[name].set()
+
+    # Run the steps of the load.
+    # With multiple threads each step runs in a thread with its own database
+    # connection. The steps are started in the order of their dependencies,
+    # and while a step is creating objects in frePPLe the next steps are
+    # already reading their data from the database.
+    if self.threads > 1:
+      slots = Semaphore(self.threads)
+      workers = []
+      for name, method, depends in steps:
+        slots.acquire()
+        t = Thread(target=self.runStep, args=(name, method, depends, slots))
+        t.start()
+        workers.append(t)
+      for t in workers:
+        t.join()
+    else:
+      for name, method, depends in steps:
+        self.runStep(name, method, depends)
+    if self.error:
+      raise self.error
+    if self.incremental:
+      loadData.history = {self.database: history}
+
+    # Report where the time went.
+    # For the steps creating objects one row at a time, the time spent in
+    # the engine is included in the Python time.
+    print('Load step          DB wait     Python     Engine    Waiting')
+    for name, method, depends in steps:
+      print('%-16s %9.2f  %9.2f  %9.2f  %9.2f' % ((name,) + tuple(self.stats[name])))
 
     # Finalize
     print('Done')
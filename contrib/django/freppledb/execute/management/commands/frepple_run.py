@@ -19,16 +19,65 @@ import os
 from datetime import datetime
 from optparse import make_option
 import subprocess
+try:
+  from urllib import urlencode
+  from urllib2 import urlopen, HTTPError, URLError
+except ImportError:
+  from urllib.parse import urlencode
+  from urllib.request import urlopen
+  from urllib.error import HTTPError, URLError
 
 from django.core.management.base import BaseCommand, CommandError
 from django.db import transaction, DEFAULT_DB_ALIAS
 from django.utils.importlib import import_module
 from django.conf import settings
 
-from freppledb.common.models import User
+from freppledb.common.models import Parameter, User
 from freppledb.execute.models import Task
 
 
+def setEngineEnvironment(database=DEFAULT_DB_ALIAS):
+  '''
+  Prepares the environment variables for running the frePPLe executable.
+  '''
+  os.environ['FREPPLE_DATABASE'] = database
+  os.environ['PATH'] = settings.FREPPLE_HOME + os.pathsep + os.environ['PATH'] + os.pathsep + settings.FREPPLE_APP
+  if os.path.isfile(os.path.join(settings.FREPPLE_HOME, 'libfrepple.so')):
+    os.environ['LD_LIBRARY_PATH'] = settings.FREPPLE_HOME
+  if 'DJANGO_SETTINGS_MODULE' not in os.environ:
+    os.environ['DJANGO_SETTINGS_MODULE'] = 'freppledb.settings'
+  if os.path.exists(os.path.join(settings.FREPPLE_HOME, 'python27.zip')):
+    # For the py2exe executable
+    os.environ['PYTHONPATH'] = os.path.join(settings.FREPPLE_HOME, 'python27.zip') + os.pathsep + os.path.normpath(settings.FREPPLE_APP)
+  else:
+    # Other executables
+    os.environ['PYTHONPATH'] = os.path.normpath(settings.FREPPLE_APP)
+
+
+def sendToEngine(database, command, **kwargs):
+  '''
+  Sends a command to the resident engine of a database, and waits for it to
+  finish.
+  Returns the reply of the engine, or None when no engine is running for
+  the database.
+  '''
+  try:
+    port = Parameter.objects.all().using(database).get(pk='Engine server').value
+  except Parameter.DoesNotExist:
+    return None
+  try:
+    reply = urlopen(
+      "http://127.0.0.1:%s/%s?%s" % (port, command, urlencode(kwargs)),
+      data=b''
+      )
+    return reply.read().decode('utf-8')
+  except HTTPError as e:
+    raise Exception(e.read().decode('utf-8'))
+  except URLError:
+    # The engine isn't running any more
+    return None
+
+
 class Command(BaseCommand):
   option_list = BaseCommand.option_list + (
     make_option(
@@ -123,39 +172,36 @@ class Command(BaseCommand):
       task.save(using=database)
       transaction.commit(using=database)
 
-      # Locate commands.py
-      cmd = None
-      for app in settings.INSTALLED_APPS:
-        mod = import_module(app)
-        if os.path.exists(os.path.join(os.path.dirname(mod.__file__), 'commands.py')):
-          cmd = os.path.join(os.path.dirname(mod.__file__), 'commands.py')
-          break
-      if not cmd:
-        raise Exception("Can't locate commands.py")
-
-      # Prepare environment
-      os.environ['FREPPLE_PLANTYPE'] = str(plantype)
-      os.environ['FREPPLE_CONSTRAINT'] = str(constraint)
-      os.environ['FREPPLE_TASKID'] = str(task.id)
-      os.environ['FREPPLE_DATABASE'] = database
-      os.environ['PATH'] = settings.FREPPLE_HOME + os.pathsep + os.environ['PATH'] + os.pathsep + settings.FREPPLE_APP
-      if os.path.isfile(os.path.join(settings.FREPPLE_HOME, 'libfrepple.so')):
-        os.environ['LD_LIBRARY_PATH'] = settings.FREPPLE_HOME
-      if 'DJANGO_SETTINGS_MODULE' not in os.environ:
-        os.environ['DJANGO_SETTINGS_MODULE'] = 'freppledb.settings'
-      if os.path.exists(os.path.join(settings.FREPPLE_HOME, 'python27.zip')):
-        # For the py2exe executable
-        os.environ['PYTHONPATH'] = os.path.join(settings.FREPPLE_HOME, 'python27.zip') + os.pathsep + os.path.normpath(settings.FREPPLE_APP)
-      else:
-        # Other executables
-        os.environ['PYTHONPATH'] = os.path.normpath(settings.FREPPLE_APP)
-
-      # Execute in foreground
-      ret = subprocess.call(['frepple', cmd])
-      if ret != 0 and ret != 2:
-        # Return code 0 is a successful run
-        # Return code is 2 is a run cancelled by a user. That's shown in the status field.
-        raise Exception('Failed with exit code %d' % ret)
+      # Send the task to the resident engine of the database, if one is
+      # running. It only loads the changes since its previous run.
+      reply = sendToEngine(
+        database, 'run', task=task.id, plantype=plantype,
+        constraint=constraint, env=options['env'] or ''
+        )
+
+      if reply is None:
+        # Locate commands.py
+        cmd = None
+        for app in settings.INSTALLED_APPS:
+          mod = import_module(app)
+          if os.path.exists(os.path.join(os.path.dirname(mod.__file__), 'commands.py')):
+            cmd = os.path.join(os.path.dirname(mod.__file__), 'commands.py')
+            break
+        if not cmd:
+          raise Exception("Can't locate commands.py")
+
+        # Prepare environment
+        os.environ['FREPPLE_PLANTYPE'] = str(plantype)
+        os.environ['FREPPLE_CONSTRAINT'] = str(constraint)
+        os.environ['FREPPLE_TASKID'] = str(task.id)
+        setEngineEnvironment(database)
+
+        # Execute in foreground
+        ret = subprocess.call(['frepple', cmd])
+        if ret != 0 and ret != 2:
+          # Return code 0 is a successful run
+          # Return code is 2 is a run cancelled by a user. That's shown in the status field.
+          raise Exception('Failed with exit code %d' % ret)
 
       # Task update
       task.status = 'Done'
@@ -0,0 +1,83 @@
+#
+# Copyright (C) 2007-2013 by Johan De Taeye, frePPLe bvba
+#
+# This library is free software; you can redistribute it and/or modify it
+# under the terms of the GNU Affero General Public License as published
+# by the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU Affero
+# General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public
+# License along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+import os
+from optparse import make_option
+import subprocess
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS
+from django.conf import settings
+
+from freppledb import VERSION
+from freppledb.execute.management.commands.frepple_run import sendToEngine, setEngineEnvironment
+
+
+class Command(BaseCommand):
+  help = '''Runs a resident frePPLe engine for a database.
+    The engine keeps the model in memory between runs. The frepple_run
+    command sends its tasks to the engine, which only loads the changes in
+    the database since its previous run.
+    '''
+  option_list = BaseCommand.option_list + (
+    make_option(
+      '--database', action='store', dest='database',
+      default=DEFAULT_DB_ALIAS, help='Nominates a specific database to load data from and export results into'
+      ),
+    make_option(
+      '--port', dest='port', type='int', default=0,
+      help='Local port of the engine (default: any free port)'
+      ),
+    make_option(
+      '--stop', action="store_true", dest='stop',
+      default=False, help='Stop the engine running for the database'
+      ),
+  )
+  requires_model_validation = False
+
+  def get_version(self):
+    return VERSION
+
+
+  def handle(self, **options):
+    # Pick up the options
+    if 'database' in options:
+      database = options['database'] or DEFAULT_DB_ALIAS
+    else:
+      database = DEFAULT_DB_ALIAS
+    if not database in settings.DATABASES:
+      raise CommandError("No database settings known for '%s'" % database )
+
+    # Stop the engine
+    if options['stop']:
+      if sendToEngine(database, 'stop') is None:
+        raise CommandError("No engine running for database '%s'" % database)
+      return
+
+    # Check if an engine already exists
+    if sendToEngine(database, 'ping') is not None:
+      raise CommandError("Engine already running for database '%s'" % database)
+
+    # Prepare environment
+    os.environ['FREPPLE_ENGINEPORT'] = str(options['port'] or 0)
+    setEngineEnvironment(database)
+
+    # Execute in foreground
+    cmd = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(__file__))), 'server.py')
+    ret = subprocess.call(['frepple', cmd])
+    if ret != 0:
+      raise CommandError('Failed with exit code %d' % ret)
@@ -0,0 +1,164 @@
+#
+# Copyright (C) 2007-2013 by Johan De Taeye, frePPLe bvba
+#
+# This library is free software; you can redistribute it and/or modify it
+# under the terms of the GNU Affero General Public License as published
+# by the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU Affero
+# General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public
+# License along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+r'''
+Runs the frePPLe engine as a resident server for a database.
+
+The code in this file is executed NOT by Django, but by the embedded Python
+interpreter from the frePPLe engine.
+
+The model stays in memory between runs, and only the changes in the database
+are loaded for every run. The server listens on a local port for the
+following commands:
+  - /load: Loads the changes in the database since the previous load.
+  - /plan: Replans the clusters with changes since the previous plan.
+  - /export: Exports the changes in the plan to the database.
+  - /run: Loads the changes, generates the plan and exports its changes.
+  - /ping: Only replies, to check whether the server is running.
+  - /stop: Stops the server.
+The arguments of a command are passed in the query string:
+  - task: Identifier of the task to report the progress on.
+  - plantype: Plan type.
+  - constraint: Constraints considered in the plan.
+  - env: A comma separated list of extra settings passed as environment
+    variables.
+  - clusters: A comma separated list of clusters to replan with the plan
+    command, whether they changed or not.
+The commands are executed one at a time, in the order they are received.
+The server replies "Done" when the command finished, and reports an error
+otherwise.
+
+The port of the server is registered in the parameter "Engine server" of the
+database. The port is picked from the environment variable FREPPLE_ENGINEPORT,
+and any free port is used if the variable isn't set.
+'''
+from __future__ import print_function
+from datetime import datetime
+import os
+try:
+  from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+  from urlparse import urlparse, parse_qs
+except ImportError:
+  from http.server import BaseHTTPRequestHandler, HTTPServer
+  from urllib.parse import urlparse, parse_qs
+
+from django.db import DEFAULT_DB_ALIAS
+
+from freppledb.common.models import Parameter
+from freppledb.execute import commands
+from freppledb.execute.load import loadData
+
+
+class EngineHandler(BaseHTTPRequestHandler):
+
+  def do_POST(self):
+    url = urlparse(self.path)
+    command = url.path.strip('/')
+    args = dict([ (k, v[0]) for k, v in parse_qs(url.query).items() ])
+    if command not in ('load', 'plan', 'export', 'run', 'ping', 'stop'):
+      self.reply(404, "Unknown command '%s'" % command)
+      return
+    print("\nStart command '%s' at %s" % (command, datetime.now().strftime("%H:%M:%S")))
+
+    # Prepare the environment of the command
+    environ = dict(os.environ)
+    if 'task' in args:
+      os.environ['FREPPLE_TASKID'] = args['task']
+    elif 'FREPPLE_TASKID' in os.environ:
+      del os.environ['FREPPLE_TASKID']
+    if 'plantype' in args:
+      os.environ['FREPPLE_PLANTYPE'] = args['plantype']
+    if 'constraint' in args:
+      os.environ['FREPPLE_CONSTRAINT'] = args['constraint']
+    if args.get('env', None):
+      for i in args['env'].split(','):
+        j = i.split('=')
+        if len(j) == 1:
+          os.environ[j[0]] = '1'
+        else:
+          os.environ[j[0]] = j[1]
+    commands.task = None
+
+    # Execute the command
+    try:
+      if command == 'load':
+        loadData(database=self.server.database, incremental=True).run()
+      elif command == 'plan':
+        if args.get('clusters', None):
+          commands.createPlan(self.server.database, clusters=[ int(i) for i in args['clusters'].split(',') ])
+        else:
+          commands.createPlan(self.server.database, incremental=True)
+      elif command == 'export':
+        commands.exportPlan(self.server.database, differential=True)
+      elif command == 'run':
+        commands.runPlan(self.server.database, incremental=True)
+      elif command == 'stop':
+        self.server.stopped = True
+      self.reply(200, "Done")
+    except SystemExit:
+      # Raised when the user cancels the task
+      self.reply(200, "Cancelled")
+    except Exception as e:
+      print("Error: Command '%s' failed: %s" % (command, e))
+      self.reply(500, str(e))
+    finally:
+      os.environ.clear()
+      os.environ.update(environ)
+    print("Finished command '%s' at %s" % (command, datetime.now().strftime("%H:%M:%S")))
+
+
+  def reply(self, code, message):
+    self.send_response(code)
+    self.send_header('Content-Type', 'text/plain; charset=utf-8')
+    self.end_headers()
+    self.wfile.write(message.encode('utf-8'))
+
+
+  def log_message(self, format, *args):
+    # Write the requests to the log file of the engine rather than stderr
+    print("%s - %s" % (self.log_date_time_string(), format % args))
+
+
+def runServer(database=DEFAULT_DB_ALIAS, port=0):
+  '''
+  Serves commands on a local port till the stop command is received.
+  '''
+  server = HTTPServer(('127.0.0.1', port), EngineHandler)
+  server.database = database
+  server.stopped = False
+  param = Parameter.objects.all().using(database).get_or_create(pk='Engine server')[0]
+  param.value = str(server.server_address[1])
+  param.save(using=database)
+  print("Engine server for database '%s' listening on port %s" % (database, param.value))
+  try:
+    while not server.stopped:
+      server.handle_request()
+  finally:
+    Parameter.objects.all().using(database).filter(pk='Engine server').delete()
+    server.server_close()
+  print("Engine server stopped")
+
+
+if __name__ == "__main__":
+  # Select database
+  try:
+    db = os.environ['FREPPLE_DATABASE'] or DEFAULT_DB_ALIAS
+  except:
+    db = DEFAULT_DB_ALIAS
+
+  commands.printWelcome(prefix='frepple_engine', database=db)
+  runServer(db, int(os.environ.get('FREPPLE_ENGINEPORT', 0)))
@@ -92,6 +92,12 @@ class LibraryModel
   */
 class Calendar : public HasName<Calendar>, public HasSource
 {
+    friend class Location;
+    friend class Buffer;
+    friend class Resource;
+    friend class ResourceBuckets;
+    friend class CalendarDouble;
+
   public:
     class BucketIterator; // Forward declaration
     class EventIterator; // Forward declaration
@@ -158,7 +164,8 @@ class Calendar : public HasName<Calendar>, public HasSource
           * offset array. */
         short offsetcounter;
 
-        /** Updates the offsets data structure. */
+        /** Updates the offsets data structure, and marks the index of the
+          * calendar for a rebuild. */
         DECLARE_EXPORT void updateOffsets();
 
         /** Increments an iterator to the next change event.<br>
@@ -181,7 +188,7 @@ class Calendar : public HasName<Calendar>, public HasSource
       protected:
         /** Constructor. */
         Bucket(Calendar *c, Date start, Date end, int ident=INT_MIN, int priority=0) :
-          startdate(start), enddate(end), nextBucket(NULL),
+          id(INT_MIN), startdate(start), enddate(end), nextBucket(NULL),
           prevBucket(NULL), priority(priority), days(127), starttime(0L),
           endtime(86400L), cal(c)
         {
@@ -302,7 +309,7 @@ class Calendar : public HasName<Calendar>, public HasSource
 
     /** Default constructor. */
     explicit DECLARE_EXPORT Calendar(const string& n) :
-      HasName<Calendar>(n), firstBucket(NULL) {}
+      HasName<Calendar>(n), firstBucket(NULL), recomputeIndex(true) {}
 
     /** Destructor, which cleans up the buckets too and all references to the
       * calendar from the core model.
@@ -441,6 +448,45 @@ class Calendar : public HasName<Calendar>, public HasSource
       * linked list. */
     Bucket* firstBucket;
 
+    /** The buckets of the calendar, indexed by their identifier. */
+    map<int, Bucket*> bucketIds;
+
+    /** Flags whether the date index of the buckets needs to be rebuilt.<br>
+      * The flag is set by every change to the buckets, and the index is
+      * rebuilt on the next call to findBucket().
+      */
+    mutable bool recomputeIndex;
+
+    /** Sorted list of all dates where a bucket starts or ends. Between two
+      * consecutive dates the same buckets are effective. */
+    mutable vector<Date> indexDates;
+
+    /** Position in the indexBuckets vector of the first bucket effective
+      * from each date in the indexDates vector. */
+    mutable vector<size_t> indexStart;
+
+    /** The buckets effective from each date in the indexDates vector,
+      * sorted by priority.<br>
+      * The list stops at the first bucket that is continuously effective,
+      * since buckets with a lower priority will never be selected.
+      */
+    mutable vector<Bucket*> indexBuckets;
+
+    /** Rebuilds the date index of the buckets. */
+    DECLARE_EXPORT void buildIndex() const;
+
+    /** Locations using this calendar as their availability calendar. */
+    set<Location*> locations;
+
+    /** Buffers using this calendar as their minimum calendar. */
+    set<Buffer*> minimumBuffers;
+
+    /** Buffers using this calendar as their maximum calendar. */
+    set<Buffer*> maximumBuffers;
+
+    /** Resources using this calendar as their maximum calendar. */
+    set<Resource*> maximumResources;
+
     /** This is the factory method used to generate new buckets. Each subclass
       * should provide an override for this function. */
     virtual Bucket* createNewBucket(Date start, Date end, int id=1, int priority=0)
@@ -962,8 +1008,11 @@ class Plannable : public HasProblems, public Solvable
 {
   public:
     /** Constructor. */
-    Plannable() : useProblemDetection(true), changed(true)
-    {anyChange = true;}
+    Plannable() : useProblemDetection(true), changed(true), replan(false)
+    {registerChange(this);}
+
+    /** Destructor. */
+    DECLARE_EXPORT ~Plannable();
 
     /** Specify whether this entity reports problems. */
     DECLARE_EXPORT void setDetectProblems(bool b);
@@ -971,17 +1020,51 @@ class Plannable : public HasProblems, public Solvable
     /** Returns whether or not this object needs to detect problems. */
     bool getDetectProblems() const {return useProblemDetection;}
 
-    /** Loops through all plannable objects and updates their problems if
-      * required. */
+    /** Updates the problems of all plannable objects that changed since the
+      * previous run.<br>
+      * The changed objects are registered in a list when they are marked as
+      * changed, which avoids a scan of the complete model. When many objects
+      * changed, the list is split in equal parts which are evaluated in
+      * parallel threads.
+      */
     static DECLARE_EXPORT void computeProblems();
 
+    /** Returns the number of problem detection runs. */
+    static unsigned long getDetectionRuns() {return detectionRuns;}
+
+    /** Returns the total number of objects evaluated by the problem
+      * detection runs. */
+    static unsigned long getDetectionEntities() {return detectionEntities;}
+
+    /** Returns the total wall clock time in seconds spent in the problem
+      * detection runs. */
+    static double getDetectionTime() {return detectionTime;}
+
     /** See if this entity has changed since the last problem
       * problem detection run. */
     bool getChanged() const {return changed;}
 
     /** Mark that this entity has been updated and that the problem
       * detection needs to be redone. */
-    void setChanged(bool b = true) {changed=b; if (b) anyChange=true;}
+    void setChanged(bool b = true)
+    {
+      if (b && (!changed || !replan)) registerChange(this);
+      changed = b;
+      if (b) anyChange = true;
+    }
+
+    /** Returns the clusters with an entity that changed since the cluster
+      * was last planned.<br>
+      * These changes are tracked apart from the changed flag, which the
+      * problem detection resets. They are only reset by the solver when it
+      * plans the clusters, with the method resetReplan.
+      */
+    static DECLARE_EXPORT set<unsigned int> getReplanClusters();
+
+    /** Marks the entities of a set of clusters as planned.<br>
+      * Entities that don't belong to a cluster are reset as well.
+      */
+    static DECLARE_EXPORT void resetReplan(const set<unsigned int>&);
 
     /** Implement the pure virtual function from the HasProblem class. */
     Plannable* getEntity() const {return const_cast<Plannable*>(this);}
@@ -997,6 +1080,10 @@ class Plannable : public HasProblems, public Solvable
       * detection run. */
     bool changed;
 
+    /** Stores whether this entity has been updated since its cluster was
+      * last planned. */
+    bool replan;
+
     /** Marks whether any entity at all has changed its status since the last
       * problem detection round.
       */
@@ -1007,6 +1094,24 @@ class Plannable : public HasProblems, public Solvable
       * environment.
       */
     static DECLARE_EXPORT bool computationBusy;
+
+    /** Objects marked as changed since the last problem detection run. */
+    static DECLARE_EXPORT set<Plannable*> changedEntities;
+
+    /** Objects marked as changed since their cluster was last planned. */
+    static DECLARE_EXPORT set<Plannable*> replanEntities;
+
+    /** Number of problem detection runs. */
+    static DECLARE_EXPORT unsigned long detectionRuns;
+
+    /** Number of objects evaluated by the problem detection runs. */
+    static DECLARE_EXPORT unsigned long detectionEntities;
+
+    /** Wall clock time spent in the problem detection runs. */
+    static DECLARE_EXPORT double detectionTime;
+
+    /** Adds an object to the list of changed objects. */
+    static DECLARE_EXPORT void registerChange(Plannable*);
 };
 
 
@@ -1035,6 +1140,15 @@ class HasLevel
       */
     static DECLARE_EXPORT bool recomputeLevels;
 
+    /** Flags whether the levels and clusters of all entities need to be
+      * recomputed, rather than only those of the changed clusters.
+      */
+    static DECLARE_EXPORT bool recomputeAll;
+
+    /** Flags whether the demands need to be assigned to their clusters again.
+      */
+    static DECLARE_EXPORT bool recomputeDemands;
+
     /** This flag is set to true during the computation of the levels. It is
       * required to ensure safe access to the level information in a
       * multi-threaded environment.
@@ -1053,38 +1167,113 @@ class HasLevel
       */
     short lvl;
 
+    /** Number of times the level search visited this entity during the
+      * current search pass.
+      */
+    short visitCount;
+
+    /** Search pass during which the level search last visited this entity.
+      */
+    unsigned long visitPass;
+
     /** Stores the cluster number of the current entity. */
     unsigned int cluster;
 
+    /** Counter of the search passes of the level computation. */
+    static DECLARE_EXPORT unsigned long numberOfPasses;
+
+    /** Buffers of each cluster, indexed by the cluster number. */
+    static DECLARE_EXPORT vector< vector<Buffer*> > clusterBuffers;
+
+    /** Resources of each cluster, indexed by the cluster number. */
+    static DECLARE_EXPORT vector< vector<Resource*> > clusterResources;
+
+    /** Operations of each cluster, indexed by the cluster number. */
+    static DECLARE_EXPORT vector< vector<Operation*> > clusterOperations;
+
+    /** Demands of each cluster, indexed by the cluster number. */
+    static DECLARE_EXPORT vector< vector<Demand*> > clusterDemands;
+
+    /** Maximum level of each cluster, indexed by the cluster number. */
+    static DECLARE_EXPORT vector<unsigned short> clusterLevels;
+
+    /** Buffers created or linked differently since the last computation. */
+    static DECLARE_EXPORT set<HasLevel*> changedBuffers;
+
+    /** Resources created or linked differently since the last computation. */
+    static DECLARE_EXPORT set<HasLevel*> changedResources;
+
+    /** Operations created or linked differently since the last computation. */
+    static DECLARE_EXPORT set<HasLevel*> changedOperations;
+
+    /** Entities deleted since the last computation.<br>
+      * The pointers are only compared, never dereferenced.
+      */
+    static DECLARE_EXPORT set<HasLevel*> deletedMembers;
+
+    /** Clusters which lost a member since the last computation. */
+    static DECLARE_EXPORT set<unsigned int> changedClusters;
+
+    /** Computes the levels and clusters of a subset of the model.<br>
+      * The subset consists of the operations, buffers and resources passed
+      * as arguments, sorted by name. It must include all entities linked to
+      * them. The last argument holds the cluster numbers which are free for
+      * reuse. Cluster numbers which remain unused are filled with the
+      * highest clusters.
+      */
+    static void computeSubset(const vector<Operation*>&,
+      const vector<Buffer*>&, const vector<Resource*>&, vector<unsigned int>&);
+
+    /** Assigns all demands to the cluster of their delivery operation. */
+    static void assignDemands();
+
   protected:
     /** Default constructor. The initial level is -1 and basically indicates
       * that this HasHierarchy (either Operation, Buffer or Resource) is not
-      * being used at all...
+      * being used at all...<br>
+      * The constructor of the subclass registers the new entity, which
+      * triggers the recomputation to add it to a cluster.
       */
-    HasLevel() : lvl(0), cluster(0) {}
+    HasLevel() : lvl(0), visitCount(0), visitPass(0), cluster(0) {}
 
     /** Copy constructor. Since the characterictics of the new object are the
       * same as the original, the level and cluster are also the same.
-      * No recomputation is required.
+      * The recomputation of all clusters is still triggered to add the new
+      * object to the member list of its cluster.
       */
-    HasLevel(const HasLevel& o) : lvl(o.lvl), cluster(o.cluster) {}
+    HasLevel(const HasLevel& o)
+      : lvl(o.lvl), visitCount(0), visitPass(0), cluster(o.cluster)
+    {recomputeAll = true; recomputeLevels = true;}
 
     /** Destructor. Deleting a HasLevel object triggers recomputation of the
-      * level and cluster computation, since the network now has changed.
+      * level and cluster computation of its cluster, since the network now
+      * has changed.
       */
-    ~HasLevel() {recomputeLevels = true;}
+    DECLARE_EXPORT ~HasLevel();
 
-    /** This function recomputes all levels in the model.
+    /** This function recomputes the levels and clusters in the model.
       * It is called automatically when the getLevel or getCluster() function
       * on a Buffer, Resource or Operation are called while the
       * "recomputeLevels" flag is set.
       * Right, this is an example of a 'lazy' algorithm: only compute the
-      * information when it is required. Note however that the computation
-      * is triggered over the complete model, not a subset...
-      * The runtime of the algorithm is pretty much linear with the total
-      * number of operations in the model. The cluster size also has some
-      * (limited) impact on the performance: a network with larger cluster
-      * size will take longer to analyze.
+      * information when it is required.<br>
+      * The computation is incremental. Only the clusters of the entities
+      * created, deleted or linked differently since the previous computation
+      * are analyzed again, together with the new entities. Clusters which
+      * merge or split are thus handled correctly, while the levels and
+      * clusters of all other entities are left untouched. The cluster numbers
+      * released by the recomputed clusters are reused, and the highest
+      * cluster numbers are moved into the remaining gaps to keep the
+      * numbering dense.<br>
+      * The first computation and the computation after a change which can't
+      * be localized analyze the complete model.
+      * The runtime of the algorithm is pretty much linear with the number of
+      * operations analyzed. The cluster size also has some (limited) impact
+      * on the performance: a network with larger cluster size will take
+      * longer to analyze.<br>
+      * The computation also builds the list of buffers, resources, operations
+      * and demands of each cluster. Code working on a single cluster uses
+      * these lists rather than filtering all entities of the model.
       * @exception LogicException Generated when there are too many clusters in
       *     your model. The maximum limit is USHRT_MAX, i.e. the greatest
       *     number that can be stored in a variable of type "unsigned short".
@@ -1112,6 +1301,34 @@ class HasLevel
       return numberOfClusters;
     }
 
+    /** Returns a copy of the buffers of a cluster, sorted by name.<br>
+      * If not up to date the recomputation will be triggered.
+      */
+    static DECLARE_EXPORT vector<Buffer*> getClusterBuffers(unsigned int);
+
+    /** Returns a copy of the resources of a cluster, sorted by name.<br>
+      * If not up to date the recomputation will be triggered.
+      */
+    static DECLARE_EXPORT vector<Resource*> getClusterResources(unsigned int);
+
+    /** Returns a copy of the operations of a cluster, sorted by name.<br>
+      * If not up to date the recomputation will be triggered.
+      */
+    static DECLARE_EXPORT vector<Operation*> getClusterOperations(unsigned int);
+
+    /** Returns a copy of the demands of a cluster, sorted by name.<br>
+      * The cluster of a demand is the cluster of its delivery operation.
+      * Demands without delivery operation belong to cluster 0.<br>
+      * If not up to date the recomputation will be triggered.
+      */
+    static DECLARE_EXPORT vector<Demand*> getClusterDemands(unsigned int);
+
+    /** Python method returning the members of a list of clusters.<br>
+      * The result is a tuple with a list of buffers, a list of resources, a
+      * list of operations and a list of demands.
+      */
+    static PyObject* clusterMembers(PyObject*, PyObject*);
+
     /** Return the level (and recompute first if required). */
     short getLevel() const
     {
@@ -1128,10 +1345,40 @@ class HasLevel
 
     /** This function should be called when something is changed in the network
       * structure. The notification sets a flag, but does not immediately
-      * trigger the recomputation.
+      * trigger the recomputation.<br>
+      * The next computation will analyze the complete model. When the change
+      * concerns the links of a specific buffer, resource or operation, the
+      * other variants of this function are preferred.
+      * @see computeLevels
+      */
+    static void triggerLazyRecomputation()
+    {recomputeAll = true; recomputeLevels = true;}
+
+    /** This function should be called when an operation is created, or when
+      * a flow, load, suboperation or superoperation is added to or removed
+      * from it. Only the cluster of the operation will be recomputed.
+      * @see computeLevels
+      */
+    static DECLARE_EXPORT void triggerLazyRecomputation(Operation*);
+
+    /** This function should be called when a buffer is created, or when a
+      * flow is added to or removed from it. Only the cluster of the buffer
+      * will be recomputed.
+      * @see computeLevels
+      */
+    static DECLARE_EXPORT void triggerLazyRecomputation(Buffer*);
+
+    /** This function should be called when a resource is created, or when a
+      * load is added to or removed from it. Only the cluster of the resource
+      * will be recomputed.
       * @see computeLevels
       */
-    static void triggerLazyRecomputation() {recomputeLevels = true;}
+    static DECLARE_EXPORT void triggerLazyRecomputation(Resource*);
+
+    /** This function should be called when the delivery operation of a
+      * demand changes. Only the demands are assigned to their clusters again.
+      */
+    static void triggerDemandRecomputation() {recomputeDemands = true;}
 };
 
 
@@ -1143,6 +1390,10 @@ class HasLevel
   */
 class Location : public HasHierarchy<Location>, public HasDescription
 {
+    friend class Buffer;
+    friend class Resource;
+    friend class Operation;
+
   public:
     /** Constructor. */
     explicit DECLARE_EXPORT Location(const string& n) :
@@ -1158,7 +1409,12 @@ class Location : public HasHierarchy<Location>, public HasDescription
     CalendarDouble *getAvailable() const {return available;}
 
     /** Updates the availability calendar of the location. */
-    void setAvailable(CalendarDouble* b) {available = b;}
+    void setAvailable(CalendarDouble* b)
+    {
+      if (available) available->locations.erase(this);
+      available = b;
+      if (b) b->locations.insert(this);
+    }
 
     DECLARE_EXPORT void writeElement(XMLOutput*, const Keyword&, mode=DEFAULT) const;
     DECLARE_EXPORT void beginElement(XMLInput&, const Attribute&);
@@ -1176,6 +1432,15 @@ class Location : public HasHierarchy<Location>, public HasDescription
       * applies to all operations, resources and buffers using this location.
       */
     CalendarDouble* available;
+
+    /** Buffers at this location. */
+    set<Buffer*> buffers;
+
+    /** Resources at this location. */
+    set<Resource*> resources;
+
+    /** Operations at this location. */
+    set<Operation*> operations;
 };
 
 
@@ -1199,6 +1464,8 @@ class LocationDefault : public Location
   */
 class Customer : public HasHierarchy<Customer>, public HasDescription
 {
+    friend class Demand;
+
   public:
     DECLARE_EXPORT void writeElement(XMLOutput*, const Keyword&, mode=DEFAULT) const;
     DECLARE_EXPORT void beginElement(XMLInput&, const Attribute&);
@@ -1217,6 +1484,10 @@ class Customer : public HasHierarchy<Customer>, public HasDescription
     virtual const MetaClass& getType() const {return *metadata;}
     static DECLARE_EXPORT const MetaCategory* metadata;
     static int initialize();
+
+  private:
+    /** Demands of this customer. */
+    set<Demand*> demands;
 };
 
 
@@ -1250,13 +1521,16 @@ class Operation : public HasName<Operation>,
     friend class OperationRouting;
     friend class OperationAlternate;
     friend class OperationSplit;
+    friend class Item;
+    friend class Buffer;
+    friend class Demand;
 
   protected:
     /** Constructor. Don't use it directly. */
     explicit DECLARE_EXPORT Operation(const string& str) :
       HasName<Operation>(str), loc(NULL), size_minimum(1.0), size_multiple(0.0),
       size_maximum(DBL_MAX), cost(0.0), hidden(false), first_opplan(NULL),
-      last_opplan(NULL) {}
+      last_opplan(NULL) {HasLevel::triggerLazyRecomputation(this);}
 
     /** Extra logic called when instantiating an operationplan.<br>
       * When the function returns false the creation of the operationplan
@@ -1402,7 +1676,12 @@ class Operation : public HasName<Operation>,
 
     /** Updates the location of the operation, which is used to model the
       * working hours and holidays. */
-    void setLocation(Location* l) {loc = l;}
+    void setLocation(Location* l)
+    {
+      if (loc) loc->operations.erase(this);
+      loc = l;
+      if (l) l->operations.insert(this);
+    }
 
     /** Returns an reference to the list of flows. */
     const flowlist& getFlows() const {return flowdata;}
@@ -1502,7 +1781,12 @@ class Operation : public HasName<Operation>,
 
     /** Register a super-operation, i.e. an operation having this one as a
       * sub-operation. */
-    void addSuperOperation(Operation * o) {superoplist.push_front(o);}
+    void addSuperOperation(Operation * o)
+    {
+      superoplist.push_front(o);
+      HasLevel::triggerLazyRecomputation(this);
+      HasLevel::triggerLazyRecomputation(o);
+    }
 
     /** Removes a sub-operation from the list. This method will need to be
       * overridden by all operation types that acts as a super-operation. */
@@ -1545,6 +1829,15 @@ class Operation : public HasName<Operation>,
       */
     Location* loc;
 
+    /** Items using this operation as their delivery operation. */
+    set<Item*> deliveryItems;
+
+    /** Demands using this operation as their delivery operation. */
+    set<Demand*> deliveryDemands;
+
+    /** Buffers using this operation as their producing operation. */
+    set<Buffer*> producedBuffers;
+
     /** Represents the time between this operation and a next one. */
     TimePeriod post_time;
 
@@ -1965,6 +2258,12 @@ class OperationPlan
     /** Returns the start and end date of this operationplan. */
     const DateRange & getDates() const {return dates;}
 
+    /** Returns the start date of this operationplan. */
+    Date getStart() const {return dates.getStart();}
+
+    /** Returns the end date of this operationplan. */
+    Date getEnd() const {return dates.getEnd();}
+
     /** Return true if the operationplan is redundant, ie all material
       * it produces is not used at all.<br>
       * If the optional argument is false (which is the default value), we
@@ -2087,8 +2386,8 @@ class OperationPlan
 
     /** Searches for an OperationPlan with a given identifier.<br>
       * Returns a NULL pointer if no such OperationPlan can be found.<br>
-      * The method is of complexity O(n), i.e. involves a LINEAR search through
-      * the existing operationplans, and can thus be quite slow in big models.<br>
+      * The method looks up the identifier in an index of all active
+      * operationplans, and is of complexity O(log n).<br>
       * The method is O(1), i.e. constant time regardless of the model size,
       * when the parameter passed is bigger than the operationplan counter.
       */
@@ -2114,6 +2413,15 @@ class OperationPlan
     virtual size_t getSize() const
     {return sizeof(OperationPlan) + getSource().size();}
 
+    /** Allocates the memory of an operationplan from a memory pool. */
+    static void* operator new(size_t sz) {return pool->alloc(sz);}
+
+    /** Returns the memory of an operationplan to its memory pool. */
+    static void operator delete(void* p) {MemoryPool::release(p);}
+
+    /** Memory pool of the operationplans. */
+    static DECLARE_EXPORT MemoryPool* pool;
+
     /** Handles the persistence of operationplan objects. */
     static DECLARE_EXPORT void writer(const MetaCategory*, XMLOutput*);
 
@@ -2220,6 +2528,14 @@ class OperationPlan
       */
     static DECLARE_EXPORT unsigned long counterMin;
 
+    /** Index of the active operationplans on their identifier.<br>
+      * An operationplan is registered when its identifier is assigned or when
+      * it is inserted in the list of its operation, and unregistered when
+      * it is removed from that list.
+      * @see findId()
+      */
+    static DECLARE_EXPORT map<unsigned long, OperationPlan*> idIndex;
+
     /** Pointer to the demand.<br>
       * Only delivery operationplans have this field set. The field is NULL
       * for all other operationplans.
@@ -2509,7 +2825,12 @@ class OperationRouting : public Operation
 
     /** Remove a step from a routing. */
     void removeSubOperation(Operation *o)
-    {steps.remove(o); o->superoplist.remove(this);}
+    {
+      steps.remove(o);
+      o->superoplist.remove(this);
+      HasLevel::triggerLazyRecomputation(this);
+      HasLevel::triggerLazyRecomputation(o);
+    }
 
     /** A operation of this type enforces the following rules on its
       * operationplans:
@@ -2847,6 +3168,9 @@ class OperationAlternate : public Operation
   */
 class Item : public HasHierarchy<Item>, public HasDescription
 {
+    friend class Buffer;
+    friend class Demand;
+
   public:
     /** Constructor. Don't use this directly! */
     explicit DECLARE_EXPORT Item(const string& str) :
@@ -2873,7 +3197,14 @@ class Item : public HasHierarchy<Item>, public HasDescription
       * If some demands have already been planned using the old delivery
       * operation they are left untouched and won't be replanned.
       */
-    void setOperation(Operation* o) {deliveryOperation = o;}
+    void setOperation(Operation* o)
+    {
+      if (deliveryOperation) deliveryOperation->deliveryItems.erase(this);
+      deliveryOperation = o;
+      if (o) o->deliveryItems.insert(this);
+      // The demands of the item can move to another cluster
+      HasLevel::triggerDemandRecomputation();
+    }
 
     /** Return the selling price of the item.<br>
       * The default value is 0.0.
@@ -2908,6 +3239,12 @@ class Item : public HasHierarchy<Item>, public HasDescription
 
     /** Selling price of the item. */
     double price;
+
+    /** Buffers storing this item. */
+    set<Buffer*> buffers;
+
+    /** Demands requesting this item. */
+    set<Demand*> demands;
 };
 
 
@@ -2945,7 +3282,8 @@ class Buffer : public HasHierarchy<Buffer>, public HasLevel,
     explicit DECLARE_EXPORT Buffer(const string& str) :
       HasHierarchy<Buffer>(str), hidden(false), producing_operation(NULL),
       loc(NULL), it(NULL), min_val(0), max_val(default_max), min_cal(NULL),
-      max_cal(NULL), min_interval(-1), carrying_cost(0.0), tool(false) {}
+      max_cal(NULL), min_interval(-1), carrying_cost(0.0), tool(false)
+    {HasLevel::triggerLazyRecomputation(this);}
 
     /** Returns the operation that is used to supply extra supply into this
       * buffer. */
@@ -2954,19 +3292,35 @@ class Buffer : public HasHierarchy<Buffer>, public HasLevel,
     /** Updates the operation that is used to supply extra supply into this
       * buffer. */
     void setProducingOperation(Operation* o)
-    {producing_operation = o; setChanged();}
+    {
+      if (producing_operation) producing_operation->producedBuffers.erase(this);
+      producing_operation = o;
+      if (o) o->producedBuffers.insert(this);
+      setChanged();
+    }
 
     /** Returns the item stored in this buffer. */
     Item* getItem() const {return it;}
 
     /** Updates the Item stored in this buffer. */
-    void setItem(Item* i) {it = i; setChanged();}
+    void setItem(Item* i)
+    {
+      if (it) it->buffers.erase(this);
+      it = i;
+      if (i) i->buffers.insert(this);
+      setChanged();
+    }
 
     /** Returns the Location of this buffer. */
     Location* getLocation() const {return loc;}
 
     /** Updates the location of this buffer. */
-    void setLocation(Location* i) {loc = i;}
+    void setLocation(Location* i)
+    {
+      if (loc) loc->buffers.erase(this);
+      loc = i;
+      if (i) i->buffers.insert(this);
+    }
 
     /** Returns the minimum inventory level. */
     double getMinimum() const {return min_val;}
@@ -3740,6 +4094,15 @@ class FlowPlan : public TimeLine<FlowPlan>::EventChangeOnhand, public PythonExte
     /** Constructor. */
     explicit DECLARE_EXPORT FlowPlan(OperationPlan*, const Flow*);
 
+    /** Allocates the memory of a flowplan from a memory pool. */
+    static void* operator new(size_t sz) {return pool->alloc(sz);}
+
+    /** Returns the memory of a flowplan to its memory pool. */
+    static void operator delete(void* p) {MemoryPool::release(p);}
+
+    /** Memory pool of the flowplans. */
+    static DECLARE_EXPORT MemoryPool* pool;
+
     /** Returns the flow of which this is an plan instance. */
     const Flow* getFlow() const {return fl;}
 
@@ -4141,7 +4504,11 @@ class Resource : public HasHierarchy<Resource>,
     /** Constructor. */
     explicit Resource(const string& str) : HasHierarchy<Resource>(str),
       size_max_cal(NULL), size_max(0), loc(NULL), cost(0.0), hidden(false), maxearly(defaultMaxEarly),
-      setupmatrix(NULL) { setMaximum(1); };
+      setupmatrix(NULL)
+    {
+      setMaximum(1);
+      HasLevel::triggerLazyRecomputation(this);
+    };
 
     /** Destructor. */
     virtual DECLARE_EXPORT ~Resource();
@@ -4212,7 +4579,12 @@ class Resource : public HasHierarchy<Resource>,
     Location* getLocation() const {return loc;}
 
     /** Updates the location of this resource. */
-    void setLocation(Location* i) {loc = i;}
+    void setLocation(Location* i)
+    {
+      if (loc) loc->resources.erase(this);
+      loc = i;
+      if (i) i->resources.insert(this);
+    }
 
     virtual void solve(Solver &s, void* v = NULL) const {s.solve(this,v);}
 
@@ -4257,6 +4629,23 @@ class Resource : public HasHierarchy<Resource>,
     /** Update the current setup. */
     void setSetup(const string s) {setup = s;}
 
+    /** Python function that returns the plan of all resources in daily
+      * buckets.<br>
+      * See the PlanIterator class for the meaning of the numbers.
+      * The function accepts an optional start and end date of the reporting
+      * horizon. By default the horizon extends from 30 days before the first
+      * loadplan till 30 days after the last loadplan.<br>
+      * A third optional argument is a list of clusters: only the resources
+      * in these clusters are then reported.<br>
+      * The result is a list with a tuple (resource name, bucket start,
+      * available, unavailable, setup, load, free) for every resource and
+      * every bucket. The list is computed in a single pass over the
+      * resources, and can be passed as is to a database cursor.<br>
+      * Resources of type buckets report their own time buckets rather than
+      * the daily buckets.
+      */
+    static PyObject* plans(PyObject*, PyObject*);
+
   protected:
     /** This calendar is used to updates to the resource size. */
     CalendarDouble* size_max_cal;
@@ -4319,9 +4708,41 @@ class Resource::PlanIterator : public PythonExtension<Resource::PlanIterator>
       */
     PlanIterator(Resource*, PyObject*);
 
+    /** Constructor for use from C++ code, where the buckets are defined
+      * by a vector of dates.
+      */
+    PlanIterator(Resource*, const vector<Date>&);
+
     /** Destructor. */
     ~PlanIterator();
 
+    /** Moves to the next bucket and computes its plan.<br>
+      * Returns false when all buckets have been processed.
+      */
+    bool next();
+
+    /** Return the start date of the current bucket. */
+    Date getStart() const {return bucket_start;}
+
+    /** Return the end date of the current bucket. */
+    Date getEnd() const {return bucket_end;}
+
+    /** Return the available capacity in the current bucket. */
+    double getAvailable() const {return bucket_available;}
+
+    /** Return the unavailable capacity in the current bucket. */
+    double getUnavailable() const {return bucket_unavailable;}
+
+    /** Return the capacity used for setups in the current bucket. */
+    double getSetup() const {return bucket_setup;}
+
+    /** Return the load in the current bucket. */
+    double getLoad() const {return bucket_load;}
+
+    /** Return the free capacity in the current bucket. */
+    double getFree() const
+    {return bucket_available - bucket_load - bucket_setup;}
+
   private:
     /** Pointer to the resource we're investigating. */
     Resource* res;
@@ -4329,6 +4750,13 @@ class Resource::PlanIterator : public PythonExtension<Resource::PlanIterator>
     /** A Python object pointing to a list of start dates of buckets. */
     PyObject* bucketiterator;
 
+    /** A list of start dates of buckets, used instead of the Python
+      * iterator when the iterator is created from C++ code. */
+    const vector<Date>* bucketlist;
+
+    /** Position in the list of bucket dates. */
+    size_t bucketindex;
+
     /** An iterator over all events in the resource timeline. */
     Resource::loadplanlist::iterator ldplaniter;
 
@@ -4349,8 +4777,15 @@ class Resource::PlanIterator : public PythonExtension<Resource::PlanIterator>
     double bucket_setup;
     double bucket_unavailable;
 
+    Date bucket_start;
+    Date bucket_end;
+
+    void init();
     void update(Date till);
 
+    /** Move to the next bucket date. Returns false at the end. */
+    bool nextDate();
+
     /** Python object pointing to the start date of the plan bucket. */
     PyObject* start_date;
 
@@ -4737,7 +5172,8 @@ class Demand
     /** Constructor. */
     explicit DECLARE_EXPORT Demand(const string& str) :
       HasHierarchy<Demand>(str), it(NULL), oper(NULL), cust(NULL), qty(0.0),
-      prio(0), maxLateness(TimePeriod::MAX), minShipment(1), hidden(false) {}
+      prio(0), maxLateness(TimePeriod::MAX), minShipment(1), hidden(false)
+    {HasLevel::triggerDemandRecomputation();}
 
     /** Destructor.
       * Deleting the demand will also delete all delivery operation
@@ -4766,7 +5202,14 @@ class Demand
     Item* getItem() const {return it;}
 
     /** Updates the item/product being requested. */
-    virtual void setItem(Item *i) {it=i; setChanged();}
+    virtual void setItem(Item *i)
+    {
+      if (it) it->demands.erase(this);
+      it = i;
+      if (i) i->demands.insert(this);
+      HasLevel::triggerDemandRecomputation();
+      setChanged();
+    }
 
     /** This fields points to an operation that is to be used to plan the
       * demand. By default, the field is left to NULL and the demand will then
@@ -4791,7 +5234,14 @@ class Demand
     }
 
     /** Updates the operation being used to plan the demand. */
-    virtual void setOperation(Operation* o) {oper=o; setChanged();}
+    virtual void setOperation(Operation* o)
+    {
+      if (oper) oper->deliveryDemands.erase(this);
+      oper = o;
+      if (o) o->deliveryDemands.insert(this);
+      HasLevel::triggerDemandRecomputation();
+      setChanged();
+    }
 
     /** Returns the delivery operationplan list. */
     DECLARE_EXPORT const OperationPlan_list& getDelivery() const;
@@ -4827,7 +5277,13 @@ class Demand
     Customer* getCustomer() const {return cust;}
 
     /** Updates the customer. */
-    virtual void setCustomer(Customer* c) {cust = c; setChanged();}
+    virtual void setCustomer(Customer* c)
+    {
+      if (cust) cust->demands.erase(this);
+      cust = c;
+      if (c) c->demands.insert(this);
+      setChanged();
+    }
 
     /** Return a reference to the constraint list. */
     const Problem::List& getConstraints() const {return constraints;}
@@ -4988,6 +5444,12 @@ class LoadPlan : public TimeLine<LoadPlan>::EventChangeOnhand, public PythonExte
     /** Return the resource. */
     Resource* getResource() const {return res;}
 
+    /** Return the start date of the operationplan. */
+    Date getStartDate() const {return oper->getDates().getStart();}
+
+    /** Return the end date of the operationplan. */
+    Date getEndDate() const {return oper->getDates().getEnd();}
+
     /** Update the load of an already existing flowplan.<br>
       * The new load must belong to the same operation.
       */
@@ -5033,6 +5495,15 @@ class LoadPlan : public TimeLine<LoadPlan>::EventChangeOnhand, public PythonExte
     PyObject* getattro(const Attribute&);
     DECLARE_EXPORT int setattro(const Attribute&, const PythonObject&);
 
+    /** Allocates the memory of a loadplan from a memory pool. */
+    static void* operator new(size_t sz) {return pool->alloc(sz);}
+
+    /** Returns the memory of a loadplan to its memory pool. */
+    static void operator delete(void* p) {MemoryPool::release(p);}
+
+    /** Memory pool of the loadplans. */
+    static DECLARE_EXPORT MemoryPool* pool;
+
   private:
     /** Private constructor. It is called from the public constructor.<br>
       * The public constructor constructs the starting loadplan, while this
@@ -6069,6 +6540,72 @@ class PeggingIterator : public Object
 };
 
 
+/** @brief This class computes the upstream pegging of all demands at once.
+  *
+  * The result is a flat table with a row for every demand and every
+  * operationplan pegged to it. It contains the same rows as a
+  * PeggingIterator created for each demand separately.<br>
+  * The demands of each cluster are pegged in a separate worker thread.
+  * Within a cluster the producing flowplans of each buffer are collected
+  * once, sorted by their cumulative production. Every consuming flowplan
+  * pegged by a demand then finds its producers with a binary search, rather
+  * than walking through the timeline of the buffer again. Buffers shared by
+  * many demands are thus only traversed once.
+  */
+class PeggingTable : public NonCopyable
+{
+  public:
+    /** @brief A row of the pegging table. */
+    struct row
+    {
+      /** Demand pegged. Hidden demands are replaced with their first
+        * non-hidden owner. */
+      const Demand* demand;
+
+      /** Recursion depth of the operationplan. */
+      short level;
+
+      /** Operationplan pegged to the demand. */
+      const OperationPlan* opplan;
+
+      /** Quantity of the operationplan pegged to the demand. */
+      double quantity;
+
+      // Constructor
+      row(const Demand* d, short l, const OperationPlan* o, double q)
+        : demand(d), level(l), opplan(o), quantity(q) {};
+    };
+    typedef vector<row> rowlist;
+
+    /** Constructor, which computes the pegging of the demands of a list of
+      * clusters. All clusters are computed when the list is empty.<br>
+      * The worker threads need the Python interpreter. When the calling
+      * thread holds it, a single thread computes all clusters.<br>
+      * A RuntimeException is thrown when the pegging of a cluster fails.
+      */
+    DECLARE_EXPORT PeggingTable(const set<unsigned int>& = set<unsigned int>());
+
+    /** Returns the rows of the table. The rows of the same cluster are
+      * consecutive, and so are the rows of the same demand.
+      */
+    const rowlist& getRows() const {return rows;}
+
+    /** Python function returning the pegging of all demands, or only of the
+      * demands of a list of clusters.<br>
+      * The result is a list of tuples with the demand name, the level, the
+      * operationplan identifier and the pegged quantity.
+      */
+    static DECLARE_EXPORT PyObject* create(PyObject*, PyObject*);
+
+  private:
+    /** Computes the pegging of a single cluster. */
+    class ClusterPegging;
+
+    /** Rows of the table. */
+    rowlist rows;
+};
+
+
 /** @brief An iterator class to go through all flowplans of an operationplan.
   * @see OperationPlan::beginFlowPlans
   * @see OperationPlan::endFlowPlans
@@ -6201,6 +6738,12 @@ class ProblemIterator
     /** Default constructor. */
     ProblemIterator() :
       FreppleIterator<ProblemIterator,Problem::const_iterator,Problem>() {}
+
+    /** Python function returning an iterator over all problems.<br>
+      * The problems are updated before creating the iterator, while the
+      * Python interpreter is free for the threads of the problem detection.
+      */
+    static DECLARE_EXPORT PyObject* create(PyObject*, PyObject*);
 };
 
 
@@ -6514,6 +7057,130 @@ class LoadPlanIterator : public PythonExtension<LoadPlanIterator>
 };
 
 
+//
+// PLAN EXPORT
+//
+
+
+/** @brief This Python iterator returns the flowplans, loadplans or
+  * operationplans in chunks of tuples.
+  *
+  * The iterator is created by the Python functions frepple.flowplans(),
+  * frepple.loadplans() and frepple.operationplans(). They accept the
+  * following keyword arguments:
+  *   - fields:<br>
+  *     Sequence with the names of the fields in a row. All fields are
+  *     returned by default.
+  *   - chunk:<br>
+  *     Maximum number of rows in a chunk. All rows are returned in a single
+  *     chunk when 0, which is the default.
+  *   - null:<br>
+  *     Value used for a missing owner, demand or setup. The default is None.
+  *
+  * Every iteration returns a list of tuples, which can be passed as such to
+  * an executemany or COPY statement. No Python object is created for the
+  * flowplans, loadplans and operationplans themselves. The names of the
+  * entities are converted to Python objects only once per iterator, and
+  * the dates only once per chunk.<br>
+  * A row is returned for every loadplan with a negative quantity, ie once
+  * for every load of an operationplan. Its quantity is the capacity
+  * consumed by the operationplan.
+  */
+class PlanRowIterator : public PythonExtension<PlanRowIterator>
+{
+  public:
+    /** Registration of the Python class and its metadata. */
+    static int initialize();
+
+    /** Python function returning the flowplans in chunks of tuples. */
+    static PyObject* flowplans(PyObject*, PyObject*, PyObject*);
+
+    /** Python function returning the loadplans in chunks of tuples. */
+    static PyObject* loadplans(PyObject*, PyObject*, PyObject*);
+
+    /** Python function returning the operationplans in chunks of tuples.<br>
+      * When it is called without arguments it returns an iterator over the
+      * operationplans instead.
+      */
+    static PyObject* operationplans(PyObject*, PyObject*, PyObject*);
+
+    /** Destructor. */
+    DECLARE_EXPORT ~PlanRowIterator();
+
+  private:
+    /** Types of rows. */
+    enum rowtype {FLOWPLANS, LOADPLANS, OPERATIONPLANS};
+
+    /** Constructor. */
+    PlanRowIterator(rowtype, const vector<unsigned short>&, int, PyObject*);
+
+    /** Parses the Python arguments and creates an iterator. */
+    static PyObject* create(rowtype, PyObject*, PyObject*);
+
+    /** Returns the next chunk. */
+    PyObject* iternext();
+
+    /** Returns the next row, or NULL at the end. */
+    PyObject* nextRow();
+
+    /** Builds a row for a flowplan. */
+    PyObject* getRow(const FlowPlan*);
+
+    /** Builds a row for a loadplan. */
+    PyObject* getRow(const LoadPlan*);
+
+    /** Builds a row for an operationplan. */
+    PyObject* getRow(OperationPlan*);
+
+    /** Returns the name of an entity as a Python string, converting it only
+      * once. */
+    PyObject* getName(const Object*, const string&);
+
+    /** Returns a date as a Python datetime, converting it only once per
+      * chunk. */
+    PyObject* getDate(const Date&);
+
+    /** Returns the value used for missing fields. */
+    PyObject* getNull() {Py_INCREF(null); return null;}
+
+    /** Type of rows returned. */
+    rowtype type;
+
+    /** Fields in a row, as an index in the list of fields of the type. */
+    vector<unsigned short> fields;
+
+    /** Maximum number of rows in a chunk. */
+    int chunk;
+
+    /** Value used for missing fields. */
+    PyObject* null;
+
+    /** Buffers to visit. */
+    vector<Buffer*> buffers;
+
+    /** Resources to visit. */
+    vector<Resource*> resources;
+
+    /** Index of the current buffer or resource. */
+    size_t owner;
+
+    /** Position in the flowplans of the current buffer. */
+    Buffer::flowplanlist::const_iterator *flowplaniter;
+
+    /** Position in the loadplans of the current resource. */
+    Resource::loadplanlist::const_iterator *loadplaniter;
+
+    /** Position in the operationplans. */
+    OperationPlan::iterator opplaniter;
+
+    /** Names of entities already converted. */
+    map<const Object*, PyObject*> names;
+
+    /** Dates already converted in the current chunk. */
+    map<Date, PyObject*> dates;
+};
+
+
 //
 // DEMAND DELIVERY OPERATIONPLANS
 //
@@ -6647,6 +7314,28 @@ DECLARE_EXPORT PyObject* readXMLdata(PyObject *, PyObject *);
 DECLARE_EXPORT PyObject* savePlan(PyObject*, PyObject*);
 
 
+/** @brief This Python function creates or updates objects in bulk.
+  *
+  * The function takes the following arguments:
+  *   - The Python type of the objects to create, e.g. frepple.location.
+  *   - A sequence of field specifications, one for each column in the rows.
+  *     A field can be:
+  *       - a string with the name of the attribute to set
+  *       - None, in which case the column is ignored
+  *       - a tuple (attribute, type [, key]) for a column holding the key of
+  *         a referenced object. The referenced object is found or created with
+  *         the type, using the column value for the key attribute. The key
+  *         attribute defaults to "name".
+  *   - An iterable of rows, e.g. the result of a database cursor.
+  *
+  * Columns with a None value are skipped, leaving the attribute at its
+  * current or default value.<br>
+  * Errors on individual rows are logged and processing continues with the
+  * next row. The return value is the number of rows processed.
+  */
+DECLARE_EXPORT PyObject* bulkLoad(PyObject*, PyObject*);
+
+
 /** @brief This Python function prints a summary of the dynamically allocated
   * memory to the standard output. This is useful for understanding better the
   * size of your model.
@@ -6673,6 +7362,31 @@ DECLARE_EXPORT PyObject* printModelSize(PyObject* self, PyObject* args);
 DECLARE_EXPORT PyObject* saveXMLfile(PyObject*, PyObject*);
 
 
+/** @brief This Python function saves the model to a binary snapshot file.
+  *
+  * The snapshot contains the same information as the STANDARD XML output:
+  * the static model, the operationplans and the solvers.<br>
+  * It is stored in a compact binary format which can be read back much
+  * faster than XML, but only on the platform where it was created.<br>
+  * The function takes the following arguments:
+  *   - Name of the output file
+  * @see XMLInputSnapshot
+  */
+DECLARE_EXPORT PyObject* saveSnapshot(PyObject*, PyObject*);
+
+
+/** @brief This Python function reads a binary snapshot file in memory.
+  *
+  * The file is memory-mapped, and its content is replayed into the model.
+  * <br>
+  * The function takes the following arguments:
+  *   - Name of the snapshot file
+  *   - Optional Python function called for every object read
+  * @see saveSnapshot
+  */
+DECLARE_EXPORT PyObject* loadSnapshot(PyObject*, PyObject*);
+
+
 /** @brief This Python function erases the model or the plan from memory.
   *
   * The function allows the following modes to control what to delete:
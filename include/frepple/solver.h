@@ -301,6 +301,23 @@ class SolverMRP : public Solver
       */
     DECLARE_EXPORT void solve(void *v = NULL);
 
+    /** Replans a selection of the planning clusters.<br>
+      * Only the operationplans of the selected clusters are deleted and
+      * replanned. The plan of all other clusters is left untouched.<br>
+      * The changes in the selected clusters are marked as planned.
+      */
+    DECLARE_EXPORT void solveClusters(const set<unsigned int>&);
+
+    /** Returns the clusters to replan after changes.<br>
+      * A cluster is reported when one of its demands, buffers, resources or
+      * operations changed since it was last planned. The problem detection
+      * doesn't reset these changes.<br>
+      * All clusters are reported when the solver settings or the current
+      * date differ from the previous plan. The same applies when no complete
+      * plan was generated yet.
+      */
+    DECLARE_EXPORT set<unsigned int> getChangedClusters() const;
+
     /** Constructor. */
     DECLARE_EXPORT SolverMRP(const string& n) : Solver(n), constrts(15),
       allowSplits(true), rotateResources(true), plantype(1), lazydelay(86400L),
@@ -530,8 +547,13 @@ class SolverMRP : public Solver
     /** Return the Python function that is called before solving a operation. */
     PythonFunction getUserExitOperation() const {return userexit_operation;}
 
-    /** Python method for running the solver. */
-    static DECLARE_EXPORT PyObject* solve(PyObject*, PyObject*);
+    /** Python method for running the solver.<br>
+      * Without arguments the complete model is replanned. The argument
+      * "demand" incrementally plans a single demand. The arguments
+      * "clusters" and "changed_only" replan a selection of the clusters, and
+      * return the list of clusters that were skipped.
+      */
+    static DECLARE_EXPORT PyObject* solve(PyObject*, PyObject*, PyObject*);
 
     /** Python method for commiting the plan changes. */
     static DECLARE_EXPORT PyObject* commit(PyObject*, PyObject*);
@@ -561,6 +583,31 @@ class SolverMRP : public Solver
     typedef classified_demand::iterator cluster_iterator;
     classified_demand demands_per_cluster;
 
+    /** Wall clock time in seconds spent solving each cluster in the previous
+      * run of the solver.<br>
+      * The times are used to estimate the effort of each cluster in the next
+      * run, as long as the number of clusters hasn't changed.
+      */
+    vector<double> runtime_per_cluster;
+
+    /** Log messages of each cluster when the clusters are solved in parallel
+      * threads.<br>
+      * Each thread collects the messages of its clusters in memory. At the
+      * end of the solve the messages are written to the log file in the order
+      * of the cluster numbers. When solving in a single thread this vector is
+      * empty and the messages are written directly.
+      */
+    vector<string> log_per_cluster;
+
+    /** Solver settings and current date of the previous plan of all clusters.
+      * The string is empty when no complete plan is generated yet, or when
+      * the settings changed after it.
+      */
+    string planSettings;
+
+    /** Returns the solver settings and the current date as a string. */
+    DECLARE_EXPORT string getPlanSettings() const;
+
     static const Keyword tag_rotateresources;
 
     /** Type of plan to be created. */
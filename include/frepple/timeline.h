@@ -33,8 +33,17 @@ namespace utils
 /** @brief This class implements a "sorted list" data structure, sorting
   * "events" based on a date.
   *
-  * The data structure has slow insert scalability: O(n)<br>
-  * Moving data around in the structure is efficient though: O(1)<br>
+  * The events are kept in a doubly linked list, which makes iterating
+  * through the structure efficient: O(1) per step.<br>
+  * The same events are also the nodes of a balanced binary search tree
+  * (a treap). Every node stores the totals of its subtree, from which the
+  * onhand and the cumulative produced quantity of any event are derived.
+  * Inserting, erasing and moving an event thus scale as O(log n), where
+  * the list implementation had to update all later events: O(n).<br>
+  * The onhand and cumulative produced quantity of an event are cached. The
+  * cache is invalidated by every change to the timeline. Reading them for
+  * an event whose predecessor is up to date takes O(1), which keeps a scan
+  * through the timeline linear. Other lookups take O(log n).<br>
   * The class leverages the STL library and also follows its api.<br>
   * The class used to instantiate a timeline must support the
   * "bool operator < (TYPE)".
@@ -60,12 +69,46 @@ template <class type> class TimeLine
         Date dt;
         unsigned short tp;
         double qty;
-        double oh;
-        double cum_prod;
+        mutable double oh;
+        mutable double cum_prod;
         Event* next;
         Event* prev;
         Event(unsigned short t, double q = 0.0)
-          : tp(t), qty(q), oh(0), cum_prod(0), next(NULL), prev(NULL) {};
+          : tp(t), qty(q), oh(0), cum_prod(0), next(NULL), prev(NULL),
+            tree_up(NULL), tree_left(NULL), tree_right(NULL), tree_set(false),
+            tree_oh(0), tree_prod(0), tree_owner(NULL), tree_stamp(0) {};
+
+      private:
+        /** Parent node in the tree. */
+        Event* tree_up;
+
+        /** Left child node in the tree. */
+        Event* tree_left;
+
+        /** Right child node in the tree. */
+        Event* tree_right;
+
+        /** Flags whether the subtree contains an event setting the onhand. */
+        bool tree_set;
+
+        /** Onhand change over the subtree.<br>
+          * When the subtree sets the onhand, this is the onhand after the
+          * last event of the subtree.
+          */
+        double tree_oh;
+
+        /** Total produced quantity in the subtree. */
+        double tree_prod;
+
+        /** Timeline the event is inserted in. */
+        TimeLine<type>* tree_owner;
+
+        /** Version of the timeline for which the cached onhand and
+          * cumulative produced quantity were computed. */
+        mutable unsigned long tree_stamp;
+
+        /** Computes the onhand and cumulative produced quantity. */
+        void refresh() const;
 
       public:
         virtual ~Event() {};
@@ -77,13 +120,22 @@ template <class type> class TimeLine
         inline double getQuantity() const {return qty;}
 
         /** Return the current onhand value. */
-        inline double getOnhand() const {return oh;}
+        inline double getOnhand() const
+        {
+          if (tree_owner && tree_stamp != tree_owner->version) refresh();
+          return oh;
+        }
 
         /** Return the total produced quantity till the current date. */
-        inline double getCumulativeProduced() const {return cum_prod;}
+        inline double getCumulativeProduced() const
+        {
+          if (tree_owner && tree_stamp != tree_owner->version) refresh();
+          return cum_prod;
+        }
 
         /** Return the total consumed quantity till the current date. */
-        inline double getCumulativeConsumed() const {return cum_prod - oh;}
+        inline double getCumulativeConsumed() const
+        {return getCumulativeProduced() - getOnhand();}
 
         /** Return the date of the event. */
         inline const Date& getDate() const {return dt;}
@@ -95,11 +147,7 @@ template <class type> class TimeLine
           * this event. */
         virtual double getMin(bool inclusive = true) const
         {
-          EventMinQuantity *m = this->getTimeLine()->lastMin;
-          if (inclusive)
-            while(m && getDate() < m->getDate()) m = m->prevMin;
-          else
-            while(m && getDate() <= m->getDate()) m = m->prevMin;
+          EventMinQuantity *m = this->getTimeLine()->getMinEvent(getDate(), inclusive);
           return m ? m->newMin : 0.0;
         }
 
@@ -107,11 +155,7 @@ template <class type> class TimeLine
           * this event. */
         virtual double getMax(bool inclusive = true) const
         {
-          EventMaxQuantity *m = this->getTimeLine()->lastMax;
-          if (inclusive)
-            while(m && getDate() < m->getDate()) m = m->prevMax;
-          else
-            while(m && getDate() <= m->getDate()) m = m->prevMax;
+          EventMaxQuantity *m = this->getTimeLine()->getMaxEvent(getDate(), inclusive);
           return m ? m->newMax : 0.0;
         }
 
@@ -147,12 +191,11 @@ template <class type> class TimeLine
     class EventSetOnhand : public Event
     {
         friend class TimeLine<type>;
+        friend class Event;
       private:
         double new_oh;
-      protected:
-        EventSetOnhand *prevSet;
       public:
-        EventSetOnhand(Date d, double q=0.0) : Event(2), new_oh(q), prevSet(NULL)
+        EventSetOnhand(Date d, double q=0.0) : Event(2), new_oh(q)
         {this->dt = d;}
     };
 
@@ -239,13 +282,8 @@ template <class type> class TimeLine
         bool operator!=(const iterator& x) const {return this->cur != x.cur;}
     };
 
-    TimeLine() : first(NULL), last(NULL), lastMax(NULL), lastMin(NULL), lastSet(NULL) {}
-    int size() const
-    {
-      int cnt(0);
-      for (Event* p=first; p; p=p->next) ++cnt;
-      return cnt;
-    }
+    TimeLine() : first(NULL), last(NULL), root(NULL), count(0), version(1) {}
+    int size() const {return count;}
     iterator begin() {return iterator(first);}
     iterator begin(Event* e) {return iterator(e);}
     iterator rbegin() {return iterator(last);}
@@ -290,11 +328,7 @@ template <class type> class TimeLine
     /** This functions returns the mimimum valid at a certain date. */
     virtual double getMin(Date d, bool inclusive = true) const
     {
-      EventMinQuantity *m = this->lastMin;
-      if (inclusive)
-        while(m && d < m->getDate()) m = m->prevMin;
-      else
-        while(m && d <= m->getDate()) m = m->prevMin;
+      EventMinQuantity *m = getMinEvent(d, inclusive);
       return m ? m->getMin() : 0.0;
     }
 
@@ -302,22 +336,14 @@ template <class type> class TimeLine
     virtual double getMin(const Event *e, bool inclusive = true) const
     {
       if (!e) return 0.0;
-      EventMinQuantity *m = this->lastMin;
-      if (inclusive)
-        while(m && e->getDate() < m->getDate()) m = m->prevMin;
-      else
-        while(m && e->getDate() <= m->getDate()) m = m->prevMin;
+      EventMinQuantity *m = getMinEvent(e->getDate(), inclusive);
       return m ? m->getMin() : 0.0;
     }
 
     /** This functions returns the maximum valid at a certain date. */
     virtual double getMax(Date d, bool inclusive = true) const
     {
-      EventMaxQuantity *m = this->lastMax;
-      if (inclusive)
-        while(m && d < m->getDate()) m = m->prevMax;
-      else
-        while(m && d <= m->getDate()) m = m->prevMax;
+      EventMaxQuantity *m = getMaxEvent(d, inclusive);
       return m ? m->getMax() : 0.0;
     }
 
@@ -325,34 +351,24 @@ template <class type> class TimeLine
     virtual double getMax(const Event *e, bool inclusive = true) const
     {
       if (!e) return 0.0;
-      EventMaxQuantity *m = this->lastMax;
-      if (inclusive)
-        while(m && e->getDate() < m->getDate()) m = m->prevMax;
-      else
-        while(m && e->getDate() <= m->getDate()) m = m->prevMax;
+      EventMaxQuantity *m = getMaxEvent(e->getDate(), inclusive);
       return m ? m->getMax() : 0.0;
     }
 
     /** This functions returns the minimum event valid at a certain date. */
     virtual EventMinQuantity* getMinEvent(Date d, bool inclusive = true) const
     {
-      EventMinQuantity *m = this->lastMin;
-      if (inclusive)
-        while(m && d < m->getDate()) m = m->prevMin;
-      else
-        while(m && d <= m->getDate()) m = m->prevMin;
-      return m ? m : NULL;
+      typename multimap<Date, EventMinQuantity*>::const_iterator m =
+        inclusive ? minima.upper_bound(d) : minima.lower_bound(d);
+      return (m == minima.begin()) ? NULL : (--m)->second;
     }
 
     /** This functions returns the maximum event valid at a certain date. */
     virtual EventMaxQuantity* getMaxEvent(Date d, bool inclusive = true) const
     {
-      EventMaxQuantity *m = this->lastMax;
-      if (inclusive)
-        while(m && d < m->getDate()) m = m->prevMax;
-      else
-        while(m && d <= m->getDate()) m = m->prevMax;
-      return m ? m : NULL;
+      typename multimap<Date, EventMaxQuantity*>::const_iterator m =
+        inclusive ? maxima.upper_bound(d) : maxima.lower_bound(d);
+      return (m == maxima.begin()) ? NULL : (--m)->second;
     }
 
     /** Return the lowest excess inventory level between this event
@@ -422,140 +438,313 @@ template <class type> class TimeLine
     /** A pointer to the last event in the timeline. */
     Event* last;
 
-    /** A pointer to the last maximum change. */
-    EventMaxQuantity *lastMax;
+    /** A pointer to the root of the tree. */
+    Event* root;
+
+    /** Number of events in the timeline. */
+    int count;
+
+    /** Version number, incremented on every change of the timeline. */
+    unsigned long version;
+
+    /** Minimum changes, sorted by date. */
+    multimap<Date, EventMinQuantity*> minima;
+
+    /** Maximum changes, sorted by date. */
+    multimap<Date, EventMaxQuantity*> maxima;
+
+    /** Inserts an event in the tree and the list. */
+    void link(Event*);
+
+    /** Removes an event from the tree and the list. */
+    void unlink(Event*);
+
+    /** Rotates an event above its parent in the tree. */
+    void rotate(Event*);
+
+    /** Recomputes the totals of the subtree of an event. */
+    void sum(Event*);
+
+    /** Computes the onhand and cumulative produced quantity at an event
+      * from the tree. */
+    void prefix(const Event*, double&, double&) const;
 
-    /** A pointer to the last minimum change. */
-    EventMinQuantity *lastMin;
+    /** Computes the totals of the left subtree of an event and the event
+      * itself. */
+    static void total(const Event*, bool&, double&, double&);
 
-    /** A pointer to the last fixed onhand. */
-    EventSetOnhand *lastSet;
+    /** Appends the totals of a second sequence of events to the totals of
+      * a first sequence. */
+    static void chain(bool& set, double& oh, double& prod, bool set2, double oh2, double prod2)
+    {
+      if (set2)
+      {
+        set = true;
+        oh = oh2;
+      }
+      else
+        oh += oh2;
+      prod += prod2;
+    }
+
+    /** Returns the priority of an event in the tree.<br>
+      * The priority is derived from the address of the event, which is
+      * random enough to keep the tree balanced and doesn't need to be
+      * stored.
+      */
+    static unsigned int priority(const Event* e)
+    {
+      size_t x = reinterpret_cast<size_t>(e) >> 3;
+      x ^= x >> 16;
+      x *= 0x45d9f3b;
+      x ^= x >> 16;
+      return static_cast<unsigned int>(x);
+    }
 };
 
 
-template <class type> void TimeLine<type>::insert (Event* e)
+template <class type> void TimeLine<type>::Event::refresh() const
+{
+  if (prev && prev->tree_stamp == tree_owner->version)
+  {
+    // Continue from the previous event, which is up to date
+    if (tp == 2)
+      oh = static_cast<const EventSetOnhand*>(this)->new_oh;
+    else
+      oh = prev->oh + qty;
+    cum_prod = (qty > 0) ? prev->cum_prod + qty : prev->cum_prod;
+  }
+  else
+    // Sum the events before this one in the tree
+    tree_owner->prefix(this, oh, cum_prod);
+  tree_stamp = tree_owner->version;
+}
+
+
+template <class type> void TimeLine<type>::total
+(const Event* e, bool& set, double& oh, double& prod)
 {
-  // Loop through all entities till we find the insertion point
-  // While searching from the end, update the onhand and cumulative produced
-  // quantity of all nodes passed
-  iterator i = rbegin();
-  if (lastSet)
+  if (e->tree_left)
+  {
+    set = e->tree_left->tree_set;
+    oh = e->tree_left->tree_oh;
+    prod = e->tree_left->tree_prod;
+  }
+  else
   {
-    EventSetOnhand *m = lastSet;
-    while (m->prevSet && *e<*(m->prevSet))
-      m = m->prevSet;
-    i = begin(m);
+    set = false;
+    oh = 0.0;
+    prod = 0.0;
   }
-  double qty = e->getQuantity();
-  if (qty > 0)
-    for (; i!=end() && *e<*i; --i)
+  if (e->tp == 2)
+    chain(set, oh, prod, true, static_cast<const EventSetOnhand*>(e)->new_oh, 0.0);
+  else
+    chain(set, oh, prod, false, e->qty, (e->qty > 0) ? e->qty : 0.0);
+}
+
+
+template <class type> void TimeLine<type>::sum(Event* e)
+{
+  total(e, e->tree_set, e->tree_oh, e->tree_prod);
+  if (e->tree_right)
+    chain(e->tree_set, e->tree_oh, e->tree_prod, e->tree_right->tree_set,
+        e->tree_right->tree_oh, e->tree_right->tree_prod);
+}
+
+
+template <class type> void TimeLine<type>::prefix
+(const Event* e, double& oh, double& prod) const
+{
+  bool set;
+  total(e, set, oh, prod);
+  for (const Event* i = e; i->tree_up; i = i->tree_up)
+    if (i->tree_up->tree_right == i)
     {
-      if (i->getType()!=2) i->oh += qty;
-      i->cum_prod += qty;
+      // The parent and its left subtree come before the event
+      bool set2;
+      double oh2, prod2;
+      total(i->tree_up, set2, oh2, prod2);
+      chain(set2, oh2, prod2, set, oh, prod);
+      set = set2;
+      oh = oh2;
+      prod = prod2;
     }
+}
+
+
+template <class type> void TimeLine<type>::rotate(Event* e)
+{
+  Event* up = e->tree_up;
+  Event* grandparent = up->tree_up;
+  if (up->tree_left == e)
+  {
+    // Rotate right
+    up->tree_left = e->tree_right;
+    if (e->tree_right) e->tree_right->tree_up = up;
+    e->tree_right = up;
+  }
+  else
+  {
+    // Rotate left
+    up->tree_right = e->tree_left;
+    if (e->tree_left) e->tree_left->tree_up = up;
+    e->tree_left = up;
+  }
+  up->tree_up = e;
+  e->tree_up = grandparent;
+  if (!grandparent)
+    root = e;
+  else if (grandparent->tree_left == up)
+    grandparent->tree_left = e;
   else
-    for (; i!=end() && *e<*i; --i)
-      if (i->getType()!=2) i->oh += qty;
+    grandparent->tree_right = e;
+  sum(up);
+  sum(e);
+}
+
 
-  // Insert
-  if (i == end())
+template <class type> void TimeLine<type>::link(Event* e)
+{
+  // Search the insertion point in the tree.
+  // The last nodes passed on the left and the right side become the
+  // neighbours of the event in the list.
+  Event *up = NULL, *before = NULL, *after = NULL;
+  for (Event* i = root; i; )
   {
-    // Insert at the head
-    if (first)
-      first->prev = e;
+    up = i;
+    if (*e < *i)
+    {
+      after = i;
+      i = i->tree_left;
+    }
     else
-      // First element
-      last = e;
-    e->next = first;
-    e->prev = NULL;
-    first = e;
-    e->oh = qty;
-    if (qty>0) e->cum_prod = qty;
-    else e->cum_prod = 0;
+    {
+      before = i;
+      i = i->tree_right;
+    }
   }
+
+  // Insert as a leaf in the tree
+  e->tree_up = up;
+  e->tree_left = NULL;
+  e->tree_right = NULL;
+  if (!up)
+    root = e;
+  else if (up == after)
+    up->tree_left = e;
+  else
+    up->tree_right = e;
+  e->tree_owner = this;
+
+  // Insert in the list
+  e->prev = before;
+  e->next = after;
+  if (before)
+    before->next = e;
+  else
+    // New head
+    first = e;
+  if (after)
+    after->prev = e;
   else
+    // New tail
+    last = e;
+
+  // Rotate the event up till the priorities are in heap order again, and
+  // update the totals of all subtrees above it
+  sum(e);
+  while (e->tree_up && priority(e) > priority(e->tree_up))
+    rotate(e);
+  for (Event* i = e->tree_up; i; i = i->tree_up)
+    sum(i);
+
+  ++count;
+  ++version;
+}
+
+
+template <class type> void TimeLine<type>::unlink(Event* e)
+{
+  // Rotate the event down till it is a leaf
+  while (e->tree_left || e->tree_right)
   {
-    // Insert in the middle
-    e->prev = &*i;
-    e->next = i->next;
-    if (i->next)
-      i->next->prev = e;
+    if (!e->tree_right
+        || (e->tree_left && priority(e->tree_left) > priority(e->tree_right)))
+      rotate(e->tree_left);
     else
-      // New last element
-      last = e;
-    i->next = e;
-    e->oh = i->oh + qty;
-    if (qty>0) e->cum_prod = i->cum_prod + qty;
-    else e->cum_prod = i->cum_prod;
+      rotate(e->tree_right);
   }
 
+  // Remove from the tree, and update the totals of all subtrees above it
+  Event* up = e->tree_up;
+  if (!up)
+    root = NULL;
+  else if (up->tree_left == e)
+    up->tree_left = NULL;
+  else
+    up->tree_right = NULL;
+  for (Event* i = up; i; i = i->tree_up)
+    sum(i);
+  e->tree_up = NULL;
+  e->tree_owner = NULL;
+
+  // Remove from the list
+  if (e->prev)
+    e->prev->next = e->next;
+  else
+    // Erasing the head
+    first = e->next;
+  if (e->next)
+    e->next->prev = e->prev;
+  else
+    // Erasing the tail
+    last = e->prev;
+  e->prev = NULL;
+  e->next = NULL;
+
+  --count;
+  ++version;
+}
+
+
+template <class type> void TimeLine<type>::insert (Event* e)
+{
+  link(e);
+
   switch (e->getType())
   {
-    case 2:
-      // Insert in the list of setOnhand
-      {
-        EventSetOnhand *m = static_cast<EventSetOnhand*>(e);
-        if (!lastSet || m->getDate() >= lastSet->getDate())
-        {
-          // New last setOnhand
-          m->prevSet = lastSet;
-          lastSet = m;
-        }
-        else
-        {
-          EventSetOnhand * o = lastSet;
-          while (o->prevSet && m->getDate() >= o->prevSet->getDate())
-            o = o->prevSet;
-          m->prevSet = o->prevSet;
-          o->prevSet = m;
-        }
-        // Update onhand after this setonhand till the next setonhand
-        double delta = m->new_oh - m->oh;
-        iterator i = begin(m);
-        m->oh = m->new_oh;
-        ++i;
-        for (; i!=end() && i->getType()!=2; ++i)
-          m->oh += delta;
-      }
-      break;
     case 3:
       // Insert in the list of minima
       {
         EventMinQuantity *m = static_cast<EventMinQuantity*>(e);
-        if (!lastMin || m->getDate() >= lastMin->getDate())
-        {
-          // New last minimum
-          m->prevMin = lastMin;
-          lastMin = m;
-        }
+        typename multimap<Date, EventMinQuantity*>::iterator i
+          = minima.insert(make_pair(m->getDate(), m));
+        if (i == minima.begin())
+          m->prevMin = NULL;
         else
         {
-          EventMinQuantity * o = lastMin;
-          while (o->prevMin && m->getDate() >= o->prevMin->getDate())
-            o = o->prevMin;
-          m->prevMin = o->prevMin;
-          o->prevMin = m;
+          typename multimap<Date, EventMinQuantity*>::iterator j = i;
+          m->prevMin = (--j)->second;
         }
+        if (++i != minima.end())
+          i->second->prevMin = m;
       }
       break;
     case 4:
       // Insert in the list of maxima
       {
-        EventMaxQuantity* m = static_cast<EventMaxQuantity*>(e);
-        if (!lastMax || m->getDate() >= lastMax->getDate())
-        {
-          // New last maximum
-          m->prevMax = lastMax;
-          lastMax = m;
-        }
+        EventMaxQuantity *m = static_cast<EventMaxQuantity*>(e);
+        typename multimap<Date, EventMaxQuantity*>::iterator i
+          = maxima.insert(make_pair(m->getDate(), m));
+        if (i == maxima.begin())
+          m->prevMax = NULL;
         else
         {
-          EventMaxQuantity *o = lastMax;
-          while (o->prevMax && m->getDate() >= o->prevMax->getDate())
-            o = o->prevMax;
-          m->prevMax = o->prevMax;
-          o->prevMax = m;
+          typename multimap<Date, EventMaxQuantity*>::iterator j = i;
+          m->prevMax = (--j)->second;
         }
+        if (++i != maxima.end())
+          i->second->prevMax = m;
       }
   }
 
@@ -566,88 +755,42 @@ template <class type> void TimeLine<type>::insert (Event* e)
 
 template <class type> void TimeLine<type>::erase(Event* e)
 {
-  // Update later entries
-  double qty = e->getQuantity();
-  if (qty>0)
-  {
-    bool update_oh = true;
-    for (iterator i = begin(e); i!=end(); ++i)
-    {
-      if (update_oh)
-      {
-        if (i->getType() == 2)
-          update_oh = false;
-        else
-          i->oh -= qty;
-      }
-      i->cum_prod -= qty;
-    }
-  }
-  else
-    for (iterator i = begin(e); i!=end() && i->getType()!=2; ++i)
-      i->oh -= qty;
-
-  if (e->prev)
-    e->prev->next = e->next;
-  else
-    // Erasing the head
-    first = e->next;
-
-  if (e->next)
-    e->next->prev = e->prev;
-  else
-    // Erasing the tail
-    last = e->prev;
-
-  // Clear prev and next pointers
-  e->prev = NULL;
-  e->next = NULL;
+  unlink(e);
 
   switch (e->getType())
   {
-    case 2:
-      // Remove from the list of setonhand
-      {
-        EventSetOnhand *m = static_cast<EventSetOnhand*>(e);
-        if (lastSet == e)
-          // New last set
-          lastSet = m->prevSet;
-        else
-        {
-          EventSetOnhand *o = lastSet;
-          while (o->prevSet != e && o) o = o->prevSet;
-          if (o) o->prevSet = m->prevSet;
-        };
-      }
-      break;
     case 3:
       // Remove from the list of minima
       {
         EventMinQuantity *m = static_cast<EventMinQuantity*>(e);
-        if (lastMin == e)
-          // New last minimum
-          lastMin = m->prevMin;
-        else
+        typename multimap<Date, EventMinQuantity*>::iterator i
+          = minima.lower_bound(m->getDate());
+        while (i != minima.end() && i->second != m) ++i;
+        if (i != minima.end())
         {
-          EventMinQuantity *o = lastMin;
-          while (o->prevMin != e && o) o = o->prevMin;
-          if (o) o->prevMin = m->prevMin;
-        };
+          typename multimap<Date, EventMinQuantity*>::iterator j = i;
+          if (++j != minima.end())
+            j->second->prevMin = m->prevMin;
+          minima.erase(i);
+        }
+        m->prevMin = NULL;
       }
       break;
     case 4:
       // Remove from the list of maxima
       {
         EventMaxQuantity *m = static_cast<EventMaxQuantity*>(e);
-        if (lastMax == e)
-          // New last maximum
-          lastMax = m->prevMax;
-        else
+        typename multimap<Date, EventMaxQuantity*>::iterator i
+          = maxima.lower_bound(m->getDate());
+        while (i != maxima.end() && i->second != m) ++i;
+        if (i != maxima.end())
         {
-          EventMaxQuantity * o = lastMax;
-          while (o->prevMax != e && o) o = o->prevMax;
-          if (o) o->prevMax = m->prevMax;
+          typename multimap<Date, EventMaxQuantity*>::iterator j = i;
+          if (++j != maxima.end())
+            j->second->prevMax = m->prevMax;
+          maxima.erase(i);
         }
+        m->prevMax = NULL;
       }
   }
 
@@ -658,115 +801,24 @@ template <class type> void TimeLine<type>::erase(Event* e)
 
 template <class type> void TimeLine<type>::update(EventChangeOnhand* e, double newqty, const Date& d)
 {
-  // Compute the delta quantity
-  double delta = e->qty - newqty;
-  double oldqty = e->qty;
-  bool in_bucket = false;
-
-  // Set the new date and quantity. The algorithm below swaps the element with
-  // its predecessor or successor till the timeline is properly sorted again.
+  // Set the new date and quantity
   e->dt = d;
   e->qty = newqty;
 
-  // Update the position in the timeline.
   // Remember that the quantity is also used by the '<' operator! Changing the
   // quantity thus can affect the order of elements.
-  while ( e->next && !(*e<*e->next) )
-  {
-    // Move to a later date
-    Event *theNext = e->next;
-    Event *theNextNext = theNext->next;
-    if (e->prev) e->prev->next = theNext;
-    theNext->prev = e->prev;
-    theNext->next = e;
-    e->prev = theNext;
-    e->next = theNextNext;
-    if (theNextNext)
-      theNextNext->prev = e;
-    else
-      last = e;
-    if (first == e) first = theNext;
-    if (theNext->getType() == 2)
-    {
-      delta = -newqty;
-      e->oh = theNext->oh;
-      in_bucket = true;
-    }
-    else if (in_bucket)
-      e->oh += theNext->getQuantity();
-    else
-    {
-      e->oh = theNext->oh;
-      theNext->oh -= oldqty;
-    }
-    e->cum_prod = theNext->cum_prod;
-    if (oldqty > 0) theNext->cum_prod -= oldqty;
-  }
-  while ( e->prev && !(*e->prev<*e) )
+  if ((!e->prev || *(e->prev) < *e) && (!e->next || *e < *(e->next)))
   {
-    // Move to an earlier date
-    Event *thePrev = e->prev;
-    Event *thePrevPrev = thePrev->prev;
-    if (e->next) e->next->prev = thePrev;
-    thePrev->next = e->next;
-    thePrev->prev = e;
-    e->next = thePrev;
-    e->prev = thePrevPrev;
-    if (thePrevPrev)
-      thePrevPrev->next = e;
-    else
-      first = e;
-    if (last == e) last = thePrev;
-    thePrev->cum_prod = e->cum_prod;
-    if (thePrev->getType() == 2)
-    {
-      if (thePrevPrev)
-        e->oh = thePrevPrev->oh + newqty;
-      else
-        e->oh = newqty;
-      // Update the onhand values in the bucket we are moving out
-      if (delta)
-      {
-        // First time this happens
-        for (Event *f = thePrev->next; f && f->getType()!=2; f = f->next)
-          f->oh -= oldqty;
-        delta = 0.0;
-      }
-      else
-        // Additional occurrences
-        for (Event *f = thePrev->next; f && f->getType()!=2; f = f->next)
-          f->oh -= newqty;
-    }
-    else
-    {
-      thePrev->oh = e->oh;
-      e->oh -= thePrev->getQuantity();
-    }
-    if (thePrev->getQuantity() > 0) e->cum_prod -= thePrev->getQuantity();
+    // The event stays at the same position: only update the totals
+    for (Event* i = e; i; i = i->tree_up)
+      sum(i);
+    ++version;
   }
-
-  // Update the onhand for all later events
-  if (fabs(delta) > ROUNDING_ERROR)
+  else
   {
-    double cumdelta = (oldqty>0? oldqty : 0) - (newqty>0 ? newqty : 0);
-    if (fabs(cumdelta) > 0)
-    {
-      bool update_oh = true;
-      for (iterator i=begin(e); i!=end(); ++i)
-      {
-        if (update_oh)
-        {
-          if (i->getType()==2)
-            update_oh = false;
-          else
-            i->oh -= delta;
-        }
-        i->cum_prod -= cumdelta;
-      }
-    }
-    else
-      for (iterator i=begin(e); i!=end() && i->getType()!=2; ++i)
-        i->oh -= delta;
+    // Move the event to its new position
+    unlink(e);
+    link(e);
   }
 
   // Final debugging check commented out, since loadplans change in pairs.
@@ -780,23 +832,26 @@ template <class type> bool TimeLine<type>::check() const
 {
   double expectedOH = 0.0;
   double expectedCumProd = 0.0;
+  double oh = 0.0, cum_prod = 0.0;
+  int cnt = 0;
   const Event *prev = NULL;
   for (const_iterator i = begin(); i!=end(); ++i)
   {
     // Problem 1: The onhands don't add up properly
     if (i->getType() == 2)
-      expectedOH = i->oh;
+      expectedOH = static_cast<const EventSetOnhand*>(&*i)->new_oh;
     else
       expectedOH += i->getQuantity();
     if (i->getQuantity() > 0) expectedCumProd += i->getQuantity();
-    if (fabs(expectedOH - i->oh) > ROUNDING_ERROR)
+    prefix(&*i, oh, cum_prod);
+    if (fabs(expectedOH - oh) > ROUNDING_ERROR)
     {
       inspect("Error: timeline onhand value corrupted on "
           + string(i->getDate()));
       return false;
     }
     // Problem 2: The cumulative produced quantity isn't correct
-    if (fabs(expectedCumProd - i->cum_prod) > ROUNDING_ERROR)
+    if (fabs(expectedCumProd - cum_prod) > ROUNDING_ERROR)
     {
       inspect("Error: timeline cumulative produced value corrupted on "
           + string(i->getDate()));
@@ -810,6 +865,13 @@ template <class type> bool TimeLine<type>::check() const
       return false;
     }
     prev = &*i;
+    ++cnt;
+  }
+  // Problem 4: The tree doesn't contain all events of the list
+  if (cnt != count || (root && fabs(root->tree_prod - cum_prod) > ROUNDING_ERROR))
+  {
+    inspect("Error: timeline tree corrupted");
+    return false;
   }
   return true;
 }
@@ -126,6 +126,7 @@ using namespace std;
 // Header for multithreading
 #if defined(HAVE_PTHREAD_H)
 #include <pthread.h>
+#include <sys/time.h>
 #elif defined(WIN32)
 #define WIN32_LEAN_AND_MEAN
 #include <windows.h>
@@ -213,6 +214,7 @@ class Object;
 class Keyword;
 class XMLInput;
 class AttributeList;
+class MetaField;
 
 // Include the list of predefined tags
 #include "frepple/tags.h"
@@ -509,8 +511,29 @@ class NonCopyable
   *     Read an XML-file.
   *   - <b>saveXMLfile(string)</b>:<br>
   *     Save the model to an XML-file.
+  *   - <b>saveSnapshot(string)</b>:<br>
+  *     Save the model to a binary snapshot file.
+  *   - <b>loadSnapshot(string)</b>:<br>
+  *     Read a binary snapshot file.
   *   - <b>saveplan(string)</b>:<br>
   *     Save the main plan information to a file.
+  *   - <b>bulkload(type, fields, rows [,reset])</b>:<br>
+  *     Create or update objects of a type from a sequence of rows.
+  *   - <b>resourceplans([date] [,date] [,list])</b>:<br>
+  *     Returns the plan of all resources in daily buckets.
+  *   - <b>flowplans([fields=list] [,chunk=int] [,null=value])</b>:<br>
+  *     Returns the rows of the flowplans in chunks of tuples.
+  *   - <b>loadplans([fields=list] [,chunk=int] [,null=value])</b>:<br>
+  *     Returns the rows of the loadplans in chunks of tuples.
+  *   - <b>operationplans([fields=list] [,chunk=int] [,null=value])</b>:<br>
+  *     Returns the rows of the operationplans in chunks of tuples. Without
+  *     arguments an iterator over the operationplans is returned.
+  *   - <b>pegging([list])</b>:<br>
+  *     Returns the pegging of all demands, or of the demands of a list of
+  *     clusters, as a list of tuples.
+  *   - <b>clustermembers(list)</b>:<br>
+  *     Returns the buffers, resources, operations and demands of a list of
+  *     clusters.
   *   - <b>erase(boolean)</b>:<br>
   *     Erase the model (arg true) or only the plan (arg false, default).
   *   - <b>version</b>:<br>
@@ -573,6 +596,13 @@ class PythonInterpreter
       */
     static DECLARE_EXPORT void deleteThread();
 
+    /** Returns true when the current thread holds the Python interpreter.<br>
+      * Worker threads which need the interpreter can't run while the calling
+      * thread holds it.<br>
+      * Python 3.0 till 3.3 can't report on this, and true is returned.
+      */
+    static DECLARE_EXPORT bool hasLock();
+
   private:
 #if PY_MAJOR_VERSION >= 3
     /** Callback function to create the extension module. */
@@ -753,6 +783,10 @@ extern "C"
   DECLARE_EXPORT PyObject* call_handler(PyObject*, PyObject*, PyObject*);
   /** Handler function called from Python. Internal use only. */
   DECLARE_EXPORT PyObject* str_handler(PyObject*);
+  /** Handler function called from Python. Internal use only. */
+  DECLARE_EXPORT PyObject* getfield_handler(PyObject*, void*);
+  /** Handler function called from Python. Internal use only. */
+  DECLARE_EXPORT int setfield_handler(PyObject*, PyObject*, void*);
 }
 
 
@@ -775,6 +809,12 @@ class PythonType : public NonCopyable
       */
     static const unsigned short methodArraySize = 5;
 
+    /** Incremental size of the field table.<br>
+      * We allocate memory for the field definitions per block, not
+      * one-by-one.
+      */
+    static const unsigned short fieldArraySize = 10;
+
     /** The Python type object which this class is wrapping. */
     PyTypeObject* table;
 
@@ -798,6 +838,28 @@ class PythonType : public NonCopyable
     /** Add a new method. */
     DECLARE_EXPORT void addMethod(const char*, PyCFunctionWithKeywords, int, const char*);
 
+    /** Add a new read-only field.<br>
+      * The field is exposed as a native attribute of the type, and reading
+      * it calls the getter method directly rather than the getattro method
+      * of the class.<br>
+      * The first template argument is the C++ class of the type. The other
+      * arguments are deduced from the getter method:<br>
+      *   x.addField<MyClass>(Tags::tag_name, &MyClass::getName);
+      */
+    template <class Cls, class Base, class T>
+    void addField(const Keyword&, T (Base::*)() const);
+
+    /** Add a new field that can be read and updated.<br>
+      * Updating it calls the setter method directly rather than the
+      * setattro method of the class. The argument of the setter method must
+      * be passed by value.
+      */
+    template <class Cls, class Base, class T, class Base2, class S>
+    void addField(const Keyword&, T (Base::*)() const, void (Base2::*)(S));
+
+    /** Add a new field. */
+    DECLARE_EXPORT void addField(MetaField*);
+
     /** Updates tp_name. */
     void setName (const string n)
     {
@@ -1101,56 +1163,6 @@ class MetaClass : public NonCopyable
 
 class XMLOutput;
 
-/** @brief This class stores metadata on a data field of a class.
-  *
-  * A field
-  */
-//class MetaField : public NonCopyable
-//{
-//  private:
-//    Keyword& name;
-//
-//  public:
-//    typedef double (*getDouble)() const;
-//    typedef void (*setDouble)(double);
-//    typedef int (*getInt)() const;
-//    typedef void (*setInt)(int);
-//    typedef long (*getLong)() const;
-//    typedef void (*setLong)(long);
-//    typedef unsigned long (*getUnsignedLong)() const;
-//    typedef void (*setUnsignedLong)(unsigned long);
-//    typedef bool (*getBool)() const;
-//    typedef void (*setBool)(int);
-//    typedef bool (*getString)() const;
-//    typedef void (*setString)(string);
-//    typedef Date (*getDate)() const;
-//    typedef void (*setDate)(Date);
-//    typedef TimePeriod (*getTimePeriod)() const;
-//    typedef void (*setTimePeriod)(TimePeriod);
-//    /* Other types: list of things... */
-//
-//    /** Constructor. */
-//    MetaField(Keyword&, getDouble, setDouble);
-//    MetaField(Keyword&, getInt, setInt);
-//    MetaField(Keyword&, getBool, setBool);
-//    MetaField(Keyword&, getString, setString );
-//    template <class T> MetaField(Keyword&, T*(*getFunction)() const, void (*setFunction)(T*));
-//
-//    bool get(Object*);
-//    int get(Object*);
-//    double get(Object*);
-//    string get(Object*);
-//
-//    void set(Object*, bool);
-//    void set(Object*, int);
-//    void set(Object*, double);
-//    void set(Object*, string);
-//
-//    /* for class MetaClass: */
-//    void write(writer, object*);
-//    void read(reader, Object*);
-//};
-
 
 /** @brief A MetaCategory instance represents metadata for a category of
   * object.
@@ -1414,6 +1426,45 @@ inline ostream & operator << (ostream& os, const Timer& t)
 }
 
 
+/** @brief This class is used to measure the elapsed wall clock time.
+  *
+  * The Timer class measures the cpu-time of the process, which sums the time
+  * of all threads. This class measures the real time instead, and is used to
+  * measure the time spent in a single thread.<br>
+  * The accuracy is about a millisecond.
+  */
+class WallTimer
+{
+  public:
+    /** Default constructor. Creating the timer object sets the start point
+      * for the time measurement. */
+    explicit WallTimer() : start_time(now()) {}
+
+    /** Reset the time counter to 0. */
+    void restart() {start_time = now();}
+
+    /** Return the wall clock time in seconds elapsed since the creation or
+      * the last reset of the timer. */
+    double elapsed() const {return now() - start_time;}
+
+  private:
+    /** Returns the current wall clock time in seconds. */
+    static double now()
+    {
+#if defined(HAVE_PTHREAD_H)
+      struct timeval t;
+      gettimeofday(&t, NULL);
+      return t.tv_sec + t.tv_usec / 1000000.0;
+#else
+      return GetTickCount() / 1000.0;
+#endif
+    }
+
+    /** Stores the time when the timer is started. */
+    double start_time;
+};
+
+
 //
 // UTILITY CLASSES "DATE", "DATE_RANGE" AND "TIME".
 //
@@ -3455,6 +3506,113 @@ class PythonExtension: public PythonExtensionBase, public NonCopyable
 };
 
 
+/** @brief This class stores metadata on a data field of a class.
+  *
+  * The fields are registered on a Python type with the method
+  * PythonType::addField, and are published in the tp_getset table of the
+  * type. Reading or updating a field from Python takes a single lookup in
+  * the dictionary of the type, instead of comparing the attribute name with
+  * all attributes handled in the getattro and setattro methods.
+  */
+class MetaField : public NonCopyable
+{
+  public:
+    /** Constructor. */
+    explicit MetaField(const Keyword& k) : name(k) {}
+
+    /** Destructor. */
+    virtual ~MetaField() {}
+
+    /** Returns the keyword of the field. */
+    const Keyword& getName() const {return name;}
+
+    /** Returns true when the field can't be updated. */
+    virtual bool getReadOnly() const {return true;}
+
+    /** Returns the value of the field on an object. */
+    virtual PyObject* get(PythonExtensionBase*) const = 0;
+
+    /** Updates the value of the field on an object.<br>
+      * The return value is 0 when the field is updated, and -1 otherwise.
+      */
+    virtual int set(PythonExtensionBase*, const PythonObject&) const
+    {return -1;}
+
+    /** Returns the field with a given name on the type of an object.<br>
+      * A NULL pointer is returned when the attribute isn't a field.
+      */
+    static DECLARE_EXPORT const MetaField* find(PyObject*, PyObject*);
+
+  private:
+    /** Name of the field. */
+    const Keyword& name;
+};
+
+
+/** @brief A field that is read with a getter method of a class. */
+template <class Cls, class T> class MetaFieldGet : public MetaField
+{
+  public:
+    typedef T (Cls::*getFunction)() const;
+
+    /** Constructor. */
+    MetaFieldGet(const Keyword& k, getFunction g) : MetaField(k), getf(g) {}
+
+    virtual PyObject* get(PythonExtensionBase* o) const
+    {
+      return PythonObject((static_cast<Cls*>(o)->*getf)());
+    }
+
+  private:
+    /** Getter method. */
+    getFunction getf;
+};
+
+
+/** @brief A field that is read with a getter method and updated with a
+  * setter method of a class. */
+template <class Cls, class T, class S> class MetaFieldGetSet
+  : public MetaFieldGet<Cls,T>
+{
+  public:
+    typedef void (Cls::*setFunction)(S);
+
+    /** Constructor. */
+    MetaFieldGetSet(const Keyword& k,
+      typename MetaFieldGet<Cls,T>::getFunction g, setFunction f)
+      : MetaFieldGet<Cls,T>(k, g), setf(f) {}
+
+    virtual bool getReadOnly() const {return false;}
+
+    virtual int set(PythonExtensionBase* o, const PythonObject& field) const
+    {
+      S val;
+      field >> val;
+      (static_cast<Cls*>(o)->*setf)(val);
+      return 0;
+    }
+
+  private:
+    /** Setter method. */
+    setFunction setf;
+};
+
+
+template <class Cls, class Base, class T>
+inline void PythonType::addField(const Keyword& k, T (Base::*g)() const)
+{
+  addField(new MetaFieldGet<Cls,T>(k, g));
+}
+
+
+template <class Cls, class Base, class T, class Base2, class S>
+inline void PythonType::addField
+  (const Keyword& k, T (Base::*g)() const, void (Base2::*f)(S))
+{
+  addField(new MetaFieldGetSet<Cls,T,S>(k, g, f));
+}
+
+
 /** @brief Object is the abstract base class for the main entities.
   *
   * It handles to following capabilities:
@@ -3564,7 +3722,10 @@ class Object : public PythonExtensionBase
 #endif
           if (!attr.isA(Tags::tag_name) && !attr.isA(Tags::tag_type) && !attr.isA(Tags::tag_action))
           {
-            int result = x->setattro(attr, field);
+            const MetaField* fld = MetaField::find(x, key);
+            int result = (fld && !fld->getReadOnly()) ?
+              fld->set(x, field) :
+              x->setattro(attr, field);
             if (result && !PyErr_Occurred())
               PyErr_Format(PyExc_AttributeError,
 #if PY_MAJOR_VERSION >= 3
@@ -3690,10 +3851,139 @@ class ScopeMutexLock: public NonCopyable
 };
 
 
+/** @brief This class allocates objects of a fixed size from big blocks of
+  * memory, called slabs.
+  *
+  * Classes of which many instances are created and deleted use a pool in
+  * their own operator new and delete. This avoids a separate heap
+  * allocation for every object, and the fragmentation of the heap it causes
+  * over a long run.<br>
+  * The pool is split in arenas, one for every processor core. A thread
+  * always allocates from the same arena, and an object is returned to the
+  * arena it was allocated from. Threads running in parallel thus hardly
+  * compete for a lock, and the objects created by the same thread, eg all
+  * operationplans of a cluster, are packed together. When all objects of a
+  * slab are deleted, the slab is returned to the system. Each arena keeps a
+  * single empty slab as a spare.<br>
+  * Requests bigger than the object size of the pool, eg for a subclass, are
+  * passed to the global operator new.
+  */
+class MemoryPool : public NonCopyable
+{
+  public:
+    /** Constructor. The arguments are the name of the pool, as reported by
+      * the printsize command, and the size of its objects. */
+    DECLARE_EXPORT MemoryPool(const char*, size_t);
+
+    /** Allocates memory for an object. */
+    DECLARE_EXPORT void* alloc(size_t);
+
+    /** Returns the memory of an object to the pool it was allocated from. */
+    static DECLARE_EXPORT void release(void*);
+
+    /** Returns the name of the pool. */
+    const char* getName() const {return name;}
+
+    /** Returns the size of the objects in the pool. */
+    size_t getObjectSize() const {return objectsize;}
+
+    /** Returns the size of a slab. */
+    size_t getSlabSize() const {return slabsize;}
+
+    /** Collects the number of objects allocated from the pool, the number
+      * of slabs it holds and the number of slabs it released so far. */
+    DECLARE_EXPORT void getStatistics(size_t&, size_t&, size_t&) const;
+
+    /** Returns the first pool. */
+    static const MemoryPool* begin() {return firstPool;}
+
+    /** Returns the next pool. */
+    const MemoryPool* next() const {return nextPool;}
+
+  private:
+    struct Arena;
+    struct Slab;
+
+    /** Returns the arena of the current thread. */
+    Arena& getArena();
+
+    /** Name of the pool. */
+    const char* name;
+
+    /** Size of an object. */
+    size_t objectsize;
+
+    /** Size of an object with its header. */
+    size_t chunksize;
+
+    /** Number of objects in a slab. */
+    size_t perslab;
+
+    /** Size of a slab. */
+    size_t slabsize;
+
+    /** Arenas of the pool. */
+    Arena* arenas;
+
+    /** Number of arenas. */
+    unsigned int countArenas;
+
+    /** Next pool in the list of all pools. */
+    MemoryPool* nextPool;
+
+    /** First pool in the list of all pools. */
+    static DECLARE_EXPORT MemoryPool* firstPool;
+};
+
+
+/** @brief This class keeps the log messages of a thread in memory.
+  *
+  * While an object of this class exists, the messages written to the logger
+  * stream by the thread that created it are collected in the object rather
+  * than written to the log file. Other threads keep writing to the log file.
+  * <br>
+  * Threads running in parallel can thus log at full detail. The caller
+  * writes their messages afterwards in a deterministic order, rather than
+  * having the lines of all threads interleaved in the log file.<br>
+  * The object must be deleted by the thread that created it. When objects
+  * are nested, deleting the inner object restores the outer one.
+  */
+class ThreadLog : public NonCopyable
+{
+    friend class LogDispatcher;
+  public:
+    /** Constructor. The messages of the current thread are collected from
+      * now on. */
+    DECLARE_EXPORT ThreadLog();
+
+    /** Destructor. The messages of the current thread go to the log file
+      * again. */
+    DECLARE_EXPORT ~ThreadLog();
+
+    /** Returns the messages collected so far. */
+    string getMessages() const {return messages.str();}
+
+  private:
+    /** Messages collected so far. */
+    stringbuf messages;
+
+    /** Log which was active in the thread before this one. */
+    ThreadLog* previous;
+};
+
+
 /** @brief This class supports parallel execution of a number of functions.
   *
   * Currently Pthreads and Windows threads are supported as the implementation
-  * of the multithreading.
+  * of the multithreading.<br>
+  * A function can be registered with an estimate of its cost. The workers
+  * share a single queue, and an idle worker always picks the most expensive
+  * function that is still waiting. Starting the biggest jobs first avoids
+  * that a single long function keeps one worker busy at the end while all
+  * others are idle. Functions with the same cost are called in the reverse
+  * order of registration.<br>
+  * The group measures for each worker how long it was busy. This allows to
+  * report on the utilization of the workers after the execution.
   */
 class ThreadGroup : public NonCopyable
 {
@@ -3704,27 +3994,55 @@ class ThreadGroup : public NonCopyable
     /** Constructor which defaults to have as many worker threads as there are
       * cores on the machine.
       */
-    ThreadGroup() : countCallables(0)
+    ThreadGroup() : countCallables(0), countWorkers(0), elapsed(0.0)
     {
       maxParallel = Environment::getProcessorCores();
     };
 
     /** Constructor with a predefined number of worker threads. */
-    ThreadGroup(int i) : countCallables(0)
+    ThreadGroup(int i) : countCallables(0), countWorkers(0), elapsed(0.0)
     {
       setMaxParallel(i);
     };
 
-    /** Add a new function to be called and its argument. */
-    void add(callable func, void* args)
+    /** Add a new function to be called and its argument.<br>
+      * The optional cost is an estimate of the effort of the function. The
+      * unit is irrelevant: it is only used to call the most expensive
+      * functions first.
+      */
+    void add(callable func, void* args, double cost = 0.0)
     {
-      callables.push( make_pair(func,args) );
+      callables.push_back( make_pair(cost, make_pair(func,args)) );
       ++countCallables;
     }
 
     /** Execute all functions and wait for them to finish. */
     DECLARE_EXPORT void execute();
 
+    /** Returns the number of workers used in the last execution. */
+    unsigned int getNumberOfWorkers() const {return countWorkers;}
+
+    /** Returns the number of functions called by a worker in the last
+      * execution. */
+    unsigned int getWorkerCallables(unsigned int i) const
+    {
+      return i < workerCallables.size() ? workerCallables[i] : 0;
+    }
+
+    /** Returns the wall clock time in seconds a worker spent executing
+      * functions in the last execution. */
+    double getWorkerBusyTime(unsigned int i) const
+    {
+      return i < workerBusy.size() ? workerBusy[i] : 0.0;
+    }
+
+    /** Returns the wall clock time in seconds of the last execution. */
+    double getElapsed() const {return elapsed;}
+
+    /** Prints the utilization of the workers in the last execution to the
+      * log file. */
+    DECLARE_EXPORT void logUtilization() const;
+
     /** Returns the number of parallel workers that is activated.<br>
       * By default we activate as many worker threads as there are cores on
       * the machine.
@@ -3757,12 +4075,28 @@ class ThreadGroup : public NonCopyable
       */
     int maxParallel;
 
-    /** Stack with all registered functions and their invocation arguments. */
-    stack<callableWithArgument> callables;
+    /** List with all registered functions, their invocation arguments and
+      * their cost.<br>
+      * When the execution starts, the list is sorted by increasing cost. The
+      * functions are then taken from the back of the list.
+      */
+    vector< pair<double,callableWithArgument> > callables;
 
     /** Count registered callables. */
     unsigned int countCallables;
 
+    /** Count the workers that started in the current execution. */
+    unsigned int countWorkers;
+
+    /** Number of functions called by each worker. */
+    vector<unsigned int> workerCallables;
+
+    /** Wall clock time spent by each worker in the functions. */
+    vector<double> workerBusy;
+
+    /** Wall clock time of the last execution. */
+    double elapsed;
+
     /** This functions runs a single command execution thread. It is used as
       * a holder for the main routines of a trheaded routine.
       */
@@ -3776,6 +4110,18 @@ class ThreadGroup : public NonCopyable
       * @see wrapper
       */
     DECLARE_EXPORT callableWithArgument selectNextCallable();
+
+    /** This method assigns a number to a worker when it starts.
+      * @see wrapper
+      */
+    DECLARE_EXPORT unsigned int selectWorker();
+
+    /** Compares the cost of two registered functions. */
+    static bool compareCost
+    (const pair<double,callableWithArgument>& a, const pair<double,callableWithArgument>& b)
+    {
+      return a.first < b.first;
+    }
 };
 
 
@@ -4476,6 +4822,7 @@ class CommandManager
   */
 class XMLInput : public NonCopyable,  private xercesc::DefaultHandler
 {
+    friend class XMLInputSnapshot;
   public:
     typedef pair<Attribute,XMLElement> datapair;
 
@@ -4848,6 +5195,42 @@ class XMLInputFile : public XMLInput
 };
 
 
+/** @brief This class reads a binary snapshot of XML data from a file.
+  *
+  * A snapshot stores the stream of events generated by the XML parser: the
+  * element names, the attribute names and values, the character data and
+  * the processing instructions. All strings are stored in the internal
+  * character format of the Xerces library.<br>
+  * Reading a snapshot replays these events from a memory-mapped file. The
+  * data doesn't need to be parsed, unescaped, transcoded to Xerces strings
+  * or validated again, which makes it much faster than reading the XML data.
+  * <br>
+  * A snapshot can only be read on the platform where it was created.
+  */
+class XMLInputSnapshot : public XMLInput
+{
+  public:
+    /** Constructor. The argument passed is the name of the snapshot file. */
+    XMLInputSnapshot(const string& s) : filename(s) {};
+
+    /** Replays the snapshot into an object.
+      * @exception RuntimeException Generated when the file can't be read
+      *    or isn't a valid snapshot.
+      */
+    DECLARE_EXPORT void parse(Object*, bool=false);
+
+    /** Converts a string with XML data into a snapshot file.
+      * @exception RuntimeException Generated when the file can't be written
+      *    or the XML data isn't well-formed.
+      */
+    static DECLARE_EXPORT void save(const string& filename, const string& data);
+
+  private:
+    /** Name of the snapshot file. */
+    string filename;
+};
+
+
 //
 //  UTILITY CLASSES "HASNAME", "HASHIERARCHY", "HASDESCRIPTION"
 //
@@ -160,6 +160,65 @@ PyObject* saveXMLfile(PyObject* self, PyObject* args)
 }
 
 
+//
+// SAVE AND LOAD MODEL SNAPSHOTS
+//
+
+
+DECLARE_EXPORT PyObject* saveSnapshot(PyObject* self, PyObject* args)
+{
+  // Pick up arguments
+  char *filename;
+  int ok = PyArg_ParseTuple(args, "s:saveSnapshot", &filename);
+  if (!ok) return NULL;
+
+  // Execute and catch exceptions
+  Py_BEGIN_ALLOW_THREADS   // Free Python interpreter for other threads
+  try
+  {
+    XMLOutputString o;
+    o.setContentType(XMLOutput::STANDARD);
+    o.writeElementWithHeader(Tags::tag_plan, &Plan::instance());
+    XMLInputSnapshot::save(filename, o.getData());
+  }
+  catch (...)
+  {
+    Py_BLOCK_THREADS;
+    PythonType::evalException();
+    return NULL;
+  }
+  Py_END_ALLOW_THREADS   // Reclaim Python interpreter
+  return Py_BuildValue("");
+}
+
+
+DECLARE_EXPORT PyObject* loadSnapshot(PyObject* self, PyObject* args)
+{
+  // Pick up arguments
+  char *filename;
+  PyObject *userexit = NULL;
+  int ok = PyArg_ParseTuple(args, "s|O:loadSnapshot", &filename, &userexit);
+  if (!ok) return NULL;
+
+  // Execute and catch exceptions
+  Py_BEGIN_ALLOW_THREADS   // Free Python interpreter for other threads
+  try
+  {
+    XMLInputSnapshot p(filename);
+    if (userexit) p.setUserExit(userexit);
+    p.parse(&Plan::instance());
+  }
+  catch (...)
+  {
+    Py_BLOCK_THREADS;
+    PythonType::evalException();
+    return NULL;
+  }
+  Py_END_ALLOW_THREADS   // Reclaim Python interpreter
+  return Py_BuildValue("");
+}
+
+
 //
 // SAVE PLAN SUMMARY TO TEXT FILE
 //
@@ -455,6 +514,166 @@ DECLARE_EXPORT PyObject* eraseModel(PyObject* self, PyObject* args)
 }
 
 
+//
+// BULK LOAD OF OBJECTS
+//
+
+
+DECLARE_EXPORT PyObject* bulkLoad(PyObject* self, PyObject* args)
+{
+  // Pick up arguments
+  PyObject *pytype, *fields, *rows;
+  int reset = 0;
+  int ok = PyArg_ParseTuple(args, "OOO|i:bulkload", &pytype, &fields, &rows, &reset);
+  if (!ok) return NULL;
+  if (!PyType_Check(pytype) || !reinterpret_cast<PyTypeObject*>(pytype)->tp_new)
+  {
+    PyErr_SetString(PythonDataException, "bulkload expects a frePPLe type as first argument");
+    return NULL;
+  }
+  PyTypeObject* cls = reinterpret_cast<PyTypeObject*>(pytype);
+
+  // Decode the field specification only once.
+  // Each field is either None (the column is skipped), a field name, or a
+  // tuple (field name, type [, key field]) for columns that hold the key of
+  // another object.
+  PyObject* spec = PySequence_Fast(fields, "bulkload expects a sequence of fields");
+  if (!spec) return NULL;
+  Py_ssize_t numfields = PySequence_Fast_GET_SIZE(spec);
+  vector<PyObject*> names(numfields, static_cast<PyObject*>(NULL));
+  vector<PyTypeObject*> reftypes(numfields, static_cast<PyTypeObject*>(NULL));
+  vector<PyObject*> refkeys(numfields, static_cast<PyObject*>(NULL));
+  vector<PyObject*> lastkeys(numfields, static_cast<PyObject*>(NULL));
+  vector<PyObject*> lastrefs(numfields, static_cast<PyObject*>(NULL));
+  for (Py_ssize_t i = 0; i < numfields; ++i)
+  {
+    PyObject* f = PySequence_Fast_GET_ITEM(spec, i);
+    if (f == Py_None) continue;
+    if (PyTuple_Check(f))
+    {
+      PyObject *n, *t, *k = NULL;
+      if (!PyArg_ParseTuple(f, "OO|O:bulkload", &n, &t, &k)
+        || !PyType_Check(t) || !reinterpret_cast<PyTypeObject*>(t)->tp_new)
+      {
+        PyErr_SetString(PythonDataException, "bulkload expects a tuple (field, type [, key]) for references");
+        Py_DECREF(spec);
+        return NULL;
+      }
+      names[i] = n;
+      reftypes[i] = reinterpret_cast<PyTypeObject*>(t);
+      if (k)
+      {
+        Py_INCREF(k);
+        refkeys[i] = k;
+      }
+      else
+        refkeys[i] = PythonObject(string("name"));
+    }
+    else
+      names[i] = f;
+  }
+
+  PyObject* iter = PyObject_GetIter(rows);
+  if (!iter)
+  {
+    Py_DECREF(spec);
+    return NULL;
+  }
+
+  // Create or update an object for every row
+  PyObject* emptyargs = PyTuple_New(0);
+  long cnt = 0;
+  PyObject* row;
+  while ((row = PyIter_Next(iter)))
+  {
+    ++cnt;
+    bool rowok = true;
+    PyObject* kwds = PyDict_New();
+    PyObject* values = PySequence_Fast(row, "bulkload expects a sequence for each row");
+    if (!values)
+      rowok = false;
+    else
+    {
+      Py_ssize_t numvalues = PySequence_Fast_GET_SIZE(values);
+      for (Py_ssize_t i = 0; i < numfields && i < numvalues; ++i)
+      {
+        if (!names[i]) continue;
+        PyObject* val = PySequence_Fast_GET_ITEM(values, i);
+        if (val == Py_None)
+        {
+          // In reset mode a None value clears the field
+          if (reset) PyDict_SetItem(kwds, names[i], val);
+          continue;
+        }
+        if (reftypes[i])
+        {
+          // Consecutive rows often refer to the same object: reuse the last one
+          if (!lastkeys[i] || PyObject_RichCompareBool(val, lastkeys[i], Py_EQ) != 1)
+          {
+            PyObject* refkwds = PyDict_New();
+            PyDict_SetItem(refkwds, refkeys[i], val);
+            PyObject* ref = reftypes[i]->tp_new(reftypes[i], emptyargs, refkwds);
+            Py_DECREF(refkwds);
+            Py_XDECREF(lastkeys[i]);
+            Py_XDECREF(lastrefs[i]);
+            lastkeys[i] = NULL;
+            lastrefs[i] = NULL;
+            if (!ref)
+            {
+              rowok = false;
+              break;
+            }
+            Py_INCREF(val);
+            lastkeys[i] = val;
+            lastrefs[i] = ref;
+          }
+          PyDict_SetItem(kwds, names[i], lastrefs[i]);
+        }
+        else
+          PyDict_SetItem(kwds, names[i], val);
+      }
+      Py_DECREF(values);
+    }
+    if (rowok)
+    {
+      PyObject* x = cls->tp_new(cls, emptyargs, kwds);
+      if (x)
+        Py_DECREF(x);
+      else
+        rowok = false;
+    }
+    Py_DECREF(kwds);
+    Py_DECREF(row);
+
+    // Report the error and continue with the next row
+    if (!rowok && PyErr_Occurred())
+    {
+      PyObject *ptype, *pvalue, *ptraceback;
+      PyErr_Fetch(&ptype, &pvalue, &ptraceback);
+      PyObject* msg = PyObject_Str(pvalue ? pvalue : ptype);
+      logger << "Error: " << (msg ? PythonObject(msg).getString() : string("Unidentified exception")) << endl;
+      Py_XDECREF(msg);
+      Py_XDECREF(ptype);
+      Py_XDECREF(pvalue);
+      Py_XDECREF(ptraceback);
+    }
+  }
+
+  // Clean up
+  for (Py_ssize_t i = 0; i < numfields; ++i)
+  {
+    if (reftypes[i]) Py_DECREF(refkeys[i]);
+    Py_XDECREF(lastkeys[i]);
+    Py_XDECREF(lastrefs[i]);
+  }
+  Py_DECREF(emptyargs);
+  Py_DECREF(iter);
+  Py_DECREF(spec);
+  if (PyErr_Occurred()) return NULL;  // Error while iterating over the rows
+  return PythonObject(cnt);
+}
+
+
 //
 // PRINT MODEL SIZE
 //
@@ -480,6 +699,12 @@ DECLARE_EXPORT PyObject* printModelSize(PyObject* self, PyObject* args)
     // Print the number of clusters
     logger << "Clusters: " << HasLevel::getNumberOfClusters() << endl << endl;
 
+    // Print the statistics of the problem detection
+    logger << "Problem detection: " << Plannable::getDetectionRuns()
+        << " runs evaluated " << Plannable::getDetectionEntities()
+        << " entities in " << Plannable::getDetectionTime() << " seconds"
+        << endl << endl;
+
     // Header for memory size
     logger << "Memory usage:" << endl;
     logger << "Model        \tNumber\tMemory" << endl;
@@ -632,6 +857,22 @@ DECLARE_EXPORT PyObject* printModelSize(PyObject* self, PyObject* args)
 
     // TOTAL
     logger << "Total        \t\t" << total << endl << endl;
+
+    // Memory pools
+    logger << "Memory pools:" << endl;
+    logger << "Pool         \tObjects\tSlabs\tMemory\tUsage\tReleased" << endl;
+    logger << "----         \t-------\t-----\t------\t-----\t--------" << endl;
+    for (const MemoryPool* p = MemoryPool::begin(); p; p = p->next())
+    {
+      size_t slabs, released;
+      p->getStatistics(count, slabs, released);
+      memsize = slabs * p->getSlabSize();
+      logger << p->getName() << "\t" << count << "\t" << slabs << "\t"
+          << memsize << "\t"
+          << (memsize ? 100 * count * p->getObjectSize() / memsize : 0) << "%\t"
+          << released << endl;
+    }
+    logger << endl;
   }
   catch (...)
   {
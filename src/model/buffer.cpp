@@ -423,6 +423,11 @@ DECLARE_EXPORT void Buffer::setMinimumCalendar(CalendarDouble *cal)
   // Mark as changed
   setChanged();
 
+  // Update the references on the calendars
+  if (min_cal) min_cal->minimumBuffers.erase(this);
+  min_cal = cal;
+  if (cal) cal->minimumBuffers.insert(this);
+
   // Delete previous events.
   for (flowplanlist::iterator oo=flowplans.begin(); oo!=flowplans.end(); )
     if (oo->getType() == 3)
@@ -441,7 +446,6 @@ DECLARE_EXPORT void Buffer::setMinimumCalendar(CalendarDouble *cal)
 
   // Create timeline structures for every event. A new entry is created only
   // when the value changes.
-  min_cal = const_cast< CalendarDouble* >(cal);
   double curMin = 0.0;
   for (CalendarDouble::EventIterator x(min_cal); x.getDate()<Date::infiniteFuture; ++x)
     if (curMin != x.getValue())
@@ -493,6 +497,11 @@ DECLARE_EXPORT void Buffer::setMaximumCalendar(CalendarDouble *cal)
   // Mark as changed
   setChanged();
 
+  // Update the references on the calendars
+  if (max_cal) max_cal->maximumBuffers.erase(this);
+  max_cal = cal;
+  if (cal) cal->maximumBuffers.insert(this);
+
   // Delete previous events.
   for (flowplanlist::iterator oo=flowplans.begin(); oo!=flowplans.end(); )
     if (oo->getType() == 4)
@@ -511,7 +520,6 @@ DECLARE_EXPORT void Buffer::setMaximumCalendar(CalendarDouble *cal)
 
   // Create timeline structures for every bucket. A new entry is created only
   // when the value changes.
-  max_cal = const_cast<CalendarDouble*>(cal);
   double curMax = 0.0;
   for (CalendarDouble::EventIterator x(max_cal); x.getDate()<Date::infiniteFuture; ++x)
     if (curMax != x.getValue())
@@ -549,6 +557,13 @@ DECLARE_EXPORT Buffer::~Buffer()
   // Remove the inventory operation
   Operation *invoper = Operation::find(INVENTORY_OPERATION);
   if (invoper) delete invoper;
+
+  // Remove the references to this buffer
+  if (it) it->buffers.erase(this);
+  if (loc) loc->buffers.erase(this);
+  if (producing_operation) producing_operation->producedBuffers.erase(this);
+  if (min_cal) min_cal->minimumBuffers.erase(this);
+  if (max_cal) max_cal->maximumBuffers.erase(this);
 }
 
 
@@ -888,32 +903,32 @@ DECLARE_EXPORT int Buffer::setattro(const Attribute& attr, const PythonObject& f
     setSource(field.getString());
   else if (attr.isA(Tags::tag_owner))
   {
-    if (!field.check(Buffer::metadata))
+    if (field && !field.check(Buffer::metadata))
     {
       PyErr_SetString(PythonDataException, "buffer owner must be of type buffer");
       return -1;
     }
-    Buffer* y = static_cast<Buffer*>(static_cast<PyObject*>(field));
+    Buffer* y = field ? static_cast<Buffer*>(static_cast<PyObject*>(field)) : NULL;
     setOwner(y);
   }
   else if (attr.isA(Tags::tag_location))
   {
-    if (!field.check(Location::metadata))
+    if (field && !field.check(Location::metadata))
     {
       PyErr_SetString(PythonDataException, "buffer location must be of type location");
       return -1;
     }
-    Location* y = static_cast<Location*>(static_cast<PyObject*>(field));
+    Location* y = field ? static_cast<Location*>(static_cast<PyObject*>(field)) : NULL;
     setLocation(y);
   }
   else if (attr.isA(Tags::tag_item))
   {
-    if (!field.check(Item::metadata))
+    if (field && !field.check(Item::metadata))
     {
       PyErr_SetString(PythonDataException, "buffer item must be of type item");
       return -1;
     }
-    Item* y = static_cast<Item*>(static_cast<PyObject*>(field));
+    Item* y = field ? static_cast<Item*>(static_cast<PyObject*>(field)) : NULL;
     setItem(y);
   }
   else if (attr.isA(Tags::tag_onhand))
@@ -924,22 +939,22 @@ DECLARE_EXPORT int Buffer::setattro(const Attribute& attr, const PythonObject& f
     setMaximum(field.getDouble());
   else if (attr.isA(Tags::tag_maximum_calendar))
   {
-    if (!field.check(CalendarDouble::metadata))
+    if (field && !field.check(CalendarDouble::metadata))
     {
       PyErr_SetString(PythonDataException, "buffer maximum must be of type calendar_double");
       return -1;
     }
-    CalendarDouble* y = static_cast<CalendarDouble*>(static_cast<PyObject*>(field));
+    CalendarDouble* y = field ? static_cast<CalendarDouble*>(static_cast<PyObject*>(field)) : NULL;
     setMaximumCalendar(y);
   }
   else if (attr.isA(Tags::tag_minimum_calendar))
   {
-    if (!field.check(CalendarDouble::metadata))
+    if (field && !field.check(CalendarDouble::metadata))
     {
       PyErr_SetString(PythonDataException, "buffer minimum must be of type calendar_double");
       return -1;
     }
-    CalendarDouble* y = static_cast<CalendarDouble*>(static_cast<PyObject*>(field));
+    CalendarDouble* y = field ? static_cast<CalendarDouble*>(static_cast<PyObject*>(field)) : NULL;
     setMinimumCalendar(y);
   }
   else if (attr.isA(Tags::tag_mininterval))
@@ -952,12 +967,12 @@ DECLARE_EXPORT int Buffer::setattro(const Attribute& attr, const PythonObject& f
     setTool(field.getBool());
   else if (attr.isA(Tags::tag_producing))
   {
-    if (!field.check(Operation::metadata))
+    if (field && !field.check(Operation::metadata))
     {
       PyErr_SetString(PythonDataException, "buffer producing must be of type operation");
       return -1;
     }
-    Operation* y = static_cast<Operation*>(static_cast<PyObject*>(field));
+    Operation* y = field ? static_cast<Operation*>(static_cast<PyObject*>(field)) : NULL;
     setProducingOperation(y);
   }
   else if (attr.isA(Tags::tag_hidden))
@@ -182,44 +182,26 @@ DECLARE_EXPORT Calendar::~Calendar()
     firstBucket = firstBucket->nextBucket;
     delete tmp;
   }
-
-  // Remove all references from locations
-  for (Location::iterator l = Location::begin(); l != Location::end(); ++l)
-  {
-    if (l->getAvailable() == this)
-      l->setAvailable(NULL);
-  }
-
-  // Remove reference from buffers
-  for (Buffer::iterator b = Buffer::begin(); b != Buffer::end(); ++b)
-  {
-    if (b->getMaximumCalendar() == this)
-      b->setMaximumCalendar(NULL);
-    if (b->getMinimumCalendar() == this)
-      b->setMinimumCalendar(NULL);
-  }
-
-  // Remove references from resources
-  for (Resource::iterator r = Resource::begin(); r != Resource::end(); ++r)
-  {
-    if (r->getMaximumCalendar() == this)
-      r->setMaximumCalendar(NULL);
-  }
 }
 
 
 DECLARE_EXPORT CalendarDouble::~CalendarDouble()
 {
-  // Remove all references from buffers
-  for (Buffer::iterator b = Buffer::begin(); b != Buffer::end(); ++b)
-  {
-    if (b->getMinimumCalendar()==this) b->setMinimumCalendar(NULL);
-    if (b->getMaximumCalendar()==this) b->setMaximumCalendar(NULL);
-  }
+  // Remove all references from locations.
+  // Note that we are not using a for-loop since the function is updating
+  // the set at the same time as we move through it.
+  while (!locations.empty())
+    (*locations.begin())->setAvailable(NULL);
+
+  // Remove reference from buffers
+  while (!maximumBuffers.empty())
+    (*maximumBuffers.begin())->setMaximumCalendar(NULL);
+  while (!minimumBuffers.empty())
+    (*minimumBuffers.begin())->setMinimumCalendar(NULL);
 
-  // Remove all references from resources
-  for (Resource::iterator r = Resource::begin(); r != Resource::end(); ++r)
-    if (r->getMaximumCalendar()==this) r->setMaximumCalendar(NULL);
+  // Remove references from resources
+  while (!maximumResources.empty())
+    (*maximumResources.begin())->setMaximumCalendar(NULL);
 }
 
 
@@ -237,13 +219,14 @@ DECLARE_EXPORT Calendar::Bucket* Calendar::addBucket
 DECLARE_EXPORT void Calendar::removeBucket(Calendar::Bucket* bkt)
 {
   // Verify the bucket is on this calendar indeed
-  Bucket *b = firstBucket;
-  while (b && b != bkt) b = b->nextBucket;
+  map<int, Bucket*>::iterator b = bucketIds.find(bkt->id);
 
   // Error
-  if (!b)
+  if (b == bucketIds.end() || b->second != bkt)
     throw DataException("Trying to remove unavailable bucket from calendar '"
         + getName() + "'");
+  bucketIds.erase(b);
+  recomputeIndex = true;
 
   // Update the list
   if (bkt->prevBucket)
@@ -269,6 +252,7 @@ DECLARE_EXPORT void Calendar::Bucket::setEnd(const Date d)
 
   // Update
   enddate = d;
+  cal->recomputeIndex = true;
 }
 
 
@@ -288,6 +272,9 @@ DECLARE_EXPORT void Calendar::Bucket::setStart(const Date d)
 
 DECLARE_EXPORT void Calendar::Bucket::updateSort()
 {
+  // The date index of the calendar needs to be rebuilt
+  cal->recomputeIndex = true;
+
   // Update the position in the list
   bool ok = true;
   do
@@ -334,63 +321,108 @@ DECLARE_EXPORT void Calendar::Bucket::updateSort()
 }
 
 
-DECLARE_EXPORT Calendar::Bucket* Calendar::findBucket(Date d, bool fwd) const
+DECLARE_EXPORT void Calendar::buildIndex() const
 {
-  Calendar::Bucket *curBucket = NULL;
-  double curPriority = DBL_MAX;
-  long timeInWeek = INT_MIN;
+  // Get exclusive access to this function in a multi-threaded environment.
+  static Mutex indexbusy;
+  ScopeMutexLock l(indexbusy);
+
+  // Another thread may already have built the index while this thread was
+  // waiting for the lock.
+  if (!recomputeIndex) return;
+
+  // Collect the start and end dates of all buckets.
+  // A positive number refers to the start of a bucket, a negative number
+  // to its end.
+  vector<Bucket*> bkts;
+  vector< pair<Date, int> > events;
   for (Bucket *b = firstBucket; b; b = b->nextBucket)
   {
-    if (b->getStart() > d)
-      // Buckets are sorted by the start date. Other entries definitely
-      // won't be effective.
-      break;
-    else if (curPriority > b->getPriority()
-        && ( (fwd && d >= b->getStart() && d < b->getEnd()) ||
-            (!fwd && d > b->getStart() && d <= b->getEnd())
-           ))
+    // Buckets without duration are never effective
+    if (b->startdate >= b->enddate) continue;
+    int pos = static_cast<int>(bkts.size());
+    bkts.push_back(b);
+    events.push_back(make_pair(b->startdate, pos + 1));
+    events.push_back(make_pair(b->enddate, -pos - 1));
+  }
+  sort(events.begin(), events.end());
+
+  // Sweep over the dates, maintaining the set of effective buckets.
+  // Buckets with the same priority are ranked on their position in the
+  // list, in the same way as a scan through the list does.
+  indexDates.clear();
+  indexStart.clear();
+  indexBuckets.clear();
+  set< pair<int, int> > active;
+  for (vector< pair<Date, int> >::const_iterator e = events.begin(); e != events.end(); )
+  {
+    Date d = e->first;
+    for (; e != events.end() && e->first == d; ++e)
     {
-      if (!b->offsetcounter)
-      {
-        // Continuously effective
-        curPriority = b->getPriority();
-        curBucket = &*b;
-      }
+      if (e->second > 0)
+        active.insert(make_pair(bkts[e->second - 1]->priority, e->second - 1));
       else
-      {
-        // There are ineffective periods during the week
-        if (timeInWeek == INT_MIN)
-        {
-          // Lazy initialization
-          timeInWeek = d.getSecondsWeek();
-          // Special case: asking backward while at first second of the week
-          if (!fwd && timeInWeek == 0L) timeInWeek = 604800L;
-        }
-        // Check all intervals
-        for (short i=0; i<b->offsetcounter; i+=2)
-          if ((fwd && timeInWeek >= b->offsets[i] && timeInWeek < b->offsets[i+1]) ||
-              (!fwd && timeInWeek > b->offsets[i] && timeInWeek <= b->offsets[i+1]))
-          {
-            // All conditions are met!
-            curPriority = b->getPriority();
-            curBucket = &*b;
-            break;
-          }
-      }
+        active.erase(make_pair(bkts[-e->second - 1]->priority, -e->second - 1));
+    }
+    indexDates.push_back(d);
+    indexStart.push_back(indexBuckets.size());
+    for (set< pair<int, int> >::const_iterator a = active.begin(); a != active.end(); ++a)
+    {
+      indexBuckets.push_back(bkts[a->second]);
+      // A continuously effective bucket hides all later ones
+      if (!bkts[a->second]->offsetcounter) break;
     }
   }
-  return curBucket;
+  indexStart.push_back(indexBuckets.size());
+  recomputeIndex = false;
 }
 
 
-DECLARE_EXPORT Calendar::Bucket* Calendar::findBucket(int ident) const
+DECLARE_EXPORT Calendar::Bucket* Calendar::findBucket(Date d, bool fwd) const
 {
-  for (Bucket *b = firstBucket; b; b = b->nextBucket)
-    if (b->id == ident) return b;
+  if (recomputeIndex) buildIndex();
+
+  // Binary search for the last change before the date
+  vector<Date>::const_iterator i = fwd ?
+    upper_bound(indexDates.begin(), indexDates.end(), d) :
+    lower_bound(indexDates.begin(), indexDates.end(), d);
+  if (i == indexDates.begin()) return NULL;
+  size_t k = (i - indexDates.begin()) - 1;
+
+  // Evaluate the buckets effective at that date, in order of priority
+  long timeInWeek = INT_MIN;
+  for (size_t j = indexStart[k]; j < indexStart[k+1]; ++j)
+  {
+    Bucket *b = indexBuckets[j];
+    if (!b->offsetcounter)
+      // Continuously effective
+      return b;
+    // There are ineffective periods during the week
+    if (timeInWeek == INT_MIN)
+    {
+      // Lazy initialization
+      timeInWeek = d.getSecondsWeek();
+      // Special case: asking backward while at first second of the week
+      if (!fwd && timeInWeek == 0L) timeInWeek = 604800L;
+    }
+    // Check all intervals
+    for (short o=0; o<b->offsetcounter; o+=2)
+      if ((fwd && timeInWeek >= b->offsets[o] && timeInWeek < b->offsets[o+1]) ||
+          (!fwd && timeInWeek > b->offsets[o] && timeInWeek <= b->offsets[o+1]))
+        // All conditions are met!
+        return b;
+  }
   return NULL;
 }
 
 
+DECLARE_EXPORT Calendar::Bucket* Calendar::findBucket(int ident) const
+{
+  map<int, Bucket*>::const_iterator b = bucketIds.find(ident);
+  return b == bucketIds.end() ? NULL : b->second;
+}
+
+
 DECLARE_EXPORT void Calendar::writeElement(XMLOutput *o, const Keyword& tag, mode m) const
 {
   // Writing a reference
@@ -535,7 +567,10 @@ DECLARE_EXPORT void Calendar::Bucket::writeElement
 DECLARE_EXPORT void Calendar::Bucket::endElement (XMLInput& pIn, const Attribute& pAttr, const DataElement& pElement)
 {
   if (pAttr.isA(Tags::tag_priority))
+  {
     pElement >> priority;
+    cal->recomputeIndex = true;
+  }
   else if (pAttr.isA(Tags::tag_days))
     setDays(pElement.getInt());
   else if (pAttr.isA(Tags::tag_starttime))
@@ -555,31 +590,27 @@ DECLARE_EXPORT void Calendar::Bucket::setId(int ident)
   {
     // Force generation of a new identifier.
     // This is done by taking the highest existing id and adding 1.
-    for (BucketIterator i = cal->beginBuckets(); i != cal->endBuckets(); ++i)
-      if (i->id >= ident) ident = i->id + 1;
-    if (ident == INT_MIN) ident = 1;
+    if (cal->bucketIds.empty())
+      ident = 1;
+    else
+      ident = cal->bucketIds.rbegin()->first + 1;
   }
   else
   {
     // Check & enforce uniqueness of the argument identifier
-    bool unique;
-    do
-    {
-      unique = true;
-      for (BucketIterator i = cal->beginBuckets(); i != cal->endBuckets(); ++i)
-        if (i->id == ident && &(*i) != this)
-        {
-          // Update the identifier to avoid violating the uniqueness
-          unique = false;
-          ++ident;
-          break;
-        }
-    }
-    while (!unique);
+    for (map<int, Bucket*>::const_iterator i = cal->bucketIds.find(ident);
+        i != cal->bucketIds.end() && i->first == ident && i->second != this;
+        ++i)
+      // Update the identifier to avoid violating the uniqueness
+      ++ident;
   }
 
-  // Update the identifier
+  // Update the identifier and the index
+  map<int, Bucket*>::iterator old = cal->bucketIds.find(id);
+  if (old != cal->bucketIds.end() && old->second == this)
+    cal->bucketIds.erase(old);
   id = ident;
+  cal->bucketIds[id] = this;
 }
 
 
@@ -1094,6 +1125,10 @@ PyObject* CalendarEventIterator::iternext()
 
 DECLARE_EXPORT void Calendar::Bucket::updateOffsets()
 {
+  // The index of the calendar depends on the buckets that are effective
+  // continuously
+  cal->recomputeIndex = true;
+
   if (days==127 && !starttime && endtime==TimePeriod(86400L))
   {
     // Bucket is effective continuously. No need to update the structure.
@@ -93,9 +93,10 @@ DECLARE_EXPORT void Customer::endElement(XMLInput& pIn, const Attribute& pAttr,
 
 DECLARE_EXPORT Customer::~Customer()
 {
-  // Remove all references from demands to this customer
-  for (Demand::iterator i = Demand::begin(); i != Demand::end(); ++i)
-    if (i->getCustomer() == this) i->setCustomer(NULL);
+  // Remove all references from demands to this customer.
+  // Note that we are not using a for-loop since the function is updating
+  // the set at the same time as we move through it.
+  while (!demands.empty()) (*demands.begin())->setCustomer(NULL);
 }
 
 
@@ -135,12 +136,12 @@ DECLARE_EXPORT int Customer::setattro(const Attribute& attr, const PythonObject&
     setSource(field.getString());
   else if (attr.isA(Tags::tag_owner))
   {
-    if (!field.check(Customer::metadata))
+    if (field && !field.check(Customer::metadata))
     {
       PyErr_SetString(PythonDataException, "customer owner must be of type customer");
       return -1;
     }
-    Customer* y = static_cast<Customer*>(static_cast<PyObject*>(field));
+    Customer* y = field ? static_cast<Customer*>(static_cast<PyObject*>(field)) : NULL;
     setOwner(y);
   }
   else if (attr.isA(Tags::tag_hidden))
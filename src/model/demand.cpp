@@ -74,6 +74,14 @@ DECLARE_EXPORT Demand::~Demand()
 
   // Remove the delivery operationplans
   deleteOperationPlans(true);
+
+  // Remove the references to this demand
+  if (it) it->demands.erase(this);
+  if (oper) oper->deliveryDemands.erase(this);
+  if (cust) cust->demands.erase(this);
+
+  // Remove the demand from the member list of its cluster
+  HasLevel::triggerDemandRecomputation();
 }
 
 
@@ -394,6 +402,8 @@ DECLARE_EXPORT PyObject* Demand::getattro(const Attribute& attr)
     return PythonObject(getCustomer());
   if (attr.isA(Tags::tag_operation))
     return PythonObject(getOperation());
+  if (attr.isA(Tags::tag_cluster))
+    return PythonObject(getCluster());
   if (attr.isA(Tags::tag_description))
     return PythonObject(getDescription());
   if (attr.isA(Tags::tag_category))
@@ -432,22 +442,22 @@ DECLARE_EXPORT int Demand::setattro(const Attribute& attr, const PythonObject& f
     setDue(field.getDate());
   else if (attr.isA(Tags::tag_item))
   {
-    if (!field.check(Item::metadata))
+    if (field && !field.check(Item::metadata))
     {
       PyErr_SetString(PythonDataException, "demand item must be of type item");
       return -1;
     }
-    Item* y = static_cast<Item*>(static_cast<PyObject*>(field));
+    Item* y = field ? static_cast<Item*>(static_cast<PyObject*>(field)) : NULL;
     setItem(y);
   }
   else if (attr.isA(Tags::tag_customer))
   {
-    if (!field.check(Customer::metadata))
+    if (field && !field.check(Customer::metadata))
     {
       PyErr_SetString(PythonDataException, "demand customer must be of type customer");
       return -1;
     }
-    Customer* y = static_cast<Customer*>(static_cast<PyObject*>(field));
+    Customer* y = field ? static_cast<Customer*>(static_cast<PyObject*>(field)) : NULL;
     setCustomer(y);
   }
   else if (attr.isA(Tags::tag_description))
@@ -464,22 +474,22 @@ DECLARE_EXPORT int Demand::setattro(const Attribute& attr, const PythonObject& f
     setMaxLateness(field.getTimeperiod());
   else if (attr.isA(Tags::tag_owner))
   {
-    if (!field.check(Demand::metadata))
+    if (field && !field.check(Demand::metadata))
     {
       PyErr_SetString(PythonDataException, "demand owner must be of type demand");
       return -1;
     }
-    Demand* y = static_cast<Demand*>(static_cast<PyObject*>(field));
+    Demand* y = field ? static_cast<Demand*>(static_cast<PyObject*>(field)) : NULL;
     setOwner(y);
   }
   else if (attr.isA(Tags::tag_operation))
   {
-    if (!field.check(Operation::metadata))
+    if (field && !field.check(Operation::metadata))
     {
       PyErr_SetString(PythonDataException, "demand operation must be of type operation");
       return -1;
     }
-    Operation* y = static_cast<Operation*>(static_cast<PyObject*>(field));
+    Operation* y = field ? static_cast<Operation*>(static_cast<PyObject*>(field)) : NULL;
     setOperation(y);
   }
   else if (attr.isA(Tags::tag_hidden))
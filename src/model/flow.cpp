@@ -132,14 +132,16 @@ DECLARE_EXPORT void Flow::validate(Action action)
   }
 
   // Set a flag to make sure the level computation is triggered again
-  HasLevel::triggerLazyRecomputation();
+  HasLevel::triggerLazyRecomputation(oper);
+  HasLevel::triggerLazyRecomputation(buf);
 }
 
 
 DECLARE_EXPORT Flow::~Flow()
 {
   // Set a flag to make sure the level computation is triggered again
-  HasLevel::triggerLazyRecomputation();
+  if (getOperation()) HasLevel::triggerLazyRecomputation(getOperation());
+  if (getBuffer()) HasLevel::triggerLazyRecomputation(getBuffer());
 
   // Delete existing flowplans
   if (getOperation() && getBuffer())
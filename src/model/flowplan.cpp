@@ -24,6 +24,7 @@ namespace frepple
 {
 
 DECLARE_EXPORT const MetaCategory* FlowPlan::metadata;
+DECLARE_EXPORT MemoryPool* FlowPlan::pool = NULL;
 
 
 int FlowPlan::initialize()
@@ -31,11 +32,20 @@ int FlowPlan::initialize()
   // Initialize the metadata
   metadata = new MetaCategory("flowplan", "flowplans");
 
+  // Initialize the memory pool
+  pool = new MemoryPool("FlowPlan", sizeof(FlowPlan));
+
   // Initialize the Python type
   PythonType& x = FreppleCategory<FlowPlan>::getType();
   x.setName("flowplan");
   x.setDoc("frePPLe flowplan");
   x.supportgetattro();
+  x.addField<FlowPlan>(Tags::tag_operationplan, &FlowPlan::getOperationPlan);
+  x.addField<FlowPlan>(Tags::tag_quantity, &FlowPlan::getQuantity);
+  x.addField<FlowPlan>(Tags::tag_flow, &FlowPlan::getFlow);
+  x.addField<FlowPlan>(Tags::tag_date, &FlowPlan::getDate);
+  x.addField<FlowPlan>(Tags::tag_onhand, &FlowPlan::getOnhand);
+  x.addField<FlowPlan>(Tags::tag_buffer, &FlowPlan::getBuffer);
   const_cast<MetaCategory*>(metadata)->pythonClass = x.type_object();
   return x.typeReady();
 }
@@ -165,18 +175,6 @@ DECLARE_EXPORT void FlowPlan::writeElement(XMLOutput *o, const Keyword& tag, mod
 
 PyObject* FlowPlan::getattro(const Attribute& attr)
 {
-  if (attr.isA(Tags::tag_operationplan))
-    return PythonObject(getOperationPlan());
-  if (attr.isA(Tags::tag_quantity))
-    return PythonObject(getQuantity());
-  if (attr.isA(Tags::tag_flow))
-    return PythonObject(getFlow());
-  if (attr.isA(Tags::tag_date))
-    return PythonObject(getDate());
-  if (attr.isA(Tags::tag_onhand))
-    return PythonObject(getOnhand());
-  if (attr.isA(Tags::tag_buffer)) // Convenient shortcut
-    return PythonObject(getFlow()->getBuffer());
   if (attr.isA(Tags::tag_operation)) // Convenient shortcut
     return PythonObject(getFlow()->getOperation());
   return NULL;
@@ -52,13 +52,16 @@ int ItemDefault::initialize()
 
 DECLARE_EXPORT Item::~Item()
 {
-  // Remove references from the buffers
-  for (Buffer::iterator buf = Buffer::begin(); buf != Buffer::end(); ++buf)
-    if (buf->getItem() == this) buf->setItem(NULL);
+  // Remove references from the buffers.
+  // Note that we are not using a for-loop since the function is updating
+  // the set at the same time as we move through it.
+  while (!buffers.empty()) (*buffers.begin())->setItem(NULL);
 
   // Remove references from the demands
-  for (Demand::iterator l = Demand::begin(); l != Demand::end(); ++l)
-    if (l->getItem() == this) l->setItem(NULL);
+  while (!demands.empty()) (*demands.begin())->setItem(NULL);
+
+  // Remove the reference to the delivery operation
+  setOperation(NULL);
 }
 
 
@@ -161,22 +164,22 @@ DECLARE_EXPORT int Item::setattro(const Attribute& attr, const PythonObject& fie
     setPrice(field.getDouble());
   else if (attr.isA(Tags::tag_owner))
   {
-    if (!field.check(Item::metadata))
+    if (field && !field.check(Item::metadata))
     {
       PyErr_SetString(PythonDataException, "item owner must be of type item");
       return -1;
     }
-    Item* y = static_cast<Item*>(static_cast<PyObject*>(field));
+    Item* y = field ? static_cast<Item*>(static_cast<PyObject*>(field)) : NULL;
     setOwner(y);
   }
   else if (attr.isA(Tags::tag_operation))
   {
-    if (!field.check(Operation::metadata))
+    if (field && !field.check(Operation::metadata))
     {
       PyErr_SetString(PythonDataException, "item operation must be of type operation");
       return -1;
     }
-    Operation* y = static_cast<Operation*>(static_cast<PyObject*>(field));
+    Operation* y = field ? static_cast<Operation*>(static_cast<PyObject*>(field)) : NULL;
     setOperation(y);
   }
   else if (attr.isA(Tags::tag_hidden))
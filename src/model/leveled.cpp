@@ -33,291 +33,673 @@ namespace frepple
 
 
 DECLARE_EXPORT bool HasLevel::recomputeLevels = false;
+DECLARE_EXPORT bool HasLevel::recomputeAll = true;
+DECLARE_EXPORT bool HasLevel::recomputeDemands = false;
 DECLARE_EXPORT bool HasLevel::computationBusy = false;
 DECLARE_EXPORT unsigned int HasLevel::numberOfClusters = 0;
 DECLARE_EXPORT unsigned short HasLevel::numberOfLevels = 0;
+DECLARE_EXPORT unsigned long HasLevel::numberOfPasses = 0;
+DECLARE_EXPORT vector< vector<Buffer*> > HasLevel::clusterBuffers;
+DECLARE_EXPORT vector< vector<Resource*> > HasLevel::clusterResources;
+DECLARE_EXPORT vector< vector<Operation*> > HasLevel::clusterOperations;
+DECLARE_EXPORT vector< vector<Demand*> > HasLevel::clusterDemands;
+DECLARE_EXPORT vector<unsigned short> HasLevel::clusterLevels;
+DECLARE_EXPORT set<HasLevel*> HasLevel::changedBuffers;
+DECLARE_EXPORT set<HasLevel*> HasLevel::changedResources;
+DECLARE_EXPORT set<HasLevel*> HasLevel::changedOperations;
+DECLARE_EXPORT set<HasLevel*> HasLevel::deletedMembers;
+DECLARE_EXPORT set<unsigned int> HasLevel::changedClusters;
+
+
+/** Protects the registration of network changes in a multi-threaded
+  * environment. */
+static Mutex changesbusy;
+
+
+/** Gives exclusive access to the cluster and level computation, and to the
+  * cluster members while they are copied. */
+static Mutex levelcomputationbusy;
+
+
+DECLARE_EXPORT HasLevel::~HasLevel()
+{
+  ScopeMutexLock l(changesbusy);
+  recomputeLevels = true;
+  if (recomputeAll) return;
+  changedBuffers.erase(this);
+  changedResources.erase(this);
+  changedOperations.erase(this);
+  deletedMembers.insert(this);
+  changedClusters.insert(cluster);
+}
+
+
+DECLARE_EXPORT void HasLevel::triggerLazyRecomputation(Operation* o)
+{
+  ScopeMutexLock l(changesbusy);
+  recomputeLevels = true;
+  if (!recomputeAll) changedOperations.insert(o);
+}
+
+
+DECLARE_EXPORT void HasLevel::triggerLazyRecomputation(Buffer* b)
+{
+  ScopeMutexLock l(changesbusy);
+  recomputeLevels = true;
+  if (!recomputeAll) changedBuffers.insert(b);
+}
+
+
+DECLARE_EXPORT void HasLevel::triggerLazyRecomputation(Resource* r)
+{
+  ScopeMutexLock l(changesbusy);
+  recomputeLevels = true;
+  if (!recomputeAll) changedResources.insert(r);
+}
+
+
+DECLARE_EXPORT vector<Buffer*> HasLevel::getClusterBuffers(unsigned int c)
+{
+  if (recomputeLevels || computationBusy) computeLevels();
+  ScopeMutexLock l(levelcomputationbusy);
+  return c < clusterBuffers.size() ? clusterBuffers[c] : vector<Buffer*>();
+}
+
+
+DECLARE_EXPORT vector<Resource*> HasLevel::getClusterResources(unsigned int c)
+{
+  if (recomputeLevels || computationBusy) computeLevels();
+  ScopeMutexLock l(levelcomputationbusy);
+  return c < clusterResources.size() ? clusterResources[c] : vector<Resource*>();
+}
+
+
+DECLARE_EXPORT vector<Operation*> HasLevel::getClusterOperations(unsigned int c)
+{
+  if (recomputeLevels || computationBusy) computeLevels();
+  ScopeMutexLock l(levelcomputationbusy);
+  return c < clusterOperations.size() ? clusterOperations[c] : vector<Operation*>();
+}
+
+
+DECLARE_EXPORT vector<Demand*> HasLevel::getClusterDemands(unsigned int c)
+{
+  if (recomputeLevels || recomputeDemands || computationBusy) computeLevels();
+  ScopeMutexLock l(levelcomputationbusy);
+  return c < clusterDemands.size() ? clusterDemands[c] : vector<Demand*>();
+}
+
+
+/** Appends Python references to a list of entities to a Python list. */
+template <class T> static bool appendMembers(PyObject* lst, const vector<T*>& m)
+{
+  for (typename vector<T*>::const_iterator i = m.begin(); i != m.end(); ++i)
+  {
+    PyObject* o = PythonObject(*i);
+    int err = PyList_Append(lst, o);
+    Py_DECREF(o);
+    if (err) return false;
+  }
+  return true;
+}
+
+
+PyObject* HasLevel::clusterMembers(PyObject *self, PyObject *args)
+{
+  // Parse the Python arguments
+  PyObject* pyclusters = NULL;
+  int ok = PyArg_ParseTuple(args, "O:clustermembers", &pyclusters);
+  if (!ok) return NULL;
+  PyObject* iter = PyObject_GetIter(pyclusters);
+  if (!iter)
+  {
+    PyErr_Format(PyExc_AttributeError,"Argument to clustermembers() must support iteration");
+    return NULL;
+  }
+  set<int> clusters;
+  PyObject* item;
+  while ((item = PyIter_Next(iter)))
+  {
+    clusters.insert(PythonObject(item).getInt());
+    Py_DECREF(item);
+  }
+  Py_DECREF(iter);
+  if (PyErr_Occurred()) return NULL;
+
+  // Collect the members of the clusters
+  PyObject* bufs = PyList_New(0);
+  PyObject* ress = PyList_New(0);
+  PyObject* opers = PyList_New(0);
+  PyObject* dmds = PyList_New(0);
+  try
+  {
+    if (!bufs || !ress || !opers || !dmds)
+      throw RuntimeException("Can't build the cluster members");
+    for (set<int>::const_iterator c = clusters.begin(); c != clusters.end(); ++c)
+    {
+      if (*c < 0) continue;
+      if (!appendMembers(bufs, getClusterBuffers(*c))
+        || !appendMembers(ress, getClusterResources(*c))
+        || !appendMembers(opers, getClusterOperations(*c))
+        || !appendMembers(dmds, getClusterDemands(*c)))
+        throw RuntimeException("Can't build the cluster members");
+    }
+  }
+  catch(...)
+  {
+    Py_XDECREF(bufs);
+    Py_XDECREF(ress);
+    Py_XDECREF(opers);
+    Py_XDECREF(dmds);
+    PythonType::evalException();
+    return NULL;
+  }
+
+  // The tuple takes over the references to the lists
+  return Py_BuildValue("(NNNN)", bufs, ress, opers, dmds);
+}
+
+
+/** Compares entities by name. */
+template <class T> static bool compareName(const T* a, const T* b)
+{
+  return a->getName() < b->getName();
+}
+
+
+/** Removes the entities of a set from a member list, and appends the
+  * remaining ones to another list.<br>
+  * The entities of the set can already be deleted. Their pointers are only
+  * compared.
+  */
+template <class T> static void moveMembers
+(vector<T*>& from, vector<T*>& to, const set<HasLevel*>& skip)
+{
+  for (typename vector<T*>::const_iterator i = from.begin(); i != from.end(); ++i)
+    if (skip.find(*i) == skip.end()) to.push_back(*i);
+  from.clear();
+}
 
 
 DECLARE_EXPORT void HasLevel::computeLevels()
 {
   computationBusy = true;
   // Get exclusive access to this function in a multi-threaded environment.
-  static Mutex levelcomputationbusy;
   ScopeMutexLock l(levelcomputationbusy);
 
   // Another thread may already have computed the levels while this thread was
   // waiting for the lock. In that case the while loop will be skipped.
-  while (recomputeLevels)
+  while (recomputeLevels || recomputeDemands)
   {
-    // Reset the recomputation flag. Note that during the computation the flag
-    // could be switched on again by some model change in a different thread.
-    // In that case, the while loop will be rerun.
-    recomputeLevels = false;
-
-    // Reset current levels on buffers, resources and operations
-    for (Buffer::iterator gbuf = Buffer::begin();
-        gbuf != Buffer::end(); ++gbuf)
+    // Pick up the changes and reset the recomputation flags. Note that during
+    // the computation the flags could be switched on again by some model
+    // change in a different thread. In that case, the while loop will be
+    // rerun.
+    bool levels, all;
+    set<HasLevel*> bufs, ress, opers, deleted;
+    set<unsigned int> clusters;
     {
-      gbuf->cluster = 0;
-      gbuf->lvl = -1;
+      ScopeMutexLock m(changesbusy);
+      levels = recomputeLevels;
+      all = recomputeAll;
+      recomputeLevels = false;
+      recomputeAll = false;
+      recomputeDemands = false;
+      bufs.swap(changedBuffers);
+      ress.swap(changedResources);
+      opers.swap(changedOperations);
+      deleted.swap(deletedMembers);
+      clusters.swap(changedClusters);
     }
-    for (Resource::iterator gres = Resource::begin();
-        gres != Resource::end(); ++gres)
+
+    vector<Operation*> subsetOperations;
+    vector<Buffer*> subsetBuffers;
+    vector<Resource*> subsetResources;
+    vector<unsigned int> available;
+    if (all)
     {
-      gres->cluster = 0;
-      gres->lvl = -1;
+      // Analyze the complete model
+      for (Operation::iterator gop = Operation::begin();
+          gop != Operation::end(); ++gop)
+        subsetOperations.push_back(&*gop);
+      for (Buffer::iterator gbuf = Buffer::begin();
+          gbuf != Buffer::end(); ++gbuf)
+        subsetBuffers.push_back(&*gbuf);
+      for (Resource::iterator gres = Resource::begin();
+          gres != Resource::end(); ++gres)
+        subsetResources.push_back(&*gres);
+      numberOfClusters = 0;
+      clusterBuffers.assign(1, vector<Buffer*>());
+      clusterResources.assign(1, vector<Resource*>());
+      clusterOperations.assign(1, vector<Operation*>());
+      clusterLevels.assign(1, 0);
+      computeSubset(subsetOperations, subsetBuffers, subsetResources, available);
     }
-    for (Operation::iterator gop = Operation::begin();
-        gop != Operation::end(); ++gop)
+    else if (levels)
     {
-      gop->cluster = 0;
-      gop->lvl = -1;
+      // Find the clusters of the changed entities
+      for (set<HasLevel*>::const_iterator i = bufs.begin(); i != bufs.end(); ++i)
+        clusters.insert((*i)->cluster);
+      for (set<HasLevel*>::const_iterator i = ress.begin(); i != ress.end(); ++i)
+        clusters.insert((*i)->cluster);
+      for (set<HasLevel*>::const_iterator i = opers.begin(); i != opers.end(); ++i)
+        clusters.insert((*i)->cluster);
+
+      // The subset consists of the remaining members of these clusters and
+      // the changed entities which aren't in a cluster yet. The cluster numbers
+      // are released.
+      // Cluster 0 is a special case: only its changed members leave the
+      // cluster, the unconnected entities stay.
+      for (set<unsigned int>::const_iterator c = clusters.begin();
+          c != clusters.end(); ++c)
+      {
+        if (*c > numberOfClusters) continue;
+        if (*c)
+        {
+          moveMembers(clusterOperations[*c], subsetOperations, deleted);
+          moveMembers(clusterBuffers[*c], subsetBuffers, deleted);
+          moveMembers(clusterResources[*c], subsetResources, deleted);
+          clusterLevels[*c] = 0;
+          available.push_back(*c);
+        }
+        else
+        {
+          set<HasLevel*> skip(deleted);
+          skip.insert(bufs.begin(), bufs.end());
+          skip.insert(ress.begin(), ress.end());
+          skip.insert(opers.begin(), opers.end());
+          vector<Operation*> keepOperations;
+          vector<Buffer*> keepBuffers;
+          vector<Resource*> keepResources;
+          moveMembers(clusterOperations[0], keepOperations, skip);
+          moveMembers(clusterBuffers[0], keepBuffers, skip);
+          moveMembers(clusterResources[0], keepResources, skip);
+          clusterOperations[0].swap(keepOperations);
+          clusterBuffers[0].swap(keepBuffers);
+          clusterResources[0].swap(keepResources);
+        }
+      }
+      for (set<HasLevel*>::const_iterator i = opers.begin(); i != opers.end(); ++i)
+        if (!(*i)->cluster) subsetOperations.push_back(static_cast<Operation*>(*i));
+      for (set<HasLevel*>::const_iterator i = bufs.begin(); i != bufs.end(); ++i)
+        if (!(*i)->cluster) subsetBuffers.push_back(static_cast<Buffer*>(*i));
+      for (set<HasLevel*>::const_iterator i = ress.begin(); i != ress.end(); ++i)
+        if (!(*i)->cluster) subsetResources.push_back(static_cast<Resource*>(*i));
+
+      // Analyze the subset in alphabetical order
+      sort(subsetOperations.begin(), subsetOperations.end(), compareName<Operation>);
+      sort(subsetBuffers.begin(), subsetBuffers.end(), compareName<Buffer>);
+      sort(subsetResources.begin(), subsetResources.end(), compareName<Resource>);
+      computeSubset(subsetOperations, subsetBuffers, subsetResources, available);
     }
 
-    // Loop through all operations
-    stack< pair<Operation*,int> > stack;
-    Operation* cur_oper;
-    int cur_level;
-    Buffer *cur_buf;
-    const Flow* cur_Flow;
-    bool search_level;
-    int cur_cluster;
+    // Update the maximum level in the model
     numberOfLevels = 0;
-    numberOfClusters = 0;
-    map<Operation*,short> visited;
-    for (Operation::iterator g = Operation::begin();
-        g != Operation::end(); ++g)
+    for (vector<unsigned short>::const_iterator lvls = clusterLevels.begin();
+        lvls != clusterLevels.end(); ++lvls)
+      if (*lvls > numberOfLevels) numberOfLevels = *lvls;
+
+    // Rebuild the demand lists of all clusters
+    assignDemands();
+
+  } // End of while recomputeLevels. The loop will be repeated as long as model
+  // changes are done during the recomputation.
+
+  // Unlock the exclusive access to this function
+  computationBusy = false;
+}
+
+
+void HasLevel::computeSubset(const vector<Operation*>& opers,
+  const vector<Buffer*>& bufs, const vector<Resource*>& ress,
+  vector<unsigned int>& available)
+{
+  // Reset current levels on buffers, resources and operations
+  for (vector<Buffer*>::const_iterator gbuf = bufs.begin();
+      gbuf != bufs.end(); ++gbuf)
+  {
+    (*gbuf)->cluster = 0;
+    (*gbuf)->lvl = -1;
+  }
+  for (vector<Resource*>::const_iterator gres = ress.begin();
+      gres != ress.end(); ++gres)
+  {
+    (*gres)->cluster = 0;
+    (*gres)->lvl = -1;
+  }
+  for (vector<Operation*>::const_iterator gop = opers.begin();
+      gop != opers.end(); ++gop)
+  {
+    (*gop)->cluster = 0;
+    (*gop)->lvl = -1;
+  }
+
+  // The released cluster numbers are reused, starting with the lowest one
+  sort(available.begin(), available.end());
+  vector<unsigned int>::iterator nextAvailable = available.begin();
+
+  // Loop through all operations
+  stack< pair<Operation*,int> > stack;
+  Operation* cur_oper;
+  int cur_level;
+  Buffer *cur_buf;
+  const Flow* cur_Flow;
+  bool search_level;
+  unsigned int cur_cluster;
+  for (vector<Operation*>::const_iterator g = opers.begin();
+      g != opers.end(); ++g)
+  {
+    // Select a new cluster number
+    if ((*g)->cluster)
+      cur_cluster = (*g)->cluster;
+    else
     {
-      // Select a new cluster number
-      if (g->cluster)
-        cur_cluster = g->cluster;
+      // Detect hanging operations
+      if ((*g)->getFlows().empty() && (*g)->getLoads().empty()
+          && (*g)->getSuperOperations().empty()
+          && (*g)->getSubOperations().empty()
+         )
+      {
+        // Cluster 0 keeps all dangling operations
+        (*g)->lvl = 0;
+        continue;
+      }
+      if (nextAvailable != available.end())
+        cur_cluster = *(nextAvailable++);
       else
       {
-        // Detect hanging operations
-        if (g->getFlows().empty() && g->getLoads().empty()
-            && g->getSuperOperations().empty()
-            && g->getSubOperations().empty()
-           )
-        {
-          // Cluster 0 keeps all dangling operations
-          g->lvl = 0;
-          continue;
-        }
         cur_cluster = ++numberOfClusters;
         if (numberOfClusters >= UINT_MAX)
           throw LogicException("Too many clusters");
+        clusterBuffers.push_back(vector<Buffer*>());
+        clusterResources.push_back(vector<Resource*>());
+        clusterOperations.push_back(vector<Operation*>());
+        clusterLevels.push_back(0);
       }
+    }
 
 #ifdef CLUSTERDEBUG
-      logger << "Investigating operation '" << &*g
-          << "' - current cluster " << g->cluster << endl;
+    logger << "Investigating operation '" << *g
+        << "' - current cluster " << (*g)->cluster << endl;
 #endif
 
 
-      // Do we need to activate the level search?
-      // Criterion are:
-      //   - Not used in a super operation
-      //   - Have a producing flow on the operation itself
-      //     or on any of its sub operations
-      search_level = false;
-      if (g->getSuperOperations().empty())
+    // Do we need to activate the level search?
+    // Criterion are:
+    //   - Not used in a super operation
+    //   - Have a producing flow on the operation itself
+    //     or on any of its sub operations
+    search_level = false;
+    if ((*g)->getSuperOperations().empty())
+    {
+      search_level = true;
+      // Does the operation itself have producing flows?
+      for (Operation::flowlist::const_iterator fl = (*g)->getFlows().begin();
+          fl != (*g)->getFlows().end() && search_level; ++fl)
+        if (fl->isProducer()) search_level = false;
+      if (search_level)
       {
-        search_level = true;
-        // Does the operation itself have producing flows?
-        for (Operation::flowlist::const_iterator fl = g->getFlows().begin();
-            fl != g->getFlows().end() && search_level; ++fl)
-          if (fl->isProducer()) search_level = false;
-        if (search_level)
-        {
-          // Do suboperations have a producing flow?
-          for (Operation::Operationlist::const_reverse_iterator
-              i = g->getSubOperations().rbegin();
-              i != g->getSubOperations().rend() && search_level;
-              ++i)
-            for (Operation::flowlist::const_iterator
-                fl = (*i)->getFlows().begin();
-                fl != (*i)->getFlows().end() && search_level;
-                ++fl)
-              if (fl->isProducer()) search_level = false;
-        }
+        // Do suboperations have a producing flow?
+        for (Operation::Operationlist::const_reverse_iterator
+            i = (*g)->getSubOperations().rbegin();
+            i != (*g)->getSubOperations().rend() && search_level;
+            ++i)
+          for (Operation::flowlist::const_iterator
+              fl = (*i)->getFlows().begin();
+              fl != (*i)->getFlows().end() && search_level;
+              ++fl)
+            if (fl->isProducer()) search_level = false;
       }
+    }
 
-      // If both the level and the cluster are de-activated, then we can move on
-      if (!search_level && g->cluster) continue;
-
-      // Start recursing
-      // Note that as soon as push an operation on the stack we set its
-      // cluster and/or level. This is avoid that operations are needlessly
-      // pushed a second time on the stack.
-      stack.push(make_pair(&*g, search_level ? 0 : -1));
-      visited.clear();
-      g->cluster = cur_cluster;
-      if (search_level) g->lvl = 0;
-      while (!stack.empty())
-      {
-        // Take the top of the stack
-        cur_oper = stack.top().first;
-        cur_level = stack.top().second;
-        stack.pop();
+    // If both the level and the cluster are de-activated, then we can move on
+    if (!search_level && (*g)->cluster) continue;
+
+    // Start recursing
+    // Note that as soon as push an operation on the stack we set its
+    // cluster and/or level. This is avoid that operations are needlessly
+    // pushed a second time on the stack.
+    // Every recursion is a new search pass, which resets the visit counters
+    // of the operations.
+    stack.push(make_pair(*g, search_level ? 0 : -1));
+    ++numberOfPasses;
+    (*g)->cluster = cur_cluster;
+    if (search_level) (*g)->lvl = 0;
+    while (!stack.empty())
+    {
+      // Take the top of the stack
+      cur_oper = stack.top().first;
+      cur_level = stack.top().second;
+      stack.pop();
 
-        // Keep track of the maximum number of levels
-        if (cur_level > numberOfLevels)
-          numberOfLevels = cur_level;
+      // Keep track of the maximum number of levels
+      if (cur_level > clusterLevels[cur_cluster])
+        clusterLevels[cur_cluster] = cur_level;
 
 #ifdef CLUSTERDEBUG
-        logger << "    Recursing in Operation '" << *(cur_oper)
-            << "' - current level " << cur_level << endl;
+      logger << "    Recursing in Operation '" << *(cur_oper)
+          << "' - current level " << cur_level << endl;
 #endif
-        // Detect loops in the supply chain
-        map<Operation*,short>::iterator detectloop = visited.find(cur_oper);
-        if (detectloop == visited.end())
-          // Keep track of operations already visited
-          visited.insert(make_pair(cur_oper,0));
-        else if (++(detectloop->second) > 1)
-          // Already visited this operation enough times - don't repeat
-          continue;
-
-        // Push sub operations on the stack
-        for (Operation::Operationlist::const_reverse_iterator
-            i = cur_oper->getSubOperations().rbegin();
-            i != cur_oper->getSubOperations().rend();
-            ++i)
+      // Detect loops in the supply chain
+      if (cur_oper->visitPass != numberOfPasses)
+      {
+        // Keep track of operations already visited
+        cur_oper->visitPass = numberOfPasses;
+        cur_oper->visitCount = 0;
+      }
+      else if (++(cur_oper->visitCount) > 1)
+        // Already visited this operation enough times - don't repeat
+        continue;
+
+      // Push sub operations on the stack
+      for (Operation::Operationlist::const_reverse_iterator
+          i = cur_oper->getSubOperations().rbegin();
+          i != cur_oper->getSubOperations().rend();
+          ++i)
+      {
+        if ((*i)->lvl < cur_level)
         {
-          if ((*i)->lvl < cur_level)
-          {
-            // Search level and cluster
-            stack.push(make_pair(*i,cur_level));
-            (*i)->lvl = cur_level;
-            (*i)->cluster = cur_cluster;
-          }
-          else if (!(*i)->cluster)
-          {
-            // Search for clusters information only
-            stack.push(make_pair(*i,-1));
-            (*i)->cluster = cur_cluster;
-          }
-          // else: no search required
+          // Search level and cluster
+          stack.push(make_pair(*i,cur_level));
+          (*i)->lvl = cur_level;
+          (*i)->cluster = cur_cluster;
         }
-
-        // Push super operations on the stack
-        for (Operation::Operationlist::const_reverse_iterator
-            j = cur_oper->getSuperOperations().rbegin();
-            j != cur_oper->getSuperOperations().rend();
-            ++j)
+        else if (!(*i)->cluster)
         {
-          if ((*j)->lvl < cur_level)
-          {
-            // Search level and cluster
-            stack.push(make_pair(*j,cur_level));
-            (*j)->lvl = cur_level;
-            (*j)->cluster = cur_cluster;
-          }
-          else if (!(*j)->cluster)
-          {
-            // Search for clusters information only
-            stack.push(make_pair(*j,-1));
-            (*j)->cluster = cur_cluster;
-          }
-          // else: no search required
+          // Search for clusters information only
+          stack.push(make_pair(*i,-1));
+          (*i)->cluster = cur_cluster;
         }
+        // else: no search required
+      }
 
-        // Update level of resources linked to current operation
-        for (Operation::loadlist::const_iterator gres =
-            cur_oper->getLoads().begin();
-            gres != cur_oper->getLoads().end(); ++gres)
+      // Push super operations on the stack
+      for (Operation::Operationlist::const_reverse_iterator
+          j = cur_oper->getSuperOperations().rbegin();
+          j != cur_oper->getSuperOperations().rend();
+          ++j)
+      {
+        if ((*j)->lvl < cur_level)
         {
-          Resource *resptr = gres->getResource();
-          // Update the level of the resource
-          if (resptr->lvl < cur_level) resptr->lvl = cur_level;
-          // Update the cluster of the resource and operations using it
-          if (!resptr->cluster)
-          {
-            resptr->cluster = cur_cluster;
-            // Find more operations connected to this cluster by the resource
-            for (Resource::loadlist::const_iterator resops =
-                resptr->getLoads().begin();
-                resops != resptr->getLoads().end(); ++resops)
-              if (!resops->getOperation()->cluster)
-              {
-                stack.push(make_pair(resops->getOperation(),-1));
-                resops->getOperation()->cluster = cur_cluster;
-              }
-          }
+          // Search level and cluster
+          stack.push(make_pair(*j,cur_level));
+          (*j)->lvl = cur_level;
+          (*j)->cluster = cur_cluster;
+        }
+        else if (!(*j)->cluster)
+        {
+          // Search for clusters information only
+          stack.push(make_pair(*j,-1));
+          (*j)->cluster = cur_cluster;
         }
+        // else: no search required
+      }
 
-        // Now loop through all flows of the operation
-        for (Operation::flowlist::const_iterator
-            gflow = cur_oper->getFlows().begin();
-            gflow != cur_oper->getFlows().end();
-            ++gflow)
+      // Update level of resources linked to current operation
+      for (Operation::loadlist::const_iterator gres =
+          cur_oper->getLoads().begin();
+          gres != cur_oper->getLoads().end(); ++gres)
+      {
+        Resource *resptr = gres->getResource();
+        // Update the level of the resource
+        if (resptr->lvl < cur_level) resptr->lvl = cur_level;
+        // Update the cluster of the resource and operations using it
+        if (!resptr->cluster)
         {
-          cur_Flow = &*gflow;
-          cur_buf = cur_Flow->getBuffer();
+          resptr->cluster = cur_cluster;
+          // Find more operations connected to this cluster by the resource
+          for (Resource::loadlist::const_iterator resops =
+              resptr->getLoads().begin();
+              resops != resptr->getLoads().end(); ++resops)
+            if (!resops->getOperation()->cluster)
+            {
+              stack.push(make_pair(resops->getOperation(),-1));
+              resops->getOperation()->cluster = cur_cluster;
+            }
+        }
+      }
+
+      // Now loop through all flows of the operation
+      for (Operation::flowlist::const_iterator
+          gflow = cur_oper->getFlows().begin();
+          gflow != cur_oper->getFlows().end();
+          ++gflow)
+      {
+        cur_Flow = &*gflow;
+        cur_buf = cur_Flow->getBuffer();
 
-          // Check whether the level search needs to continue
-          search_level = cur_level!=-1 && cur_buf->lvl<cur_level+1;
+        // Check whether the level search needs to continue
+        search_level = cur_level!=-1 && cur_buf->lvl<cur_level+1;
 
-          // Check if the buffer needs processing
-          if (search_level || !cur_buf->cluster)
+        // Check if the buffer needs processing
+        if (search_level || !cur_buf->cluster)
+        {
+          // Update the cluster of the current buffer
+          cur_buf->cluster = cur_cluster;
+
+          // Loop through all flows of the buffer
+          for (Buffer::flowlist::const_iterator
+              buffl = cur_buf->getFlows().begin();
+              buffl != cur_buf->getFlows().end();
+              ++buffl)
           {
-            // Update the cluster of the current buffer
-            cur_buf->cluster = cur_cluster;
-
-            // Loop through all flows of the buffer
-            for (Buffer::flowlist::const_iterator
-                buffl = cur_buf->getFlows().begin();
-                buffl != cur_buf->getFlows().end();
-                ++buffl)
+            // Check level recursion
+            if (cur_Flow->isConsumer() && search_level)
             {
-              // Check level recursion
-              if (cur_Flow->isConsumer() && search_level)
+              if (buffl->getOperation()->lvl < cur_level+1
+                  && &*buffl != cur_Flow && buffl->isProducer())
               {
-                if (buffl->getOperation()->lvl < cur_level+1
-                    && &*buffl != cur_Flow && buffl->isProducer())
-                {
-                  stack.push(make_pair(buffl->getOperation(),cur_level+1));
-                  buffl->getOperation()->lvl = cur_level+1;
-                  buffl->getOperation()->cluster = cur_cluster;
-                }
-                else if (!buffl->getOperation()->cluster)
-                {
-                  stack.push(make_pair(buffl->getOperation(),-1));
-                  buffl->getOperation()->cluster = cur_cluster;
-                }
-                if (cur_level+1 > numberOfLevels)
-                  numberOfLevels = cur_level+1;
-                cur_buf->lvl = cur_level+1;
+                stack.push(make_pair(buffl->getOperation(),cur_level+1));
+                buffl->getOperation()->lvl = cur_level+1;
+                buffl->getOperation()->cluster = cur_cluster;
               }
-              // Check cluster recursion
               else if (!buffl->getOperation()->cluster)
               {
                 stack.push(make_pair(buffl->getOperation(),-1));
                 buffl->getOperation()->cluster = cur_cluster;
               }
+              if (cur_level+1 > clusterLevels[cur_cluster])
+                clusterLevels[cur_cluster] = cur_level+1;
+              cur_buf->lvl = cur_level+1;
             }
-          }  // End of needs-procssing if statement
-        } // End of flow loop
-
-      }     // End while stack not empty
-
-    } // End of Operation loop
-
-    // The above loop will visit ALL operations and recurse through the
-    // buffers and resources connected to them.
-    // Missing from the loop are buffers and resources that have no flows or
-    // loads at all. We catch those poor lonely fellows now...
-    for (Buffer::iterator gbuf2 = Buffer::begin();
-        gbuf2 != Buffer::end(); ++gbuf2)
-      if (gbuf2->getFlows().empty()) gbuf2->cluster = 0;
-    for (Resource::iterator gres2 = Resource::begin();
-        gres2 != Resource::end(); ++gres2)
-      if (gres2->getLoads().empty()) gres2->cluster = 0;
+            // Check cluster recursion
+            else if (!buffl->getOperation()->cluster)
+            {
+              stack.push(make_pair(buffl->getOperation(),-1));
+              buffl->getOperation()->cluster = cur_cluster;
+            }
+          }
+        }  // End of needs-procssing if statement
+      } // End of flow loop
+
+    }     // End while stack not empty
+
+  } // End of Operation loop
+
+  // The above loop will visit ALL operations of the subset and recurse
+  // through the buffers and resources connected to them.
+  // Missing from the loop are buffers and resources that have no flows or
+  // loads at all. We catch those poor lonely fellows now...
+  for (vector<Buffer*>::const_iterator gbuf2 = bufs.begin();
+      gbuf2 != bufs.end(); ++gbuf2)
+    if ((*gbuf2)->getFlows().empty()) (*gbuf2)->cluster = 0;
+  for (vector<Resource*>::const_iterator gres2 = ress.begin();
+      gres2 != ress.end(); ++gres2)
+    if ((*gres2)->getLoads().empty()) (*gres2)->cluster = 0;
+
+  // Add the subset to the member lists of its clusters. The entities are
+  // visited in alphabetical order, which keeps the lists sorted by name.
+  // The unconnected entities are merged into the sorted list of cluster 0.
+  size_t zeroBuffers = clusterBuffers[0].size();
+  size_t zeroResources = clusterResources[0].size();
+  size_t zeroOperations = clusterOperations[0].size();
+  for (vector<Buffer*>::const_iterator gbuf3 = bufs.begin();
+      gbuf3 != bufs.end(); ++gbuf3)
+    clusterBuffers[(*gbuf3)->cluster].push_back(*gbuf3);
+  for (vector<Resource*>::const_iterator gres3 = ress.begin();
+      gres3 != ress.end(); ++gres3)
+    clusterResources[(*gres3)->cluster].push_back(*gres3);
+  for (vector<Operation*>::const_iterator gop3 = opers.begin();
+      gop3 != opers.end(); ++gop3)
+    clusterOperations[(*gop3)->cluster].push_back(*gop3);
+  inplace_merge(clusterBuffers[0].begin(),
+    clusterBuffers[0].begin() + zeroBuffers, clusterBuffers[0].end(),
+    compareName<Buffer>);
+  inplace_merge(clusterResources[0].begin(),
+    clusterResources[0].begin() + zeroResources, clusterResources[0].end(),
+    compareName<Resource>);
+  inplace_merge(clusterOperations[0].begin(),
+    clusterOperations[0].begin() + zeroOperations, clusterOperations[0].end(),
+    compareName<Operation>);
+
+  // Fill the unused cluster numbers with the highest clusters, to keep the
+  // cluster numbers consecutive
+  set<unsigned int> unused(nextAvailable, available.end());
+  while (!unused.empty())
+  {
+    unsigned int last = numberOfClusters;
+    if (unused.find(last) == unused.end())
+    {
+      // Move the last cluster to the lowest unused number
+      unsigned int target = *unused.begin();
+      unused.erase(unused.begin());
+      for (vector<Buffer*>::const_iterator b = clusterBuffers[last].begin();
+          b != clusterBuffers[last].end(); ++b)
+        (*b)->cluster = target;
+      for (vector<Resource*>::const_iterator r = clusterResources[last].begin();
+          r != clusterResources[last].end(); ++r)
+        (*r)->cluster = target;
+      for (vector<Operation*>::const_iterator o = clusterOperations[last].begin();
+          o != clusterOperations[last].end(); ++o)
+        (*o)->cluster = target;
+      clusterBuffers[target].swap(clusterBuffers[last]);
+      clusterResources[target].swap(clusterResources[last]);
+      clusterOperations[target].swap(clusterOperations[last]);
+      clusterLevels[target] = clusterLevels[last];
+    }
+    else
+      // The last cluster is empty
+      unused.erase(last);
+    clusterBuffers.pop_back();
+    clusterResources.pop_back();
+    clusterOperations.pop_back();
+    clusterLevels.pop_back();
+    --numberOfClusters;
+  }
+}
 
-  } // End of while recomputeLevels. The loop will be repeated as long as model
-  // changes are done during the recomputation.
 
-  // Unlock the exclusive access to this function
-  computationBusy = false;
+void HasLevel::assignDemands()
+{
+  clusterDemands.assign(numberOfClusters + 1, vector<Demand*>());
+  for (Demand::iterator gdem = Demand::begin();
+      gdem != Demand::end(); ++gdem)
+  {
+    // Not using getCluster() on the demand, since that would recurse
+    // into this function
+    Operation* o = gdem->getDeliveryOperation();
+    clusterDemands[o ? o->cluster : 0].push_back(&*gdem);
+  }
 }
 
 } // End Namespace
@@ -115,6 +115,7 @@ void LibraryModel::initialize()
   nok += LoadIterator::initialize();
   nok += LoadPlan::initialize();
   nok += LoadPlanIterator::initialize();
+  nok += PlanRowIterator::initialize();
 
   // Initialize the flow metadata.
   nok += Flow::initialize();
@@ -152,9 +153,18 @@ void LibraryModel::initialize()
   PythonInterpreter::registerGlobalMethod(
     "saveXMLfile", saveXMLfile, METH_VARARGS,
     "Save the model to an XML-file.");
+  PythonInterpreter::registerGlobalMethod(
+    "saveSnapshot", saveSnapshot, METH_VARARGS,
+    "Save the model to a binary snapshot file.");
+  PythonInterpreter::registerGlobalMethod(
+    "loadSnapshot", loadSnapshot, METH_VARARGS,
+    "Read a binary snapshot file.");
   PythonInterpreter::registerGlobalMethod(
     "saveplan", savePlan, METH_VARARGS,
     "Save the main plan information to a file.");
+  PythonInterpreter::registerGlobalMethod(
+    "bulkload", bulkLoad, METH_VARARGS,
+    "Create or update objects of a type from a sequence of rows.");
   PythonInterpreter::registerGlobalMethod(
     "buffers", BufferIterator::create, METH_NOARGS,
     "Returns an iterator over the buffers.");
@@ -176,12 +186,27 @@ void LibraryModel::initialize()
   PythonInterpreter::registerGlobalMethod(
     "resources", ResourceIterator::create, METH_NOARGS,
     "Returns an iterator over the resources.");
+  PythonInterpreter::registerGlobalMethod(
+    "resourceplans", Resource::plans, METH_VARARGS,
+    "Returns the plan of all resources in daily buckets.");
+  PythonInterpreter::registerGlobalMethod(
+    "clustermembers", HasLevel::clusterMembers, METH_VARARGS,
+    "Returns the buffers, resources, operations and demands of a list of clusters.");
   PythonInterpreter::registerGlobalMethod(
     "operations", OperationIterator::create, METH_NOARGS,
     "Returns an iterator over the operations.");
   PythonInterpreter::registerGlobalMethod(
-    "operationplans", OperationPlanIterator::create, METH_NOARGS,
-    "Returns an iterator over the operationplans.");
+    "operationplans", PlanRowIterator::operationplans, METH_VARARGS,
+    "Returns an iterator over the operationplans, or their rows in chunks of tuples.");
+  PythonInterpreter::registerGlobalMethod(
+    "flowplans", PlanRowIterator::flowplans, METH_VARARGS,
+    "Returns the rows of the flowplans in chunks of tuples.");
+  PythonInterpreter::registerGlobalMethod(
+    "loadplans", PlanRowIterator::loadplans, METH_VARARGS,
+    "Returns the rows of the loadplans in chunks of tuples.");
+  PythonInterpreter::registerGlobalMethod(
+    "pegging", PeggingTable::create, METH_VARARGS,
+    "Returns the pegging of all demands, or of the demands of a list of clusters.");
   PythonInterpreter::registerGlobalMethod(
     "problems", ProblemIterator::create, METH_NOARGS,
     "Returns an iterator over the problems.");
@@ -119,21 +119,24 @@ DECLARE_EXPORT void Load::validate(Action action)
             + oper->getName() + "' and '" + res->getName() + "'");
       delete &*i;
       // Set a flag to make sure the level computation is triggered again
-      HasLevel::triggerLazyRecomputation();
+      HasLevel::triggerLazyRecomputation(oper);
+      HasLevel::triggerLazyRecomputation(res);
       return;
   }
 
   // The statements below should be executed only when a new load is created.
 
   // Set a flag to make sure the level computation is triggered again
-  HasLevel::triggerLazyRecomputation();
+  HasLevel::triggerLazyRecomputation(oper);
+  HasLevel::triggerLazyRecomputation(res);
 }
 
 
 DECLARE_EXPORT Load::~Load()
 {
   // Set a flag to make sure the level computation is triggered again
-  HasLevel::triggerLazyRecomputation();
+  if (getOperation()) HasLevel::triggerLazyRecomputation(getOperation());
+  if (getResource()) HasLevel::triggerLazyRecomputation(getResource());
 
   // Delete existing loadplans
   if (getOperation() && getResource())
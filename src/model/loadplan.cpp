@@ -25,6 +25,7 @@ namespace frepple
 {
 
 DECLARE_EXPORT const MetaCategory* LoadPlan::metadata;
+DECLARE_EXPORT MemoryPool* LoadPlan::pool = NULL;
 
 
 int LoadPlan::initialize()
@@ -32,12 +33,23 @@ int LoadPlan::initialize()
   // Initialize the metadata
   metadata = new MetaCategory("loadplan", "loadplans");
 
+  // Initialize the memory pool
+  pool = new MemoryPool("LoadPlan", sizeof(LoadPlan));
+
   // Initialize the Python type
   PythonType& x = FreppleCategory<LoadPlan>::getType();
   x.setName("loadplan");
   x.setDoc("frePPLe loadplan");
   x.supportgetattro();
   x.supportsetattro();
+  x.addField<LoadPlan>(Tags::tag_operationplan, &LoadPlan::getOperationPlan);
+  x.addField<LoadPlan>(Tags::tag_quantity, &LoadPlan::getQuantity);
+  x.addField<LoadPlan>(Tags::tag_startdate, &LoadPlan::getStartDate);
+  x.addField<LoadPlan>(Tags::tag_enddate, &LoadPlan::getEndDate);
+  x.addField<LoadPlan>(Tags::tag_onhand, &LoadPlan::getOnhand);
+  // The resource and load are updated with validation in the setattro method
+  x.addField<LoadPlan>(Tags::tag_resource, &LoadPlan::getResource);
+  x.addField<LoadPlan>(Tags::tag_load, &LoadPlan::getLoad);
   const_cast<MetaCategory*>(metadata)->pythonClass = x.type_object();
   return x.typeReady();
 }
@@ -386,22 +398,8 @@ DECLARE_EXPORT void LoadPlan::setLoad(const Load* newld)
 
 PyObject* LoadPlan::getattro(const Attribute& attr)
 {
-  if (attr.isA(Tags::tag_operationplan))
-    return PythonObject(getOperationPlan());
-  if (attr.isA(Tags::tag_quantity))
-    return PythonObject(getQuantity());
-  if (attr.isA(Tags::tag_startdate))
-    return PythonObject(getOperationPlan()->getDates().getStart());
-  if (attr.isA(Tags::tag_enddate))
-    return PythonObject(getOperationPlan()->getDates().getEnd());
-  if (attr.isA(Tags::tag_resource))
-    return PythonObject(getResource());
   if (attr.isA(Tags::tag_operation)) // Convenient shortcut
     return PythonObject(getLoad()->getOperation());
-  if (attr.isA(Tags::tag_load))
-    return PythonObject(getLoad());
-  if (attr.isA(Tags::tag_onhand))
-    return PythonObject(getOnhand());
   if (attr.isA(Tags::tag_setup))
     return PythonObject(getSetup());
   return NULL;
@@ -114,20 +114,19 @@ DECLARE_EXPORT void Location::endElement(XMLInput& pIn, const Attribute& pAttr,
 
 DECLARE_EXPORT Location::~Location()
 {
-  // Remove all references from buffers to this location
-  for (Buffer::iterator buf = Buffer::begin();
-      buf != Buffer::end(); ++buf)
-    if (buf->getLocation() == this) buf->setLocation(NULL);
+  // Remove all references from buffers to this location.
+  // Note that we are not using a for-loop since the function is updating
+  // the set at the same time as we move through it.
+  while (!buffers.empty()) (*buffers.begin())->setLocation(NULL);
 
   // Remove all references from resources to this location
-  for (Resource::iterator res = Resource::begin();
-      res != Resource::end(); ++res)
-    if (res->getLocation() == this) res->setLocation(NULL);
+  while (!resources.empty()) (*resources.begin())->setLocation(NULL);
 
   // Remove all references from operations to this location
-  for (Operation::iterator oper = Operation::begin();
-      oper != Operation::end(); ++oper)
-    if (oper->getLocation() == this) oper->setLocation(NULL);
+  while (!operations.empty()) (*operations.begin())->setLocation(NULL);
+
+  // Remove the reference to the availability calendar
+  setAvailable(NULL);
 }
 
 
@@ -169,22 +168,22 @@ DECLARE_EXPORT int Location::setattro(const Attribute& attr, const PythonObject&
     setSource(field.getString());
   else if (attr.isA(Tags::tag_owner))
   {
-    if (!field.check(Location::metadata))
+    if (field && !field.check(Location::metadata))
     {
       PyErr_SetString(PythonDataException, "location owner must be of type location");
       return -1;
     }
-    Location* y = static_cast<Location*>(static_cast<PyObject*>(field));
+    Location* y = field ? static_cast<Location*>(static_cast<PyObject*>(field)) : NULL;
     setOwner(y);
   }
   else if (attr.isA(Tags::tag_available))
   {
-    if (!field.check(CalendarDouble::metadata))
+    if (field && !field.check(CalendarDouble::metadata))
     {
       PyErr_SetString(PythonDataException, "location availability must be of type double calendar");
       return -1;
     }
-    CalendarDouble* y = static_cast<CalendarDouble*>(static_cast<PyObject*>(field));
+    CalendarDouble* y = field ? static_cast<CalendarDouble*>(static_cast<PyObject*>(field)) : NULL;
     setAvailable(y);
   }
   else if (attr.isA(Tags::tag_hidden))
@@ -135,17 +135,22 @@ DECLARE_EXPORT Operation::~Operation()
   // The Flow and Load objects are automatically deleted by the destructor
   // of the Association list class.
 
-  // Remove the reference to this operation from all items
-  for (Item::iterator k = Item::begin(); k != Item::end(); ++k)
-    if (k->getOperation() == this) k->setOperation(NULL);
+  // Remove the reference to this operation from all items.
+  // Note that we are not using a for-loop since the function is updating
+  // the set at the same time as we move through it.
+  while (!deliveryItems.empty())
+    (*deliveryItems.begin())->setOperation(NULL);
 
   // Remove the reference to this operation from all demands
-  for (Demand::iterator l = Demand::begin(); l != Demand::end(); ++l)
-    if (l->getOperation() == this) l->setOperation(NULL);
+  while (!deliveryDemands.empty())
+    (*deliveryDemands.begin())->setOperation(NULL);
 
   // Remove the reference to this operation from all buffers
-  for (Buffer::iterator m = Buffer::begin(); m != Buffer::end(); ++m)
-    if (m->getProducingOperation() == this) m->setProducingOperation(NULL);
+  while (!producedBuffers.empty())
+    (*producedBuffers.begin())->setProducingOperation(NULL);
+
+  // Remove the reference to the location
+  setLocation(NULL);
 
   // Remove the operation from its super-operations and sub-operations
   // Note that we are not using a for-loop since our function is actually
@@ -1341,6 +1346,8 @@ DECLARE_EXPORT void OperationAlternate::removeSubOperation(Operation *o)
     alternates.erase(altIter);
     alternateProperties.erase(propIter);
     o->superoplist.remove(this);
+    HasLevel::triggerLazyRecomputation(this);
+    HasLevel::triggerLazyRecomputation(o);
     setChanged();
   }
   else
@@ -1582,6 +1589,8 @@ DECLARE_EXPORT void OperationSplit::removeSubOperation(Operation *o)
     alternates.erase(altIter);
     alternateProperties.erase(propIter);
     o->superoplist.remove(this);
+    HasLevel::triggerLazyRecomputation(this);
+    HasLevel::triggerLazyRecomputation(o);
     setChanged();
   }
   else
@@ -1745,12 +1754,12 @@ DECLARE_EXPORT int Operation::setattro(const Attribute& attr, const PythonObject
     setSource(field.getString());
   else if (attr.isA(Tags::tag_location))
   {
-    if (!field.check(Location::metadata))
+    if (field && !field.check(Location::metadata))
     {
       PyErr_SetString(PythonDataException, "buffer location must be of type location");
       return -1;
     }
-    Location* y = static_cast<Location*>(static_cast<PyObject*>(field));
+    Location* y = field ? static_cast<Location*>(static_cast<PyObject*>(field)) : NULL;
     setLocation(y);
   }
   else if (attr.isA(Tags::tag_fence))
@@ -27,6 +27,11 @@ namespace frepple
 DECLARE_EXPORT const MetaClass* OperationPlan::metadata;
 DECLARE_EXPORT const MetaCategory* OperationPlan::metacategory;
 DECLARE_EXPORT unsigned long OperationPlan::counterMin = 2;
+DECLARE_EXPORT map<unsigned long, OperationPlan*> OperationPlan::idIndex;
+DECLARE_EXPORT MemoryPool* OperationPlan::pool = NULL;
+
+// Lock protecting the identifier index
+static Mutex idIndexBusy;
 
 
 int OperationPlan::initialize()
@@ -36,6 +41,9 @@ int OperationPlan::initialize()
       OperationPlan::createOperationPlan, OperationPlan::writer);
   OperationPlan::metadata = new MetaClass("operationplan", "operationplan");
 
+  // Initialize the memory pool
+  OperationPlan::pool = new MemoryPool("OperationPlan", sizeof(OperationPlan));
+
   // Initialize the Python type
   PythonType& x = FreppleCategory<OperationPlan>::getType();
   x.setName("operationplan");
@@ -45,6 +53,25 @@ int OperationPlan::initialize()
   x.supportstr();
   x.supportcreate(create);
   x.addMethod("toXML", toXML, METH_VARARGS, "return a XML representation");
+  x.addField<OperationPlan>(Tags::tag_id, &OperationPlan::getIdentifier);
+  x.addField<OperationPlan>(Tags::tag_operation, &OperationPlan::getOperation);
+  x.addField<OperationPlan>(Tags::tag_start, &OperationPlan::getStart, &OperationPlan::setStart);
+  x.addField<OperationPlan>(Tags::tag_end, &OperationPlan::getEnd, &OperationPlan::setEnd);
+  x.addField<OperationPlan>(Tags::tag_locked, &OperationPlan::getLocked, &OperationPlan::setLocked);
+  x.addField<OperationPlan>(Tags::tag_hidden, &OperationPlan::getHidden);
+  x.addField<OperationPlan>(Tags::tag_unavailable, &OperationPlan::getUnavailable);
+  x.addField<OperationPlan>(Tags::tag_criticality, &OperationPlan::getCriticality);
+  x.addField<OperationPlan>(Tags::tag_consume_material,
+    &OperationPlan::getConsumeMaterial, &OperationPlan::setConsumeMaterial);
+  x.addField<OperationPlan>(Tags::tag_consume_capacity,
+    &OperationPlan::getConsumeCapacity, &OperationPlan::setConsumeCapacity);
+  x.addField<OperationPlan>(Tags::tag_produce_material,
+    &OperationPlan::getProduceMaterial, &OperationPlan::setProduceMaterial);
+  x.addField<OperationPlan>(Tags::tag_source, &OperationPlan::getSource, &OperationPlan::setSource);
+  // The quantity, demand and owner are updated in the setattro method
+  x.addField<OperationPlan>(Tags::tag_quantity, &OperationPlan::getQuantity);
+  x.addField<OperationPlan>(Tags::tag_demand, &OperationPlan::getDemand);
+  x.addField<OperationPlan>(Tags::tag_owner, &OperationPlan::getOwner);
   const_cast<MetaClass*>(metadata)->pythonClass = x.type_object();
   return x.typeReady();
 }
@@ -185,12 +212,10 @@ DECLARE_EXPORT OperationPlan* OperationPlan::findId(unsigned long l)
   // instantiate() method.
   if (l >= counterMin) return NULL;
 
-  // Loop through all operationplans.
-  for (OperationPlan::iterator i = begin(); i != end(); ++i)
-    if (i->id == l) return &*i;
-
-  // This ID was not found
-  return NULL;
+  // Look up the identifier in the index
+  ScopeMutexLock lock(idIndexBusy);
+  map<unsigned long, OperationPlan*>::const_iterator i = idIndex.find(l);
+  return i == idIndex.end() ? NULL : i->second;
 }
 
 
@@ -223,6 +248,9 @@ DECLARE_EXPORT bool OperationPlan::assignIdentifier()
   if (counterMin >= ULONG_MAX)
     throw RuntimeException("Exhausted the range of available operationplan identifiers");
 
+  // Register the identifier in the index
+  ScopeMutexLock lock(idIndexBusy);
+  idIndex[id] = this;
   return true;
 }
 
@@ -284,15 +312,15 @@ DECLARE_EXPORT bool OperationPlan::activate()
 
 DECLARE_EXPORT void OperationPlan::deactivate()
 {
-  // Mark as not activated
-  id = 0;
-
   // Delete from the list of deliveries
   if (dmd) dmd->removeDelivery(this);
 
-  // Delete from the operationplan list
+  // Delete from the operationplan list and the identifier index
   removeFromOperationplanList();
 
+  // Mark as not activated
+  id = 0;
+
   // Mark the operation to detect its problems
   oper->setChanged();
 }
@@ -304,6 +332,14 @@ DECLARE_EXPORT void OperationPlan::insertInOperationplanList()
   // Check if already linked
   if (prev || oper->first_opplan == this) return;
 
+  // Register in the identifier index. Operationplans with a temporary
+  // identifier are registered when their final identifier is assigned.
+  if (id && id != ULONG_MAX)
+  {
+    ScopeMutexLock lock(idIndexBusy);
+    idIndex[id] = this;
+  }
+
   if (!oper->first_opplan)
   {
     // First operationplan in the list
@@ -344,6 +380,14 @@ DECLARE_EXPORT void OperationPlan::insertInOperationplanList()
 
 DECLARE_EXPORT void OperationPlan::removeFromOperationplanList()
 {
+  // Unregister from the identifier index
+  if (id && id != ULONG_MAX)
+  {
+    ScopeMutexLock lock(idIndexBusy);
+    map<unsigned long, OperationPlan*>::iterator i = idIndex.find(id);
+    if (i != idIndex.end() && i->second == this) idIndex.erase(i);
+  }
+
   if (prev)
     // In the middle
     prev->next = next;
@@ -967,35 +1011,48 @@ PyObject* OperationPlan::create(PyTypeObject* pytype, PyObject* args, PyObject*
     Py_INCREF(x);
 
     // Iterate over extra keywords, and set attributes.   @todo move this responsibility to the readers...
+    // The locked field is set in a second pass: a locked operationplan
+    // ignores any later change of its quantity and dates.
     if (x)
     {
-      PyObject *key, *value;
-      Py_ssize_t pos = 0;
-      while (PyDict_Next(kwds, &pos, &key, &value))
+      if (PyDict_GetItemString(kwds, "locked")
+        && static_cast<OperationPlan*>(x)->getLocked())
+        static_cast<OperationPlan*>(x)->setLocked(false);
+      for (int pass = 0; pass < 2; ++pass)
       {
-        PythonObject field(value);
+        PyObject *key, *value;
+        Py_ssize_t pos = 0;
+        while (PyDict_Next(kwds, &pos, &key, &value))
+        {
+          PythonObject field(value);
 #if PY_MAJOR_VERSION >= 3
-        PyObject* key_utf8 = PyUnicode_AsUTF8String(key);
-        Attribute attr(PyBytes_AsString(key_utf8));
-        Py_DECREF(key_utf8);
+          PyObject* key_utf8 = PyUnicode_AsUTF8String(key);
+          Attribute attr(PyBytes_AsString(key_utf8));
+          Py_DECREF(key_utf8);
 #else
-        Attribute attr(PyString_AsString(key));
+          Attribute attr(PyString_AsString(key));
 #endif
-        if (!attr.isA(Tags::tag_operation) && !attr.isA(Tags::tag_id)
-          && !attr.isA(Tags::tag_action) && !attr.isA(Tags::tag_type))
-        {
-          int result = x->setattro(attr, field);
-          if (result && !PyErr_Occurred())
-            PyErr_Format(PyExc_AttributeError,
+          if (attr.isA(Tags::tag_locked) != (pass == 1))
+            continue;
+          if (!attr.isA(Tags::tag_operation) && !attr.isA(Tags::tag_id)
+            && !attr.isA(Tags::tag_action) && !attr.isA(Tags::tag_type))
+          {
+            const MetaField* fld = MetaField::find(x, key);
+            int result = (fld && !fld->getReadOnly()) ?
+              fld->set(x, field) :
+              x->setattro(attr, field);
+            if (result && !PyErr_Occurred())
+              PyErr_Format(PyExc_AttributeError,
 #if PY_MAJOR_VERSION >= 3
-                "attribute '%S' on '%s' can't be updated",
-                key, Py_TYPE(x)->tp_name);
+                  "attribute '%S' on '%s' can't be updated",
+                  key, Py_TYPE(x)->tp_name);
 #else
-                "attribute '%s' on '%s' can't be updated",
-                PyString_AsString(key), Py_TYPE(x)->tp_name);
+                  "attribute '%s' on '%s' can't be updated",
+                  PyString_AsString(key), Py_TYPE(x)->tp_name);
 #endif
-        }
-      };
+          }
+        };
+      }
     }
 
     if (x && !static_cast<OperationPlan*>(x)->activate())
@@ -1015,42 +1072,12 @@ PyObject* OperationPlan::create(PyTypeObject* pytype, PyObject* args, PyObject*
 
 DECLARE_EXPORT PyObject* OperationPlan::getattro(const Attribute& attr)
 {
-  if (attr.isA(Tags::tag_id))
-    return PythonObject(getIdentifier());
-  if (attr.isA(Tags::tag_operation))
-    return PythonObject(getOperation());
   if (attr.isA(Tags::tag_flowplans))
     return new frepple::FlowPlanIterator(this);
   if (attr.isA(Tags::tag_loadplans))
     return new frepple::LoadPlanIterator(this);
-  if (attr.isA(Tags::tag_quantity))
-    return PythonObject(getQuantity());
-  if (attr.isA(Tags::tag_start))
-    return PythonObject(getDates().getStart());
-  if (attr.isA(Tags::tag_end))
-    return PythonObject(getDates().getEnd());
-  if (attr.isA(Tags::tag_demand))
-    return PythonObject(getDemand());
-  if (attr.isA(Tags::tag_locked))
-    return PythonObject(getLocked());
-  if (attr.isA(Tags::tag_owner))
-    return PythonObject(getOwner());
   if (attr.isA(Tags::tag_operationplans))
     return new OperationPlanIterator(this);
-  if (attr.isA(Tags::tag_hidden))
-    return PythonObject(getHidden());
-  if (attr.isA(Tags::tag_unavailable))
-    return PythonObject(getUnavailable());
-  if (attr.isA(Tags::tag_criticality))
-    return PythonObject(getCriticality());
-  if (attr.isA(Tags::tag_consume_material))
-    return PythonObject(getConsumeMaterial());
-  if (attr.isA(Tags::tag_consume_capacity))
-    return PythonObject(getConsumeCapacity());
-  if (attr.isA(Tags::tag_produce_material))
-    return PythonObject(getProduceMaterial());
-  if (attr.isA(Tags::tag_source))
-    return PythonObject(getSource());
   if (attr.isA(Tags::tag_motive))
   {
     // Null
@@ -1084,12 +1111,6 @@ DECLARE_EXPORT int OperationPlan::setattro(const Attribute& attr, const PythonOb
 {
   if (attr.isA(Tags::tag_quantity))
     setQuantity(field.getDouble());
-  else if (attr.isA(Tags::tag_start))
-    setStart(field.getDate());
-  else if (attr.isA(Tags::tag_end))
-    setEnd(field.getDate());
-  else if (attr.isA(Tags::tag_locked))
-    setLocked(field.getBool());
   else if (attr.isA(Tags::tag_demand))
   {
     if (!field.check(Demand::metadata))
@@ -1128,14 +1149,6 @@ DECLARE_EXPORT int OperationPlan::setattro(const Attribute& attr, const PythonOb
     }
     setMotive(y);
   }
-  else if (attr.isA(Tags::tag_consume_material))
-    setConsumeMaterial(field.getBool());
-  else if (attr.isA(Tags::tag_consume_capacity))
-    setConsumeCapacity(field.getBool());
-  else if (attr.isA(Tags::tag_produce_material))
-    setProduceMaterial(field.getBool());
-  else if (attr.isA(Tags::tag_source))
-    setSource(field.getString());
   else
     return -1;
   return 0;
@@ -238,4 +238,378 @@ DECLARE_EXPORT void PeggingIterator::updateStack
 }
 
 
+
+/** @brief Computes the pegging of the demands of a single cluster.
+  *
+  * The producing flowplans of a buffer are collected the first time a
+  * demand is pegged to the buffer, and reused for all other demands of the
+  * cluster. A buffer belongs to a single cluster, so the threads don't share
+  * any data.
+  */
+class PeggingTable::ClusterPegging : public NonCopyable
+{
+  public:
+    /** Constructor. */
+    ClusterPegging(const vector<Demand*>& d) : demands(d) {}
+
+    /** Rows of the demands of the cluster. */
+    PeggingTable::rowlist rows;
+
+    /** Returns the demands of the cluster. */
+    const vector<Demand*>& getDemands() const {return demands;}
+
+    /** Error message of a failed computation, or empty. */
+    string error;
+
+    /** Auxilary function for the thread group.<br>
+      * The thread group only logs exceptions. They are recorded here and
+      * raised again by the calling thread.
+      */
+    static void runme(void *args)
+    {
+      ClusterPegging* c = static_cast<ClusterPegging*>(args);
+      try {c->compute();}
+      catch (const exception& e) {c->error = e.what();}
+      catch (...) {c->error = "Unknown exception";}
+    }
+
+  private:
+    /** A producing flowplan of a buffer. */
+    struct producer
+    {
+      /** Cumulative production of the buffer at the flowplan. */
+      double cumulative;
+
+      /** Quantity of the flowplan. */
+      double quantity;
+
+      /** Operationplan pegged when the flowplan is pegged. */
+      const OperationPlan* opplan;
+
+      // Constructor
+      producer(double c, double q, const OperationPlan* o)
+        : cumulative(c), quantity(q), opplan(o) {};
+    };
+    typedef vector<producer> producerlist;
+
+    /** An operationplan still to peg. */
+    struct state
+    {
+      const OperationPlan* opplan;
+      double quantity;
+      double offset;
+      short level;
+
+      // Constructor
+      state(const OperationPlan* op, double q, double o, short l)
+        : opplan(op), quantity(q), offset(o), level(l) {};
+    };
+
+    /** Comparison function to search the producers of a buffer. */
+    static bool compareCumulative(double c, const producer& p)
+    {
+      return c < p.cumulative;
+    }
+
+    /** Computes the pegging of all demands of the cluster. */
+    void compute();
+
+    /** Adds an operationplan to peg. */
+    void push(const OperationPlan* op, double qty, double offset, short lvl)
+    {
+      // Avoid very small pegging quantities
+      if (qty >= ROUNDING_ERROR) states.push_back(state(op, qty, offset, lvl));
+    }
+
+    /** Adds the operationplans supplying a part of an operationplan. */
+    void followPegging(const OperationPlan*, double, double, short);
+
+    /** Adds the operationplans producing the material consumed by a part of
+      * a flowplan. */
+    void followBuffer(const FlowPlan*, double, double, short);
+
+    /** Adds the operationplan of a producing flowplan. */
+    void pushProducer(const producer&, double, double, short);
+
+    /** Returns the producing flowplans of a buffer. */
+    const producerlist& getProducers(const Buffer*);
+
+    /** Demands of the cluster. */
+    const vector<Demand*>& demands;
+
+    /** Operationplans still to peg. */
+    vector<state> states;
+
+    /** Producing flowplans of the buffers visited so far. */
+    map<const Buffer*, producerlist> producers;
+};
+
+
+void PeggingTable::ClusterPegging::compute()
+{
+  for (vector<Demand*>::const_iterator d = demands.begin(); d != demands.end(); ++d)
+  {
+    // Find the non-hidden owner
+    const Demand* n = *d;
+    while (n->getHidden() && n->getOwner()) n = n->getOwner();
+
+    // Push the delivery operationplans on the stack
+    const Demand::OperationPlan_list &deli = (*d)->getDelivery();
+    for (Demand::OperationPlan_list::const_iterator opplaniter = deli.begin();
+        opplaniter != deli.end(); ++opplaniter)
+    {
+      OperationPlan *t = (*opplaniter)->getTopOwner();
+      push(t, t->getQuantity(), 0.0, 0);
+    }
+
+    // Peg till the stack is empty
+    while (!states.empty())
+    {
+      state t = states.back();
+      states.pop_back();
+      rows.push_back(row(n, t.level, t.opplan, t.quantity));
+      followPegging(t.opplan, t.quantity, t.offset, t.level);
+    }
+  }
+}
+
+
+void PeggingTable::ClusterPegging::followPegging
+(const OperationPlan* op, double qty, double offset, short lvl)
+{
+  // Zero quantity operationplans don't have further pegging
+  if (!op->getQuantity()) return;
+
+  // Follow the consuming flowplans upstream
+  for (OperationPlan::FlowPlanIterator i = op->beginFlowPlans();
+      i != op->endFlowPlans(); ++i)
+    if (i->getQuantity() < -ROUNDING_ERROR)
+      followBuffer(&*i, qty, offset, lvl+1);
+
+  // Push child operationplans on the stack.
+  // The pegged quantity is equal to the ratio of the quantities of the
+  // parent and child operationplan.
+  for (OperationPlan::iterator j(op); j != OperationPlan::end(); ++j)
+    push(
+      &*j,
+      qty * j->getQuantity() / op->getQuantity(),
+      offset * j->getQuantity() / op->getQuantity(),
+      lvl+1
+      );
+}
+
+
+void PeggingTable::ClusterPegging::followBuffer
+(const FlowPlan* f, double qty, double offset, short lvl)
+{
+  // Flowplans with quantity 0 have no pegging.
+  // Flowplans for buffers representing tools have no pegging either.
+  if (!f->getOperationPlan()->getQuantity() || f->getBuffer()->getTool())
+    return;
+
+  // Range of the cumulative production consumed by this part of the
+  // flowplan. This is the same computation as in Buffer::followPegging.
+  double scale = - f->getQuantity() / f->getOperationPlan()->getQuantity();
+  double startQty = f->getCumulativeConsumed() + f->getQuantity() + offset * scale;
+  double endQty = startQty + qty * scale;
+  const producerlist& p = getProducers(f->getBuffer());
+  if (f->getCumulativeProduced() <= startQty + ROUNDING_ERROR)
+  {
+    // Not produced enough yet: use the producers after the flowplan
+    producerlist::const_iterator i = upper_bound(
+      p.begin(), p.end(),
+      startQty > f->getCumulativeProduced() ? startQty : f->getCumulativeProduced(),
+      compareCumulative
+      );
+    for (; i != p.end() && i->cumulative - i->quantity < endQty; ++i)
+      pushProducer(*i, startQty, endQty, lvl);
+  }
+  else
+  {
+    // Produced too much already: use the producers before the flowplan,
+    // in reverse order
+    producerlist::const_iterator i = upper_bound(
+      p.begin(), p.end(), f->getCumulativeProduced(), compareCumulative
+      );
+    while (i != p.begin() && (i-1)->cumulative - (i-1)->quantity > endQty) --i;
+    while (i != p.begin() && (i-1)->cumulative > startQty)
+      pushProducer(*--i, startQty, endQty, lvl);
+  }
+}
+
+
+void PeggingTable::ClusterPegging::pushProducer
+(const producer& p, double startQty, double endQty, short lvl)
+{
+  double newqty = p.quantity;
+  double newoffset = 0.0;
+  if (p.cumulative - p.quantity < startQty)
+  {
+    newoffset = startQty - (p.cumulative - p.quantity);
+    newqty -= newoffset;
+  }
+  if (p.cumulative > endQty)
+    newqty -= p.cumulative - endQty;
+  push(
+    p.opplan,
+    p.opplan->getQuantity() * newqty / p.quantity,
+    p.opplan->getQuantity() * newoffset / p.quantity,
+    lvl
+    );
+}
+
+
+const PeggingTable::ClusterPegging::producerlist&
+PeggingTable::ClusterPegging::getProducers(const Buffer* b)
+{
+  map<const Buffer*, producerlist>::iterator i = producers.find(b);
+  if (i != producers.end()) return i->second;
+
+  // Collect the producing flowplans, which are sorted by their cumulative
+  // production
+  producerlist& result = producers[b];
+  for (Buffer::flowplanlist::const_iterator f = b->getFlowPlans().begin();
+      f != b->getFlowPlans().end(); ++f)
+  {
+    if (f->getType() != 1 || f->getQuantity() <= ROUNDING_ERROR) continue;
+    const OperationPlan *opplan = static_cast<const FlowPlan*>(&*f)->getOperationPlan();
+    const OperationPlan *topopplan = opplan->getTopOwner();
+    if (topopplan->getOperation()->getType() == *OperationSplit::metadata)
+      topopplan = opplan;
+    result.push_back(producer(f->getCumulativeProduced(), f->getQuantity(), topopplan));
+  }
+  return result;
+}
+
+
+DECLARE_EXPORT PeggingTable::PeggingTable(const set<unsigned int>& clusters)
+{
+  // Collect the demands of the clusters. This also brings the clusters up
+  // to date before the threads start.
+  unsigned int cl = HasLevel::getNumberOfClusters();
+  vector<ClusterPegging*> work;
+  for (unsigned int c = 0; c < cl; ++c)
+  {
+    if (!clusters.empty() && clusters.find(c) == clusters.end()) continue;
+    const vector<Demand*>& dmds = HasLevel::getClusterDemands(c);
+    if (!dmds.empty()) work.push_back(new ClusterPegging(dmds));
+  }
+
+  // Peg the clusters in parallel threads, biggest clusters first
+  ThreadGroup threads;
+  // The worker threads need the Python interpreter. When the calling
+  // thread holds it, the workers would wait for it forever.
+  if (PythonInterpreter::hasLock()) threads.setMaxParallel(1);
+  for (vector<ClusterPegging*>::const_iterator i = work.begin(); i != work.end(); ++i)
+    threads.add(ClusterPegging::runme, *i, static_cast<double>((*i)->getDemands().size()));
+  try
+  {
+    threads.execute();
+
+    // Raise the error of a failed cluster
+    for (vector<ClusterPegging*>::const_iterator i = work.begin(); i != work.end(); ++i)
+      if (!(*i)->error.empty())
+        throw RuntimeException("Pegging failed: " + (*i)->error);
+  }
+  catch (...)
+  {
+    for (vector<ClusterPegging*>::const_iterator i = work.begin(); i != work.end(); ++i)
+      delete *i;
+    throw;
+  }
+
+  // Collect the rows in the order of the clusters
+  size_t cnt = 0;
+  for (vector<ClusterPegging*>::const_iterator i = work.begin(); i != work.end(); ++i)
+    cnt += (*i)->rows.size();
+  rows.reserve(cnt);
+  for (vector<ClusterPegging*>::const_iterator i = work.begin(); i != work.end(); ++i)
+  {
+    rows.insert(rows.end(), (*i)->rows.begin(), (*i)->rows.end());
+    delete *i;
+  }
+}
+
+
+DECLARE_EXPORT PyObject* PeggingTable::create(PyObject* self, PyObject* args)
+{
+  // Parse the Python arguments
+  PyObject* pyclusters = NULL;
+  int ok = PyArg_ParseTuple(args, "|O:pegging", &pyclusters);
+  if (!ok) return NULL;
+  set<unsigned int> clusters;
+  if (pyclusters && pyclusters != Py_None)
+  {
+    PyObject* iter = PyObject_GetIter(pyclusters);
+    if (!iter)
+    {
+      PyErr_Format(PyExc_AttributeError,"Argument to pegging() must support iteration");
+      return NULL;
+    }
+    PyObject* item;
+    while ((item = PyIter_Next(iter)))
+    {
+      int c = PythonObject(item).getInt();
+      if (c >= 0) clusters.insert(c);
+      Py_DECREF(item);
+    }
+    Py_DECREF(iter);
+    if (PyErr_Occurred()) return NULL;
+    // None of the clusters exists
+    if (clusters.empty()) return PyList_New(0);
+  }
+
+  // Free Python interpreter for the worker threads
+  PeggingTable* table = NULL;
+  Py_BEGIN_ALLOW_THREADS
+  try
+  {
+    table = new PeggingTable(clusters);
+  }
+  catch (...)
+  {
+    Py_BLOCK_THREADS;
+    PythonType::evalException();
+    return NULL;
+  }
+  Py_END_ALLOW_THREADS   // Reclaim Python interpreter
+
+  // Build the list of tuples.
+  // The names of the demands are converted only once.
+  const rowlist& r = table->getRows();
+  PyObject* result = PyList_New(r.size());
+  map<const Demand*, PyObject*> names;
+  try
+  {
+    if (!result) throw RuntimeException("Can't build the pegging");
+    for (size_t i = 0; i < r.size(); ++i)
+    {
+      map<const Demand*, PyObject*>::const_iterator n = names.find(r[i].demand);
+      if (n == names.end())
+        n = names.insert(make_pair(
+          r[i].demand, static_cast<PyObject*>(PythonObject(r[i].demand->getName()))
+          )).first;
+      Py_XINCREF(n->second);
+      PyObject* t = Py_BuildValue("(NNNN)",
+        n->second,
+        static_cast<PyObject*>(PythonObject(r[i].level)),
+        static_cast<PyObject*>(PythonObject(r[i].opplan->getIdentifier())),
+        static_cast<PyObject*>(PythonObject(r[i].quantity))
+        );
+      if (!t) throw RuntimeException("Can't build the pegging");
+      PyList_SET_ITEM(result, i, t);
+    }
+  }
+  catch (...)
+  {
+    Py_XDECREF(result);
+    result = NULL;
+    PythonType::evalException();
+  }
+  for (map<const Demand*, PyObject*>::const_iterator n = names.begin(); n != names.end(); ++n)
+    Py_XDECREF(n->second);
+  delete table;
+  return result;
+}
+
 } // End namespace
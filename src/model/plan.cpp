@@ -67,6 +67,9 @@ DECLARE_EXPORT Plan::~Plan()
 
 DECLARE_EXPORT void Plan::setCurrent (Date l)
 {
+  // Nothing changes when the date is set again to the same value
+  if (cur_Date == l) return;
+
   // Update the time
   cur_Date = l;
 
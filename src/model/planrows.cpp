@@ -0,0 +1,445 @@
+/***************************************************************************
+ *                                                                         *
+ * Copyright (C) 2007-2013 by Johan De Taeye, frePPLe bvba                 *
+ *                                                                         *
+ * This library is free software; you can redistribute it and/or modify it *
+ * under the terms of the GNU Affero General Public License as published   *
+ * by the Free Software Foundation; either version 3 of the License, or    *
+ * (at your option) any later version.                                     *
+ *                                                                         *
+ * This library is distributed in the hope that it will be useful,         *
+ * but WITHOUT ANY WARRANTY; without even the implied warranty of          *
+ * MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the            *
+ * GNU Affero General Public License for more details.                     *
+ *                                                                         *
+ * You should have received a copy of the GNU Affero General Public        *
+ * License along with this program.                                        *
+ * If not, see <http://www.gnu.org/licenses/>.                             *
+ *                                                                         *
+ ***************************************************************************/
+
+#define FREPPLE_CORE
+#include "frepple/model.h"
+namespace frepple
+{
+
+
+// Fields of a flowplan row, in their default order
+static const Keyword* flowplanFields[] =
+{
+  &Tags::tag_operationplan, &Tags::tag_buffer, &Tags::tag_operation,
+  &Tags::tag_quantity, &Tags::tag_date, &Tags::tag_onhand, NULL
+};
+enum
+{
+  FLOWPLAN_OPERATIONPLAN, FLOWPLAN_BUFFER, FLOWPLAN_OPERATION,
+  FLOWPLAN_QUANTITY, FLOWPLAN_DATE, FLOWPLAN_ONHAND
+};
+
+
+// Fields of a loadplan row, in their default order
+static const Keyword* loadplanFields[] =
+{
+  &Tags::tag_operationplan, &Tags::tag_resource, &Tags::tag_operation,
+  &Tags::tag_quantity, &Tags::tag_startdate, &Tags::tag_enddate,
+  &Tags::tag_setup, NULL
+};
+enum
+{
+  LOADPLAN_OPERATIONPLAN, LOADPLAN_RESOURCE, LOADPLAN_OPERATION,
+  LOADPLAN_QUANTITY, LOADPLAN_STARTDATE, LOADPLAN_ENDDATE, LOADPLAN_SETUP
+};
+
+
+// Fields of an operationplan row, in their default order
+static const Keyword* operationplanFields[] =
+{
+  &Tags::tag_id, &Tags::tag_operation, &Tags::tag_quantity,
+  &Tags::tag_start, &Tags::tag_end, &Tags::tag_criticality,
+  &Tags::tag_locked, &Tags::tag_unavailable, &Tags::tag_owner,
+  &Tags::tag_demand, NULL
+};
+enum
+{
+  OPERATIONPLAN_ID, OPERATIONPLAN_OPERATION, OPERATIONPLAN_QUANTITY,
+  OPERATIONPLAN_START, OPERATIONPLAN_END, OPERATIONPLAN_CRITICALITY,
+  OPERATIONPLAN_LOCKED, OPERATIONPLAN_UNAVAILABLE, OPERATIONPLAN_OWNER,
+  OPERATIONPLAN_DEMAND
+};
+
+
+int PlanRowIterator::initialize()
+{
+  // Initialize the type
+  PythonType& x = PythonExtension<PlanRowIterator>::getType();
+  x.setName("planRowIterator");
+  x.setDoc("frePPLe iterator for chunks of plan rows");
+  x.supportiter();
+  return x.typeReady();
+}
+
+
+PyObject* PlanRowIterator::flowplans(PyObject* self, PyObject* args, PyObject* kwds)
+{
+  return create(FLOWPLANS, args, kwds);
+}
+
+
+PyObject* PlanRowIterator::loadplans(PyObject* self, PyObject* args, PyObject* kwds)
+{
+  return create(LOADPLANS, args, kwds);
+}
+
+
+PyObject* PlanRowIterator::operationplans(PyObject* self, PyObject* args, PyObject* kwds)
+{
+  // Without arguments we return an iterator over the operationplans
+  if ((!args || !PyTuple_Size(args)) && (!kwds || !PyDict_Size(kwds)))
+    return OperationPlanIterator::create(self, args);
+  return create(OPERATIONPLANS, args, kwds);
+}
+
+
+PyObject* PlanRowIterator::create(rowtype t, PyObject* args, PyObject* kwds)
+{
+  // Parse the Python arguments
+  PyObject* pyfields = NULL;
+  int chunk = 0;
+  PyObject* null = Py_None;
+  static const char *kwlist[] = {"fields", "chunk", "null", NULL};
+  const char* format =
+    t == FLOWPLANS ? "|OiO:flowplans" :
+    (t == LOADPLANS ? "|OiO:loadplans" : "|OiO:operationplans");
+  if (!PyArg_ParseTupleAndKeywords(args, kwds, format,
+      const_cast<char**>(kwlist), &pyfields, &chunk, &null))
+    return NULL;
+  if (chunk < 0)
+  {
+    PyErr_SetString(PyExc_AttributeError, "Chunk argument can't be negative");
+    return NULL;
+  }
+
+  // Pick up the list of fields
+  const Keyword** allowed =
+    t == FLOWPLANS ? flowplanFields :
+    (t == LOADPLANS ? loadplanFields : operationplanFields);
+  vector<unsigned short> fields;
+  if (pyfields && pyfields != Py_None)
+  {
+    PyObject* iter = PyObject_GetIter(pyfields);
+    if (!iter)
+    {
+      PyErr_SetString(PyExc_AttributeError, "Fields argument must support iteration");
+      return NULL;
+    }
+    PyObject* item;
+    while ((item = PyIter_Next(iter)))
+    {
+      string name = PythonObject(item).getString();
+      Py_DECREF(item);
+      unsigned short i = 0;
+      while (allowed[i] && allowed[i]->getName() != name) ++i;
+      if (!allowed[i])
+      {
+        Py_DECREF(iter);
+        PyErr_Format(PyExc_AttributeError, "Invalid field '%s'", name.c_str());
+        return NULL;
+      }
+      fields.push_back(i);
+    }
+    Py_DECREF(iter);
+    if (PyErr_Occurred()) return NULL;
+  }
+  else
+    for (unsigned short i = 0; allowed[i]; ++i) fields.push_back(i);
+
+  // Create the iterator
+  try
+  {
+    return new PlanRowIterator(t, fields, chunk, null);
+  }
+  catch (...)
+  {
+    PythonType::evalException();
+    return NULL;
+  }
+}
+
+
+PlanRowIterator::PlanRowIterator
+(rowtype t, const vector<unsigned short>& f, int c, PyObject* n)
+  : type(t), fields(f), chunk(c), null(n), owner(0),
+    flowplaniter(NULL), loadplaniter(NULL)
+{
+  Py_INCREF(null);
+  if (type == FLOWPLANS)
+    for (Buffer::iterator b = Buffer::begin(); b != Buffer::end(); ++b)
+      buffers.push_back(&*b);
+  else if (type == LOADPLANS)
+    for (Resource::iterator r = Resource::begin(); r != Resource::end(); ++r)
+      resources.push_back(&*r);
+}
+
+
+DECLARE_EXPORT PlanRowIterator::~PlanRowIterator()
+{
+  if (flowplaniter) delete flowplaniter;
+  if (loadplaniter) delete loadplaniter;
+  Py_DECREF(null);
+  for (map<const Object*, PyObject*>::iterator i = names.begin(); i != names.end(); ++i)
+    Py_DECREF(i->second);
+  for (map<Date, PyObject*>::iterator i = dates.begin(); i != dates.end(); ++i)
+    Py_DECREF(i->second);
+}
+
+
+PyObject* PlanRowIterator::iternext()
+{
+  // Release the dates of the previous chunk
+  for (map<Date, PyObject*>::iterator i = dates.begin(); i != dates.end(); ++i)
+    Py_DECREF(i->second);
+  dates.clear();
+
+  // Collect the rows of the chunk
+  PyObject* result = PyList_New(0);
+  if (!result) return NULL;
+  try
+  {
+    PyObject* row;
+    while ((!chunk || PyList_GET_SIZE(result) < chunk) && (row = nextRow()))
+    {
+      int err = PyList_Append(result, row);
+      Py_DECREF(row);
+      if (err) throw RuntimeException("Can't build the plan rows");
+    }
+  }
+  catch (...)
+  {
+    Py_DECREF(result);
+    PythonType::evalException();
+    return NULL;
+  }
+
+  // The iteration ends when no rows are left
+  if (!PyList_GET_SIZE(result))
+  {
+    Py_DECREF(result);
+    return NULL;
+  }
+  return result;
+}
+
+
+PyObject* PlanRowIterator::nextRow()
+{
+  switch (type)
+  {
+    case FLOWPLANS:
+      while (owner < buffers.size())
+      {
+        const Buffer::flowplanlist& l = buffers[owner]->getFlowPlans();
+        if (!flowplaniter)
+          flowplaniter = new Buffer::flowplanlist::const_iterator(l.begin());
+        while (*flowplaniter != l.end())
+        {
+          const Buffer::flowplanlist::Event* e = &*((*flowplaniter)++);
+          if (e->getType() == 1 && e->getQuantity() != 0.0)
+            return getRow(static_cast<const FlowPlan*>(e));
+        }
+        delete flowplaniter;
+        flowplaniter = NULL;
+        ++owner;
+      }
+      return NULL;
+    case LOADPLANS:
+      while (owner < resources.size())
+      {
+        const Resource::loadplanlist& l = resources[owner]->getLoadPlans();
+        if (!loadplaniter)
+          loadplaniter = new Resource::loadplanlist::const_iterator(l.begin());
+        while (*loadplaniter != l.end())
+        {
+          // Only the loadplan consuming the capacity is returned
+          const Resource::loadplanlist::Event* e = &*((*loadplaniter)++);
+          if (e->getType() == 1 && e->getQuantity() < 0.0)
+            return getRow(static_cast<const LoadPlan*>(e));
+        }
+        delete loadplaniter;
+        loadplaniter = NULL;
+        ++owner;
+      }
+      return NULL;
+    case OPERATIONPLANS:
+      if (opplaniter == OperationPlan::end()) return NULL;
+      return getRow(&*(opplaniter++));
+  }
+  return NULL;
+}
+
+
+PyObject* PlanRowIterator::getRow(const FlowPlan* f)
+{
+  PyObject* row = PyTuple_New(fields.size());
+  if (!row) throw RuntimeException("Can't build the plan rows");
+  for (unsigned short i = 0; i < fields.size(); ++i)
+  {
+    PyObject* val = NULL;
+    switch (fields[i])
+    {
+      case FLOWPLAN_OPERATIONPLAN:
+        val = PythonObject(f->getOperationPlan()->getIdentifier());
+        break;
+      case FLOWPLAN_BUFFER:
+        val = getName(f->getBuffer(), f->getBuffer()->getName());
+        break;
+      case FLOWPLAN_OPERATION:
+        val = getName(f->getFlow()->getOperation(), f->getFlow()->getOperation()->getName());
+        break;
+      case FLOWPLAN_QUANTITY:
+        val = PythonObject(f->getQuantity());
+        break;
+      case FLOWPLAN_DATE:
+        val = getDate(f->getDate());
+        break;
+      case FLOWPLAN_ONHAND:
+        val = PythonObject(f->getOnhand());
+        break;
+    }
+    if (!val)
+    {
+      Py_DECREF(row);
+      throw RuntimeException("Can't build the plan rows");
+    }
+    PyTuple_SET_ITEM(row, i, val);
+  }
+  return row;
+}
+
+
+PyObject* PlanRowIterator::getRow(const LoadPlan* l)
+{
+  PyObject* row = PyTuple_New(fields.size());
+  if (!row) throw RuntimeException("Can't build the plan rows");
+  for (unsigned short i = 0; i < fields.size(); ++i)
+  {
+    PyObject* val = NULL;
+    switch (fields[i])
+    {
+      case LOADPLAN_OPERATIONPLAN:
+        val = PythonObject(l->getOperationPlan()->getIdentifier());
+        break;
+      case LOADPLAN_RESOURCE:
+        val = getName(l->getResource(), l->getResource()->getName());
+        break;
+      case LOADPLAN_OPERATION:
+        val = getName(l->getLoad()->getOperation(), l->getLoad()->getOperation()->getName());
+        break;
+      case LOADPLAN_QUANTITY:
+        val = PythonObject(-l->getQuantity());
+        break;
+      case LOADPLAN_STARTDATE:
+        val = getDate(l->getOperationPlan()->getDates().getStart());
+        break;
+      case LOADPLAN_ENDDATE:
+        val = getDate(l->getOperationPlan()->getDates().getEnd());
+        break;
+      case LOADPLAN_SETUP:
+        val = l->getSetup().empty() ?
+          getNull() :
+          static_cast<PyObject*>(PythonObject(l->getSetup()));
+        break;
+    }
+    if (!val)
+    {
+      Py_DECREF(row);
+      throw RuntimeException("Can't build the plan rows");
+    }
+    PyTuple_SET_ITEM(row, i, val);
+  }
+  return row;
+}
+
+
+PyObject* PlanRowIterator::getRow(OperationPlan* o)
+{
+  PyObject* row = PyTuple_New(fields.size());
+  if (!row) throw RuntimeException("Can't build the plan rows");
+  for (unsigned short i = 0; i < fields.size(); ++i)
+  {
+    PyObject* val = NULL;
+    switch (fields[i])
+    {
+      case OPERATIONPLAN_ID:
+        val = PythonObject(o->getIdentifier());
+        break;
+      case OPERATIONPLAN_OPERATION:
+        val = getName(o->getOperation(), o->getOperation()->getName());
+        break;
+      case OPERATIONPLAN_QUANTITY:
+        val = PythonObject(o->getQuantity());
+        break;
+      case OPERATIONPLAN_START:
+        val = getDate(o->getDates().getStart());
+        break;
+      case OPERATIONPLAN_END:
+        val = getDate(o->getDates().getEnd());
+        break;
+      case OPERATIONPLAN_CRITICALITY:
+        val = PythonObject(o->getCriticality());
+        break;
+      case OPERATIONPLAN_LOCKED:
+        val = PythonObject(o->getLocked());
+        break;
+      case OPERATIONPLAN_UNAVAILABLE:
+        val = PythonObject(o->getUnavailable());
+        break;
+      case OPERATIONPLAN_OWNER:
+        val = o->getOwner() ?
+          static_cast<PyObject*>(PythonObject(o->getOwner()->getIdentifier())) :
+          getNull();
+        break;
+      case OPERATIONPLAN_DEMAND:
+        val = o->getDemand() ?
+          getName(o->getDemand(), o->getDemand()->getName()) :
+          getNull();
+        break;
+    }
+    if (!val)
+    {
+      Py_DECREF(row);
+      throw RuntimeException("Can't build the plan rows");
+    }
+    PyTuple_SET_ITEM(row, i, val);
+  }
+  return row;
+}
+
+
+PyObject* PlanRowIterator::getName(const Object* o, const string& n)
+{
+  map<const Object*, PyObject*>::const_iterator i = names.find(o);
+  if (i == names.end())
+  {
+    PyObject* p = PythonObject(n);
+    if (!p) return NULL;
+    i = names.insert(make_pair(o, p)).first;
+  }
+  Py_INCREF(i->second);
+  return i->second;
+}
+
+
+PyObject* PlanRowIterator::getDate(const Date& d)
+{
+  map<Date, PyObject*>::const_iterator i = dates.find(d);
+  if (i == dates.end())
+  {
+    PyObject* p = PythonObject(d);
+    if (!p) return NULL;
+    i = dates.insert(make_pair(d, p)).first;
+  }
+  Py_INCREF(i->second);
+  return i->second;
+}
+
+} // end namespace
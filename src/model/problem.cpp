@@ -26,6 +26,11 @@ namespace frepple
 
 DECLARE_EXPORT bool Plannable::anyChange = false;
 DECLARE_EXPORT bool Plannable::computationBusy = false;
+DECLARE_EXPORT set<Plannable*> Plannable::changedEntities;
+DECLARE_EXPORT set<Plannable*> Plannable::replanEntities;
+DECLARE_EXPORT unsigned long Plannable::detectionRuns = 0;
+DECLARE_EXPORT unsigned long Plannable::detectionEntities = 0;
+DECLARE_EXPORT double Plannable::detectionTime = 0.0;
 DECLARE_EXPORT const MetaCategory* Problem::metadata;
 DECLARE_EXPORT const MetaClass* ProblemMaterialExcess::metadata,
                *ProblemMaterialShortage::metadata,
@@ -168,6 +173,106 @@ DECLARE_EXPORT void Plannable::setDetectProblems(bool b)
 }
 
 
+/** Protects the list of changed objects in a multi-threaded environment. */
+static Mutex changesbusy;
+
+
+/** Minimum number of changed objects evaluated by a thread. Smaller lists
+  * aren't worth the overhead of an extra thread. */
+static const size_t minimumPerThread = 1000;
+
+
+DECLARE_EXPORT Plannable::~Plannable()
+{
+  ScopeMutexLock l(changesbusy);
+  changedEntities.erase(this);
+  replanEntities.erase(this);
+}
+
+
+DECLARE_EXPORT void Plannable::registerChange(Plannable* e)
+{
+  ScopeMutexLock l(changesbusy);
+  changedEntities.insert(e);
+  if (!e->replan)
+  {
+    e->replan = true;
+    replanEntities.insert(e);
+  }
+  anyChange = true;
+}
+
+
+/** Returns the cluster of a plannable entity, or -1 when the entity doesn't
+  * belong to a cluster. */
+static int getEntityCluster(Plannable* e)
+{
+  HasLevel* h = dynamic_cast<HasLevel*>(e);
+  if (h) return h->getCluster();
+  Demand* d = dynamic_cast<Demand*>(e);
+  if (d) return d->getCluster();
+  return -1;
+}
+
+
+DECLARE_EXPORT set<unsigned int> Plannable::getReplanClusters()
+{
+  // Pick up the changed entities. The clusters are computed first, since
+  // that can mark entities as changed.
+  HasLevel::getNumberOfClusters();
+  vector<Plannable*> entities;
+  {
+    ScopeMutexLock l(changesbusy);
+    entities.assign(replanEntities.begin(), replanEntities.end());
+  }
+
+  set<unsigned int> result;
+  for (vector<Plannable*>::const_iterator i = entities.begin(); i != entities.end(); ++i)
+  {
+    int c = getEntityCluster(*i);
+    if (c >= 0) result.insert(c);
+  }
+  return result;
+}
+
+
+DECLARE_EXPORT void Plannable::resetReplan(const set<unsigned int>& clusters)
+{
+  HasLevel::getNumberOfClusters();
+  vector<Plannable*> entities;
+  {
+    ScopeMutexLock l(changesbusy);
+    entities.assign(replanEntities.begin(), replanEntities.end());
+  }
+
+  // Select the entities of the clusters
+  vector<Plannable*> planned;
+  for (vector<Plannable*>::const_iterator i = entities.begin(); i != entities.end(); ++i)
+  {
+    int c = getEntityCluster(*i);
+    if (c < 0 || clusters.find(c) != clusters.end()) planned.push_back(*i);
+  }
+
+  // Mark them as planned. Entities deleted in the meantime are no longer
+  // in the list.
+  ScopeMutexLock l(changesbusy);
+  for (vector<Plannable*>::const_iterator j = planned.begin(); j != planned.end(); ++j)
+    if (replanEntities.erase(*j)) (*j)->replan = false;
+}
+
+
+/** Updates the problems of a part of the changed objects. The argument is a
+  * pair of iterators delimiting the part. */
+static void updateChangedProblems(void* args)
+{
+  typedef vector<Plannable*>::const_iterator iter;
+  pair<iter,iter>* range = static_cast< pair<iter,iter>* >(args);
+  for (iter i = range->first; i != range->second; ++i)
+    if ((*i)->getChanged() && (*i)->getDetectProblems())
+      (*i)->updateProblems();
+}
+
+
 DECLARE_EXPORT void Plannable::computeProblems()
 {
   // Exit immediately if the list is up to date
@@ -183,23 +288,58 @@ DECLARE_EXPORT void Plannable::computeProblems()
     // waiting for the lock
     while (anyChange)
     {
-      // Reset to change flag. Note that during the computation the flag
-      // could be switched on again by some model change in a different thread.
-      anyChange = false;
+      WallTimer timer;
 
-      // Loop through all entities
-      for (HasProblems::EntityIterator i; i!=HasProblems::endEntity(); ++i)
+      // Reset to change flag and pick up the changed entities. Note that
+      // during the computation the flag could be switched on again by some
+      // model change in a different thread.
+      vector<Plannable*> entities;
       {
-        Plannable *e = i->getEntity();
-        if (e->getChanged() && e->getDetectProblems()) i->updateProblems();
+        ScopeMutexLock m(changesbusy);
+        anyChange = false;
+        entities.assign(changedEntities.begin(), changedEntities.end());
+        changedEntities.clear();
       }
 
-      // Mark the entities as unchanged
-      for (HasProblems::EntityIterator j; j!=HasProblems::endEntity(); ++j)
+      // Evaluate the entities, split in equal parts over the worker threads
+      typedef vector<Plannable*>::const_iterator iter;
+      ThreadGroup threads;
+      // The worker threads need the Python interpreter. When the calling
+      // thread holds it, the workers would wait for it forever.
+      if (PythonInterpreter::hasLock()) threads.setMaxParallel(1);
+      size_t parts = entities.size() / minimumPerThread;
+      if (parts > static_cast<size_t>(threads.getMaxParallel()))
+        parts = threads.getMaxParallel();
+      if (parts < 1) parts = 1;
+      vector< pair<iter,iter> > ranges;
+      ranges.reserve(parts);
+      for (size_t p = 0; p < parts; ++p)
       {
-        Plannable *e = j->getEntity();
-        if (e->getChanged() && e->getDetectProblems()) e->setChanged(false);
+        ranges.push_back(make_pair(
+          entities.begin() + entities.size() * p / parts,
+          entities.begin() + entities.size() * (p + 1) / parts
+          ));
+        threads.add(updateChangedProblems, &ranges.back());
       }
+      threads.execute();
+
+      // Mark the entities as unchanged.
+      // Entities without problem detection remain in the list of changed
+      // entities, to be evaluated when the problem detection is switched on.
+      {
+        ScopeMutexLock m(changesbusy);
+        for (iter j = entities.begin(); j != entities.end(); ++j)
+        {
+          if (!(*j)->getChanged()) continue;
+          if ((*j)->getDetectProblems()) (*j)->changed = false;
+          else changedEntities.insert(*j);
+        }
+      }
+
+      // Update the counters
+      ++detectionRuns;
+      detectionEntities += entities.size();
+      detectionTime += timer.elapsed();
     }
 
     // Unlock the exclusive access to this function
@@ -502,6 +642,27 @@ DECLARE_EXPORT Problem::const_iterator& Problem::const_iterator::operator++()
 }
 
 
+DECLARE_EXPORT PyObject* ProblemIterator::create(PyObject* self, PyObject* args)
+{
+  // Free Python interpreter for the worker threads of the problem detection
+  Py_BEGIN_ALLOW_THREADS
+
+  // Execute and catch exceptions
+  try
+  {
+    Plannable::computeProblems();
+  }
+  catch (...)
+  {
+    Py_BLOCK_THREADS;
+    PythonType::evalException();
+    return NULL;
+  }
+  Py_END_ALLOW_THREADS   // Reclaim Python interpreter
+  return new ProblemIterator();
+}
+
+
 DECLARE_EXPORT Problem::const_iterator Problem::begin()
 {
   Plannable::computeProblems();
@@ -125,6 +125,11 @@ DECLARE_EXPORT void Resource::setMaximumCalendar(CalendarDouble* c)
   // Mark as changed
   setChanged();
 
+  // Update the references on the calendars
+  if (size_max_cal) size_max_cal->maximumResources.erase(this);
+  size_max_cal = c;
+  if (c) c->maximumResources.insert(this);
+
   // Remove the current max events.
   for (loadplanlist::iterator oo=loadplans.begin(); oo!=loadplans.end(); )
     if (oo->getType() == 4)
@@ -142,7 +147,6 @@ DECLARE_EXPORT void Resource::setMaximumCalendar(CalendarDouble* c)
   }
 
   // Create timeline structures for every bucket.
-  size_max_cal = c;
   double curMax = 0.0;
   for (CalendarDouble::EventIterator x(size_max_cal); x.getDate()<Date::infiniteFuture; ++x)
     if (curMax != x.getValue())
@@ -163,6 +167,11 @@ DECLARE_EXPORT void ResourceBuckets::setMaximumCalendar(CalendarDouble* c)
   // Mark as changed
   setChanged();
 
+  // Update the references on the calendars
+  if (size_max_cal) size_max_cal->maximumResources.erase(this);
+  size_max_cal = c;
+  if (c) c->maximumResources.insert(this);
+
   // Remove the current set-onhand events.
   for (loadplanlist::iterator oo=loadplans.begin(); oo!=loadplans.end(); )
     if (oo->getType() == 2)
@@ -172,8 +181,10 @@ DECLARE_EXPORT void ResourceBuckets::setMaximumCalendar(CalendarDouble* c)
     }
     else ++oo;
 
+  // Null pointer passed. The resource has no buckets.
+  if (!c) return;
+
   // Create timeline structures for every bucket.
-  size_max_cal = c;
   double v = 0.0;
   for (CalendarDouble::EventIterator x(size_max_cal); x.getDate()<Date::infiniteFuture; ++x)
     if (v != x.getValue())
@@ -359,6 +370,10 @@ DECLARE_EXPORT Resource::~Resource()
 
   // The Load and ResourceSkill objects are automatically deleted by the
   // destructor of the Association list class.
+
+  // Remove the references to this resource
+  if (loc) loc->resources.erase(this);
+  if (size_max_cal) size_max_cal->maximumResources.erase(this);
 }
 
 
@@ -503,34 +518,34 @@ DECLARE_EXPORT int Resource::setattro(const Attribute& attr, const PythonObject&
     setSource(field.getString());
   else if (attr.isA(Tags::tag_owner))
   {
-    if (!field.check(Resource::metadata))
+    if (field && !field.check(Resource::metadata))
     {
       PyErr_SetString(PythonDataException, "resource owner must be of type resource");
       return -1;
     }
-    Resource* y = static_cast<Resource*>(static_cast<PyObject*>(field));
+    Resource* y = field ? static_cast<Resource*>(static_cast<PyObject*>(field)) : NULL;
     setOwner(y);
   }
   else if (attr.isA(Tags::tag_location))
   {
-    if (!field.check(Location::metadata))
+    if (field && !field.check(Location::metadata))
     {
       PyErr_SetString(PythonDataException, "resource location must be of type location");
       return -1;
     }
-    Location* y = static_cast<Location*>(static_cast<PyObject*>(field));
+    Location* y = field ? static_cast<Location*>(static_cast<PyObject*>(field)) : NULL;
     setLocation(y);
   }
   else if (attr.isA(Tags::tag_maximum))
     setMaximum(field.getDouble());
   else if (attr.isA(Tags::tag_maximum_calendar))
   {
-    if (!field.check(CalendarDouble::metadata))
+    if (field && !field.check(CalendarDouble::metadata))
     {
       PyErr_SetString(PythonDataException, "resource maximum_calendar must be of type calendar_double");
       return -1;
     }
-    CalendarDouble* y = static_cast<CalendarDouble*>(static_cast<PyObject*>(field));
+    CalendarDouble* y = field ? static_cast<CalendarDouble*>(static_cast<PyObject*>(field)) : NULL;
     setMaximumCalendar(y);
   }
   else if (attr.isA(Tags::tag_hidden))
@@ -543,12 +558,12 @@ DECLARE_EXPORT int Resource::setattro(const Attribute& attr, const PythonObject&
     setSetup(field.getString());
   else if (attr.isA(Tags::tag_setupmatrix))
   {
-    if (!field.check(SetupMatrix::metadata))
+    if (field && !field.check(SetupMatrix::metadata))
     {
       PyErr_SetString(PythonDataException, "resource setup_matrix must be of type setup_matrix");
       return -1;
     }
-    SetupMatrix* y = static_cast<SetupMatrix*>(static_cast<PyObject*>(field));
+    SetupMatrix* y = field ? static_cast<SetupMatrix*>(static_cast<PyObject*>(field)) : NULL;
     setSetupMatrix(y);
   }
   else
@@ -592,7 +607,8 @@ int Resource::PlanIterator::initialize()
 
 
 Resource::PlanIterator::PlanIterator(Resource* r, PyObject* o) :
-  res(r), bucketiterator(o), ldplaniter(r ? r->getLoadPlans().begin() : NULL),
+  res(r), bucketiterator(o), bucketlist(NULL), bucketindex(0),
+  ldplaniter(r ? r->getLoadPlans().begin() : NULL),
   cur_setup(0.0), cur_load(0.0), cur_size(0.0), start_date(NULL), end_date(NULL)
 {
   if (!r)
@@ -600,9 +616,25 @@ Resource::PlanIterator::PlanIterator(Resource* r, PyObject* o) :
     bucketiterator = NULL;
     throw LogicException("Creating resource plan iterator for NULL resource");
   }
+  init();
+}
 
+
+Resource::PlanIterator::PlanIterator(Resource* r, const vector<Date>& b) :
+  res(r), bucketiterator(NULL), bucketlist(&b), bucketindex(0),
+  ldplaniter(r ? r->getLoadPlans().begin() : NULL),
+  cur_setup(0.0), cur_load(0.0), cur_size(0.0), start_date(NULL), end_date(NULL)
+{
+  if (!r)
+    throw LogicException("Creating resource plan iterator for NULL resource");
+  init();
+}
+
+
+void Resource::PlanIterator::init()
+{
   // Count differently for bucketized and continuous resources
-  bucketized = (r->getType() == *ResourceBuckets::metadata);
+  bucketized = (res->getType() == *ResourceBuckets::metadata);
 
   if (bucketized)
   {
@@ -612,13 +644,11 @@ Resource::PlanIterator::PlanIterator(Resource* r, PyObject* o) :
   else
   {
     // Start date of the first bucket
-    end_date = PyIter_Next(bucketiterator);
-    if (!end_date) throw LogicException("Expecting at least two dates as argument");
-    cur_date = PythonObject(end_date).getDate();
+    if (!nextDate()) throw LogicException("Expecting at least two dates as argument");
     prev_date = cur_date;
 
     // A flag to remember whether this resource has an unavailability calendar.
-    hasUnavailability = r->getLocation() && r->getLocation()->getAvailable();
+    hasUnavailability = res->getLocation() && res->getLocation()->getAvailable();
     if (hasUnavailability)
     {
       unavailableIterator = Calendar::EventIterator(res->getLocation()->getAvailable(), cur_date);
@@ -658,6 +688,29 @@ Resource::PlanIterator::~PlanIterator()
 }
 
 
+bool Resource::PlanIterator::nextDate()
+{
+  bucket_start = cur_date;
+  if (bucketlist)
+  {
+    // Pick the next date from the list
+    if (bucketindex >= bucketlist->size()) return false;
+    cur_date = (*bucketlist)[bucketindex++];
+  }
+  else
+  {
+    // Pick the next date from the Python iterator
+    if (start_date) Py_DECREF(start_date);
+    start_date = end_date;
+    end_date = PyIter_Next(bucketiterator);
+    if (!end_date) return false;
+    cur_date = PythonObject(end_date).getDate();
+  }
+  bucket_end = cur_date;
+  return true;
+}
+
+
 void Resource::PlanIterator::update(Date till)
 {
   long timedelta;
@@ -705,7 +758,7 @@ void Resource::PlanIterator::update(Date till)
 }
 
 
-PyObject* Resource::PlanIterator::iternext()
+bool Resource::PlanIterator::next()
 {
   // Reset counters
   bucket_available = 0.0;
@@ -717,17 +770,10 @@ PyObject* Resource::PlanIterator::iternext()
   {
     if (ldplaniter == res->getLoadPlans().end())
       // No more resource buckets
-      return NULL;
-    else
-    {
-      // At this point ldplaniter points to a bucket start event.
-      if (start_date) Py_DECREF(start_date);
-      if (end_date)
-        start_date = end_date;
-      else
-        start_date = PythonObject(ldplaniter->getDate());
-      bucket_available = ldplaniter->getOnhand();
-    }
+      return false;
+    // At this point ldplaniter points to a bucket start event.
+    bucket_start = ldplaniter->getDate();
+    bucket_available = ldplaniter->getOnhand();
     // Advance the loadplan iterator to the start of the next bucket
     ++ldplaniter;
     while (ldplaniter != res->getLoadPlans().end() && ldplaniter->getType() != 2)
@@ -737,18 +783,14 @@ PyObject* Resource::PlanIterator::iternext()
       ++ldplaniter;
     }
     if (ldplaniter == res->getLoadPlans().end())
-      end_date = PythonObject(Date::infiniteFuture);
+      bucket_end = Date::infiniteFuture;
     else
-      end_date = PythonObject(ldplaniter->getDate());
+      bucket_end = ldplaniter->getDate();
   }
   else
   {
     // Get the start and end date of the current bucket
-    if (start_date) Py_DECREF(start_date);
-    start_date = end_date;
-    end_date = PyIter_Next(bucketiterator);
-    if (!end_date) return NULL;
-    cur_date = PythonObject(end_date).getDate();
+    if (!nextDate()) return false;
 
     // Measure from beginning of the bucket till the first event in this bucket
     if (ldplaniter != res->getLoadPlans().end() && ldplaniter->getDate() < cur_date)
@@ -790,6 +832,24 @@ PyObject* Resource::PlanIterator::iternext()
     bucket_unavailable /= 3600;
     bucket_setup /= 3600;
   }
+  return true;
+}
+
+
+PyObject* Resource::PlanIterator::iternext()
+{
+  if (!next()) return NULL;
+
+  // Python objects for the dates of a resource bucket
+  if (bucketized)
+  {
+    if (start_date) Py_DECREF(start_date);
+    if (end_date)
+      start_date = end_date;
+    else
+      start_date = PythonObject(bucket_start);
+    end_date = PythonObject(bucket_end);
+  }
 
   // Return the result
   return Py_BuildValue("{s:O,s:O,s:d,s:d,s:d,s:d,s:d}",
@@ -799,7 +859,161 @@ PyObject* Resource::PlanIterator::iternext()
     "load", bucket_load,
     "unavailable", bucket_unavailable,
     "setup", bucket_setup,
-    "free", bucket_available - bucket_load - bucket_setup);
+    "free", getFree());
+}
+
+
+/** Truncates a date to the start of its day. */
+static Date startOfDay(Date d, int offset = 0)
+{
+  time_t ticks = d.getTicks();
+#ifdef HAVE_LOCALTIME_R
+  struct tm t;
+  localtime_r(&ticks, &t);
+#else
+  struct tm t = *localtime(&ticks);
+#endif
+  return Date(t.tm_year + 1900, t.tm_mon + 1, t.tm_mday + offset);
+}
+
+
+PyObject* Resource::plans(PyObject *self, PyObject *args)
+{
+  // Parse the Python arguments
+  PyObject* pystart = NULL;
+  PyObject* pyend = NULL;
+  PyObject* pyclusters = NULL;
+  int ok = PyArg_ParseTuple(args, "|OOO:resourceplans", &pystart, &pyend, &pyclusters);
+  if (!ok) return NULL;
+
+  // Pick up the list of clusters to report on
+  set<int> clusters;
+  if (pyclusters && pyclusters != Py_None)
+  {
+    PyObject* iter = PyObject_GetIter(pyclusters);
+    if (!iter)
+    {
+      PyErr_Format(PyExc_AttributeError,"Clusters argument to resourceplans() must support iteration");
+      return NULL;
+    }
+    PyObject* item;
+    while ((item = PyIter_Next(iter)))
+    {
+      clusters.insert(PythonObject(item).getInt());
+      Py_DECREF(item);
+    }
+    Py_DECREF(iter);
+    if (PyErr_Occurred()) return NULL;
+  }
+
+  PyObject* result = NULL;
+  PyObject* name = NULL;
+  vector<PyObject*> pydates;
+  try
+  {
+    // Determine the reporting horizon.
+    // The default start date is 30 days before the start of the earliest
+    // loadplan in the plan, and the default end date is 30 days after the
+    // end of the latest loadplan. If no loadplans exist at all, the
+    // current date is used.
+    Date start, end;
+    if (pystart && pystart != Py_None)
+      start = PythonObject(pystart).getDate();
+    if (pyend && pyend != Py_None)
+      end = PythonObject(pyend).getDate();
+    if (!start || !end)
+    {
+      Date first = Date::infiniteFuture;
+      Date last = Date::infinitePast;
+      for (Resource::iterator r = Resource::begin(); r != Resource::end(); ++r)
+        for (loadplanlist::const_iterator i = r->getLoadPlans().begin();
+          i != r->getLoadPlans().end(); ++i)
+        {
+          if (i->getType() != 1) continue;
+          const OperationPlan* opplan =
+            static_cast<const LoadPlan*>(&*i)->getOperationPlan();
+          if (opplan->getDates().getStart() < first)
+            first = opplan->getDates().getStart();
+          if (opplan->getDates().getEnd() > last)
+            last = opplan->getDates().getEnd();
+        }
+      if (first == Date::infiniteFuture) first = Plan::instance().getCurrent();
+      if (last == Date::infinitePast) last = Plan::instance().getCurrent();
+      if (!start) start = first - TimePeriod(30*86400L);
+      if (!end) end = last + TimePeriod(30*86400L);
+    }
+    // The day before the infinite future is the last day we can report on
+    Date limit = startOfDay(Date::infiniteFuture, -1);
+    if (end > limit) end = limit;
+
+    // The last bucket ends at the start of the day of the end date
+    end = startOfDay(end);
+
+    // Build the list of daily buckets, and their Python dates
+    vector<Date> buckets;
+    for (int d = 0; ; ++d)
+    {
+      Date dt = startOfDay(start, d);
+      if (dt >= end) break;
+      buckets.push_back(dt);
+      pydates.push_back(PythonObject(dt));
+    }
+
+    // Select the resources to report on. When clusters are specified only
+    // the members of those clusters are visited.
+    vector<Resource*> resources;
+    if (clusters.empty())
+      for (Resource::iterator r = Resource::begin(); r != Resource::end(); ++r)
+        resources.push_back(&*r);
+    else
+      for (set<int>::const_iterator c = clusters.begin(); c != clusters.end(); ++c)
+      {
+        if (*c < 0) continue;
+        const vector<Resource*>& members = HasLevel::getClusterResources(*c);
+        resources.insert(resources.end(), members.begin(), members.end());
+      }
+
+    // Compute the plan of the resources
+    result = PyList_New(0);
+    if (!buckets.empty())
+      for (vector<Resource*>::const_iterator r = resources.begin(); r != resources.end(); ++r)
+      {
+        bool bucketized = ((*r)->getType() == *ResourceBuckets::metadata);
+        name = PythonObject((*r)->getName());
+        PlanIterator p(*r, buckets);
+        size_t idx = 0;
+        while (p.next())
+        {
+          PyObject* dt = bucketized ?
+            static_cast<PyObject*>(PythonObject(p.getStart())) :
+            pydates[idx++];
+          PyObject* row = Py_BuildValue("(OOddddd)",
+            name, dt, p.getAvailable(), p.getUnavailable(),
+            p.getSetup(), p.getLoad(), p.getFree());
+          if (bucketized) Py_DECREF(dt);
+          if (!row) throw RuntimeException("Can't build the resource plans");
+          int err = PyList_Append(result, row);
+          Py_DECREF(row);
+          if (err) throw RuntimeException("Can't build the resource plans");
+        }
+        Py_DECREF(name);
+        name = NULL;
+      }
+  }
+  catch(...)
+  {
+    Py_XDECREF(result);
+    Py_XDECREF(name);
+    for (vector<PyObject*>::iterator i = pydates.begin(); i != pydates.end(); ++i)
+      Py_DECREF(*i);
+    PythonType::evalException();
+    return NULL;
+  }
+
+  // Clean up and return the result
+  for (vector<PyObject*>::iterator i = pydates.begin(); i != pydates.end(); ++i)
+    Py_DECREF(*i);
+  return result;
 }
 
 }
@@ -85,13 +85,28 @@ DECLARE_EXPORT void SolverMRP::SolverMRPdata::commit()
   if (!demands || !solver)
     throw LogicException("Missing demands or solver.");
 
+  // Collect the messages of this cluster when solving in parallel
+  ThreadLog* log = (cluster < solver->log_per_cluster.size()) ?
+    new ThreadLog() :
+    NULL;
+
   // Message
   if (solver->getLogLevel()>0)
     logger << "Start solving cluster " << cluster << " at " << Date::now() << endl;
+  WallTimer timer;
 
   // Solve the planning problem
   try
   {
+    // Delete the previous plan of this cluster. The locked operationplans
+    // are kept. The entities of a cluster aren't connected to any other
+    // cluster, which makes it safe to delete in parallel with other threads.
+    if (solver->getLogLevel()>0)
+      logger << "Deleting previous plan of cluster " << cluster << endl;
+    const vector<Operation*>& opers = HasLevel::getClusterOperations(cluster);
+    for (vector<Operation*>::const_iterator e = opers.begin(); e != opers.end(); ++e)
+      (*e)->deleteOperationPlans();
+
     // TODO Propagate & solve initial shortages and overloads
 
     // Sort the demands of this problem.
@@ -152,17 +167,29 @@ DECLARE_EXPORT void SolverMRP::SolverMRPdata::commit()
     catch (...) {logger << "  Unknown type" << endl;}
 
     // Clean up the operationplans of this cluster
-    for (Operation::iterator f=Operation::begin(); f!=Operation::end(); ++f)
-      if (f->getCluster() == cluster)
-        f->deleteOperationPlans();
+    const vector<Operation*>& opers = HasLevel::getClusterOperations(cluster);
+    for (vector<Operation*>::const_iterator f = opers.begin(); f != opers.end(); ++f)
+      (*f)->deleteOperationPlans();
 
     // Clean the list of demands of this cluster
     demands->clear();
   }
 
+  // Remember the effort for the scheduling of the next run. Every thread
+  // updates a different element of the vector.
+  if (cluster < solver->runtime_per_cluster.size())
+    solver->runtime_per_cluster[cluster] = timer.elapsed();
+
   // Message
   if (solver->getLogLevel()>0)
     logger << "End solving cluster " << cluster << " at " << Date::now() << endl;
+
+  // Hand over the messages of this cluster to the solver
+  if (log)
+  {
+    solver->log_per_cluster[cluster] = log->getMessages();
+    delete log;
+  }
 }
 
 
@@ -172,12 +199,11 @@ void SolverMRP::SolverMRPdata::solveSafetyStock(SolverMRP* solver)
   safety_stock_planning = true;
   if (getLogLevel()>0) logger << "Start safety stock replenishment pass   " << solver->getConstraints() << endl;
   vector< list<Buffer*> > bufs(HasLevel::getNumberOfLevels() + 1);
-  for (Buffer::iterator buf = Buffer::begin(); buf != Buffer::end(); ++buf)
-    if (buf->getCluster() == cluster
-      && ( buf->getMinimum() || buf->getMinimumCalendar()
-        || buf->getType() == *BufferProcure::metadata )
-      )
-      bufs[(buf->getLevel()>=0) ? buf->getLevel() : 0].push_back(&*buf);
+  const vector<Buffer*>& members = HasLevel::getClusterBuffers(cluster);
+  for (vector<Buffer*>::const_iterator buf = members.begin(); buf != members.end(); ++buf)
+    if ((*buf)->getMinimum() || (*buf)->getMinimumCalendar()
+      || (*buf)->getType() == *BufferProcure::metadata)
+      bufs[((*buf)->getLevel()>=0) ? (*buf)->getLevel() : 0].push_back(*buf);
   for (vector< list<Buffer*> >::iterator b_list = bufs.begin(); b_list != bufs.end(); ++b_list)
     for (list<Buffer*>::iterator b = b_list->begin(); b != b_list->end(); ++b)
       try
@@ -210,46 +236,130 @@ void SolverMRP::SolverMRPdata::solveSafetyStock(SolverMRP* solver)
 
 
 DECLARE_EXPORT void SolverMRP::solve(void *v)
+{
+  // Replan all clusters
+  set<unsigned int> clusters;
+  unsigned int cl = HasLevel::getNumberOfClusters() + 1;
+  for (unsigned int c = 0; c < cl; ++c) clusters.insert(c);
+  solveClusters(clusters);
+}
+
+
+DECLARE_EXPORT void SolverMRP::solveClusters(const set<unsigned int>& clusters)
 {
   // Count how many clusters we have to plan
   int cl = HasLevel::getNumberOfClusters() + 1;
 
-  // Categorize all demands in their cluster
-  demands_per_cluster.resize(cl);
-  for (Demand::iterator i = Demand::begin(); i != Demand::end(); ++i)
-    demands_per_cluster[i->getCluster()].push_back(&*i);
-
-  // Delete of operationplans of the affected clusters
-  // This deletion is not multi-threaded... But on the other hand we need to
-  // loop through the operations only once (rather than as many times as there
-  // are clusters)
-  // A multi-threaded alternative would be to hash the operations here, and
-  // then delete in each thread.
-  if (getLogLevel()>0) logger << "Deleting previous plan" << endl;
-  for (Operation::iterator e=Operation::begin(); e!=Operation::end(); ++e)
-    e->deleteOperationPlans();
+  // Categorize the demands of the selected clusters
+  demands_per_cluster.assign(cl, deque<Demand*>());
+  unsigned int selected = 0;
+  for (set<unsigned int>::const_iterator c = clusters.begin(); c != clusters.end(); ++c)
+  {
+    if (*c >= static_cast<unsigned int>(cl)) continue;
+    const vector<Demand*>& dmds = HasLevel::getClusterDemands(*c);
+    demands_per_cluster[*c].assign(dmds.begin(), dmds.end());
+    ++selected;
+  }
+  if (getLogLevel()>0 && selected < static_cast<unsigned int>(cl))
+    logger << "Replanning " << selected << " clusters, skipping "
+        << (cl - selected) << " clusters" << endl;
+
+  // The operationplans of the previous plan are deleted by the thread solving
+  // the cluster, such that the deletion also runs in parallel.
 
   // Solve in parallel threads.
-  // When not solving in silent and autocommit mode, we only use a single
-  // solver thread.
+  // When not solving in autocommit mode, we only use a single solver thread.
   // Otherwise we use as many worker threads as processor cores.
   ThreadGroup threads;
-  if (getLogLevel()>0 || !getAutocommit())
+  if (!getAutocommit())
     threads.setMaxParallel(1);
+  bool parallel = threads.getMaxParallel() > 1 && selected > 1;
 
-  // Register all clusters to be solved
-  for (int j = 0; j < cl; ++j)
-    threads.add(
-      SolverMRPdata::runme,
-      new SolverMRPdata(this, j, &(demands_per_cluster[j]))
-      );
+  // When logging in parallel threads, the messages of each cluster are
+  // collected in memory and written in the order of the clusters at the end.
+  if (parallel && getLogLevel()>0)
+    log_per_cluster.assign(cl, string());
+  else
+    log_per_cluster.clear();
+
+  // Estimate the effort of each cluster. The run time of the previous run is
+  // the best estimate. When the clusters have changed since, the number of
+  // demands and operations in the cluster is used instead.
+  // The biggest clusters are solved first, such that a big cluster doesn't
+  // keep a single thread busy while all others are idle.
+  // A single thread solves the clusters in a fixed order instead, which
+  // keeps the plan reproducible.
+  bool measured = (runtime_per_cluster.size() == static_cast<size_t>(cl));
+  if (!measured) runtime_per_cluster.assign(cl, 0.0);
+
+  // Register all selected clusters to be solved
+  for (set<unsigned int>::const_iterator j = clusters.begin(); j != clusters.end(); ++j)
+    if (*j < static_cast<unsigned int>(cl))
+      threads.add(
+        SolverMRPdata::runme,
+        new SolverMRPdata(this, *j, &(demands_per_cluster[*j])),
+        !parallel ? 0.0 :
+          measured ?
+            runtime_per_cluster[*j] :
+            static_cast<double>(demands_per_cluster[*j].size()
+              + HasLevel::getClusterOperations(*j).size())
+        );
 
   // Run the planning command threads and wait for them to exit
   threads.execute();
 
+  // Write the messages of the clusters in a fixed order
+  for (vector<string>::const_iterator m = log_per_cluster.begin();
+      m != log_per_cluster.end(); ++m)
+    logger << *m;
+  log_per_cluster.clear();
+  if (getLogLevel()>0) threads.logUtilization();
+
   // @todo Check the resource setups that were broken - needs to be removed
-  for (Resource::iterator gres = Resource::begin(); gres != Resource::end(); ++gres)
-    if (gres->getSetupMatrix()) gres->updateSetups();
+  for (set<unsigned int>::const_iterator c = clusters.begin(); c != clusters.end(); ++c)
+  {
+    if (*c >= static_cast<unsigned int>(cl)) continue;
+    const vector<Resource*>& res = HasLevel::getClusterResources(*c);
+    for (vector<Resource*>::const_iterator gres = res.begin(); gres != res.end(); ++gres)
+      if ((*gres)->getSetupMatrix()) (*gres)->updateSetups();
+  }
+
+  // The changes in the selected clusters, including the ones of this plan,
+  // are now planned
+  Plannable::resetReplan(clusters);
+
+  // Remember the settings of a complete plan. A partial plan with other
+  // settings leaves the other clusters out of date.
+  if (selected == static_cast<unsigned int>(cl))
+    planSettings = getPlanSettings();
+  else if (planSettings != getPlanSettings())
+    planSettings.clear();
+}
+
+
+DECLARE_EXPORT set<unsigned int> SolverMRP::getChangedClusters() const
+{
+  // Different settings or a different current date affect all clusters
+  if (planSettings.empty() || planSettings != getPlanSettings())
+  {
+    set<unsigned int> result;
+    unsigned int cl = HasLevel::getNumberOfClusters() + 1;
+    for (unsigned int c = 0; c < cl; ++c) result.insert(c);
+    return result;
+  }
+  return Plannable::getReplanClusters();
+}
+
+
+DECLARE_EXPORT string SolverMRP::getPlanSettings() const
+{
+  ostringstream o;
+  o << constrts << " " << plantype << " " << lazydelay << " "
+    << allowSplits << " " << rotateResources << " "
+    << iteration_threshold << " " << iteration_accuracy << " "
+    << iteration_max << " " << planSafetyStockFirst << " "
+    << Plan::instance().getCurrent();
+  return o.str();
 }
 
 
@@ -403,22 +513,81 @@ DECLARE_EXPORT int SolverMRP::setattro(const Attribute& attr, const PythonObject
 }
 
 
-DECLARE_EXPORT PyObject* SolverMRP::solve(PyObject *self, PyObject *args)
+DECLARE_EXPORT PyObject* SolverMRP::solve(PyObject *self, PyObject *args, PyObject *kwdict)
 {
-  // Parse the argument
+  // Parse the arguments
   PyObject *dem = NULL;
-  if (args && !PyArg_ParseTuple(args, "|O:solve", &dem)) return NULL;
+  PyObject *pyclusters = NULL;
+  PyObject *pychanged = NULL;
+  static const char *kwlist[] = {"demand", "clusters", "changed_only", NULL};
+  if (!PyArg_ParseTupleAndKeywords(args, kwdict, "|OOO:solve",
+      const_cast<char**>(kwlist), &dem, &pyclusters, &pychanged))
+    return NULL;
+  if (dem == Py_None) dem = NULL;
   if (dem && !PyObject_TypeCheck(dem, Demand::metadata->pythonClass))
   {
     PyErr_SetString(PythonDataException, "solve(d) argument must be a demand");
     return NULL;
   }
+  bool changed_only = pychanged && PyObject_IsTrue(pychanged);
+  bool selection = changed_only || (pyclusters && pyclusters != Py_None);
+  if (dem && selection)
+  {
+    PyErr_SetString(PythonDataException, "solve() can't plan a demand and a selection of clusters");
+    return NULL;
+  }
 
+  // Pick up the list of clusters to replan
+  set<unsigned int> clusters;
+  if (pyclusters && pyclusters != Py_None)
+  {
+    PyObject* iter = PyObject_GetIter(pyclusters);
+    if (!iter)
+    {
+      PyErr_Format(PyExc_AttributeError,"Clusters argument to solve() must support iteration");
+      return NULL;
+    }
+    PyObject* item;
+    while ((item = PyIter_Next(iter)))
+    {
+      int c = PythonObject(item).getInt();
+      if (c >= 0) clusters.insert(c);
+      Py_DECREF(item);
+    }
+    Py_DECREF(iter);
+    if (PyErr_Occurred()) return NULL;
+  }
+
+  vector<unsigned int> skipped;
   Py_BEGIN_ALLOW_THREADS   // Free Python interpreter for other threads
   try
   {
     SolverMRP* sol = static_cast<SolverMRP*>(self);
-    if (!dem)
+    if (selection)
+    {
+      // Replan a selection of the clusters
+      if (changed_only)
+      {
+        set<unsigned int> changed = sol->getChangedClusters();
+        if (pyclusters && pyclusters != Py_None)
+        {
+          // Only the changed clusters among the ones passed as argument
+          set<unsigned int> tmp;
+          for (set<unsigned int>::const_iterator c = clusters.begin();
+              c != clusters.end(); ++c)
+            if (changed.find(*c) != changed.end()) tmp.insert(*c);
+          clusters.swap(tmp);
+        }
+        else
+          clusters.swap(changed);
+      }
+      sol->setAutocommit(true);
+      sol->solveClusters(clusters);
+      unsigned int cl = HasLevel::getNumberOfClusters() + 1;
+      for (unsigned int c = 0; c < cl; ++c)
+        if (clusters.find(c) == clusters.end()) skipped.push_back(c);
+    }
+    else if (!dem)
     {
       // Complete replan
       sol->setAutocommit(true);
@@ -439,7 +608,14 @@ DECLARE_EXPORT PyObject* SolverMRP::solve(PyObject *self, PyObject *args)
     return NULL;
   }
   Py_END_ALLOW_THREADS   // Reclaim Python interpreter
-  return Py_BuildValue("");
+  if (!selection) return Py_BuildValue("");
+
+  // Return the list of skipped clusters
+  PyObject* result = PyList_New(skipped.size());
+  if (!result) return NULL;
+  for (size_t i = 0; i < skipped.size(); ++i)
+    PyList_SET_ITEM(result, i, PythonObject(skipped[i]));
+  return result;
 }
 
 
@@ -244,11 +244,21 @@ DECLARE_EXPORT void CommandManager::rollback()
 
 DECLARE_EXPORT void ThreadGroup::execute()
 {
+  // Sort the functions by cost. The workers pick the most expensive
+  // function first from the back of the list. The stable sort keeps
+  // functions with the same cost in the order of registration.
+  stable_sort(callables.begin(), callables.end(), compareCost);
+  WallTimer timer;
+  countWorkers = 0;
+
   // CASE 1: No need to create worker threads when either a) only a single
   // worker is allowed or b) only a single function needs to be called.
   if (maxParallel<=1 || countCallables<=1)
   {
+    workerCallables.assign(1, 0);
+    workerBusy.assign(1, 0.0);
     wrapper(this);
+    elapsed = timer.elapsed();
     return;
   }
 
@@ -256,6 +266,8 @@ DECLARE_EXPORT void ThreadGroup::execute()
   int numthreads = countCallables;
   // Limit the number of threads to the maximum allowed
   if (numthreads > maxParallel) numthreads = maxParallel;
+  workerCallables.assign(numthreads, 0);
+  workerBusy.assign(numthreads, 0.0);
   int worker = 0;
 #ifdef HAVE_PTHREAD_H
   // Create a thread for every command list. The main thread will then
@@ -352,6 +364,22 @@ DECLARE_EXPORT void ThreadGroup::execute()
   delete[] threads;
   delete[] m_id;
 #endif    // End of #ifdef ifHAVE_PTHREAD_H
+  elapsed = timer.elapsed();
+}
+
+
+DECLARE_EXPORT void ThreadGroup::logUtilization() const
+{
+  logger << "Executed functions in " << countWorkers << " worker"
+      << (countWorkers == 1 ? "" : "s") << " in " << elapsed << " seconds" << endl;
+  for (unsigned int i = 0; i < countWorkers; ++i)
+  {
+    logger << "  Worker " << i << ": " << workerCallables[i]
+        << " functions, busy " << workerBusy[i] << " seconds";
+    if (elapsed > 0)
+      logger << ", utilization " << (100.0 * workerBusy[i] / elapsed) << "%";
+    logger << endl;
+  }
 }
 
 
@@ -364,13 +392,20 @@ DECLARE_EXPORT ThreadGroup::callableWithArgument ThreadGroup::selectNextCallable
     assert( countCallables == 0 );
     return callableWithArgument(static_cast<callable>(NULL),static_cast<void*>(NULL));
   }
-  callableWithArgument c = callables.top();
-  callables.pop();
+  callableWithArgument c = callables.back().second;
+  callables.pop_back();
   --countCallables;
   return c;
 }
 
 
+DECLARE_EXPORT unsigned int ThreadGroup::selectWorker()
+{
+  ScopeMutexLock l(lock);
+  return countWorkers++;
+}
+
+
 #if defined(HAVE_PTHREAD_H)
 void* ThreadGroup::wrapper(void *arg)
 #else
@@ -379,8 +414,9 @@ unsigned __stdcall ThreadGroup::wrapper(void *arg)
 {
   // Each OS-level thread needs to initialize a Python thread state.
   ThreadGroup *l = static_cast<ThreadGroup*>(arg);
-  bool threaded = l->maxParallel > 1 && l->countCallables > 1;
+  bool threaded = l->workerBusy.size() > 1;
   if (threaded) PythonInterpreter::addThread();
+  unsigned int worker = l->selectWorker();
 
   for (callableWithArgument nextfunc = l->selectNextCallable();
       nextfunc.first;
@@ -390,6 +426,7 @@ unsigned __stdcall ThreadGroup::wrapper(void *arg)
     // Verify whether there has been a cancellation request in the meantime
     if (threaded) pthread_testcancel();
 #endif
+    WallTimer timer;
     try {nextfunc.first(nextfunc.second);}
     catch (...)
     {
@@ -399,6 +436,9 @@ unsigned __stdcall ThreadGroup::wrapper(void *arg)
       catch (const exception& e) {logger << "  " << e.what() << endl;}
       catch (...) {logger << "  Unknown type" << endl;}
     }
+    // Each worker only updates its own statistics
+    l->workerBusy[worker] += timer.elapsed();
+    ++(l->workerCallables[worker]);
   };
 
   // Finalize the Python thread state
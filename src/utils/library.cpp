@@ -50,9 +50,94 @@ DECLARE_EXPORT set<string> Environment::moduleRegistry;
 // is called the first time.
 DECLARE_EXPORT int Environment::processorcores = -1;
 
-// Output logging stream, whose input buffer is shared with either
-// Environment::logfile or cout.
-DECLARE_EXPORT ostream logger(cout.rdbuf());
+// Pointer to the ThreadLog of the current thread, if any
+#if defined(HAVE_PTHREAD_H)
+static pthread_key_t threadlogkey;
+static pthread_once_t threadlogonce = PTHREAD_ONCE_INIT;
+static void createThreadLogKey() {pthread_key_create(&threadlogkey, NULL);}
+static ThreadLog* getThreadLog()
+{
+  pthread_once(&threadlogonce, createThreadLogKey);
+  return static_cast<ThreadLog*>(pthread_getspecific(threadlogkey));
+}
+static void setThreadLog(ThreadLog* l)
+{
+  pthread_once(&threadlogonce, createThreadLogKey);
+  pthread_setspecific(threadlogkey, l);
+}
+#else
+static DWORD threadlogkey = TlsAlloc();
+static ThreadLog* getThreadLog()
+{
+  return static_cast<ThreadLog*>(TlsGetValue(threadlogkey));
+}
+static void setThreadLog(ThreadLog* l) {TlsSetValue(threadlogkey, l);}
+#endif
+
+
+/** @brief Stream buffer of the logger stream.
+  *
+  * The messages of a thread with a ThreadLog are collected in that object.
+  * The messages of all other threads are passed to the buffer of either
+  * Environment::logfile or cout. A mutex avoids that the messages of
+  * different threads are mixed up within a single write.
+  */
+class LogDispatcher : public streambuf
+{
+  public:
+    LogDispatcher() : target(cout.rdbuf()) {}
+
+    /** Updates the buffer receiving the messages. */
+    void setTarget(streambuf* t)
+    {
+      ScopeMutexLock l(lock);
+      target = t;
+    }
+
+  protected:
+    virtual int overflow(int c)
+    {
+      if (c == traits_type::eof()) return traits_type::not_eof(c);
+      char ch = traits_type::to_char_type(c);
+      return xsputn(&ch, 1) == 1 ? c : traits_type::eof();
+    }
+
+    virtual streamsize xsputn(const char* s, streamsize n)
+    {
+      ThreadLog* t = getThreadLog();
+      if (t) return t->messages.sputn(s, n);
+      ScopeMutexLock l(lock);
+      return target->sputn(s, n);
+    }
+
+    virtual int sync()
+    {
+      if (getThreadLog()) return 0;
+      ScopeMutexLock l(lock);
+      return target->pubsync();
+    }
+
+  private:
+    Mutex lock;
+    streambuf* target;
+};
+static LogDispatcher logdispatcher;
+
+// Output logging stream, whose messages are passed to either
+// Environment::logfile or cout, or collected in a ThreadLog.
+DECLARE_EXPORT ostream logger(&logdispatcher);
+
+
+DECLARE_EXPORT ThreadLog::ThreadLog() : previous(getThreadLog())
+{
+  setThreadLog(this);
+}
+
+
+DECLARE_EXPORT ThreadLog::~ThreadLog()
+{
+  setThreadLog(previous);
+}
 
 // Output file stream
 DECLARE_EXPORT ofstream Environment::logfile;
@@ -194,7 +279,7 @@ DECLARE_EXPORT void Environment::setLogFile(const string& x)
   if (x.empty() || x == "+")
   {
     logfilename = x;
-    logger.rdbuf(cout.rdbuf());
+    logdispatcher.setTarget(cout.rdbuf());
     return;
   }
 
@@ -206,7 +291,7 @@ DECLARE_EXPORT void Environment::setLogFile(const string& x)
     // Redirect to the previous logfile (or cout if that's not possible)
     if (logfile.is_open()) logfile.close();
     logfile.open(logfilename.c_str(), ios::app);
-    logger.rdbuf(logfile.is_open() ? logfile.rdbuf() : cout.rdbuf());
+    logdispatcher.setTarget(logfile.is_open() ? logfile.rdbuf() : cout.rdbuf());
     // The log file could not be opened
     throw RuntimeException("Could not open log file '" + x + "'");
   }
@@ -215,7 +300,7 @@ DECLARE_EXPORT void Environment::setLogFile(const string& x)
   logfilename = x;
 
   // Redirect the log file.
-  logger.rdbuf(logfile.rdbuf());
+  logdispatcher.setTarget(logfile.rdbuf());
 
   // Print a nice header
   logger << "Start logging frePPLe " << PACKAGE_VERSION << " ("
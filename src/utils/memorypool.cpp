@@ -0,0 +1,264 @@
+/***************************************************************************
+ *                                                                         *
+ * Copyright (C) 2007-2013 by Johan De Taeye, frePPLe bvba                 *
+ *                                                                         *
+ * This library is free software; you can redistribute it and/or modify it *
+ * under the terms of the GNU Affero General Public License as published   *
+ * by the Free Software Foundation; either version 3 of the License, or    *
+ * (at your option) any later version.                                     *
+ *                                                                         *
+ * This library is distributed in the hope that it will be useful,         *
+ * but WITHOUT ANY WARRANTY; without even the implied warranty of          *
+ * MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the            *
+ * GNU Affero General Public License for more details.                     *
+ *                                                                         *
+ * You should have received a copy of the GNU Affero General Public        *
+ * License along with this program.                                        *
+ * If not, see <http://www.gnu.org/licenses/>.                             *
+ *                                                                         *
+ ***************************************************************************/
+
+#define FREPPLE_CORE
+#include "frepple/utils.h"
+
+#ifdef WIN32
+#include <windows.h>
+#endif
+
+
+namespace frepple
+{
+namespace utils
+{
+
+DECLARE_EXPORT MemoryPool* MemoryPool::firstPool = NULL;
+
+
+/** Size of the header in front of every object, which points to its slab.
+  * The header also keeps the objects aligned on 8 bytes. */
+static const size_t headersize = sizeof(void*) > 8 ? sizeof(void*) : 8;
+
+
+/** Approximate size of a slab. */
+static const size_t slabbytes = 65536;
+
+
+/** Rounds a size up to a multiple of 8 bytes. */
+static inline size_t alignSize(size_t s)
+{
+  return (s + 7) & ~static_cast<size_t>(7);
+}
+
+
+/** Number of the current thread. The number is assigned the first time a
+  * thread allocates from a pool, and selects the arena of the thread. */
+static Mutex threadnumberbusy;
+static unsigned int threadcounter = 0;
+#if defined(HAVE_PTHREAD_H)
+static pthread_key_t threadnumberkey;
+static pthread_once_t threadnumberonce = PTHREAD_ONCE_INIT;
+static void createThreadNumberKey() {pthread_key_create(&threadnumberkey, NULL);}
+static void* getThreadValue()
+{
+  pthread_once(&threadnumberonce, createThreadNumberKey);
+  return pthread_getspecific(threadnumberkey);
+}
+static void setThreadValue(void* v) {pthread_setspecific(threadnumberkey, v);}
+#else
+static DWORD threadnumberkey = TlsAlloc();
+static void* getThreadValue() {return TlsGetValue(threadnumberkey);}
+static void setThreadValue(void* v) {TlsSetValue(threadnumberkey, v);}
+#endif
+static unsigned int getThreadNumber()
+{
+  // The value 0 means no number is assigned yet
+  void* n = getThreadValue();
+  if (!n)
+  {
+    ScopeMutexLock l(threadnumberbusy);
+    n = reinterpret_cast<void*>(static_cast<size_t>(++threadcounter));
+    setThreadValue(n);
+  }
+  return static_cast<unsigned int>(reinterpret_cast<size_t>(n));
+}
+
+
+/** A slab holds a fixed number of objects. It is followed in memory by
+  * the objects, each preceded by a header pointing to the slab. */
+struct MemoryPool::Slab
+{
+  /** Arena owning the slab. */
+  Arena* arena;
+
+  /** Previous slab with free objects in the arena. */
+  Slab* prev;
+
+  /** Next slab with free objects in the arena. */
+  Slab* next;
+
+  /** First free object. A free object stores a pointer to the next one. */
+  void* freelist;
+
+  /** Number of objects in use. */
+  size_t used;
+};
+
+
+/** An arena is the part of a pool used by a set of threads. */
+struct MemoryPool::Arena
+{
+  /** Lock protecting the arena. */
+  Mutex lock;
+
+  /** Slabs with free objects. */
+  Slab* partial;
+
+  /** Empty slab kept for the next allocation. */
+  Slab* spare;
+
+  /** Number of slabs. */
+  size_t slabs;
+
+  /** Number of objects in use. */
+  size_t objects;
+
+  /** Number of slabs released so far. */
+  size_t released;
+
+  // Constructor
+  Arena() : partial(NULL), spare(NULL), slabs(0), objects(0), released(0) {}
+};
+
+
+DECLARE_EXPORT MemoryPool::MemoryPool(const char* n, size_t s)
+  : name(n), objectsize(s), chunksize(headersize + alignSize(s)),
+    nextPool(firstPool)
+{
+  perslab = (slabbytes - alignSize(sizeof(Slab))) / chunksize;
+  if (perslab < 16) perslab = 16;
+  slabsize = alignSize(sizeof(Slab)) + perslab * chunksize;
+  countArenas = Environment::getProcessorCores();
+  if (countArenas < 1) countArenas = 1;
+  arenas = new Arena[countArenas];
+  firstPool = this;
+}
+
+
+MemoryPool::Arena& MemoryPool::getArena()
+{
+  return arenas[getThreadNumber() % countArenas];
+}
+
+
+DECLARE_EXPORT void* MemoryPool::alloc(size_t s)
+{
+  // Bigger objects aren't allocated from the pool. Their header is empty.
+  if (s > objectsize)
+  {
+    char* chunk = static_cast<char*>(::operator new(headersize + s));
+    *reinterpret_cast<Slab**>(chunk) = NULL;
+    return chunk + headersize;
+  }
+
+  Arena& a = getArena();
+  ScopeMutexLock l(a.lock);
+  Slab* slab = a.partial;
+  if (!slab)
+  {
+    // Create a new slab, and chain all its objects in the free list
+    char* mem = static_cast<char*>(::operator new(slabsize));
+    slab = reinterpret_cast<Slab*>(mem);
+    slab->arena = &a;
+    slab->prev = NULL;
+    slab->next = NULL;
+    slab->freelist = NULL;
+    slab->used = 0;
+    char* first = mem + alignSize(sizeof(Slab));
+    for (size_t i = perslab; i > 0; --i)
+    {
+      char* chunk = first + (i - 1) * chunksize;
+      *reinterpret_cast<Slab**>(chunk) = slab;
+      *reinterpret_cast<void**>(chunk + headersize) = slab->freelist;
+      slab->freelist = chunk + headersize;
+    }
+    a.partial = slab;
+    ++a.slabs;
+  }
+
+  // Take the first free object of the slab
+  void* result = slab->freelist;
+  slab->freelist = *static_cast<void**>(result);
+  ++slab->used;
+  ++a.objects;
+  if (slab == a.spare) a.spare = NULL;
+  if (!slab->freelist)
+  {
+    // The slab is full
+    a.partial = slab->next;
+    if (a.partial) a.partial->prev = NULL;
+    slab->next = NULL;
+  }
+  return result;
+}
+
+
+DECLARE_EXPORT void MemoryPool::release(void* p)
+{
+  if (!p) return;
+  char* chunk = static_cast<char*>(p) - headersize;
+  Slab* slab = *reinterpret_cast<Slab**>(chunk);
+  if (!slab)
+  {
+    // Not allocated from a slab
+    ::operator delete(chunk);
+    return;
+  }
+
+  Arena& a = *(slab->arena);
+  ScopeMutexLock l(a.lock);
+  if (!slab->freelist)
+  {
+    // A full slab has free objects again
+    slab->prev = NULL;
+    slab->next = a.partial;
+    if (a.partial) a.partial->prev = slab;
+    a.partial = slab;
+  }
+  *static_cast<void**>(p) = slab->freelist;
+  slab->freelist = p;
+  --slab->used;
+  --a.objects;
+  if (slab->used) return;
+
+  // Keep a single empty slab as a spare, and release all others
+  if (!a.spare)
+  {
+    a.spare = slab;
+    return;
+  }
+  if (slab->prev)
+    slab->prev->next = slab->next;
+  else
+    a.partial = slab->next;
+  if (slab->next) slab->next->prev = slab->prev;
+  --a.slabs;
+  ++a.released;
+  ::operator delete(slab);
+}
+
+
+DECLARE_EXPORT void MemoryPool::getStatistics
+(size_t& objects, size_t& slabs, size_t& released) const
+{
+  objects = slabs = released = 0;
+  for (unsigned int i = 0; i < countArenas; ++i)
+  {
+    ScopeMutexLock l(arenas[i].lock);
+    objects += arenas[i].objects;
+    slabs += arenas[i].slabs;
+    released += arenas[i].released;
+  }
+}
+
+} // end namespace
+} // end namespace
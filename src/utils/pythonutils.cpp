@@ -181,6 +181,20 @@ DECLARE_EXPORT void PythonInterpreter::addThread()
 }
 
 
+DECLARE_EXPORT bool PythonInterpreter::hasLock()
+{
+#if PY_VERSION_HEX >= 0x03040000
+  return PyGILState_Check() != 0;
+#elif PY_MAJOR_VERSION < 3
+  // The thread holding the lock is the current thread state of Python
+  PyThreadState * myThreadState = PyGILState_GetThisThreadState();
+  return myThreadState && myThreadState == _PyThreadState_Current;
+#else
+  return true;
+#endif
+}
+
+
 DECLARE_EXPORT void PythonInterpreter::deleteThread()
 {
   // Check whether the thread already has a Python state
@@ -716,6 +730,61 @@ DECLARE_EXPORT void PythonType::addMethod
 }
 
 
+DECLARE_EXPORT void PythonType::addField(MetaField* f)
+{
+  unsigned short i = 0;
+
+  // Create a field table array
+  if (!table->tp_getset)
+    // Allocate a first block
+    table->tp_getset = new PyGetSetDef[fieldArraySize];
+  else
+  {
+    // Find the first non-empty field record
+    while (table->tp_getset[i].name) i++;
+    if (i % fieldArraySize == fieldArraySize - 1)
+    {
+      // Allocation of a bigger buffer is required
+      PyGetSetDef* tmp = new PyGetSetDef[i + 1 + fieldArraySize];
+      for(unsigned short j = 0; j < i; j++)
+        tmp[j] = table->tp_getset[j];
+      delete [] table->tp_getset;
+      table->tp_getset = tmp;
+    }
+  }
+
+  // Populate a field definition struct
+  table->tp_getset[i].name = const_cast<char*>(f->getName().getName().c_str());
+  table->tp_getset[i].get = getfield_handler;
+  table->tp_getset[i].set = f->getReadOnly() ? NULL : setfield_handler;
+  table->tp_getset[i].doc = NULL;
+  table->tp_getset[i].closure = f;
+
+  // Append an empty terminator record
+  table->tp_getset[++i].name = NULL;
+  table->tp_getset[i].get = NULL;
+  table->tp_getset[i].set = NULL;
+  table->tp_getset[i].doc = NULL;
+  table->tp_getset[i].closure = NULL;
+}
+
+
+DECLARE_EXPORT const MetaField* MetaField::find(PyObject* self, PyObject* name)
+{
+  // Look up the attribute on the type and its base types.
+  // Python caches these lookups, so this doesn't involve a scan of the
+  // type dictionaries.
+  PyObject* descr = _PyType_Lookup(Py_TYPE(self), name);
+  if (!descr || Py_TYPE(descr) != &PyGetSetDescr_Type) return NULL;
+
+  // Only descriptors created with PythonType::addField are fields
+  PyGetSetDef* def = reinterpret_cast<PyGetSetDescrObject*>(descr)->d_getset;
+  return def->get == getfield_handler ?
+    static_cast<const MetaField*>(def->closure) :
+    NULL;
+}
+
+
 DECLARE_EXPORT int PythonType::typeReady()
 {
   // Register the new type in the module
@@ -888,6 +957,9 @@ extern "C" DECLARE_EXPORT PyObject* getattro_handler(PyObject *self, PyObject *n
       return NULL;
     }
     PythonExtensionBase* cpp_self = static_cast<PythonExtensionBase*>(self);
+    // Exit 1: A field of the type
+    const MetaField* fld = MetaField::find(self, name);
+    if (fld) return fld->get(cpp_self);
 #if PY_MAJOR_VERSION >= 3
     PyObject* name_utf8 = PyUnicode_AsUTF8String(name);
     PyObject* result = cpp_self->getattro(Attribute(PyBytes_AsString(name_utf8)));
@@ -895,11 +967,11 @@ extern "C" DECLARE_EXPORT PyObject* getattro_handler(PyObject *self, PyObject *n
 #else
     PyObject* result = cpp_self->getattro(Attribute(PyString_AsString(name)));
 #endif
-    // Exit 1: Normal
+    // Exit 2: Normal
     if (result) return result;
-    // Exit 2: Exception occurred
+    // Exit 3: Exception occurred
     if (PyErr_Occurred()) return NULL;
-    // Exit 3: Look up in our custom dictionary
+    // Exit 4: Look up in our custom dictionary
     if (cpp_self->dict)
     {
       PyObject* item = PyDict_GetItem(cpp_self->dict, name);
@@ -909,7 +981,7 @@ extern "C" DECLARE_EXPORT PyObject* getattro_handler(PyObject *self, PyObject *n
         return item;
       }
     }
-    // Exit 4: No error occurred but the attribute was not found.
+    // Exit 5: No error occurred but the attribute was not found.
     // Use the standard generic function to pick up  standard attributes
     // (such as __class__, __doc__, ...)
     // Note that this function also picks up attributes from base classes, but
@@ -924,6 +996,44 @@ extern "C" DECLARE_EXPORT PyObject* getattro_handler(PyObject *self, PyObject *n
 }
 
 
+extern "C" DECLARE_EXPORT PyObject* getfield_handler(PyObject *self, void *closure)
+{
+  try
+  {
+    return static_cast<const MetaField*>(closure)->get(
+      static_cast<PythonExtensionBase*>(self)
+      );
+  }
+  catch (...)
+  {
+    PythonType::evalException();
+    return NULL;
+  }
+}
+
+
+extern "C" DECLARE_EXPORT int setfield_handler(PyObject *self, PyObject *value, void *closure)
+{
+  try
+  {
+    const MetaField* fld = static_cast<const MetaField*>(closure);
+    if (!value)
+    {
+      PyErr_Format(PyExc_AttributeError,
+          "attribute '%s' on '%s' can't be deleted",
+          fld->getName().getName().c_str(), Py_TYPE(self)->tp_name);
+      return -1;
+    }
+    return fld->set(static_cast<PythonExtensionBase*>(self), PythonObject(value));
+  }
+  catch (...)
+  {
+    PythonType::evalException();
+    return -1;
+  }
+}
+
+
 extern "C" DECLARE_EXPORT int setattro_handler(PyObject *self, PyObject *name, PyObject *value)
 {
   try
@@ -947,8 +1057,12 @@ extern "C" DECLARE_EXPORT int setattro_handler(PyObject *self, PyObject *name, P
     }
     PythonObject field(value);
 
-    // Call the object to update the attribute
+    // Update a field of the type
     PythonExtensionBase* cpp_self = static_cast<PythonExtensionBase*>(self);
+    const MetaField* fld = MetaField::find(self, name);
+    if (fld && value && !fld->getReadOnly()) return fld->set(cpp_self, field);
+
+    // Call the object to update the attribute
 #if PY_MAJOR_VERSION >= 3
     PyObject* name_utf8 = PyUnicode_AsUTF8String(name);
     int result = cpp_self->setattro(Attribute(PyBytes_AsString(name_utf8)), field);
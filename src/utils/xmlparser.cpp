@@ -31,6 +31,10 @@
 #define WIN32_LEAN_AND_MEAN
 #include <windows.h>
 #else
+// Memory-mapped files for reading snapshots
+#include <fcntl.h>
+#include <sys/mman.h>
+#include <unistd.h>
 // With Unix-like systems we use a check suggested by the autoconf tools
 #if HAVE_DIRENT_H
 # include <dirent.h>
@@ -917,5 +921,432 @@ DECLARE_EXPORT void XMLInputFile::parse(Object *pRoot, bool validate)
   }
 }
 
+
+//
+// BINARY SNAPSHOTS
+//
+
+
+/* A snapshot file starts with a header, followed by a sequence of records.
+ * All fields are 4-byte aligned:
+ *   - Header: magic string, format version, size of an XMLCh character
+ *     and a byte order mark.
+ *   - Start of an element: record type, element name, number of attributes,
+ *     and the name and value of each attribute.
+ *   - End of an element: record type.
+ *   - Character data: record type, data.
+ *   - Processing instruction: record type, target, data.
+ * A string is stored as its length, the null terminated Xerces characters,
+ * and padding to the next 4-byte boundary.
+ */
+static const char snapshotMagic[8] = {'f','r','e','p','p','l','e','S'};
+static const unsigned int snapshotVersion = 1;
+static const unsigned int snapshotByteOrder = 0x01020304;
+enum snapshotRecord
+{
+  SNAPSHOT_START = 1,
+  SNAPSHOT_END = 2,
+  SNAPSHOT_CHARACTERS = 3,
+  SNAPSHOT_INSTRUCTION = 4
+};
+
+#if XERCES_VERSION_MAJOR==2
+typedef unsigned int snapshotIndex;
+#else
+typedef XMLSize_t snapshotIndex;
+#endif
+
+
+/** @brief A SAX handler writing the parser events to a snapshot file. */
+class SnapshotWriter : public xercesc::DefaultHandler
+{
+  public:
+    SnapshotWriter(ostream& o) : out(o) {}
+
+    void startElement(const XMLCh* const uri, const XMLCh* const n,
+        const XMLCh* const qname, const xercesc::Attributes& atts)
+    {
+      writeInt(SNAPSHOT_START);
+      writeString(n);
+      writeInt(atts.getLength());
+      for (snapshotIndex i=0, cnt=atts.getLength(); i<cnt; i++)
+      {
+        writeString(atts.getLocalName(i));
+        writeString(atts.getValue(i));
+      }
+    }
+
+    void endElement(const XMLCh* const uri, const XMLCh* const n,
+        const XMLCh* const qname)
+    {
+      writeInt(SNAPSHOT_END);
+    }
+
+#if XERCES_VERSION_MAJOR==2
+    void characters(const XMLCh *const c, const unsigned int n)
+#else
+    void characters(const XMLCh *const c, const XMLSize_t n)
+#endif
+    {
+      writeInt(SNAPSHOT_CHARACTERS);
+      writeString(c, n);
+    }
+
+    void processingInstruction(const XMLCh *const target, const XMLCh *const data)
+    {
+      writeInt(SNAPSHOT_INSTRUCTION);
+      writeString(target);
+      writeString(data);
+    }
+
+    void fatalError(const xercesc::SAXParseException& e)
+    {
+      char* message = xercesc::XMLString::transcode(e.getMessage());
+      ostringstream ch;
+      ch << message;
+      if (e.getLineNumber() > 0) ch << " at line " << e.getLineNumber();
+      xercesc::XMLString::release(&message);
+      throw DataException(ch.str());
+    }
+
+    void writeInt(unsigned int i)
+    {
+      out.write(reinterpret_cast<const char*>(&i), sizeof(unsigned int));
+    }
+
+    void writeString(const XMLCh* c)
+    {
+      writeString(c, xercesc::XMLString::stringLen(c));
+    }
+
+    void writeString(const XMLCh* c, XMLSize_t n)
+    {
+      static const char padding[8] = {0,0,0,0,0,0,0,0};
+      writeInt(static_cast<unsigned int>(n));
+      out.write(reinterpret_cast<const char*>(c), n * sizeof(XMLCh));
+      // Null terminator and padding
+      size_t bytes = (n + 1) * sizeof(XMLCh);
+      out.write(padding, sizeof(XMLCh) + (4 - bytes % 4) % 4);
+    }
+
+  private:
+    ostream& out;
+};
+
+
+/** @brief A list of attributes pointing into a snapshot. */
+class SnapshotAttributes : public xercesc::Attributes
+{
+  public:
+    void clear() {names.clear(); values.clear();}
+
+    void add(const XMLCh* n, const XMLCh* v)
+    {
+      names.push_back(n);
+      values.push_back(v);
+    }
+
+    snapshotIndex getLength() const {return static_cast<snapshotIndex>(names.size());}
+
+    const XMLCh* getURI(const snapshotIndex index) const
+    {return xercesc::XMLUni::fgZeroLenString;}
+
+    const XMLCh* getLocalName(const snapshotIndex index) const
+    {return index < names.size() ? names[index] : NULL;}
+
+    const XMLCh* getQName(const snapshotIndex index) const
+    {return index < names.size() ? names[index] : NULL;}
+
+    const XMLCh* getType(const snapshotIndex index) const
+    {return index < names.size() ? xercesc::XMLUni::fgCDATAString : NULL;}
+
+    const XMLCh* getValue(const snapshotIndex index) const
+    {return index < values.size() ? values[index] : NULL;}
+
+    int getIndex(const XMLCh* const uri, const XMLCh* const localPart) const
+    {return getIndex(localPart);}
+
+    int getIndex(const XMLCh* const qName) const
+    {
+      for (size_t i = 0; i < names.size(); ++i)
+        if (xercesc::XMLString::equals(names[i], qName))
+          return static_cast<int>(i);
+      return -1;
+    }
+
+#if XERCES_VERSION_MAJOR>2
+    bool getIndex(const XMLCh* const uri, const XMLCh* const localPart, XMLSize_t& index) const
+    {return getIndex(localPart, index);}
+
+    bool getIndex(const XMLCh* const qName, XMLSize_t& index) const
+    {
+      int i = getIndex(qName);
+      if (i < 0) return false;
+      index = i;
+      return true;
+    }
+#endif
+
+    const XMLCh* getType(const XMLCh* const uri, const XMLCh* const localPart) const
+    {return getType(localPart);}
+
+    const XMLCh* getType(const XMLCh* const qName) const
+    {return getIndex(qName) < 0 ? NULL : xercesc::XMLUni::fgCDATAString;}
+
+    const XMLCh* getValue(const XMLCh* const uri, const XMLCh* const localPart) const
+    {return getValue(localPart);}
+
+    const XMLCh* getValue(const XMLCh* const qName) const
+    {
+      int i = getIndex(qName);
+      return i < 0 ? NULL : values[i];
+    }
+
+  private:
+    vector<const XMLCh*> names;
+    vector<const XMLCh*> values;
+};
+
+
+/** @brief A cursor for reading the fields of a snapshot. */
+class SnapshotReader
+{
+  public:
+    SnapshotReader(const char* b, const char* e) : cur(b), end(e) {}
+
+    bool atEnd() const {return cur >= end;}
+
+    unsigned int readInt()
+    {
+      if (cur + sizeof(unsigned int) > end)
+        throw DataException("Unexpected end of snapshot");
+      unsigned int i = *reinterpret_cast<const unsigned int*>(cur);
+      cur += sizeof(unsigned int);
+      return i;
+    }
+
+    const XMLCh* readString(XMLSize_t& n)
+    {
+      n = readInt();
+      size_t bytes = (n + 1) * sizeof(XMLCh);
+      bytes += (4 - bytes % 4) % 4;
+      if (cur + bytes > end)
+        throw DataException("Unexpected end of snapshot");
+      const XMLCh* c = reinterpret_cast<const XMLCh*>(cur);
+      cur += bytes;
+      return c;
+    }
+
+    const XMLCh* readString()
+    {
+      XMLSize_t n;
+      return readString(n);
+    }
+
+  private:
+    const char* cur;
+    const char* end;
+};
+
+
+/** @brief A snapshot file mapped in memory. */
+class SnapshotFile : public NonCopyable
+{
+  public:
+    const char* data;
+    size_t size;
+
+    SnapshotFile(const string& filename) : data(NULL), size(0)
+    {
+#ifdef _MSC_VER
+      fileHandle = CreateFile(filename.c_str(), GENERIC_READ,
+        FILE_SHARE_READ, NULL, OPEN_EXISTING, FILE_ATTRIBUTE_NORMAL, NULL);
+      if (fileHandle == INVALID_HANDLE_VALUE)
+        throw RuntimeException("Couldn't open snapshot file '" + filename + "'");
+      size = GetFileSize(fileHandle, NULL);
+      mapHandle = size ?
+        CreateFileMapping(fileHandle, NULL, PAGE_READONLY, 0, 0, NULL) :
+        NULL;
+      if (mapHandle)
+        data = static_cast<const char*>(MapViewOfFile(mapHandle, FILE_MAP_READ, 0, 0, 0));
+      if (!data)
+      {
+        if (mapHandle) CloseHandle(mapHandle);
+        CloseHandle(fileHandle);
+        throw RuntimeException("Couldn't map snapshot file '" + filename + "'");
+      }
+#else
+      fd = open(filename.c_str(), O_RDONLY);
+      if (fd < 0)
+        throw RuntimeException("Couldn't open snapshot file '" + filename + "'");
+      struct stat st;
+      void* mapped = MAP_FAILED;
+      if (!fstat(fd, &st) && st.st_size > 0)
+        mapped = mmap(NULL, st.st_size, PROT_READ, MAP_PRIVATE, fd, 0);
+      if (mapped == MAP_FAILED)
+      {
+        close(fd);
+        throw RuntimeException("Couldn't map snapshot file '" + filename + "'");
+      }
+      size = st.st_size;
+      data = static_cast<const char*>(mapped);
+#endif
+    }
+
+    ~SnapshotFile()
+    {
+#ifdef _MSC_VER
+      UnmapViewOfFile(data);
+      CloseHandle(mapHandle);
+      CloseHandle(fileHandle);
+#else
+      munmap(const_cast<char*>(data), size);
+      close(fd);
+#endif
+    }
+
+  private:
+#ifdef _MSC_VER
+    HANDLE fileHandle;
+    HANDLE mapHandle;
+#else
+    int fd;
+#endif
+};
+
+
+DECLARE_EXPORT void XMLInputSnapshot::save(const string& filename, const string& data)
+{
+  ofstream out(filename.c_str(), ios::out | ios::binary);
+  if (!out) throw RuntimeException("Could not open output file '" + filename + "'");
+  SnapshotWriter writer(out);
+  xercesc::SAX2XMLReader* parser = NULL;
+  try
+  {
+    // Write the header
+    out.write(snapshotMagic, sizeof(snapshotMagic));
+    writer.writeInt(snapshotVersion);
+    writer.writeInt(sizeof(XMLCh));
+    writer.writeInt(snapshotByteOrder);
+
+    // Parse the XML data, and write the events to the file
+    parser = xercesc::XMLReaderFactory::createXMLReader();
+    parser->setProperty(xercesc::XMLUni::fgXercesScannerName,
+      const_cast<XMLCh*>(xercesc::XMLUni::fgWFXMLScanner));
+    parser->setFeature(xercesc::XMLUni::fgSAX2CoreValidation, false);
+    parser->setFeature(xercesc::XMLUni::fgSAX2CoreNameSpacePrefixes, false);
+    parser->setContentHandler(&writer);
+    parser->setErrorHandler(&writer);
+    xercesc::MemBufInputSource in(
+      reinterpret_cast<const XMLByte*>(data.c_str()),
+      static_cast<const unsigned int>(data.size()),
+      "memory data",
+      false);
+    parser->parse(in);
+    delete parser;
+    parser = NULL;
+    out.close();
+    if (!out) throw RuntimeException("Error writing snapshot file '" + filename + "'");
+  }
+  catch (const xercesc::XMLException& toCatch)
+  {
+    delete parser;
+    char* message = xercesc::XMLString::transcode(toCatch.getMessage());
+    string msg(message);
+    xercesc::XMLString::release(&message);
+    throw RuntimeException("Error writing snapshot: " + msg);
+  }
+  catch (const exception& toCatch)
+  {
+    delete parser;
+    ostringstream msg;
+    msg << "Error writing snapshot: " << toCatch.what();
+    throw RuntimeException(msg.str());
+  }
+}
+
+
+DECLARE_EXPORT void XMLInputSnapshot::parse(Object *pRoot, bool validate)
+{
+  // Without a root object there's nothing to replay
+  if (!pRoot) return;
+
+  // Map the file in memory
+  SnapshotFile file(filename);
+
+  try
+  {
+    // Validate the header
+    if (file.size < sizeof(snapshotMagic)
+      || memcmp(file.data, snapshotMagic, sizeof(snapshotMagic)))
+      throw DataException("Not a snapshot file");
+    SnapshotReader reader(file.data + sizeof(snapshotMagic), file.data + file.size);
+    if (reader.readInt() != snapshotVersion)
+      throw DataException("Unsupported snapshot version");
+    if (reader.readInt() != sizeof(XMLCh)
+      || reader.readInt() != snapshotByteOrder)
+      throw DataException("Snapshot created on a different platform");
+
+    // Replay the events
+    m_EHStack.push_back(make_pair(pRoot,static_cast<void*>(NULL)));
+    states.push(INIT);
+    SnapshotAttributes atts;
+    XMLSize_t len;
+    while (!reader.atEnd() && !states.empty() && states.top() != SHUTDOWN)
+    {
+      switch (reader.readInt())
+      {
+        case SNAPSHOT_START:
+        {
+          const XMLCh* name = reader.readString();
+          atts.clear();
+          for (unsigned int cnt = reader.readInt(); cnt > 0; --cnt)
+          {
+            const XMLCh* attname = reader.readString();
+            atts.add(attname, reader.readString());
+          }
+          startElement(xercesc::XMLUni::fgZeroLenString, name, name, atts);
+          break;
+        }
+        case SNAPSHOT_END:
+          endElement(xercesc::XMLUni::fgZeroLenString,
+            xercesc::XMLUni::fgZeroLenString, xercesc::XMLUni::fgZeroLenString);
+          break;
+        case SNAPSHOT_CHARACTERS:
+        {
+          const XMLCh* c = reader.readString(len);
+          characters(c, len);
+          break;
+        }
+        case SNAPSHOT_INSTRUCTION:
+        {
+          const XMLCh* target = reader.readString();
+          processingInstruction(target, reader.readString());
+          break;
+        }
+        default:
+          throw DataException("Corrupted snapshot file");
+      }
+    }
+  }
+  // Note: the reset() method needs to be called in all circumstances. The
+  // reset method allows all objects to finish in a valid state and clean up
+  // any memory they may have allocated.
+  catch (const exception& toCatch)
+  {
+    reset();
+    ostringstream msg;
+    msg << "Error reading snapshot '" << filename << "': " << toCatch.what();
+    throw RuntimeException(msg.str());
+  }
+  catch (...)
+  {
+    reset();
+    throw RuntimeException(
+      "Error reading snapshot '" + filename + "': Unexpected exception");
+  }
+  reset();
+}
+
 } // end namespace
 } // end namespace
@@ -0,0 +1,32 @@
+#!/usr/bin/python
+#
+# Copyright (C) 2007-2013 by Johan De Taeye, frePPLe bvba
+#
+# This library is free software; you can redistribute it and/or modify it
+# under the terms of the GNU Affero General Public License as published
+# by the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU Affero
+# General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public
+# License along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+from __future__ import print_function
+import os, sys
+
+# Run the execution.
+# The model compares the bulk resource plan with the plan of each resource.
+out = os.popen(os.environ['EXECUTABLE'] + "  ./commands.xml")
+while True:
+  i = out.readline()
+  if not i: break
+  print(i.strip())
+if out.close() != None:
+  print("Planner exited abnormally\n")
+  sys.exit(1)
+
+print("\nTest passed\n")
@@ -0,0 +1,85 @@
+#!/usr/bin/python
+#
+# Copyright (C) 2013 by Johan De Taeye, frePPLe bvba
+#
+# This library is free software; you can redistribute it and/or modify it
+# under the terms of the GNU Affero General Public License as published
+# by the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU Affero
+# General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public
+# License along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+# This test measures the scalability of the timeline of a buffer.
+# All operationplans produce in the same buffer, and they are read in the
+# reverse order of their dates. Every flowplan is thus inserted at the head
+# of the timeline. A timeline implemented as a sorted list needs to update
+# the onhand of all later flowplans on every insert, and its run time grows
+# quadratically with the number of flowplans.
+
+from __future__ import print_function
+import os, sys
+from datetime import datetime, timedelta
+
+runtimes = {}
+
+def createdata(outfile, counter):
+  start = datetime(2009, 1, 1)
+  outfile.write(
+    "<plan xmlns:xsi=\"http://www.w3.org/2001/XMLSchema-instance\">\n" +
+    "<current>2009-01-01T00:00:00</current>\n" +
+    "<buffers><buffer name=\"BUFFER\"/></buffers>\n" +
+    "<operations><operation name=\"MAKE\" xsi:type=\"operation_fixed_time\"/></operations>\n" +
+    "<flows><flow xsi:type=\"flow_end\"><operation name=\"MAKE\"/>" +
+    "<buffer name=\"BUFFER\"/><quantity>1</quantity></flow></flows>\n" +
+    "<operationplans>\n"
+    )
+  for cnt in range(counter, 0, -1):
+    print(
+      "<operationplan id=\"%d\" operation=\"MAKE\"><end>%s</end><quantity>%d</quantity></operationplan>"
+      % (cnt, (start + timedelta(minutes=cnt)).strftime("%Y-%m-%dT%H:%M:%S"), cnt % 10 + 1),
+      file=outfile
+      )
+  outfile.write("</operationplans></plan>\n")
+
+
+# Main loop
+for counter in [10000, 20000, 30000, 40000, 50000]:
+  print("\ncounter", counter)
+  outfile = open("input.xml","wt")
+  createdata(outfile, counter)
+  outfile.close();
+
+  # Run the execution
+  starttime = os.times()
+  out = os.popen(os.environ['EXECUTABLE'] + "  ./commands.xml")
+  while True:
+    i = out.readline()
+    if not i: break
+    print(i.strip())
+  if out.close() != None:
+    print("Planner exited abnormally\n")
+    sys.exit(1)
+
+  # Measure the time
+  endtime = os.times()
+  runtimes[counter] = endtime[4]-starttime[4]
+  print("time: %.3f" % (endtime[4]-starttime[4]))
+
+  # Clean up the input
+  os.remove("input.xml")
+
+# Define failure criterium.
+# An insert in the timeline takes logarithmic time, which is allowed for
+# with an extra margin on top of linear scaling.
+if runtimes[50000] > runtimes[10000]*5*1.3:
+  print("\nTest failed. Run time scales worse than n log n with the number of flowplans.\n")
+  sys.exit(1)
+
+print("\nTest passed\n")
@@ -0,0 +1,119 @@
+#!/usr/bin/python
+#
+# Copyright (C) 2013 by Johan De Taeye, frePPLe bvba
+#
+# This library is free software; you can redistribute it and/or modify it
+# under the terms of the GNU Affero General Public License as published
+# by the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU Affero
+# General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public
+# License along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+# This test measures the scalability of deleting entities in bulk.
+# Items, customers, locations, calendars and operations are deleted one by
+# one while buffers, resources and demands still refer to them. Deleting an
+# entity should only visit the objects referring to it, and the run time
+# should grow linearly with the model size.
+
+from __future__ import print_function
+import os, sys
+
+runtimes = {}
+
+def createdata(outfile, counter):
+  outfile.write(
+    "<plan xmlns:xsi=\"http://www.w3.org/2001/XMLSchema-instance\">\n" +
+    "<current>2009-01-01T00:00:00</current>\n"
+    )
+  outfile.write("<calendars>\n")
+  for cnt in range(counter):
+    print(
+      "<calendar name=\"CAL_%d\" xsi:type=\"calendar_double\"><buckets>" % cnt +
+      "<bucket start=\"2009-01-01T00:00:00\" end=\"2010-01-01T00:00:00\" value=\"10\"/>" +
+      "</buckets></calendar>", file=outfile
+      )
+  outfile.write("</calendars>\n<locations>\n")
+  for cnt in range(counter):
+    print(
+      "<location name=\"LOC_%d\"><available name=\"CAL_%d\"/></location>" % (cnt, cnt),
+      file=outfile
+      )
+  outfile.write("</locations>\n<customers>\n")
+  for cnt in range(counter):
+    print("<customer name=\"CUST_%d\"/>" % cnt, file=outfile)
+  outfile.write("</customers>\n<operations>\n")
+  for cnt in range(counter):
+    print(
+      "<operation name=\"OPER_%d\" xsi:type=\"operation_fixed_time\">" % cnt +
+      "<location name=\"LOC_%d\"/></operation>" % cnt, file=outfile
+      )
+  outfile.write("</operations>\n<items>\n")
+  for cnt in range(counter):
+    print(
+      "<item name=\"ITEM_%d\"><operation name=\"OPER_%d\"/></item>" % (cnt, cnt),
+      file=outfile
+      )
+  outfile.write("</items>\n<buffers>\n")
+  for cnt in range(counter):
+    print(
+      "<buffer name=\"BUF_%d\"><item name=\"ITEM_%d\"/><location name=\"LOC_%d\"/>" % (cnt, cnt, cnt) +
+      "<producing name=\"OPER_%d\"/><minimum_calendar name=\"CAL_%d\"/></buffer>" % (cnt, cnt),
+      file=outfile
+      )
+  outfile.write("</buffers>\n<resources>\n")
+  for cnt in range(counter):
+    print(
+      "<resource name=\"RES_%d\"><location name=\"LOC_%d\"/>" % (cnt, cnt) +
+      "<maximum_calendar name=\"CAL_%d\"/></resource>" % cnt,
+      file=outfile
+      )
+  outfile.write("</resources>\n<demands>\n")
+  for cnt in range(counter):
+    print(
+      "<demand name=\"DEMAND_%d\" quantity=\"10\" due=\"2009-03-03T00:00:00\">" % cnt +
+      "<item name=\"ITEM_%d\"/><operation name=\"OPER_%d\"/>" % (cnt, cnt) +
+      "<customer name=\"CUST_%d\"/></demand>" % cnt,
+      file=outfile
+      )
+  outfile.write("</demands></plan>\n")
+
+
+# Main loop
+for counter in [2000, 4000, 6000, 8000, 10000]:
+  print("\ncounter", counter)
+  outfile = open("input.xml","wt")
+  createdata(outfile, counter)
+  outfile.close();
+
+  # Run the execution
+  starttime = os.times()
+  out = os.popen(os.environ['EXECUTABLE'] + "  ./commands.xml")
+  while True:
+    i = out.readline()
+    if not i: break
+    print(i.strip())
+  if out.close() != None:
+    print("Planner exited abnormally\n")
+    sys.exit(1)
+
+  # Measure the time
+  endtime = os.times()
+  runtimes[counter] = endtime[4]-starttime[4]
+  print("time: %.3f" % (endtime[4]-starttime[4]))
+
+  # Clean up the input
+  os.remove("input.xml")
+
+# Define failure criterium
+if runtimes[10000] > runtimes[2000]*5*1.3:
+  print("\nTest failed. Run time scales worse than linear with model size.\n")
+  sys.exit(1)
+
+print("\nTest passed\n")
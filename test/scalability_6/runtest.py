@@ -0,0 +1,87 @@
+#!/usr/bin/python
+#
+# Copyright (C) 2013 by Johan De Taeye, frePPLe bvba
+#
+# This library is free software; you can redistribute it and/or modify it
+# under the terms of the GNU Affero General Public License as published
+# by the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU Affero
+# General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public
+# License along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+# This test measures the scalability of the safety stock planning.
+# Every buffer has a safety stock and forms a cluster by itself. Each cluster
+# should only visit its own buffers, and the run time should grow linearly
+# with the number of clusters.
+
+from __future__ import print_function
+import os, sys
+
+runtimes = {}
+
+def createdata(outfile, counter):
+  outfile.write(
+    "<plan xmlns:xsi=\"http://www.w3.org/2001/XMLSchema-instance\">\n" +
+    "<current>2009-01-01T00:00:00</current>\n<operations>\n"
+    )
+  for cnt in range(counter):
+    print(
+      "<operation name=\"OPER_%d\" xsi:type=\"operation_fixed_time\" duration=\"P1D\"/>" % cnt,
+      file=outfile
+      )
+  outfile.write("</operations>\n<buffers>\n")
+  for cnt in range(counter):
+    print(
+      "<buffer name=\"BUF_%d\"><item name=\"ITEM_%d\"/>" % (cnt, cnt) +
+      "<producing name=\"OPER_%d\"/><minimum>10</minimum></buffer>" % cnt,
+      file=outfile
+      )
+  outfile.write("</buffers>\n<flows>\n")
+  for cnt in range(counter):
+    print(
+      "<flow xsi:type=\"flow_end\"><operation name=\"OPER_%d\"/>" % cnt +
+      "<buffer name=\"BUF_%d\"/><quantity>1</quantity></flow>" % cnt,
+      file=outfile
+      )
+  outfile.write("</flows></plan>\n")
+
+
+# Main loop
+for counter in [2000, 4000, 6000, 8000, 10000]:
+  print("\ncounter", counter)
+  outfile = open("input.xml","wt")
+  createdata(outfile, counter)
+  outfile.close();
+
+  # Run the execution
+  starttime = os.times()
+  out = os.popen(os.environ['EXECUTABLE'] + "  ./commands.xml")
+  while True:
+    i = out.readline()
+    if not i: break
+    print(i.strip())
+  if out.close() != None:
+    print("Planner exited abnormally\n")
+    sys.exit(1)
+
+  # Measure the time
+  endtime = os.times()
+  runtimes[counter] = endtime[4]-starttime[4]
+  print("time: %.3f" % (endtime[4]-starttime[4]))
+
+  # Clean up the input
+  os.remove("input.xml")
+
+# Define failure criterium
+if runtimes[10000] > runtimes[2000]*5*1.3:
+  print("\nTest failed. Run time scales worse than linear with model size.\n")
+  sys.exit(1)
+
+print("\nTest passed\n")
@@ -0,0 +1,94 @@
+#!/usr/bin/python
+#
+# Copyright (C) 2013 by Johan De Taeye, frePPLe bvba
+#
+# This library is free software; you can redistribute it and/or modify it
+# under the terms of the GNU Affero General Public License as published
+# by the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU Affero
+# General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public
+# License along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+# This test measures the scalability of loading operationplans with an owner.
+# Locked routing operationplans and their locked step operationplans are
+# created the same way the database loader does: every step looks up its
+# owner by identifier. The run time should grow linearly with the number of
+# operationplans.
+
+from __future__ import print_function
+import os, sys
+
+runtimes = {}
+
+def createdata(outfile, counter):
+  outfile.write(
+    "<plan xmlns:xsi=\"http://www.w3.org/2001/XMLSchema-instance\">\n" +
+    "<current>2009-01-01T00:00:00</current>\n<operations>\n"
+    )
+  for cnt in range(counter):
+    print(
+      "<operation name=\"ROUTING_%d\" xsi:type=\"operation_routing\"><steps>" % cnt +
+      "<operation name=\"STEP1_%d\" xsi:type=\"operation_fixed_time\" duration=\"P1D\"/>" % cnt +
+      "<operation name=\"STEP2_%d\" xsi:type=\"operation_fixed_time\" duration=\"P1D\"/>" % cnt +
+      "</steps></operation>",
+      file=outfile
+      )
+  outfile.write("</operations>\n")
+  # The operationplans are created like the database loader does it
+  outfile.write(
+    "<?python\n" +
+    "from datetime import datetime\n" +
+    "counter = %d\n" % counter +
+    "for i in range(counter):\n" +
+    "  frepple.operationplan(operation=frepple.operation(name='ROUTING_%d' % i),\n" +
+    "    id=i+1, quantity=1, end=datetime(2009,1,3), locked=True)\n" +
+    "for i in range(counter):\n" +
+    "  frepple.operationplan(operation=frepple.operation(name='STEP1_%d' % i),\n" +
+    "    id=counter+2*i+1, quantity=1, start=datetime(2009,1,1), end=datetime(2009,1,2),\n" +
+    "    locked=True, owner=frepple.operationplan(id=i+1))\n" +
+    "  frepple.operationplan(operation=frepple.operation(name='STEP2_%d' % i),\n" +
+    "    id=counter+2*i+2, quantity=1, start=datetime(2009,1,2), end=datetime(2009,1,3),\n" +
+    "    locked=True, owner=frepple.operationplan(id=i+1))\n" +
+    "?>\n</plan>\n"
+    )
+
+
+# Main loop
+for counter in [10000, 20000, 30000, 40000, 50000]:
+  print("\ncounter", counter)
+  outfile = open("input.xml","wt")
+  createdata(outfile, counter)
+  outfile.close();
+
+  # Run the execution
+  starttime = os.times()
+  out = os.popen(os.environ['EXECUTABLE'] + "  ./commands.xml")
+  while True:
+    i = out.readline()
+    if not i: break
+    print(i.strip())
+  if out.close() != None:
+    print("Planner exited abnormally\n")
+    sys.exit(1)
+
+  # Measure the time
+  endtime = os.times()
+  runtimes[counter] = endtime[4]-starttime[4]
+  print("time: %.3f" % (endtime[4]-starttime[4]))
+
+  # Clean up the input
+  os.remove("input.xml")
+
+# Define failure criterium
+if runtimes[50000] > runtimes[10000]*5*1.3:
+  print("\nTest failed. Run time scales worse than linear with model size.\n")
+  sys.exit(1)
+
+print("\nTest passed\n")